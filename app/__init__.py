@@ -3,11 +3,91 @@ from sqlalchemy import inspect, text
 from sqlalchemy.orm import sessionmaker
 from app.database import engine, Base
 from dotenv import load_dotenv
+from contextlib import contextmanager
 import os
 from pathlib import Path
 from app.routes import all_blueprints  # ✅ import centralizzato
 from app.routes.staff import staff_bp, staff_admin_bp
 from app.utils.limiter import init_limiter
+from app.services.fedelta_ledger import init_cli as init_fedelta_cli
+from app.services.cover_eventi import init_app as init_cover_eventi
+from app.utils.assets import init_app as init_assets
+from app.services.qr_clienti import init_cli as init_qr_cli
+from app.services.codici_pool import init_cli as init_codici_cli
+from app.services.log_archivio import init_cli as init_log_archivio_cli
+from app.services.archivio_eventi import init_cli as init_archivio_eventi_cli
+from app.services.ricerca_clienti import init_cli as init_ricerca_clienti_cli
+from app.utils.cert_dev import init_cli as init_cert_cli
+
+# Flag in config_app delle migrazioni di dati da eseguire una volta sola
+MIGRAZIONE_INVENTARIO_TAVOLI = "MIGRAZIONE_INVENTARIO_TAVOLI"
+
+
+@contextmanager
+def _migrazione(app, nome):
+    """Ogni migrazione ha il suo blocco: se fallisce si logga e le successive girano comunque"""
+    try:
+        yield
+    except Exception as exc:
+        app.logger.error("Migrazione non riuscita (%s): %s", nome, exc)
+
+
+def _proxy_fidato(wsgi_app, proxy_hops: int, fidati: str):
+    """
+    ProxyFix applicato solo alle connessioni dal proxy: ``fidati`` è un elenco separato da
+    virgole di IP o reti (``10.0.0.0/8``), ``*`` = tutti. Un client che raggiunge direttamente
+    la porta non può scegliersi l'IP con X-Forwarded-For (e aggirare i limiti sul login).
+    """
+    import ipaddress
+    from werkzeug.middleware.proxy_fix import ProxyFix
+
+    corretta = ProxyFix(wsgi_app, x_for=proxy_hops, x_proto=proxy_hops, x_host=proxy_hops)
+    voci = [v.strip() for v in fidati.split(",") if v.strip()]
+    tutti = "*" in voci
+    reti = [ipaddress.ip_network(v, strict=False) for v in voci if v != "*"]
+
+    def da_proxy(indirizzo: str) -> bool:
+        try:
+            ip = ipaddress.ip_address(indirizzo)
+        except ValueError:
+            return False
+        return any(ip in rete for rete in reti)
+
+    def middleware(environ, start_response):
+        if tutti or da_proxy(environ.get("REMOTE_ADDR", "")):
+            return corretta(environ, start_response)
+        return wsgi_app(environ, start_response)
+
+    return middleware
+
+
+def _ricrea_tabella_sqlite(tabella, inspector):
+    """
+    SQLite non ha ALTER COLUMN: ricrea la tabella dal model (rinomina la vecchia,
+    crea la nuova con i suoi indici, copia le colonne comuni, elimina la vecchia),
+    con FK disattivate come nella procedura documentata da SQLite.
+    """
+    nome = tabella.name
+    vecchia = f"{nome}_vecchia"
+    colonne = [c.name for c in tabella.columns if c.name in {col["name"] for col in inspector.get_columns(nome)}]
+    elenco = ", ".join(colonne)
+    with engine.connect() as conn:
+        # PRAGMA fuori transazione: qui non hanno effetto dentro un BEGIN
+        conn.exec_driver_sql("PRAGMA foreign_keys=OFF")
+        conn.exec_driver_sql("PRAGMA legacy_alter_table=ON")
+        try:
+            for idx in inspector.get_indexes(nome):
+                conn.exec_driver_sql(f"DROP INDEX IF EXISTS {idx['name']}")
+            conn.exec_driver_sql(f"ALTER TABLE {nome} RENAME TO {vecchia}")
+            tabella.create(conn)
+            conn.exec_driver_sql(f"INSERT INTO {nome} ({elenco}) SELECT {elenco} FROM {vecchia}")
+            conn.exec_driver_sql(f"DROP TABLE {vecchia}")
+            conn.commit()
+        finally:
+            conn.exec_driver_sql("PRAGMA legacy_alter_table=OFF")
+            conn.exec_driver_sql("PRAGMA foreign_keys=ON")
+    inspector.clear_cache()
+
 
 def create_app():
     load_dotenv()
@@ -17,11 +97,45 @@ def create_app():
     static_dir = base_dir / 'static'
     app = Flask(__name__, template_folder=str(template_dir), static_folder=str(static_dir))
     app.secret_key = os.getenv("SECRET_KEY")
+
+    # Dietro il proxy che termina il TLS: schema, host e IP client dagli header X-Forwarded-*
+    # (servono a url_for esterni e al rate limiter). PROXY_HOPS = n. di proxy fidati davanti;
+    # gli header contano solo se la connessione arriva da FORWARDED_ALLOW_IPS (come in gunicorn)
+    proxy_hops = int(os.getenv("PROXY_HOPS", "0"))
+    if proxy_hops:
+        app.wsgi_app = _proxy_fidato(app.wsgi_app, proxy_hops, os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1"))
     
     # ⚡ Configurazione Rate Limiting
     limiter = init_limiter(app)
     app.limiter = limiter
 
+    # Comandi CLI ledger fedeltà (snapshot / riconciliazione)
+    init_fedelta_cli(app)
+
+    # Copertine eventi: helper template + cache immutabile delle varianti
+    init_cover_eventi(app)
+
+    # Asset statici fingerprinted/precompressi (manifest generato da `flask assets-build`)
+    init_assets(app)
+
+    # Pregenerazione immagini QR clienti (`flask qr-pregenera EVENTO_ID`)
+    init_qr_cli(app)
+
+    # Pool codici QR/invito pregenerati (`flask codici-rifornisci`)
+    init_codici_cli(app)
+
+    # Archiviazione del log attività oltre la retention (`flask log-archivia`)
+    init_log_archivio_cli(app)
+
+    # Archiviazione degli eventi chiusi da tempo nelle tabelle *_archivio (`flask eventi-archivia`)
+    init_archivio_eventi_cli(app)
+
+    # Indice di ricerca clienti (`flask clienti-indicizza`)
+    init_ricerca_clienti_cli(app)
+
+    # Certificato self-signed per il server di sviluppo HTTPS (`flask cert-genera`)
+    init_cert_cli(app)
+
     # Configurazione database
     use_sqlite = os.getenv("USE_SQLITE", "false").lower() == "true"
     if use_sqlite:
@@ -216,7 +330,7 @@ def create_app():
                         "ALTER TABLE eventi "
                         "ADD COLUMN data_ora_chiusura_auto DATETIME NULL"
                     ))
-        
+
         staff_columns = inspector.get_columns("staff")
         ruolo_column = next((col for col in staff_columns if col["name"] == "ruolo"), None)
         desired_roles = ("admin", "barista", "ingressista")
@@ -264,6 +378,156 @@ def create_app():
         if app.logger:
             app.logger.error("Impossibile sincronizzare le migrazioni automatiche: %s", exc)
 
+    # Migrazione: eventi archiviati (dettaglio nelle tabelle *_archivio)
+    with _migrazione(app, "eventi archiviati"):
+        eventi_columns = {col["name"] for col in inspector.get_columns("eventi")}
+        if "archiviato_il" not in eventi_columns:
+            with engine.begin() as conn:
+                conn.execute(text(
+                    "ALTER TABLE eventi "
+                    "ADD COLUMN archiviato_il DATETIME NULL"
+                ))
+
+    # Migrazione: ledger fedeltà (movimenti senza evento + indice per saldo snapshot+coda)
+    with _migrazione(app, "ledger fedeltà"):
+        fedelta_columns = {col["name"]: col for col in inspector.get_columns("fedelta")}
+        if not fedelta_columns["evento_id"]["nullable"]:
+            if is_sqlite:
+                from app.models.fedeltà import Fedelta
+                _ricrea_tabella_sqlite(Fedelta.__table__, inspector)
+            else:
+                with engine.begin() as conn:
+                    conn.execute(text(
+                        "ALTER TABLE fedelta "
+                        "MODIFY evento_id INT NULL"
+                    ))
+        fedelta_indexes = {idx["name"] for idx in inspector.get_indexes("fedelta")}
+        if "ix_fedelta_cliente_seq" not in fedelta_indexes:
+            with engine.begin() as conn:
+                conn.execute(text(
+                    "CREATE INDEX ix_fedelta_cliente_seq "
+                    "ON fedelta (cliente_id, id_fedelta)"
+                ))
+
+    # Migrazione: indice su punti_fedelta per top-N/classifica senza full scan
+    with _migrazione(app, "indice punti fedeltà"):
+        clienti_indexes = {idx["name"] for idx in inspector.get_indexes("clienti")}
+        if "ix_clienti_punti_fedelta" not in clienti_indexes:
+            with engine.begin() as conn:
+                conn.execute(text(
+                    "CREATE INDEX ix_clienti_punti_fedelta "
+                    "ON clienti (punti_fedelta)"
+                ))
+
+    # Migrazione: inventario tavoli (claim atomico + contatore occupazione)
+    with _migrazione(app, "inventario tavoli"):
+        tavoli_columns = {col["name"] for col in inspector.get_columns("tavoli_evento")}
+        if "prenotazione_id" not in tavoli_columns or "occupati" not in tavoli_columns:
+            with engine.begin() as conn:
+                if "prenotazione_id" not in tavoli_columns:
+                    conn.execute(text(
+                        "ALTER TABLE tavoli_evento "
+                        "ADD COLUMN prenotazione_id INTEGER NULL"
+                    ))
+                    conn.execute(text(
+                        "CREATE UNIQUE INDEX ux_tavoli_evento_prenotazione "
+                        "ON tavoli_evento (prenotazione_id)"
+                    ))
+                if "occupati" not in tavoli_columns:
+                    conn.execute(text(
+                        "ALTER TABLE tavoli_evento "
+                        "ADD COLUMN occupati INTEGER NOT NULL DEFAULT 0"
+                    ))
+
+    # Migrazione: versione/updated_at per ETag e Last-Modified
+    with _migrazione(app, "versione/updated_at"):
+        for tabella in ("eventi", "prodotti", "tavoli_evento", "clienti"):
+            colonne = {col["name"] for col in inspector.get_columns(tabella)}
+            if "versione" not in colonne:
+                with engine.begin() as conn:
+                    conn.execute(text(
+                        f"ALTER TABLE {tabella} "
+                        f"ADD COLUMN versione INTEGER NOT NULL DEFAULT 1"
+                    ))
+            if "updated_at" not in colonne:
+                with engine.begin() as conn:
+                    # SQLite non accetta default non costanti in ADD COLUMN: valorizza dopo
+                    conn.execute(text(
+                        f"ALTER TABLE {tabella} "
+                        f"ADD COLUMN updated_at DATETIME NULL"
+                    ))
+                    conn.execute(text(
+                        f"UPDATE {tabella} SET updated_at = CURRENT_TIMESTAMP"
+                    ))
+
+    # Migrazione: indice (timestamp, id) per la paginazione keyset del log
+    with _migrazione(app, "indice log attività"):
+        log_indexes = {idx["name"] for idx in inspector.get_indexes("log_attivita")}
+        if "ix_log_attivita_ts_id" not in log_indexes:
+            with engine.begin() as conn:
+                conn.execute(text(
+                    "CREATE INDEX ix_log_attivita_ts_id "
+                    "ON log_attivita (timestamp, id_log)"
+                ))
+
+    # Migrazione: indici (evento, data, id) per le tab a cursore del dettaglio evento
+    with _migrazione(app, "indici dettaglio evento"):
+        for tabella, indice, colonne in (
+            ("ingressi", "ix_ingressi_evento_orario", "evento_id, orario_ingresso, id_ingresso"),
+            ("consumi", "ix_consumi_evento_data", "evento_id, data_consumo, id_consumo"),
+            ("feedback", "ix_feedback_evento_data", "evento_id, data_feedback, id_feedback"),
+        ):
+            if indice not in {idx["name"] for idx in inspector.get_indexes(tabella)}:
+                with engine.begin() as conn:
+                    conn.execute(text(f"CREATE INDEX {indice} ON {tabella} ({colonne})"))
+
+    # Migrazione: fasce orarie persistite (data lavorativa / ora della notte) per i grafici
+    with _migrazione(app, "fasce orarie persistite"):
+        from sqlalchemy import update
+        from app.models.ingressi import Ingresso
+        from app.models.consumi import Consumo
+        from app.utils.fasce_orarie import giorno_lavorativo, ora_della_notte
+        for model, orario, indici in (
+            (Ingresso, Ingresso.orario_ingresso, (
+                ("ix_ingressi_evento_ora_notte", "evento_id, ora_notte"),
+                ("ix_ingressi_data_lavorativa", "data_lavorativa"),
+            )),
+            (Consumo, Consumo.data_consumo, (
+                ("ix_consumi_evento_ora_notte", "evento_id, ora_notte"),
+                ("ix_consumi_data_lavorativa", "data_lavorativa, importo"),
+            )),
+        ):
+            tabella = model.__tablename__
+            colonne = {col["name"] for col in inspector.get_columns(tabella)}
+            if "data_lavorativa" not in colonne:
+                with engine.begin() as conn:
+                    conn.execute(text(f"ALTER TABLE {tabella} ADD COLUMN data_lavorativa DATE NULL"))
+                    conn.execute(text(f"ALTER TABLE {tabella} ADD COLUMN ora_notte SMALLINT NULL"))
+                    # Backfill in SQL con le stesse regole del calcolo in Python
+                    conn.execute(
+                        update(model)
+                        .where(orario.isnot(None))
+                        .values(data_lavorativa=giorno_lavorativo(orario), ora_notte=ora_della_notte(orario))
+                    )
+            esistenti = {idx["name"] for idx in inspector.get_indexes(tabella)}
+            for indice, colonne_indice in indici:
+                if indice not in esistenti:
+                    with engine.begin() as conn:
+                        conn.execute(text(f"CREATE INDEX {indice} ON {tabella} ({colonne_indice})"))
+
+    # Inventario tavoli ricostruito una volta dalle prenotazioni, dopo tutte le ALTER
+    # (flag in config_app: riparte anche sui database dove la prima migrazione era fallita)
+    with _migrazione(app, "ricostruzione inventario tavoli"):
+        from app.services.tavoli_inventario import ricostruisci_inventario
+        from app.utils.events import get_config_value, set_config_value
+        db = SessionLocal()
+        try:
+            if get_config_value(db, MIGRAZIONE_INVENTARIO_TAVOLI) is None:
+                ricostruisci_inventario(db)
+                set_config_value(db, MIGRAZIONE_INVENTARIO_TAVOLI, "1")
+        finally:
+            db.close()
+
     # Route root: reindirizza al login cliente (pubblico)
     @app.route("/")
     def root():
@@ -315,30 +579,65 @@ def create_app():
         except Exception:
             pass  # Non bloccare le richieste se c'è un errore
 
+    # Classifica/distribuzione fedeltà: costruite una volta se mancanti, poi incrementali
+    try:
+        from app.services.fedelta_classifica import inizializza as inizializza_classifica
+        db = SessionLocal()
+        try:
+            inizializza_classifica(db)
+        finally:
+            db.close()
+    except Exception as exc:
+        app.logger.error("Impossibile inizializzare la classifica fedeltà: %s", exc)
+
+    # Indice di ricerca clienti: costruito una volta se mancante, poi aggiornato a ogni modifica
+    try:
+        from app.services.ricerca_clienti import inizializza as inizializza_ricerca
+        db = SessionLocal()
+        try:
+            inizializza_ricerca(db)
+        finally:
+            db.close()
+    except Exception as exc:
+        app.logger.error("Impossibile inizializzare l'indice di ricerca clienti: %s", exc)
+
+    # Riprende i job in background interrotti da un riavvio (es. azzeramento punti).
+    # Con gunicorn in preload lo fa ogni worker dopo il fork (gunicorn.conf.py): i thread
+    # avviati qui resterebbero nel master
+    try:
+        if os.getenv("SERVER_PREFORK") != "1":
+            from app.utils.jobs import riprendi_job_interrotti
+            riprendi_job_interrotti()
+    except Exception as exc:
+        app.logger.error("Impossibile riprendere i job in background: %s", exc)
+
+    # Contatori mantenuti (tavoli in attesa, prenotazioni attive, ingressi per evento)
+    try:
+        from app.services.contatori import inizializza as inizializza_contatori
+        db = SessionLocal()
+        try:
+            inizializza_contatori(db)
+        finally:
+            db.close()
+    except Exception as exc:
+        app.logger.error("Impossibile inizializzare i contatori: %s", exc)
+
     # Context processor per conteggio prenotazioni tavolo in attesa (admin)
     @app.context_processor
     def inject_prenotazioni_tavolo_attesa():
-        """Aggiunge il conteggio delle prenotazioni tavolo in attesa a tutte le pagine admin"""
+        """Aggiunge il conteggio delle prenotazioni tavolo in attesa a tutte le pagine admin (dal contatore in cache)"""
         from flask import session, request
-        from app.database import SessionLocal
-        from app.models.prenotazioni import Prenotazione
-        
+        from app.services import contatori
+
         # Solo per pagine admin e se l'utente è admin
         if request.endpoint and request.endpoint.startswith(('prenotazioni.admin_', 'dashboard.admin_', 'eventi.admin_', 'clienti.admin_', 'ingressi.admin_', 'consumi.admin_', 'feedback.admin_', 'staff_admin.', 'prodotti.admin_', 'log.', 'stats.admin_')):
             # Verifica se l'utente è admin
             if session.get('staff_role') == 'admin':
-                db = SessionLocal()
                 try:
-                    count = db.query(Prenotazione).filter(
-                        Prenotazione.tipo == "tavolo",
-                        Prenotazione.stato_approvazione_tavolo == "in_attesa"
-                    ).count()
-                    return {'prenotazioni_tavolo_attesa_count': count}
+                    return {'prenotazioni_tavolo_attesa_count': contatori.tavoli_in_attesa()}
                 except Exception:
                     return {'prenotazioni_tavolo_attesa_count': 0}
-                finally:
-                    db.close()
-        
+
         return {'prenotazioni_tavolo_attesa_count': 0}
 
     return app
\ No newline at end of file
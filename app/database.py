@@ -1,5 +1,5 @@
 from contextlib import contextmanager
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, declarative_base
 from dotenv import load_dotenv
 import os
@@ -27,6 +27,15 @@ else:
 
 # Connessione
 engine = create_engine(SQLALCHEMY_DATABASE_URL, echo=False)
+
+if USE_SQLITE:
+    # SQLite applica le FK (e i loro ON DELETE CASCADE) solo se richiesto per connessione
+    @event.listens_for(engine, "connect")
+    def _abilita_foreign_keys(conn, _record):
+        cursore = conn.cursor()
+        cursore.execute("PRAGMA foreign_keys=ON")
+        cursore.close()
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -5,9 +5,18 @@ from app.models.prenotazioni import Prenotazione
 from app.models.ingressi import Ingresso
 from app.models.consumi import Consumo
 from app.models.fedeltà import Fedelta
+from app.models.fedelta_snapshot import FedeltaSnapshot
+from app.models.fedelta_classifica import ClassificaPunti, DistribuzioneLivelli
 from app.models.soglie_fedelta import SogliaFedelta
 from app.models.staff import Staff
 from app.models.feedback import Feedback
 from app.models.log_attivita import LogAttivita
 from app.models.prodotti import Prodotto
-from app.models.tavoli_evento import TavoloEvento
\ No newline at end of file
+from app.models.tavoli_evento import TavoloEvento
+from app.models.job_background import JobBackground
+from app.models.codici_pool import CodicePool
+from app.models.clienti_ricerca import ClienteRicerca
+from app.models.contatori import Contatore
+from app.models.archivio_eventi import (
+    IngressoArchivio, ConsumoArchivio, PrenotazioneArchivio, FedeltaArchivio, RiepilogoEvento, RiepilogoProdottoEvento,
+)
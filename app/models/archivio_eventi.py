@@ -0,0 +1,106 @@
+"""
+Archivio freddo degli eventi chiusi (vedi ``app/services/archivio_eventi.py``).
+
+Le tabelle ``*_archivio`` hanno le stesse colonne delle tabelle calde, così
+le select del dettaglio evento funzionano su entrambe cambiando solo il model.
+Restano solo le FK verso clienti ed eventi (in CASCADE): prenotazioni padre,
+staff, prodotti e tavoli possono sparire senza toccare lo storico.
+I riepiloghi conservano gli aggregati usati da statistiche e overview.
+"""
+from sqlalchemy import Column, Integer, String, DECIMAL, DateTime, ForeignKey, Index, Table
+from sqlalchemy.sql import func
+from app.database import Base
+from app.models.consumi import Consumo
+from app.models.fedeltà import Fedelta
+from app.models.ingressi import Ingresso
+from app.models.prenotazioni import Prenotazione
+
+FK_CONSERVATE = ("clienti", "eventi")
+
+
+def _tabella_archivio(model, nome: str, *indici) -> Table:
+    """Copia le colonne di ``model``: stessi nomi e tipi, id conservati, niente default"""
+    colonne = []
+    for c in model.__table__.columns:
+        fk = [
+            ForeignKey(f.target_fullname, ondelete="CASCADE", onupdate="CASCADE")
+            for f in c.foreign_keys if f.target_fullname.split(".")[0] in FK_CONSERVATE
+        ]
+        colonne.append(Column(c.name, c.type, *fk, primary_key=c.primary_key, nullable=c.nullable,
+                              autoincrement=False))
+    return Table(nome, Base.metadata, *colonne, *indici)
+
+
+class IngressoArchivio(Base):
+    __table__ = _tabella_archivio(
+        Ingresso, "ingressi_archivio",
+        Index("ix_ingressi_archivio_evento_orario", "evento_id", "orario_ingresso", "id_ingresso"),
+        Index("ix_ingressi_archivio_cliente", "cliente_id"),
+    )
+
+
+class ConsumoArchivio(Base):
+    __table__ = _tabella_archivio(
+        Consumo, "consumi_archivio",
+        Index("ix_consumi_archivio_evento_data", "evento_id", "data_consumo", "id_consumo"),
+        Index("ix_consumi_archivio_cliente", "cliente_id"),
+    )
+
+
+class PrenotazioneArchivio(Base):
+    __table__ = _tabella_archivio(
+        Prenotazione, "prenotazioni_archivio",
+        Index("ix_prenotazioni_archivio_evento", "evento_id", "id_prenotazione"),
+        Index("ix_prenotazioni_archivio_cliente", "cliente_id"),
+    )
+
+
+class FedeltaArchivio(Base):
+    __table__ = _tabella_archivio(
+        Fedelta, "fedelta_archivio",
+        Index("ix_fedelta_archivio_evento", "evento_id"),
+        Index("ix_fedelta_archivio_cliente_seq", "cliente_id", "id_fedelta"),
+    )
+
+
+class RiepilogoEvento(Base):
+    """Aggregati di un evento archiviato (stessi KPI di ``statistics._select_kpi``)"""
+    __tablename__ = "riepilogo_eventi"
+
+    evento_id = Column(Integer, ForeignKey("eventi.id_evento", ondelete="CASCADE", onupdate="CASCADE"),
+                       primary_key=True, autoincrement=False)
+    ingressi = Column(Integer, nullable=False, default=0)
+    prenotazioni = Column(Integer, nullable=False, default=0)
+    prenotazioni_lista = Column(Integer, nullable=False, default=0)
+    prenotazioni_tavolo = Column(Integer, nullable=False, default=0)
+    tavoli_in_attesa = Column(Integer, nullable=False, default=0)
+    tavoli_approvati = Column(Integer, nullable=False, default=0)
+    tavoli_rifiutati = Column(Integer, nullable=False, default=0)
+    revenue = Column(DECIMAL(12, 2), nullable=False, default=0)
+    num_ordini = Column(Integer, nullable=False, default=0)
+    punti_fedelta = Column(Integer, nullable=False, default=0)
+    log_archiviati = Column(Integer, nullable=False, default=0)
+    data_archiviazione = Column(DateTime, server_default=func.now())
+
+    def __repr__(self):
+        return f"<RiepilogoEvento(evento_id={self.evento_id}, ingressi={self.ingressi}, revenue={self.revenue})>"
+
+
+class RiepilogoProdottoEvento(Base):
+    """Vendite per prodotto di un evento archiviato (top prodotti e revenue per categoria)"""
+    __tablename__ = "riepilogo_eventi_prodotti"
+    __table_args__ = (
+        Index("ix_riepilogo_prodotti_prodotto", "prodotto_id"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    evento_id = Column(Integer, ForeignKey("eventi.id_evento", ondelete="CASCADE", onupdate="CASCADE"),
+                       nullable=False, index=True)
+    prodotto_id = Column(Integer, nullable=True)
+    prodotto = Column(String(100), nullable=False)
+    num_consumi = Column(Integer, nullable=False, default=0)
+    quantita = Column(Integer, nullable=False, default=0)
+    revenue = Column(DECIMAL(12, 2), nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<RiepilogoProdottoEvento(evento_id={self.evento_id}, prodotto='{self.prodotto}')>"
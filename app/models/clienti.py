@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Date, DateTime, Enum, Text
+from sqlalchemy import Column, Integer, String, Date, DateTime, Enum, Text, literal_column
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.database import Base
@@ -21,20 +21,24 @@ class Cliente(Base):
         Enum("base", "loyal", "premium", "vip", name="livello_enum"),
         default="base"
     )
-    punti_fedelta = Column(Integer, default=0)
+    punti_fedelta = Column(Integer, default=0, index=True)
     stato_account = Column(
         Enum("attivo", "disattivato", name="stato_account_enum"),
         nullable=False,
         default="attivo"
     )
     nota_staff = Column(Text, nullable=True)
+    # Versione/ultima modifica del profilo (ETag area personale)
+    versione = Column(Integer, nullable=False, default=1, server_default="1", onupdate=literal_column("versione + 1"))
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
 
     # 🔗 Relazioni ORM (back_populates definite nei moduli collegati)
-    prenotazioni = relationship("Prenotazione", back_populates="cliente", cascade="all, delete-orphan")
-    ingressi = relationship("Ingresso", back_populates="cliente", cascade="all, delete-orphan")
-    consumi = relationship("Consumo", back_populates="cliente", cascade="all, delete-orphan")
-    fedelta = relationship("Fedelta", back_populates="cliente", cascade="all, delete-orphan")
-    feedback = relationship("Feedback", back_populates="cliente", cascade="all, delete-orphan")
+    # passive_deletes: le righe collegate le elimina il DB (FK ON DELETE CASCADE)
+    prenotazioni = relationship("Prenotazione", back_populates="cliente", cascade="all, delete-orphan", passive_deletes=True)
+    ingressi = relationship("Ingresso", back_populates="cliente", cascade="all, delete-orphan", passive_deletes=True)
+    consumi = relationship("Consumo", back_populates="cliente", cascade="all, delete-orphan", passive_deletes=True)
+    fedelta = relationship("Fedelta", back_populates="cliente", cascade="all, delete-orphan", passive_deletes=True)
+    feedback = relationship("Feedback", back_populates="cliente", cascade="all, delete-orphan", passive_deletes=True)
 
     def __repr__(self):
         return f"<Cliente(id={self.id_cliente}, nome='{self.nome}', cognome='{self.cognome}')>"
\ No newline at end of file
@@ -0,0 +1,25 @@
+"""
+Indice di ricerca clienti: parole normalizzate e trigrammi di nome/cognome/telefono
+"""
+from sqlalchemy import Column, Integer, String, ForeignKey, Index
+from app.database import Base
+
+
+class ClienteRicerca(Base):
+    """
+    Una riga per token del cliente. ``tipo`` = 'p' (parola intera, per la
+    ricerca per prefisso) oppure 't' (trigramma, per la ricerca approssimata).
+    """
+    __tablename__ = "clienti_ricerca"
+    __table_args__ = (
+        Index("ix_clienti_ricerca_tipo_valore", "tipo", "valore", "cliente_id"),
+    )
+
+    id_token = Column(Integer, primary_key=True)
+    cliente_id = Column(Integer, ForeignKey("clienti.id_cliente", ondelete="CASCADE", onupdate="CASCADE"),
+                        nullable=False, index=True)
+    tipo = Column(String(1), nullable=False)
+    valore = Column(String(64), nullable=False)
+
+    def __repr__(self):
+        return f"<ClienteRicerca(cliente_id={self.cliente_id}, tipo='{self.tipo}', valore='{self.valore}')>"
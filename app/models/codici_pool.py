@@ -0,0 +1,20 @@
+"""
+Pool di codici univoci pregenerati (QR clienti, codici invito tavolo)
+"""
+from sqlalchemy import Column, Integer, String, DateTime, UniqueConstraint
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class CodicePool(Base):
+    """Codice libero già verificato come non usato: l'assegnazione lo elimina dal pool"""
+    __tablename__ = "codici_pool"
+    __table_args__ = (UniqueConstraint("tipo", "codice", name="uq_codici_pool_tipo_codice"),)
+
+    id_codice = Column(Integer, primary_key=True)
+    tipo = Column(String(20), nullable=False, index=True)  # qr | invito
+    codice = Column(String(20), nullable=False)
+    created_at = Column(DateTime, server_default=func.now())
+
+    def __repr__(self):
+        return f"<CodicePool(tipo='{self.tipo}', codice='{self.codice}')>"
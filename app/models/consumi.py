@@ -1,11 +1,17 @@
-from sqlalchemy import Column, Integer, String, DECIMAL, DateTime, Enum, Text, ForeignKey
+from sqlalchemy import Column, Integer, SmallInteger, String, DECIMAL, Date, DateTime, Enum, Text, ForeignKey, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.database import Base
+from app.utils.fasce_orarie import collega_fasce
 
 
 class Consumo(Base):
     __tablename__ = "consumi"
+    __table_args__ = (
+        Index("ix_consumi_evento_data", "evento_id", "data_consumo", "id_consumo"),  # tab del dettaglio evento (keyset)
+        Index("ix_consumi_evento_ora_notte", "evento_id", "ora_notte"),  # incassi per ora
+        Index("ix_consumi_data_lavorativa", "data_lavorativa", "importo"),  # trend incassi
+    )
 
     id_consumo = Column(Integer, primary_key=True, index=True)
     cliente_id = Column(Integer, ForeignKey("clienti.id_cliente", ondelete="CASCADE", onupdate="CASCADE"), nullable=False)
@@ -15,6 +21,9 @@ class Consumo(Base):
     prodotto = Column(String(100), nullable=False)
     importo = Column(DECIMAL(8, 2), nullable=False)
     data_consumo = Column(DateTime, server_default=func.now())
+    # Fasce calcolate al salvataggio (app/utils/fasce_orarie.py)
+    data_lavorativa = Column(Date, nullable=True)
+    ora_notte = Column(SmallInteger, nullable=True)
     punto_vendita = Column(
         Enum("bar", "tavolo", "privè", name="punto_vendita_enum"),
         nullable=False
@@ -28,4 +37,7 @@ class Consumo(Base):
     prodotto_rel = relationship("Prodotto", back_populates="consumi")
 
     def __repr__(self):
-        return f"<Consumo(id={self.id_consumo}, prodotto='{self.prodotto}', importo={self.importo})>"
\ No newline at end of file
+        return f"<Consumo(id={self.id_consumo}, prodotto='{self.prodotto}', importo={self.importo})>"
+
+
+collega_fasce(Consumo, "data_consumo")
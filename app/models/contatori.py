@@ -0,0 +1,19 @@
+"""
+Contatori mantenuti (prenotazioni tavolo in attesa, prenotazioni attive,
+ingressi per evento), aggiornati nella stessa transazione delle scritture
+(vedi ``app/services/contatori.py``)
+"""
+from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class Contatore(Base):
+    __tablename__ = "contatori"
+
+    nome = Column(String(50), primary_key=True)
+    valore = Column(Integer, nullable=False, default=0)
+    aggiornato_il = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<Contatore(nome='{self.nome}', valore={self.valore})>"
@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, Date, DateTime, Enum, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, Date, DateTime, Enum, ForeignKey, Boolean, literal_column
+from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.database import Base
 
@@ -36,14 +37,21 @@ class Evento(Base):
     # Orari operatività staff (determinano quando lo staff può operare)
     staff_open_at = Column(DateTime, nullable=True)  # Quando lo staff può iniziare a operare
     staff_close_at = Column(DateTime, nullable=True)  # Quando lo staff deve smettere di operare
+    # Versionamento per richieste condizionali (ETag/Last-Modified): cambia a ogni UPDATE, anche bulk
+    versione = Column(Integer, nullable=False, default=1, server_default="1", onupdate=literal_column("versione + 1"))
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+    # Dettaglio spostato nelle tabelle *_archivio (app/services/archivio_eventi.py)
+    archiviato_il = Column(DateTime, nullable=True)
 
     # 🔗 Relazioni ORM (verso le altre tabelle)
-    prenotazioni = relationship("Prenotazione", back_populates="evento", cascade="all, delete-orphan")
-    ingressi = relationship("Ingresso", back_populates="evento", cascade="all, delete-orphan")
-    consumi = relationship("Consumo", back_populates="evento", cascade="all, delete-orphan")
-    fedelta = relationship("Fedelta", back_populates="evento", cascade="all, delete-orphan")
-    feedback = relationship("Feedback", back_populates="evento", cascade="all, delete-orphan")
-    tavoli_evento = relationship("TavoloEvento", back_populates="evento", cascade="all, delete-orphan")
+    # passive_deletes: all'eliminazione le righe collegate le rimuove il DB (FK ON DELETE CASCADE),
+    # senza caricarle in memoria (vedi app/services/eliminazioni.py)
+    prenotazioni = relationship("Prenotazione", back_populates="evento", cascade="all, delete-orphan", passive_deletes=True)
+    ingressi = relationship("Ingresso", back_populates="evento", cascade="all, delete-orphan", passive_deletes=True)
+    consumi = relationship("Consumo", back_populates="evento", cascade="all, delete-orphan", passive_deletes=True)
+    fedelta = relationship("Fedelta", back_populates="evento", cascade="all, delete-orphan", passive_deletes=True)
+    feedback = relationship("Feedback", back_populates="evento", cascade="all, delete-orphan", passive_deletes=True)
+    tavoli_evento = relationship("TavoloEvento", back_populates="evento", cascade="all, delete-orphan", passive_deletes=True)
 
     def __repr__(self):
         return f"<Evento(id={self.id_evento}, nome='{self.nome_evento}', data={self.data_evento})>"
\ No newline at end of file
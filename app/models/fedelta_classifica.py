@@ -0,0 +1,28 @@
+"""
+Istogrammi precalcolati per classifica e distribuzione livelli fedeltà
+(aggiornati in modo incrementale a ogni variazione di punti/livello)
+"""
+from sqlalchemy import Column, Integer, String
+from app.database import Base
+
+
+class ClassificaPunti(Base):
+    """Quanti clienti hanno esattamente ``punti`` punti: rank = 1 + Σ n_clienti dei punteggi superiori"""
+    __tablename__ = "fedelta_classifica"
+
+    punti = Column(Integer, primary_key=True, autoincrement=False)
+    n_clienti = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<ClassificaPunti(punti={self.punti}, n={self.n_clienti})>"
+
+
+class DistribuzioneLivelli(Base):
+    """Numero di clienti per livello (valore salvato in clienti.livello)"""
+    __tablename__ = "fedelta_livelli"
+
+    livello = Column(String(20), primary_key=True)
+    n_clienti = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<DistribuzioneLivelli(livello='{self.livello}', n={self.n_clienti})>"
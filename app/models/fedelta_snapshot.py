@@ -0,0 +1,22 @@
+"""
+Snapshot periodici dei saldi fedeltà.
+
+Il ledger ``fedelta`` è append-only: il saldo di un cliente è
+``saldo`` dello snapshot + somma dei movimenti con ``id_fedelta`` successivo
+a ``ultimo_id_fedelta`` (la "coda" non ancora consolidata).
+"""
+from sqlalchemy import Column, Integer, DateTime, ForeignKey
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class FedeltaSnapshot(Base):
+    __tablename__ = "fedelta_snapshot"
+
+    cliente_id = Column(Integer, ForeignKey("clienti.id_cliente", ondelete="CASCADE", onupdate="CASCADE"), primary_key=True)
+    saldo = Column(Integer, nullable=False, default=0)
+    ultimo_id_fedelta = Column(Integer, nullable=False, default=0)  # sequenza ledger inclusa nello snapshot
+    data_snapshot = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<FedeltaSnapshot(cliente_id={self.cliente_id}, saldo={self.saldo}, seq={self.ultimo_id_fedelta})>"
@@ -1,15 +1,19 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.database import Base
 
 
 class Fedelta(Base):
+    """Movimento del ledger punti (append-only): id_fedelta è il numero di sequenza."""
     __tablename__ = "fedelta"
+    __table_args__ = (
+        Index("ix_fedelta_cliente_seq", "cliente_id", "id_fedelta"),
+    )
 
     id_fedelta = Column(Integer, primary_key=True, index=True)
     cliente_id = Column(Integer, ForeignKey("clienti.id_cliente", ondelete="CASCADE", onupdate="CASCADE"), nullable=False)
-    evento_id = Column(Integer, ForeignKey("eventi.id_evento", ondelete="CASCADE", onupdate="CASCADE"), nullable=False)
+    evento_id = Column(Integer, ForeignKey("eventi.id_evento", ondelete="CASCADE", onupdate="CASCADE"), nullable=True)  # NULL = rettifica/azzeramento
     punti = Column(Integer, nullable=False)
     motivo = Column(String(200))
     data_assegnazione = Column(DateTime, server_default=func.now())
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, SmallInteger, DateTime, Text, ForeignKey, CheckConstraint
+from sqlalchemy import Column, Integer, SmallInteger, DateTime, Text, ForeignKey, CheckConstraint, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.database import Base
@@ -23,6 +23,7 @@ class Feedback(Base):
         CheckConstraint("voto_ingresso BETWEEN 1 AND 10", name="chk_voto_ingresso"),
         CheckConstraint("voto_ambiente BETWEEN 1 AND 10", name="chk_voto_ambiente"),
         CheckConstraint("voto_servizio BETWEEN 1 AND 10", name="chk_voto_servizio"),
+        Index("ix_feedback_evento_data", "evento_id", "data_feedback", "id_feedback"),  # tab del dettaglio evento (keyset)
     )
 
     # 🔗 Relazioni ORM
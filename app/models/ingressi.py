@@ -1,11 +1,17 @@
-from sqlalchemy import Column, Integer, Enum, DateTime, Text, ForeignKey
+from sqlalchemy import Column, Integer, SmallInteger, Enum, Date, DateTime, Text, ForeignKey, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.database import Base
+from app.utils.fasce_orarie import collega_fasce
 
 
 class Ingresso(Base):
     __tablename__ = "ingressi"
+    __table_args__ = (
+        Index("ix_ingressi_evento_orario", "evento_id", "orario_ingresso", "id_ingresso"),  # tab del dettaglio evento (keyset)
+        Index("ix_ingressi_evento_ora_notte", "evento_id", "ora_notte"),  # affluenza oraria
+        Index("ix_ingressi_data_lavorativa", "data_lavorativa"),  # trend giornalieri
+    )
 
     id_ingresso = Column(Integer, primary_key=True, index=True)
     cliente_id = Column(Integer, ForeignKey("clienti.id_cliente", ondelete="CASCADE", onupdate="CASCADE"), nullable=False)
@@ -14,6 +20,9 @@ class Ingresso(Base):
     staff_id = Column(Integer, ForeignKey("staff.id_staff", ondelete="SET NULL", onupdate="CASCADE"), nullable=True)
     tipo_ingresso = Column(Enum("lista", "tavolo", "omaggio", "prevendita", name="tipo_ingresso_enum"), nullable=False)
     orario_ingresso = Column(DateTime, server_default=func.now())
+    # Fasce calcolate al salvataggio (app/utils/fasce_orarie.py)
+    data_lavorativa = Column(Date, nullable=True)
+    ora_notte = Column(SmallInteger, nullable=True)
     note = Column(Text)
 
     # 🔗 Relazioni ORM
@@ -23,4 +32,7 @@ class Ingresso(Base):
     staff = relationship("Staff", back_populates="ingressi")
 
     def __repr__(self):
-        return f"<Ingresso(id={self.id_ingresso}, tipo='{self.tipo_ingresso}', evento_id={self.evento_id})>"
\ No newline at end of file
+        return f"<Ingresso(id={self.id_ingresso}, tipo='{self.tipo_ingresso}', evento_id={self.evento_id})>"
+
+
+collega_fasce(Ingresso, "orario_ingresso")
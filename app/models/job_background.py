@@ -0,0 +1,39 @@
+"""
+Job in background (operazioni massive a lotti, riprendibili dopo un crash)
+"""
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class JobBackground(Base):
+    """Stato persistente di un job: il cursore viene salvato nella stessa transazione di ogni lotto"""
+    __tablename__ = "job_background"
+
+    id_job = Column(Integer, primary_key=True, index=True)
+    tipo = Column(String(50), nullable=False, index=True)
+    stato = Column(String(20), nullable=False, default="in_coda")  # in_coda | in_corso | completato | errore
+    cursore = Column(Integer, nullable=False, default=0)  # ultima chiave elaborata
+    processati = Column(Integer, nullable=False, default=0)
+    totale = Column(Integer, nullable=True)
+    parametri = Column(Text, nullable=True)  # JSON
+    errore = Column(String(255), nullable=True)
+    staff_id = Column(Integer, ForeignKey("staff.id_staff", ondelete="SET NULL", onupdate="CASCADE"), nullable=True)
+    heartbeat = Column(DateTime, nullable=True)  # ultimo segno di vita del worker
+    created_at = Column(DateTime, server_default=func.now())
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+    @property
+    def percentuale(self):
+        if self.stato == "completato":
+            return 100
+        if not self.totale:
+            return 0
+        return min(100, int(self.processati * 100 / self.totale))
+
+    @property
+    def attivo(self):
+        return self.stato in ("in_coda", "in_corso")
+
+    def __repr__(self):
+        return f"<JobBackground(id={self.id_job}, tipo='{self.tipo}', stato='{self.stato}')>"
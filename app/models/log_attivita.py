@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Enum, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Enum, DateTime, ForeignKey, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.database import Base
@@ -6,6 +6,9 @@ from app.database import Base
 
 class LogAttivita(Base):
     __tablename__ = "log_attivita"
+    __table_args__ = (
+        Index("ix_log_attivita_ts_id", "timestamp", "id_log"),  # cursore keyset del registro
+    )
 
     id_log = Column(Integer, primary_key=True, index=True)
     tabella = Column(String(50), nullable=False)
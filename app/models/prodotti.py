@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, DECIMAL, Boolean
+from sqlalchemy import Column, Integer, String, DECIMAL, Boolean, DateTime, literal_column
+from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.database import Base
 
@@ -11,6 +12,9 @@ class Prodotto(Base):
     prezzo = Column(DECIMAL(8, 2), nullable=False)
     categoria = Column(String(50), nullable=True)
     attivo = Column(Boolean, default=True)
+    # Versione riga: cambia a ogni modifica del prodotto (ETag del listino)
+    versione = Column(Integer, nullable=False, default=1, server_default="1", onupdate=literal_column("versione + 1"))
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
 
     # 🔗 Relazioni ORM
     consumi = relationship("Consumo", back_populates="prodotto_rel")
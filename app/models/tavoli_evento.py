@@ -1,7 +1,8 @@
 """
 Modello per gestire i tavoli disponibili per evento
 """
-from sqlalchemy import Column, Integer, String, ForeignKey, Boolean, Enum
+from sqlalchemy import Column, Integer, String, ForeignKey, Boolean, Enum, DateTime, literal_column
+from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.database import Base
 
@@ -17,6 +18,13 @@ class TavoloEvento(Base):
     capienza = Column(Integer, default=4)  # Capienza massima del tavolo
     prezzo_minimo = Column(Integer, default=None)  # Prezzo minimo consumo opzionale
     attivo = Column(Boolean, default=True, nullable=False)  # Se il tavolo è disponibile per prenotazioni
+    # Inventario: prenotazione referente che "tiene" il tavolo (claim atomico) e posti occupati
+    # (senza FK per non creare un ciclo con prenotazioni.numero_tavolo; i claim orfani sono riassegnabili)
+    prenotazione_id = Column(Integer, nullable=True, unique=True)
+    occupati = Column(Integer, nullable=False, default=0)
+    # Versione riga e ultima modifica (cache HTTP)
+    versione = Column(Integer, nullable=False, default=1, server_default="1", onupdate=literal_column("versione + 1"))
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
     
     # 🔗 Relazioni
     evento = relationship("Evento", back_populates="tavoli_evento")
@@ -10,6 +10,7 @@ from app.routes.staff import staff_bp, staff_admin_bp
 from app.routes.log_attivita import log_bp
 from app.routes.prodotti import prodotti_bp
 from app.routes.stats import stats_bp
+from app.routes.esportazioni import esportazioni_bp
 
 # Esportiamo tutti i blueprint in una lista centralizzata
 # Nota: staff_bp e staff_admin_bp sono registrati manualmente in app/__init__.py
@@ -26,4 +27,5 @@ all_blueprints = [
     log_bp,
     prodotti_bp,
     stats_bp,
+    esportazioni_bp,
 ]
\ No newline at end of file
@@ -5,9 +5,9 @@ from app.database import SessionLocal
 from app.models.clienti import Cliente
 from app.models.staff import Staff
 from werkzeug.security import generate_password_hash, check_password_hash
-from app.utils.qr import generate_short_code
 from app.utils.auth import hash_password
 from app.utils.limiter import limiter
+from app.services import fedelta_classifica, codici_pool, ricerca_clienti
 import os
 
 auth_bp = Blueprint("auth", __name__, url_prefix="/auth")
@@ -56,12 +56,6 @@ def _deve_avere_password_chiaro(nome: str, cognome: str, telefono: str) -> bool:
 # -----------------------
 # Helpers
 # -----------------------
-def _generate_unique_qr(db) -> str:
-    while True:
-        code = generate_short_code(10)
-        if not db.query(Cliente).filter_by(qr_code=code).first():
-            return code
-
 def _clear_identities():
     # Sgombera eventuali sessioni pregresse
     session.pop("cliente_id", None)
@@ -147,7 +141,7 @@ def auth_register_submit():
 
     db = SessionLocal()
     try:
-        qr = _generate_unique_qr(db)
+        qr = codici_pool.assegna_codice(db, "qr")
         
         # Controlla se questo utente (nome + cognome + telefono) deve avere password in chiaro
         password_da_salvare = password if _deve_avere_password_chiaro(nome, cognome, telefono) else generate_password_hash(password)
@@ -165,6 +159,9 @@ def auth_register_submit():
             stato_account="attivo"
         )
         db.add(nuovo)
+        db.flush()
+        ricerca_clienti.indicizza(db, nuovo)
+        fedelta_classifica.cliente_aggiunto(db, 0, "base")
         db.commit()
         _clear_identities()
         session["cliente_id"] = nuovo.id_cliente
@@ -1,4 +1,4 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session, abort
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, abort, make_response
 from sqlalchemy import func
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import joinedload
@@ -8,9 +8,15 @@ from app.models.prenotazioni import Prenotazione
 from app.models.eventi import Evento
 from app.models.ingressi import Ingresso
 from app.models.consumi import Consumo
-from app.utils.qr import qr_data_url
+from app.services import qr_clienti
 from app.utils.auth import hash_password
 from app.routes.fedelta import get_thresholds, compute_level, next_threshold_info
+from app.services.fedelta_ledger import registra_movimento, saldo_da_ledger
+from app.services import archivio_eventi, eliminazioni, fedelta_classifica, ricerca_clienti
+from app.services.versioni_contenuti import firma_area_personale
+from app.services.esportazioni import registra_esportazione
+from app.utils.http_cache import condizionale
+from app.utils.paginazione import pagina_keyset, per_page_richiesto, imposta_totale, richiesta_json, risposta_json
 from app.utils.decorators import require_cliente, require_admin
 from app.utils.events import get_evento_operativo
 from app.utils.helpers import get_current_cliente as current_cliente
@@ -26,6 +32,7 @@ dashboard_bp = Blueprint("dashboard", __name__, url_prefix="/dashboard")
 # -----------------------
 @clienti_bp.route("/me", methods=["GET"])
 @require_cliente
+@condizionale(firma_area_personale)
 def area_personale():
     db = SessionLocal()
     try:
@@ -34,8 +41,8 @@ def area_personale():
             session.pop("cliente_id", None)
             flash("La tua sessione non è più valida. Effettua di nuovo l'accesso.", "warning")
             return redirect(url_for("auth.auth_login_cliente_form"))
-        # Prepara QR in data URL per embed
-        qr_url = qr_data_url(cli.qr_code) if cli and cli.qr_code else None
+        # QR servito a parte (URL con impronta, cache immutabile) invece che inline in base64
+        qr_impronta = qr_clienti.impronta_qr(cli.qr_code) if cli.qr_code else None
 
         prenotazioni_future = (
             db.query(Prenotazione)
@@ -96,13 +103,14 @@ def area_personale():
             progress = int(100 * (points - prev_min) / denom)
         else:
             progress = 100
+        posizione = fedelta_classifica.posizione_cliente(db, points)
 
         # storico (se le relazioni sono mappate)
         # carica lazy-safe (puoi ottimizzare quando definisci i modelli collegati)
         return render_template(
             "clienti/me.html",
             cliente=cli,
-            qr_url=qr_url,
+            qr_impronta=qr_impronta,
             prenotazioni_future=prenotazioni_future,
             prenotazioni_passate=prenotazioni_passate,
             ultimo_ingresso=ultimo_ingresso,
@@ -111,11 +119,39 @@ def area_personale():
             current_level=current_level,
             next_level=nxt,
             to_go=to_go,
-            progress=progress
+            progress=progress,
+            posizione=posizione
         )
     finally:
         db.close()
 
+@clienti_bp.route("/me/qr/<impronta>.<formato>", methods=["GET"])
+@require_cliente
+def qr_immagine(impronta, formato):
+    """Immagine del QR personale (svg/png): stesso URL = stessi byte, cache immutabile"""
+    if formato not in qr_clienti.FORMATI:
+        abort(404)
+    db = SessionLocal()
+    try:
+        qr_code = db.query(Cliente.qr_code).filter(Cliente.id_cliente == session.get("cliente_id")).scalar()
+    finally:
+        db.close()
+    if not qr_code:
+        abort(404)
+    attuale = qr_clienti.impronta_qr(qr_code)
+    if impronta != attuale:
+        # QR rigenerato o link vecchio: rimanda all'immagine corrente
+        resp = redirect(url_for("clienti.qr_immagine", impronta=attuale, formato=formato))
+        resp.headers["Cache-Control"] = "private, no-cache"
+        return resp
+
+    resp = make_response(qr_clienti.immagine_qr(qr_code, formato))
+    resp.mimetype = qr_clienti.mimetype_qr(formato)
+    resp.set_etag(f"{attuale}-{formato}")
+    resp.headers["Cache-Control"] = f"private, max-age={qr_clienti.MAX_AGE}, immutable"
+    return resp.make_conditional(request)
+
+
 @clienti_bp.route("/me/edit", methods=["GET", "POST"])
 @require_cliente
 def me_edit():
@@ -127,7 +163,10 @@ def me_edit():
 
         # POST: aggiornamento campi consentiti
         nuovo_telefono = request.form.get("telefono", cli.telefono).strip()
-        cli.telefono = nuovo_telefono
+        if nuovo_telefono != cli.telefono:
+            cli.telefono = nuovo_telefono
+            db.flush()
+            ricerca_clienti.indicizza(db, cli)
         cli.citta = request.form.get("citta", cli.citta).strip() or None
 
         # opzionale: cambio password
@@ -349,25 +388,25 @@ def admin_dashboard():
                           .limit(5).all()
         
         # Trend temporali per grafici
-        date_expr_ingressi = func.date(Ingresso.orario_ingresso)
+        date_expr_ingressi = Ingresso.data_lavorativa
         ingressi_trend_rows = (
             db.query(
                 date_expr_ingressi.label("giorno"),
                 func.count(Ingresso.id_ingresso).label("totale")
             )
-            .filter(Ingresso.orario_ingresso >= start_period)
+            .filter(Ingresso.data_lavorativa >= start_period.date())
             .group_by(date_expr_ingressi)
             .order_by(date_expr_ingressi)
             .all()
         )
 
-        date_expr_consumi = func.date(Consumo.data_consumo)
+        date_expr_consumi = Consumo.data_lavorativa
         consumi_trend_rows = (
             db.query(
                 date_expr_consumi.label("giorno"),
                 func.coalesce(func.sum(Consumo.importo), 0).label("totale")
             )
-            .filter(Consumo.data_consumo >= start_period)
+            .filter(Consumo.data_lavorativa >= start_period.date())
             .group_by(date_expr_consumi)
             .order_by(date_expr_consumi)
             .all()
@@ -629,13 +668,13 @@ def admin_statistics():
 
         max_range_days = max(valid_ranges)
         temporal_start = now - timedelta(days=max_range_days)
-        date_expr = func.date(Ingresso.orario_ingresso)
+        date_expr = Ingresso.data_lavorativa
         ingressi_temporali_rows = (
             db.query(
                 date_expr.label("giorno"),
                 func.count(Ingresso.id_ingresso).label("tot_slot")
             )
-            .filter(Ingresso.orario_ingresso >= temporal_start)
+            .filter(Ingresso.data_lavorativa >= temporal_start.date())
             .group_by(date_expr)
             .order_by(date_expr)
             .all()
@@ -774,50 +813,66 @@ def admin_dashboard_legacy():
 # -----------------------
 # ADMIN — Lista clienti
 # -----------------------
+def _filtro_lista(args) -> dict:
+    """Filtri della lista admin dalla query string (condivisi con l'esportazione)"""
+    return {
+        "q": (args.get("q") or "").strip(),
+        "stato": args.get("stato"),  # 'attivo'/'disattivato'/None
+        "livello": args.get("livello"),  # 'base'/'loyal'/'premium'/'vip'/None
+    }
+
+
+def _query_lista(db, filtro: dict):
+    q = db.query(Cliente)
+    if filtro["q"]:
+        q = q.filter(ricerca_clienti.filtro_clienti(db, filtro["q"]))
+    if filtro["stato"] in ("attivo", "disattivato"):
+        q = q.filter(Cliente.stato_account == filtro["stato"])
+    if filtro["livello"] in ("base", "loyal", "premium", "vip"):
+        q = q.filter(Cliente.livello == filtro["livello"])
+    return q
+
+
+@registra_esportazione("clienti", _filtro_lista)
+def _esporta_lista(db, filtro: dict):
+    # Niente password né QR: solo anagrafica e fedeltà
+    return _query_lista(db, filtro).with_entities(
+        Cliente.id_cliente.label("id_cliente"),
+        Cliente.nome.label("nome"),
+        Cliente.cognome.label("cognome"),
+        Cliente.telefono.label("telefono"),
+        Cliente.citta.label("citta"),
+        Cliente.data_nascita.label("data_nascita"),
+        Cliente.data_registrazione.label("data_registrazione"),
+        Cliente.ultimo_accesso.label("ultimo_accesso"),
+        Cliente.livello.label("livello"),
+        Cliente.punti_fedelta.label("punti_fedelta"),
+        Cliente.stato_account.label("stato_account"),
+    ).order_by(Cliente.id_cliente.desc())
+
+
 @clienti_bp.route("/admin/list", methods=["GET"])
 @require_admin
 def admin_lista_clienti():
     db = SessionLocal()
     try:
-        from sqlalchemy import func
-        
-        # Parametri paginazione
-        page = request.args.get("page", 1, type=int)
-        per_page = request.args.get("per_page", 50, type=int)
-        per_page = min(max(per_page, 10), 200)  # Limite tra 10 e 200
-        
-        # Filtri
-        search = request.args.get("q", "").strip()
-        stato = request.args.get("stato")  # 'attivo'/'disattivato'/None
-        livello = request.args.get("livello")  # 'base'/'loyal'/'premium'/'vip'/None
-        
-        # Query base
-        q = db.query(Cliente)
-        
-        # Applica filtri
-        if search:
-            q = q.filter(
-                (Cliente.nome.ilike(f"%{search}%")) |
-                (Cliente.cognome.ilike(f"%{search}%")) |
-                (Cliente.telefono.ilike(f"%{search}%"))
-            )
-        if stato in ("attivo", "disattivato"):
-            q = q.filter(Cliente.stato_account == stato)
-        if livello in ("base", "loyal", "premium", "vip"):
-            q = q.filter(Cliente.livello == livello)
-        
-        # Conta totale risultati
-        total = q.count()
-        
-        # Applica paginazione
-        clienti = q.order_by(Cliente.id_cliente.desc())\
-                   .offset((page - 1) * per_page)\
-                   .limit(per_page)\
-                   .all()
-        
+        per_page = per_page_richiesto()
+
+        filtro = _filtro_lista(request.args)
+        search, stato, livello = filtro["q"], filtro["stato"], filtro["livello"]
+        q = _query_lista(db, filtro)
+
+        # Paginazione a cursore sull'id (niente COUNT/OFFSET sull'intera tabella)
+        pagina = pagina_keyset(
+            q, [(Cliente.id_cliente, True)],
+            prima=request.args.get("prima"), dopo=request.args.get("dopo"), per_page=per_page,
+            parametri=filtro,
+        )
+        clienti = pagina.righe
+
         # Calcola statistiche totali (solo se non ci sono filtri per performance)
         stats = None
-        if not search and not stato and not livello:
+        if not search and not stato and not livello and not richiesta_json():
             stats = {
                 'total': db.query(func.count(Cliente.id_cliente)).scalar() or 0,
                 'attivi': db.query(func.count(Cliente.id_cliente)).filter(Cliente.stato_account == 'attivo').scalar() or 0,
@@ -834,27 +889,21 @@ def admin_lista_clienti():
                 .all()
             )
             ultimo_ingressi = {cid: data for cid, data in ultime_date}
-        
-        # Calcola numero di pagine
-        total_pages = (total + per_page - 1) // per_page if total > 0 else 1
-        
-        # Calcola range pagine da mostrare (max 5 pagine intorno alla corrente)
-        start_page = max(1, page - 2)
-        end_page = min(total_pages, page + 2)
-        pages_list = list(range(start_page, end_page + 1))
-        
+
+        if richiesta_json():
+            return risposta_json(pagina, "admin/_righe_clienti.html", clienti=clienti, ultimo_ingressi=ultimo_ingressi)
+        imposta_totale(pagina, db, q, Cliente)
+
         return render_template("admin/clienti_list.html", 
                              clienti=clienti, 
                              search=search,
                              stato=stato,
                              livello=livello,
-                             page=page,
                              per_page=per_page,
-                             total=total,
-                             total_pages=total_pages,
-                             pages_list=pages_list,
+                             pagina=pagina,
                              stats=stats,
-                             ultimo_ingressi=ultimo_ingressi)
+                             ultimo_ingressi=ultimo_ingressi,
+                             eliminazioni=eliminazioni.eliminazioni_in_corso(db, "cliente"))
     finally:
         db.close()
 
@@ -880,7 +929,13 @@ def admin_cliente_detail(cliente_id):
         tot_ingressi = db.query(func.count(Ingresso.id_ingresso)).filter(Ingresso.cliente_id == cliente_id).scalar() or 0
         tot_consumi = db.query(func.sum(Consumo.importo)).filter(Consumo.cliente_id == cliente_id).scalar() or 0
         tot_consumi = float(tot_consumi) if tot_consumi else 0
-        tot_punti = db.query(func.sum(Fedelta.punti)).filter(Fedelta.cliente_id == cliente_id).scalar() or 0
+        # Saldo dal ledger (snapshot + coda): include i movimenti già archiviati
+        tot_punti = saldo_da_ledger(db, cliente_id)
+        # Eventi archiviati: il dettaglio è nelle tabelle *_archivio
+        archivio = archivio_eventi.totali_archivio_cliente(db, cliente_id)
+        tot_prenotazioni += archivio["prenotazioni"]
+        tot_ingressi += archivio["ingressi"]
+        tot_consumi += archivio["consumi"]
         
         # Ultime attività
         ultime_prenotazioni = (
@@ -911,7 +966,7 @@ def admin_cliente_detail(cliente_id):
         )
         
         movimenti_fedelta = db.query(Fedelta, Evento)\
-                             .join(Evento, Evento.id_evento == Fedelta.evento_id)\
+                             .outerjoin(Evento, Evento.id_evento == Fedelta.evento_id)\
                              .filter(Fedelta.cliente_id == cliente_id)\
                              .order_by(Fedelta.data_assegnazione.desc())\
                              .limit(10).all()
@@ -967,6 +1022,7 @@ def admin_set_level(cliente_id):
     try:
         cli = db.query(Cliente).get(cliente_id)
         if not cli: abort(404)
+        fedelta_classifica.sposta_livello(db, cli.livello or "base", livello)
         cli.livello = livello
         db.commit()
         flash("✓ Livello cliente aggiornato con successo.", "success")
@@ -982,8 +1038,11 @@ def admin_adjust_points(cliente_id):
     try:
         cli = db.query(Cliente).get(cliente_id)
         if not cli: abort(404)
-        cli.punti_fedelta = max(0, (cli.punti_fedelta or 0) + delta)
-        db.commit()
+        # La rettifica non porta il saldo sotto zero: nel ledger finisce il delta effettivo
+        delta = max(delta, -(cli.punti_fedelta or 0))
+        if delta:
+            registra_movimento(db, cliente_id, delta, "Rettifica manuale admin")
+            db.commit()
         flash("✓ Punti fedeltà aggiornati con successo.", "success")
         return redirect(url_for("clienti.admin_cliente_detail", cliente_id=cliente_id))
     finally:
@@ -996,9 +1055,11 @@ def admin_deactivate(cliente_id):
     try:
         cli = db.query(Cliente).get(cliente_id)
         if not cli: abort(404)
-        db.delete(cli)
-        db.commit()
-        flash("Cliente eliminato definitivamente.", "warning")
+        job = eliminazioni.elimina(db, "cliente", cli, staff_id=session.get("staff_id"))
+        if job:
+            flash(f"Eliminazione del cliente avviata in background (job #{job.id_job}).", "info")
+        else:
+            flash("Cliente eliminato definitivamente.", "warning")
         return redirect(url_for("clienti.admin_lista_clienti"))
     finally:
         db.close()
@@ -1022,9 +1083,11 @@ def admin_delete(cliente_id):
         cli = db.query(Cliente).get(cliente_id)
         if not cli:
             abort(404)
-        db.delete(cli)
-        db.commit()
-        flash("Cliente eliminato definitivamente.", "warning")
+        job = eliminazioni.elimina(db, "cliente", cli, staff_id=session.get("staff_id"))
+        if job:
+            flash(f"Eliminazione del cliente avviata in background (job #{job.id_job}).", "info")
+        else:
+            flash("Cliente eliminato definitivamente.", "warning")
         return redirect(url_for("clienti.admin_lista_clienti"))
     finally:
         db.close()
@@ -17,6 +17,11 @@ from app.models.ingressi import Ingresso
 from app.models.consumi import Consumo
 from app.models.staff import Staff
 from app.routes.fedelta import award_on_consumo
+from app.utils.http_cache import condizionale
+from app.utils.paginazione import pagina_keyset, per_page_richiesto, imposta_totale, richiesta_json, risposta_json
+from app.services.versioni_contenuti import firma_listino_staff
+from app.services import ricerca_clienti
+from app.services.esportazioni import registra_esportazione
 
 # Supporto opzionale catalogo prodotti (se esiste il modello)
 try:
@@ -73,7 +78,7 @@ def staff_cliente_info():
 @require_staff
 def staff_search_cliente():
     """
-    Cerca clienti per nome/cognome con autocomplete.
+    Cerca clienti per nome/cognome/telefono con autocomplete (indice `clienti_ricerca`).
     Restituisce lista di clienti trovati con id, nome, cognome.
     """
     data = request.get_json(silent=True) or {}
@@ -90,23 +95,19 @@ def staff_search_cliente():
         if evento.stato_pubblico == "chiuso" or not evento.is_staff_operativo:
             return jsonify({"ok": False, "reason": "event_closed"}), 409
 
-        # Ricerca per nome o cognome (case-insensitive, wildcard)
-        search_term = f"%{query}%"
-        clienti = db.query(Cliente).filter(
-            (Cliente.nome.ilike(search_term)) | (Cliente.cognome.ilike(search_term))
-        ).limit(10).all()
-
-        # Ritorna solo clienti con ingresso all'evento
-        result = []
-        for cli in clienti:
-            has_ingresso = cliente_has_ingresso(db, cli.id_cliente, evento.id_evento)
-            result.append({
-                "id": cli.id_cliente,
-                "nome": cli.nome,
-                "cognome": cli.cognome,
-                "qr": cli.qr_code,
-                "ha_ingresso": has_ingresso
-            })
+        # Ricerca indicizzata (prefisso, poi approssimata); ingresso all'evento nella stessa query
+        risultati = ricerca_clienti.cerca(
+            db, query, limite=10, evento_id=evento.id_evento,
+            solo_entrati=bool(data.get("solo_entrati")),
+        )
+        result = [{
+            "id": r.cliente.id_cliente,
+            "nome": r.cliente.nome,
+            "cognome": r.cliente.cognome,
+            "qr": r.cliente.qr_code,
+            "ha_ingresso": r.ha_ingresso,
+            "approssimato": r.approssimato,
+        } for r in risultati]
 
         return jsonify({"ok": True, "clienti": result}), 200
     finally:
@@ -209,6 +210,7 @@ def miei():
 # ============================================
 @consumi_bp.route("/staff/listino", methods=["GET"])
 @require_staff
+@condizionale(firma_listino_staff)
 def staff_listino():
     """Visualizza il listino prodotti per lo staff"""
     db = SessionLocal()
@@ -523,64 +525,89 @@ def staff_new():
 # ============================================
 # 👑 ADMIN — Liste/Filtri, CRUD, Analytics
 # ============================================
+def _filtro_lista(args) -> dict:
+    """Filtri della lista admin dalla query string (condivisi con l'esportazione)"""
+    return {
+        "evento_id": args.get("evento_id", type=int),
+        "staff_id": args.get("staff_id", type=int),
+        "punto_vendita": args.get("punto_vendita"),
+        "prodotto": (args.get("prodotto") or "").strip(),
+        "dal": args.get("dal"),
+        "al": args.get("al"),
+        "cerca_nome": (args.get("cerca_nome") or "").strip(),
+    }
+
+
+def _query_lista(db, filtro: dict):
+    q = db.query(Consumo, Cliente, Evento).join(Cliente, Cliente.id_cliente == Consumo.cliente_id) \
+                                          .join(Evento, Evento.id_evento == Consumo.evento_id)
+
+    if filtro["evento_id"]: q = q.filter(Consumo.evento_id == filtro["evento_id"])
+    if filtro["staff_id"]:  q = q.filter(Consumo.staff_id == filtro["staff_id"])
+    if filtro["punto_vendita"] in PUNTI_CONSENTITI: q = q.filter(Consumo.punto_vendita == filtro["punto_vendita"])
+    if filtro["prodotto"]: q = q.filter(Consumo.prodotto.ilike(f"%{filtro['prodotto']}%"))
+    if filtro["cerca_nome"]:
+        cerca_pattern = f"%{filtro['cerca_nome']}%"
+        q = q.filter(
+            or_(
+                func.lower(Cliente.nome).like(func.lower(cerca_pattern)),
+                func.lower(Cliente.cognome).like(func.lower(cerca_pattern)),
+                func.lower(func.concat(Cliente.nome, ' ', Cliente.cognome)).like(func.lower(cerca_pattern))
+            )
+        )
+    if filtro["dal"]:
+        try:
+            d = datetime.strptime(filtro["dal"], "%Y-%m-%d")
+            q = q.filter(Consumo.data_consumo >= d)
+        except ValueError: pass
+    if filtro["al"]:
+        try:
+            d2 = datetime.strptime(filtro["al"], "%Y-%m-%d") + timedelta(days=1)
+            q = q.filter(Consumo.data_consumo < d2)
+        except ValueError: pass
+    return q
+
+
+@registra_esportazione("consumi", _filtro_lista)
+def _esporta_lista(db, filtro: dict):
+    return _query_lista(db, filtro).outerjoin(Staff, Staff.id_staff == Consumo.staff_id).with_entities(
+        Consumo.id_consumo.label("id_consumo"),
+        Consumo.data_consumo.label("data"),
+        Evento.nome_evento.label("evento"),
+        Cliente.id_cliente.label("id_cliente"),
+        Cliente.nome.label("nome"),
+        Cliente.cognome.label("cognome"),
+        Consumo.prodotto.label("prodotto"),
+        Consumo.importo.label("importo"),
+        Consumo.punto_vendita.label("punto_vendita"),
+        Staff.nome.label("staff"),
+        Consumo.note.label("note"),
+    ).order_by(Consumo.data_consumo.desc(), Consumo.id_consumo.desc())
+
+
 @consumi_bp.route("/admin", methods=["GET"])
 @require_admin
 def admin_list():
     db = SessionLocal()
     try:
-        evento_id = request.args.get("evento_id", type=int)
-        staff_id = request.args.get("staff_id", type=int)
-        punto = request.args.get("punto_vendita")
-        qprod = (request.args.get("prodotto") or "").strip()
-        dal = request.args.get("dal")
-        al  = request.args.get("al")
-        cerca_nome = request.args.get("cerca_nome", "").strip()
-
-        q = db.query(Consumo, Cliente, Evento).join(Cliente, Cliente.id_cliente == Consumo.cliente_id) \
-                                              .join(Evento, Evento.id_evento == Consumo.evento_id)
-
-        if evento_id: q = q.filter(Consumo.evento_id == evento_id)
-        if staff_id:  q = q.filter(Consumo.staff_id == staff_id)
-        if punto in PUNTI_CONSENTITI: q = q.filter(Consumo.punto_vendita == punto)
-        if qprod: q = q.filter(Consumo.prodotto.ilike(f"%{qprod}%"))
-        if cerca_nome:
-            cerca_pattern = f"%{cerca_nome}%"
-            q = q.filter(
-                or_(
-                    func.lower(Cliente.nome).like(func.lower(cerca_pattern)),
-                    func.lower(Cliente.cognome).like(func.lower(cerca_pattern)),
-                    func.lower(func.concat(Cliente.nome, ' ', Cliente.cognome)).like(func.lower(cerca_pattern))
-                )
-            )
-        if dal:
-            try:
-                d = datetime.strptime(dal, "%Y-%m-%d")
-                q = q.filter(Consumo.data_consumo >= d)
-            except ValueError: pass
-        if al:
-            try:
-                d2 = datetime.strptime(al, "%Y-%m-%d") + timedelta(days=1)
-                q = q.filter(Consumo.data_consumo < d2)
-            except ValueError: pass
-
-        rows = q.options(joinedload(Consumo.cliente), joinedload(Consumo.evento)) \
-                .order_by(Consumo.data_consumo.desc()) \
-                .all()
+        filtro = _filtro_lista(request.args)
+        q = _query_lista(db, filtro)
+
+        # Cliente ed evento arrivano già dalla join: niente joinedload, una pagina alla volta
+        pagina = pagina_keyset(
+            q, [(Consumo.data_consumo, True), (Consumo.id_consumo, True)],
+            prima=request.args.get("prima"), dopo=request.args.get("dopo"), per_page=per_page_richiesto(),
+            parametri=filtro,
+        )
+        rows = pagina.righe
+        if richiesta_json():
+            return risposta_json(pagina, "admin/_righe_consumi.html", rows=rows)
+        imposta_totale(pagina, db, q, Consumo)
         eventi = db.query(Evento).order_by(Evento.data_evento.desc()).all()
         staff_list = db.query(Staff).order_by(Staff.nome.asc()).all()
         
-        # Conteggio prenotazioni tavolo in attesa
-        from app.models.prenotazioni import Prenotazione
-        prenotazioni_tavolo_attesa_count = db.query(func.count(Prenotazione.id_prenotazione))\
-            .filter(
-                Prenotazione.tipo == "tavolo",
-                Prenotazione.stato_approvazione_tavolo == "in_attesa"
-            ).scalar() or 0
-        
         return render_template("admin/consumi_list.html", rows=rows, eventi=eventi, staff_list=staff_list,
-                               filtro={"evento_id": evento_id, "staff_id": staff_id, "punto_vendita": punto,
-                                       "prodotto": qprod, "dal": dal, "al": al, "cerca_nome": cerca_nome},
-                               prenotazioni_tavolo_attesa_count=prenotazioni_tavolo_attesa_count)
+                               filtro=filtro, pagina=pagina)
     finally:
         db.close()
 
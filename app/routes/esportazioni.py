@@ -0,0 +1,128 @@
+# app/routes/esportazioni.py
+import json
+
+from flask import Blueprint, abort, flash, jsonify, redirect, render_template, request, send_file, session, url_for
+
+from app.database import SessionLocal
+from app.models.job_background import JobBackground
+from app.services.esportazioni import (
+    FORMATI, JOB_ESPORTAZIONE, RETENZIONE_ESPORTAZIONI, avvia_esportazione, get_esportazione, nome_file,
+    percorso_file, risposta_esportazione,
+)
+from app.utils.decorators import require_admin
+
+esportazioni_bp = Blueprint("esportazioni", __name__, url_prefix="/admin/esportazioni")
+
+ESPORTAZIONI_MOSTRATE = 20
+
+
+def _esportazione_o_404(nome, formato):
+    esportazione = get_esportazione(nome)
+    if esportazione is None or formato not in FORMATI:
+        abort(404)
+    return esportazione
+
+
+def _descrivi(job: JobBackground) -> dict:
+    parametri = json.loads(job.parametri or "{}")
+    pronta = job.stato == "completato" and percorso_file(job).is_file()
+    return {
+        "id_job": job.id_job,
+        "nome": parametri.get("nome"),
+        "formato": parametri.get("formato"),
+        "filtri": {k: v for k, v in (parametri.get("filtro") or {}).items() if v},
+        "stato": job.stato,
+        "processati": job.processati,
+        "errore": job.errore,
+        "creata": job.created_at.strftime("%d/%m/%Y %H:%M") if job.created_at else None,
+        "download": url_for("esportazioni.download", job_id=job.id_job) if pronta else None,
+    }
+
+
+# ============================================
+# 👑 ADMIN — Download in streaming
+# ============================================
+@esportazioni_bp.route("/<nome>.<formato>", methods=["GET"])
+@require_admin
+def esporta(nome, formato):
+    """Righe della lista ``nome`` con i filtri della query string, in streaming"""
+    return risposta_esportazione(_esportazione_o_404(nome, formato), formato)
+
+
+# ============================================
+# 👑 ADMIN — Esportazioni in background
+# ============================================
+@esportazioni_bp.route("/<nome>.<formato>", methods=["POST"])
+@require_admin
+def avvia(nome, formato):
+    """Scrive l'esportazione su file in background; la pagina esportazioni avvisa quando è pronta"""
+    esportazione = _esportazione_o_404(nome, formato)
+    db = SessionLocal()
+    try:
+        job = avvia_esportazione(db, esportazione, formato, staff_id=session.get("staff_id"))
+        flash(f"Esportazione #{job.id_job} avviata: il file sarà scaricabile da questa pagina appena pronto.", "info")
+        return redirect(url_for("esportazioni.lista"))
+    finally:
+        db.close()
+
+
+@esportazioni_bp.route("/", methods=["GET"])
+@require_admin
+def lista():
+    db = SessionLocal()
+    try:
+        jobs = db.query(JobBackground).filter(
+            JobBackground.tipo == JOB_ESPORTAZIONE
+        ).order_by(JobBackground.id_job.desc()).limit(ESPORTAZIONI_MOSTRATE).all()
+        return render_template("admin/esportazioni.html", esportazioni=[_descrivi(j) for j in jobs],
+                               giorni_retenzione=RETENZIONE_ESPORTAZIONI.days)
+    finally:
+        db.close()
+
+
+@esportazioni_bp.route("/stato", methods=["GET"])
+@require_admin
+def stato():
+    """Avanzamento delle esportazioni indicate in ``?ids=1,2`` (JSON, per il polling della pagina)"""
+    ids = [int(i) for i in request.args.get("ids", "").split(",") if i.isdigit()][:ESPORTAZIONI_MOSTRATE]
+    if not ids:
+        return jsonify({"ok": False, "reason": "nessun_job"})
+    db = SessionLocal()
+    try:
+        jobs = db.query(JobBackground).filter(
+            JobBackground.tipo == JOB_ESPORTAZIONE,
+            JobBackground.id_job.in_(ids)
+        ).all()
+        return jsonify({"ok": True, "esportazioni": [_descrivi(j) for j in jobs]})
+    finally:
+        db.close()
+
+
+@esportazioni_bp.route("/<int:job_id>/download", methods=["GET"])
+@require_admin
+def download(job_id):
+    db = SessionLocal()
+    try:
+        job = db.get(JobBackground, job_id)
+        if not job or job.tipo != JOB_ESPORTAZIONE or job.stato != "completato":
+            abort(404)
+        percorso = percorso_file(job)
+        parametri = json.loads(job.parametri)
+        quando = job.created_at
+    finally:
+        db.close()
+    if not percorso.is_file():
+        flash("Il file dell'esportazione non è più disponibile: avviane una nuova.", "warning")
+        return redirect(url_for("esportazioni.lista"))
+
+    nome = nome_file(parametri["nome"], parametri["formato"], quando)
+    if parametri["formato"] != "csv":
+        return send_file(percorso, mimetype=FORMATI["xlsx"], as_attachment=True, download_name=nome)
+    # Il CSV è salvato compresso: lo si invia così com'è, decompresso dal browser se accetta gzip
+    if "gzip" in request.accept_encodings:
+        resp = send_file(percorso, mimetype=FORMATI["csv"], as_attachment=True, download_name=nome)
+        resp.headers["Content-Encoding"] = "gzip"
+    else:
+        resp = send_file(percorso, mimetype="application/gzip", as_attachment=True, download_name=nome + ".gz")
+    resp.headers["Vary"] = "Accept-Encoding"
+    return resp
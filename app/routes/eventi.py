@@ -1,22 +1,24 @@
 # app/routes/eventi.py
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session, current_app
+from flask import (Blueprint, render_template, request, redirect, url_for, flash, session, current_app,
+                   abort, jsonify, Response, stream_with_context)
 from sqlalchemy import func, and_, Integer
 from datetime import date, datetime, timedelta
-from werkzeug.utils import secure_filename
-from pathlib import Path
-import os
-import shutil
 
 from app.database import SessionLocal
 from app.models.eventi import Evento
 from app.models.ingressi import Ingresso
-from app.models.prenotazioni import Prenotazione
 from app.models.consumi import Consumo
-from app.models.feedback import Feedback
+from app.models.archivio_eventi import RiepilogoEvento
 from app.utils.decorators import require_admin, require_staff
-from app.utils.events import get_evento_operativo, set_evento_operativo_id, get_evento_operativo_id
+from app.utils.events import get_evento_operativo, set_evento_operativo_id
 from app.routes.log_attivita import log_action
 from app.routes.fedelta import award_on_no_show
+from app.services import eventi_pubblici, cover_eventi, qr_clienti, evento_dettaglio, eliminazioni
+from app.services.previsione_ingressi import previsione_ingressi
+from app.utils.jobs import crea_job, avvia_job
+from app.services.versioni_contenuti import firma_lista_eventi, firma_dettaglio_evento
+from app.utils.http_cache import condizionale
+from app.utils.paginazione import per_page_richiesto
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in current_app.config['ALLOWED_EXTENSIONS']
@@ -32,68 +34,24 @@ CATEGORIES_PUBLIC = ["reggaeton", "techno", "altro"]  # categorie pubbliche espo
 # CLIENTE — LISTA EVENTI PUBBLICI (no login)
 # --------------------------
 @eventi_bp.route("/", methods=["GET"])
+@condizionale(firma_lista_eventi)
 def lista_pubblica():
-    from app.utils.workflow import get_workflow_state, evento_stato_badge
     db = SessionLocal()
     try:
         dal = request.args.get("dal")   # yyyy-mm-dd
         al  = request.args.get("al")    # yyyy-mm-dd
-        # Costruisce filtro base da riusare
-        def apply_common_filters(query):
-            if dal:
-                try:
-                    dal_d = datetime.strptime(dal, "%Y-%m-%d").date()
-                    query = query.filter(Evento.data_evento >= dal_d)
-                except ValueError:
-                    pass
-            if al:
-                try:
-                    al_d = datetime.strptime(al, "%Y-%m-%d").date()
-                    query = query.filter(Evento.data_evento <= al_d)
-                except ValueError:
-                    pass
-            return query
-
-        oggi = date.today()
-        # Prossimi eventi (oggi e futuri)
-        q_next = apply_common_filters(
-            db.query(Evento)
-              .filter(Evento.data_evento >= oggi)
-        )
-        eventi_prossimi = q_next.order_by(Evento.data_evento.asc(), Evento.id_evento.asc()).all()
-
-        # Eventi passati (ultimi 10, più "grigi" a UI)
         show_all = request.args.get("show_all")
         show_all_past = (show_all == "past")
 
-        q_past = apply_common_filters(db.query(Evento).filter(Evento.data_evento < oggi))
-        q_past = q_past.order_by(Evento.data_evento.desc(), Evento.id_evento.desc())
-        if not show_all_past:
-            q_past = q_past.limit(20)
-        eventi_passati = q_past.all()
+        # Parte anonima (eventi + badge) dalla cache condivisa
+        eventi_prossimi, eventi_passati = eventi_pubblici.lista_pubblica(db, dal, al, show_all_past)
 
-        # Stato prenotazioni e workflow per cliente loggato
-        prenotati_ids = set()
-        workflow_map = {}  # { evento_id: workflow_state }
-        cid = session.get("cliente_id")
-        if cid and eventi_prossimi:
-            prenotati_ids = {
-                pid for (pid,) in db.query(Prenotazione.evento_id)
-                .filter(
-                    Prenotazione.cliente_id == cid,
-                    Prenotazione.evento_id.in_([e.id_evento for e in eventi_prossimi]),
-                    Prenotazione.stato.in_(("attiva", "usata"))
-                )
-                .all()
-            }
-            # Crea workflow state per ogni evento
-            for ev in eventi_prossimi:
-                workflow_map[ev.id_evento] = get_workflow_state(db, cid, ev.id_evento)
+        # Overlay per il cliente loggato: una sola query batch
+        prenotati_ids, workflow_map = eventi_pubblici.overlay_cliente(
+            db, session.get("cliente_id"), eventi_prossimi
+        )
 
-        # Badge per stato evento
-        evento_badge_map = {}
-        for ev in eventi_prossimi + eventi_passati:
-            evento_badge_map[ev.id_evento] = evento_stato_badge(ev)
+        evento_badge_map = {ev.id_evento: ev.badge for ev in eventi_prossimi + eventi_passati}
 
         return render_template("clienti/eventi_list.html",
                                eventi_prossimi=eventi_prossimi,
@@ -110,6 +68,7 @@ def lista_pubblica():
 # CLIENTE — DETTAGLIO EVENTO (no capienza per cliente)
 # --------------------------
 @eventi_bp.route("/<int:evento_id>", methods=["GET"])
+@condizionale(firma_dettaglio_evento)
 def dettaglio_pubblico(evento_id):
     from app.utils.workflow import get_workflow_state, evento_stato_badge
     db = SessionLocal()
@@ -179,8 +138,8 @@ def staff_dashboard():
         capienza = e.capienza_max or 0
         residua  = max(0, capienza - ingressi_tot)
 
-        # ritmo ultimi 15 minuti
-        now = datetime.utcnow()
+        # ritmo ultimi 15 minuti (orari ingresso in ora locale)
+        now = datetime.now()
         window_start = now - timedelta(minutes=15)
         ritmo_15m = db.query(func.count(Ingresso.id_ingresso)) \
                       .filter(and_(Ingresso.evento_id == evento_id,
@@ -192,7 +151,25 @@ def staff_dashboard():
                                ingressi_tot=ingressi_tot,
                                capienza=capienza,
                                residua=residua,
-                               ritmo_15m=ritmo_15m)
+                               ritmo_15m=ritmo_15m,
+                               previsione=previsione_ingressi(db, e))
+    finally:
+        db.close()
+
+
+@eventi_bp.route("/staff/dashboard/previsione", methods=["GET"])
+@require_staff
+def staff_dashboard_previsione():
+    """Previsione arrivi aggiornata (polling della dashboard)"""
+    db = SessionLocal()
+    try:
+        e = get_evento_operativo(db)
+        if not e:
+            return jsonify({"ok": False, "error": "Nessun evento attivo"}), 404
+        previsione = previsione_ingressi(db, e)
+        if previsione is None:
+            return jsonify({"ok": False, "error": "Previsione non disponibile"}), 503
+        return jsonify({"ok": True, **previsione})
     finally:
         db.close()
 
@@ -272,6 +249,7 @@ def admin_evento_attivo():
                             note=f"evento_id={ev.id_evento}"
                         )
                     db.commit()
+                    eventi_pubblici.invalida_lista_pubblica()
                     flash(f"Evento operativo staff impostato su {ev.nome_evento}.", "success")
             return redirect(url_for("eventi.admin_evento_attivo"))
 
@@ -318,6 +296,10 @@ def admin_list():
                         .group_by(Ingresso.evento_id)
                         .all())
             ingressi_map = {eid: count for eid, count in counts}
+            # Eventi archiviati: il totale è nel riepilogo
+            ingressi_map.update(db.query(RiepilogoEvento.evento_id, RiepilogoEvento.ingressi).filter(
+                RiepilogoEvento.evento_id.in_(evento_ids)
+            ).all())
         
         # Classifica automaticamente gli eventi
         # Eventi in Programma: data >= oggi E stato_pubblico == 'programmato'
@@ -346,7 +328,8 @@ def admin_list():
                              eventi_in_programma=eventi_in_programma,
                              eventi_attivi=eventi_attivi,
                              eventi_passati=eventi_passati,
-                             ingressi_map=ingressi_map)
+                             ingressi_map=ingressi_map,
+                             eliminazioni=eliminazioni.eliminazioni_in_corso(db, "evento"))
     finally:
         db.close()
 
@@ -360,13 +343,12 @@ def admin_new():
             if 'cover_image' in request.files:
                 file = request.files['cover_image']
                 if file and file.filename and allowed_file(file.filename):
-                    filename = secure_filename(file.filename)
-                    # Genera un nome unico basato su timestamp
-                    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                    name, ext = os.path.splitext(filename)
-                    cover_filename = f"{timestamp}_{name}{ext}"
-                    file_path = Path(current_app.config['UPLOAD_FOLDER']) / cover_filename
-                    file.save(str(file_path))
+                    # Varianti ridimensionate generate in background, nome = hash del contenuto
+                    try:
+                        cover_filename = cover_eventi.salva_upload(file)
+                    except cover_eventi.CoverNonValida:
+                        flash("Immagine di copertina non valida.", "danger")
+                        return redirect(url_for("eventi.admin_new"))
             
             # Gestione data evento (converti stringa in date per SQLite)
             data_evento_str = request.form.get("data_evento")
@@ -439,6 +421,7 @@ def admin_new():
                 note=f"evento_id={e.id_evento}"
             )
             db.commit()
+            eventi_pubblici.invalida_lista_pubblica()
             flash("Evento creato.", "success")
             return redirect(url_for("eventi.admin_evento_detail", evento_id=e.id_evento))
         return render_template("admin/eventi_form.html", e=None, CATEGORIES_PUBLIC=CATEGORIES_PUBLIC)
@@ -448,159 +431,41 @@ def admin_new():
 @eventi_bp.route("/admin/<int:evento_id>", methods=["GET"])
 @require_admin
 def admin_evento_detail(evento_id):
+    """Header KPI da aggregati; le tab caricano i dati da ``admin_evento_sezione``"""
     db = SessionLocal()
     try:
-        from app.models.fedeltà import Fedelta
-        from app.models.feedback import Feedback
-        from app.models.clienti import Cliente
-        from app.models.staff import Staff
-        
         e = db.query(Evento).get(evento_id)
         if not e:
             flash("Evento non trovato.", "danger")
             return redirect(url_for("eventi.admin_list"))
-        
-        # Statistiche generali
-        tot_prenotazioni = db.query(func.count(Prenotazione.id_prenotazione)).filter(Prenotazione.evento_id == evento_id).scalar() or 0
-        tot_ingressi = db.query(func.count(Ingresso.id_ingresso)).filter(Ingresso.evento_id == evento_id).scalar() or 0
-        tot_consumi = db.query(func.coalesce(func.sum(Consumo.importo), 0)).filter(Consumo.evento_id == evento_id).scalar() or 0
-        tot_consumi = float(tot_consumi) if tot_consumi else 0
-        tot_punti_fedelta = db.query(func.sum(Fedelta.punti)).filter(Fedelta.evento_id == evento_id).scalar() or 0
-        tot_feedback = db.query(func.count(Feedback.id_feedback)).filter(Feedback.evento_id == evento_id).scalar() or 0
-        
-        # Liste dettagliate per evento
-        prenotazioni_evento = (
-            db.query(Prenotazione, Cliente)
-              .join(Cliente, Cliente.id_cliente == Prenotazione.cliente_id)
-              .filter(Prenotazione.evento_id == evento_id)
-              .order_by(Prenotazione.id_prenotazione.desc())
-              .all()
-        )
-        ingressi_evento = (
-            db.query(Ingresso, Cliente, Staff)
-              .join(Cliente, Cliente.id_cliente == Ingresso.cliente_id)
-              .outerjoin(Staff, Staff.id_staff == Ingresso.staff_id)
-              .filter(Ingresso.evento_id == evento_id)
-              .order_by(Ingresso.orario_ingresso.desc())
-              .all()
-        )
-        consumi_evento = (
-            db.query(Consumo, Cliente, Staff)
-              .join(Cliente, Cliente.id_cliente == Consumo.cliente_id)
-              .outerjoin(Staff, Staff.id_staff == Consumo.staff_id)
-              .filter(Consumo.evento_id == evento_id)
-              .order_by(Consumo.data_consumo.desc())
-              .all()
-        )
 
-        feedback_evento = (
-            db.query(Feedback, Cliente)
-              .join(Cliente, Cliente.id_cliente == Feedback.cliente_id)
-              .filter(Feedback.evento_id == evento_id)
-              .order_by(Feedback.data_feedback.desc())
-              .all()
-        )
-        
-        # Breakdown prenotazioni
-        pren_by_tipo = dict(db.query(Prenotazione.tipo, func.count(Prenotazione.id_prenotazione))
-                           .filter(Prenotazione.evento_id == evento_id)
-                           .group_by(Prenotazione.tipo).all())
-        pren_by_stato = dict(db.query(Prenotazione.stato, func.count(Prenotazione.id_prenotazione))
-                            .filter(Prenotazione.evento_id == evento_id)
-                            .group_by(Prenotazione.stato).all())
-        tavolo_persone = db.query(func.coalesce(func.sum(Prenotazione.num_persone), 0)) \
-                          .filter(Prenotazione.evento_id == evento_id, Prenotazione.tipo == "tavolo") \
-                          .scalar() or 0
-        
-        # Breakdown ingressi
-        ingressi_by_tipo = dict(db.query(Ingresso.tipo_ingresso, func.count(Ingresso.id_ingresso))
-                               .filter(Ingresso.evento_id == evento_id)
-                               .group_by(Ingresso.tipo_ingresso).all())
-        ingressi_by_staff = db.query(Staff.nome, func.count(Ingresso.id_ingresso)) \
-                             .join(Ingresso, Ingresso.staff_id == Staff.id_staff) \
-                             .filter(Ingresso.evento_id == evento_id) \
-                             .group_by(Staff.id_staff, Staff.nome) \
-                             .order_by(func.count(Ingresso.id_ingresso).desc()) \
-                             .limit(10).all()
-        
-        # Breakdown consumi
-        consumi_by_punto = dict(db.query(Consumo.punto_vendita, func.sum(Consumo.importo))
-                               .filter(Consumo.evento_id == evento_id)
-                               .group_by(Consumo.punto_vendita).all())
-        consumi_by_prodotto = db.query(Consumo.prodotto, func.sum(Consumo.importo), func.count(Consumo.id_consumo)) \
-                                .filter(Consumo.evento_id == evento_id) \
-                                .group_by(Consumo.prodotto) \
-                                .order_by(func.sum(Consumo.importo).desc()) \
-                                .limit(10).all()
-        clienti_consumi = db.query(func.count(func.distinct(Consumo.cliente_id))) \
-                           .filter(Consumo.evento_id == evento_id).scalar() or 0
-        scontrino_medio = round(tot_consumi / clienti_consumi, 2) if clienti_consumi else 0
-        
-        # Top clienti
-        top_clienti_consumi = db.query(Cliente, func.sum(Consumo.importo).label("spesa")) \
-                                .join(Consumo, Consumo.cliente_id == Cliente.id_cliente) \
-                                .filter(Consumo.evento_id == evento_id) \
-                                .group_by(Cliente.id_cliente) \
-                                .order_by(func.sum(Consumo.importo).desc()) \
-                                .limit(10).all()
-        
-        # Feedback media
-        avg_feedback = db.query(
-            func.avg(Feedback.voto_musica),
-            func.avg(Feedback.voto_ingresso),
-            func.avg(Feedback.voto_ambiente),
-            func.avg(Feedback.voto_servizio)
-        ).filter(Feedback.evento_id == evento_id).one()
-        
-        # Dati per grafici analytics
-        # Ingressi per ora (MySQL: usa HOUR invece di strftime)
-        ingressi_ora = db.query(
-            func.hour(Ingresso.orario_ingresso).label('ora'),
-            func.count(Ingresso.id_ingresso).label('count')
-        ).filter(Ingresso.evento_id == evento_id).group_by(func.hour(Ingresso.orario_ingresso)).order_by(func.hour(Ingresso.orario_ingresso)).all()
-        
-        ingressi_temporali_data = []
-        for ora, count in ingressi_ora:
-            ingressi_temporali_data.append({'slot': f"{ora:02d}:00", 'value': count})
-        
-        # Prenotazioni per tipo (per grafico)
-        prenotazioni_chart_data = [{'label': tipo.capitalize(), 'value': count} for tipo, count in pren_by_tipo.items()]
-        
-        # Prodotti top (per grafico)
-        prodotti_chart_data = [{'label': prodotto, 'count': count, 'revenue': float(importo)} for prodotto, importo, count in consumi_by_prodotto]
-        
         return render_template("admin/evento_detail.html",
                              evento=e,
-                             tot_prenotazioni=tot_prenotazioni,
-                             tot_ingressi=tot_ingressi,
-                             tot_consumi=tot_consumi,
-                             tot_punti_fedelta=tot_punti_fedelta,
-                             tot_feedback=tot_feedback,
-                             prenotazioni_evento=prenotazioni_evento,
-                             ingressi_evento=ingressi_evento,
-                             consumi_evento=consumi_evento,
-                             feedback_evento=feedback_evento,
-                             pren_by_tipo=pren_by_tipo,
-                             pren_by_stato=pren_by_stato,
-                             tavolo_persone=tavolo_persone,
-                             ingressi_by_tipo=ingressi_by_tipo,
-                             ingressi_by_staff=ingressi_by_staff,
-                             consumi_by_punto=consumi_by_punto,
-                             consumi_by_prodotto=consumi_by_prodotto,
-                             clienti_consumi=clienti_consumi,
-                             scontrino_medio=scontrino_medio,
-                             top_clienti_consumi=top_clienti_consumi,
-                             avg_musica=round(avg_feedback[0] or 0, 1),
-                             avg_ingresso=round(avg_feedback[1] or 0, 1),
-                             avg_ambiente=round(avg_feedback[2] or 0, 1),
-                             avg_servizio=round(avg_feedback[3] or 0, 1),
-                             ingressi_temporali_data=ingressi_temporali_data,
-                             prenotazioni_chart_data=prenotazioni_chart_data,
-                             prodotti_chart_data=prodotti_chart_data,
+                             kpi=evento_dettaglio.kpi_evento(db, evento_id),
                              CATEGORIES_PUBLIC=CATEGORIES_PUBLIC)
     finally:
         db.close()
 
+@eventi_bp.route("/admin/<int:evento_id>/sezioni/<sezione>", methods=["GET"])
+@require_admin
+def admin_evento_sezione(evento_id, sezione):
+    """JSON in streaming di una tab del dettaglio (prenotazioni/ingressi/consumi/feedback)"""
+    if sezione not in evento_dettaglio.SEZIONI:
+        abort(404)
+    flusso = evento_dettaglio.stream_sezione(
+        evento_id, sezione, prima=request.args.get("prima"), per_page=per_page_richiesto(100),
+    )
+    return Response(stream_with_context(flusso), mimetype="application/json")
+
+@eventi_bp.route("/admin/<int:evento_id>/analytics", methods=["GET"])
+@require_admin
+def admin_evento_analytics(evento_id):
+    db = SessionLocal()
+    try:
+        return jsonify(evento_dettaglio.analytics_evento(db, evento_id))
+    finally:
+        db.close()
+
 @eventi_bp.route("/admin/<int:evento_id>/edit", methods=["GET", "POST"])
 @require_admin
 def admin_edit(evento_id):
@@ -668,32 +533,24 @@ def admin_edit(evento_id):
                 e.data_ora_chiusura_auto = None
             
             # Gestione upload immagine
+            vecchia_cover = e.cover_url
             if 'cover_image' in request.files:
                 file = request.files['cover_image']
                 if file and file.filename and allowed_file(file.filename):
-                    # Elimina vecchia immagine se esiste
-                    if e.cover_url:
-                        old_path = Path(current_app.config['UPLOAD_FOLDER']) / e.cover_url
-                        if old_path.exists():
-                            old_path.unlink()
-                    
-                    # Salva nuova immagine
-                    filename = secure_filename(file.filename)
-                    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                    name, ext = os.path.splitext(filename)
-                    cover_filename = f"{timestamp}_{name}{ext}"
-                    file_path = Path(current_app.config['UPLOAD_FOLDER']) / cover_filename
-                    file.save(str(file_path))
-                    e.cover_url = cover_filename
+                    try:
+                        e.cover_url = cover_eventi.salva_upload(file)
+                    except cover_eventi.CoverNonValida:
+                        flash("Immagine di copertina non valida.", "danger")
+                        return redirect(url_for("eventi.admin_edit", evento_id=evento_id))
                 elif request.form.get("remove_cover") == "1":
                     # Rimuovi immagine se richiesto
-                    if e.cover_url:
-                        old_path = Path(current_app.config['UPLOAD_FOLDER']) / e.cover_url
-                        if old_path.exists():
-                            old_path.unlink()
                     e.cover_url = None
             
             db.commit()
+            if vecchia_cover and vecchia_cover != e.cover_url:
+                # I file restano se la copertina è condivisa con eventi duplicati
+                cover_eventi.rimuovi_se_inutilizzata(db, vecchia_cover)
+            eventi_pubblici.invalida_lista_pubblica()
             flash("Evento aggiornato.", "success")
             return redirect(url_for("eventi.admin_evento_detail", evento_id=evento_id))
         return render_template("admin/eventi_form.html", e=e, CATEGORIES_PUBLIC=CATEGORIES_PUBLIC)
@@ -719,9 +576,13 @@ def admin_set_stato(evento_id, stato):
         if not e:
             flash("Evento non trovato.", "danger")
             return redirect(url_for("eventi.admin_list"))
+        if e.archiviato_il:
+            flash("L'evento è archiviato: i suoi dati sono in sola lettura e non può essere riaperto.", "warning")
+            return redirect(url_for("eventi.admin_evento_detail", evento_id=evento_id))
         
         if imposta_stato_evento(db, e, stato, staff_id=session.get("staff_id"), automatico=False):
             db.commit()
+            eventi_pubblici.invalida_lista_pubblica()
             stato_label = {"programmato": "programmato", "attivo": "attivato", "chiuso": "chiuso"}[stato]
             flash(f"Evento '{e.nome_evento}' impostato a {stato_label}.", "success")
         else:
@@ -754,40 +615,37 @@ def admin_delete(evento_id):
             flash("Evento non trovato.", "danger")
         else:
             evento_nome = e.nome_evento
-            evento_data = e.data_evento
-            
-            # Se è l'evento operativo, disattivalo prima di eliminare
-            evento_operativo_id = get_evento_operativo_id(db)
-            if evento_operativo_id == evento_id:
-                set_evento_operativo_id(db, None)
-            
-            # Elimina immagine se esiste
-            if e.cover_url:
-                img_path = Path(current_app.config['UPLOAD_FOLDER']) / e.cover_url
-                if img_path.exists():
-                    img_path.unlink()
-            
-            # Elimina l'evento (le relazioni vengono eliminate in cascade grazie a cascade="all, delete-orphan")
-            db.delete(e)
-            db.flush()
-            
-            # Registra l'azione nel log
-            staff_id = session.get("staff_id")
-            log_action(
-                db,
-                tabella="eventi",
-                record_id=evento_id,
-                staff_id=staff_id,
-                azione="delete",
-                note=f"Evento eliminato: {evento_nome} ({evento_data})"
-            )
-            
-            db.commit()
-            flash(f"Evento '{evento_nome}' eliminato definitivamente.", "warning")
+            # Le righe collegate le elimina il database (FK in CASCADE); grafi grandi a lotti in background
+            job = eliminazioni.elimina(db, "evento", e, staff_id=session.get("staff_id"))
+            if job:
+                flash(f"Eliminazione dell'evento '{evento_nome}' avviata in background (job #{job.id_job}).", "info")
+            else:
+                flash(f"Evento '{evento_nome}' eliminato definitivamente.", "warning")
         return redirect(url_for("eventi.admin_list"))
     finally:
         db.close()
 
+@eventi_bp.route("/admin/<int:evento_id>/qr-pregenera", methods=["POST"])
+@require_admin
+def admin_qr_pregenera(evento_id):
+    """Genera in background le immagini QR degli ospiti con prenotazione attiva"""
+    db = SessionLocal()
+    try:
+        if not db.get(Evento, evento_id):
+            flash("Evento non trovato.", "danger")
+            return redirect(url_for("eventi.admin_list"))
+        totale = qr_clienti.conta_ospiti_attesi(db, evento_id)
+        if not totale:
+            flash("Nessun ospite con prenotazione attiva per questo evento.", "info")
+            return redirect(url_for("eventi.admin_evento_detail", evento_id=evento_id))
+        job = crea_job(db, qr_clienti.JOB_PREGENERA_QR, totale=totale,
+                       parametri={"evento_id": evento_id}, staff_id=session.get("staff_id"))
+        avvia_job(job.id_job)
+        flash(f"Generazione QR avviata per {totale} ospiti.", "success")
+        return redirect(url_for("eventi.admin_evento_detail", evento_id=evento_id))
+    finally:
+        db.close()
+
 @eventi_bp.route("/admin/<int:evento_id>/duplicate", methods=["POST"])
 @require_admin
 def admin_duplicate(evento_id):
@@ -831,19 +689,9 @@ def admin_duplicate(evento_id):
         )
         db.add(dup)
         db.flush()
-        # Duplica cover se richiesto e presente
+        # Duplica cover se richiesto: stessa copertina per riferimento (nessuna copia dei file)
         if request.form.get("duplica_cover") == "1" and e.cover_url:
-            src = Path(current_app.config['UPLOAD_FOLDER']) / e.cover_url
-            if src.exists():
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                name, ext = os.path.splitext(e.cover_url)
-                new_cover = f"{timestamp}_{name}{ext}"
-                dst = Path(current_app.config['UPLOAD_FOLDER']) / new_cover
-                try:
-                    shutil.copyfile(str(src), str(dst))
-                    dup.cover_url = new_cover
-                except Exception:
-                    pass
+            dup.cover_url = e.cover_url
         log_action(
             db,
             tabella="eventi",
@@ -853,6 +701,7 @@ def admin_duplicate(evento_id):
             note=f"evento_id={dup.id_evento}"
         )
         db.commit()
+        eventi_pubblici.invalida_lista_pubblica()
         flash("Evento duplicato.", "success")
         return redirect(url_for("eventi.admin_evento_detail", evento_id=dup.id_evento))
     finally:
@@ -882,6 +731,7 @@ def admin_close(evento_id):
         count_marcate, count_già, count_con_ingresso = processa_no_show_automatico(db, evento_id=evento_id)
         
         db.commit()
+        eventi_pubblici.invalida_lista_pubblica()
         
         if count_marcate > 0:
             flash(f"Evento chiuso. {count_marcate} prenotazione/i marcate come no-show.", "success")
@@ -1,11 +1,15 @@
 # app/routes/fedelta.py
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify
 from sqlalchemy import func
 from datetime import datetime, timedelta
 from app.database import SessionLocal
 from app.utils.decorators import require_cliente, require_admin, require_staff
 from werkzeug.security import check_password_hash
-from app.routes.log_attivita import log_action
+from app.services.fedelta_ledger import registra_movimento, JOB_AZZERA_PUNTI
+from app.services import fedelta_classifica, ricerca_clienti
+from app.services.esportazioni import registra_esportazione
+from app.utils.jobs import crea_job, avvia_job, get_job_attivo, get_ultimo_job
+from app.utils.paginazione import pagina_keyset, per_page_richiesto, imposta_totale, richiesta_json, risposta_json
 import os
 
 # Modelli
@@ -75,6 +79,7 @@ def _update_cliente_level(db, cliente_id):
     thr = get_thresholds(db)
     lvl = compute_level(cli.punti_fedelta or 0, thr)
     if cli.livello != lvl:
+        fedelta_classifica.sposta_livello(db, cli.livello or "base", lvl)
         cli.livello = lvl
         db.commit()
 
@@ -88,22 +93,14 @@ def award_on_ingresso(db, cliente_id, evento_id, has_prenotazione=False):
         if has_prenotazione else
         f"Ingresso evento #{evento_id} (walk-in)"
     )
-    m = Fedelta(cliente_id=cliente_id, evento_id=evento_id,
-                punti=punti, motivo=motivo)
-    db.add(m)
-    # aggiorna saldo cliente
-    cli = db.query(Cliente).get(cliente_id)
-    cli.punti_fedelta = (cli.punti_fedelta or 0) + punti
+    # movimento nel ledger + incremento atomico del saldo cliente
+    registra_movimento(db, cliente_id, punti, motivo, evento_id=evento_id)
     db.commit()
     _update_cliente_level(db, cliente_id)
 
 def award_on_no_show(db, cliente_id, evento_id):
     # -5 punti per prenotazione senza ingresso
-    m = Fedelta(cliente_id=cliente_id, evento_id=evento_id,
-                punti=PUNTI_NO_SHOW, motivo=f"No-show evento #{evento_id}")
-    db.add(m)
-    cli = db.query(Cliente).get(cliente_id)
-    cli.punti_fedelta = (cli.punti_fedelta or 0) + PUNTI_NO_SHOW
+    registra_movimento(db, cliente_id, PUNTI_NO_SHOW, f"No-show evento #{evento_id}", evento_id=evento_id)
     db.commit()
     _update_cliente_level(db, cliente_id)
 
@@ -114,11 +111,7 @@ def award_on_consumo(db, cliente_id, evento_id, importo_euro):
     pts = int(float(importo_euro) // 10.0)
     if pts == 0:
         return
-    m = Fedelta(cliente_id=cliente_id, evento_id=evento_id,
-                punti=pts, motivo=f"Consumo evento #{evento_id}")
-    db.add(m)
-    cli = db.query(Cliente).get(cliente_id)
-    cli.punti_fedelta = (cli.punti_fedelta or 0) + pts
+    registra_movimento(db, cliente_id, pts, f"Consumo evento #{evento_id}", evento_id=evento_id)
     db.commit()
     _update_cliente_level(db, cliente_id)
 
@@ -166,17 +159,11 @@ def admin_list():
         thresholds = get_thresholds(db)
         thresholds_sorted = sorted(thresholds.items(), key=lambda x: x[1])
 
-        totale_clienti = db.query(func.count(Cliente.id_cliente)).scalar() or 0
-        punti_totali = db.query(func.coalesce(func.sum(Cliente.punti_fedelta), 0)).scalar() or 0
-        punti_medi = int(round(punti_totali / totale_clienti)) if totale_clienti else 0
+        # Tutto da strutture precalcolate: nessuna scansione completa di clienti
+        stats = fedelta_classifica.riepilogo(db)
 
-        top_raw = (db.query(Cliente)
-                     .order_by(Cliente.punti_fedelta.is_(None).asc(),
-                               Cliente.punti_fedelta.desc())
-                     .limit(12)
-                     .all())
         top_clienti = []
-        for cli in top_raw:
+        for cli in fedelta_classifica.top_clienti(db, 12):
             points = int(cli.punti_fedelta or 0)
             level = compute_level(points, thresholds)
             nxt, to_go = next_threshold_info(points, thresholds)
@@ -188,16 +175,9 @@ def admin_list():
                 "points_to_next": to_go
             })
 
-        distribuzione_raw = db.query(Cliente.livello, func.count(Cliente.id_cliente))\
-                              .group_by(Cliente.livello).all()
-        distribuzione_map = {lvl or "base": count for lvl, count in distribuzione_raw}
+        distribuzione_map = fedelta_classifica.distribuzione_livelli(db)
         distribuzione = [(lvl, distribuzione_map.get(lvl, 0)) for lvl, _ in thresholds_sorted]
-
-        stats = {
-            "totale_clienti": totale_clienti,
-            "punti_totali": int(punti_totali),
-            "punti_medi": punti_medi
-        }
+        top_per_livello = fedelta_classifica.top_per_livello(db, thresholds, 5)
 
         return render_template(
             "admin/fedelta_list.html",
@@ -206,7 +186,8 @@ def admin_list():
             thresholds=thresholds,
             thresholds_sorted=thresholds_sorted,
             can_edit_thresholds=SogliaFedelta is not None,
-            distribuzione=distribuzione
+            distribuzione=distribuzione,
+            top_per_livello=top_per_livello
         )
     finally:
         db.close()
@@ -214,57 +195,72 @@ def admin_list():
 # =========================================
 # 👑 Admin — elenco movimenti dettagliati
 # =========================================
+def _filtro_movimenti(args) -> dict:
+    """Filtri dei movimenti dalla query string (condivisi con l'esportazione)"""
+    return {
+        "evento_id": args.get("evento_id", type=int),
+        "q": (args.get("q") or "").strip(),
+        "dal": args.get("dal"),
+        "al": args.get("al"),
+    }
+
+
+def _query_movimenti(db, filtro: dict):
+    q = db.query(Fedelta, Cliente, Evento)\
+          .join(Cliente, Cliente.id_cliente == Fedelta.cliente_id)\
+          .outerjoin(Evento, Evento.id_evento == Fedelta.evento_id)
+
+    if filtro["evento_id"]:
+        q = q.filter(Fedelta.evento_id == filtro["evento_id"])
+    if filtro["q"]:
+        q = q.filter(ricerca_clienti.filtro_clienti(db, filtro["q"]))
+    if filtro["dal"]:
+        try:
+            d = datetime.strptime(filtro["dal"], "%Y-%m-%d")
+            q = q.filter(Fedelta.data_assegnazione >= d)
+        except ValueError:
+            pass
+    if filtro["al"]:
+        try:
+            d2 = datetime.strptime(filtro["al"], "%Y-%m-%d") + timedelta(days=1)
+            q = q.filter(Fedelta.data_assegnazione < d2)
+        except ValueError:
+            pass
+    return q
+
+
+@registra_esportazione("fedelta_movimenti", _filtro_movimenti)
+def _esporta_movimenti(db, filtro: dict):
+    return _query_movimenti(db, filtro).with_entities(
+        Fedelta.id_fedelta.label("id_movimento"),
+        Fedelta.data_assegnazione.label("data"),
+        Cliente.id_cliente.label("id_cliente"),
+        Cliente.nome.label("nome"),
+        Cliente.cognome.label("cognome"),
+        Evento.nome_evento.label("evento"),
+        Fedelta.punti.label("punti"),
+        Fedelta.motivo.label("motivo"),
+    ).order_by(Fedelta.data_assegnazione.desc(), Fedelta.id_fedelta.desc())
+
+
 @fedelta_bp.route("/admin/movimenti", methods=["GET"])
 @require_admin
 def admin_movimenti():
     db = SessionLocal()
     try:
-        from sqlalchemy import func
-
-        page = request.args.get("page", 1, type=int)
-        per_page = request.args.get("per_page", 50, type=int)
-        per_page = min(max(per_page, 10), 200)
-
-        evento_id = request.args.get("evento_id", type=int)
-        cliente_q = (request.args.get("q") or "").strip()
-        dal = request.args.get("dal")
-        al = request.args.get("al")
-
-        q = db.query(Fedelta, Cliente, Evento)\
-              .join(Cliente, Cliente.id_cliente == Fedelta.cliente_id)\
-              .join(Evento, Evento.id_evento == Fedelta.evento_id)
-
-        if evento_id:
-            q = q.filter(Fedelta.evento_id == evento_id)
-        if cliente_q:
-            like = f"%{cliente_q}%"
-            q = q.filter((Cliente.nome.ilike(like)) |
-                         (Cliente.cognome.ilike(like)) |
-                         (Cliente.telefono.ilike(like)))
-        if dal:
-            try:
-                d = datetime.strptime(dal, "%Y-%m-%d")
-                q = q.filter(Fedelta.data_assegnazione >= d)
-            except ValueError:
-                pass
-        if al:
-            try:
-                d2 = datetime.strptime(al, "%Y-%m-%d") + timedelta(days=1)
-                q = q.filter(Fedelta.data_assegnazione < d2)
-            except ValueError:
-                pass
-
-        total = q.count()
-
-        rows = (q.order_by(Fedelta.data_assegnazione.desc())
-                  .offset((page - 1) * per_page)
-                  .limit(per_page)
-                  .all())
-
-        total_pages = (total + per_page - 1) // per_page if total > 0 else 1
-        start_page = max(1, page - 2)
-        end_page = min(total_pages, page + 2)
-        pages_list = list(range(start_page, end_page + 1))
+        per_page = per_page_richiesto()
+        filtro = _filtro_movimenti(request.args)
+        q = _query_movimenti(db, filtro)
+
+        pagina = pagina_keyset(
+            q, [(Fedelta.data_assegnazione, True), (Fedelta.id_fedelta, True)],
+            prima=request.args.get("prima"), dopo=request.args.get("dopo"), per_page=per_page,
+            parametri=filtro,
+        )
+        rows = pagina.righe
+        if richiesta_json():
+            return risposta_json(pagina, "admin/_righe_fedelta_movimenti.html", rows=rows)
+        imposta_totale(pagina, db, q, Fedelta)
 
         eventi = db.query(Evento).order_by(Evento.data_evento.desc()).all()
 
@@ -272,12 +268,9 @@ def admin_movimenti():
             "admin/fedelta_movimenti.html",
             rows=rows,
             eventi=eventi,
-            filtro={"evento_id": evento_id, "q": cliente_q, "dal": dal, "al": al},
-            page=page,
+            filtro=filtro,
             per_page=per_page,
-            total=total,
-            total_pages=total_pages,
-            pages_list=pages_list
+            pagina=pagina,
         )
     finally:
         db.close()
@@ -312,10 +305,8 @@ def admin_analytics():
                  .order_by(func.sum(Fedelta.punti).desc())
                  .limit(20).all())
 
-        # distribuzione tier (usa valore corrente nel profilo cliente)
-        dist = (db.query(Cliente.livello, func.count(Cliente.id_cliente))
-                  .group_by(Cliente.livello).all())
-        dist = dict(dist)
+        # distribuzione tier (precalcolata, valore corrente nel profilo cliente)
+        dist = fedelta_classifica.distribuzione_livelli(db)
 
         # punti medi per evento nel periodo
         per_evento = dict(db.query(Fedelta.evento_id, func.avg(Fedelta.punti))
@@ -402,13 +393,18 @@ def _verify_admin_password(db, password: str) -> bool:
 @fedelta_bp.route("/admin/azzera-punti", methods=["GET"])
 @require_admin
 def admin_azzera_punti_form():
-    """Mostra il form per confermare l'azzeramento con password"""
-    return render_template("admin/fedelta_azzera.html")
+    """Mostra il form per confermare l'azzeramento con password (e l'avanzamento del job)"""
+    db = SessionLocal()
+    try:
+        job = get_ultimo_job(db, JOB_AZZERA_PUNTI)
+        return render_template("admin/fedelta_azzera.html", job=job)
+    finally:
+        db.close()
 
 @fedelta_bp.route("/admin/azzera-punti", methods=["POST"])
 @require_admin
 def admin_azzera_punti_submit():
-    """Processa l'azzeramento dei punti dopo verifica password"""
+    """Avvia l'azzeramento dei punti in background dopo verifica password"""
     db = SessionLocal()
     try:
         password = request.form.get("password", "").strip()
@@ -421,31 +417,38 @@ def admin_azzera_punti_submit():
         if not _verify_admin_password(db, password):
             flash("Password non corretta. Operazione annullata.", "danger")
             return redirect(url_for("fedelta.admin_azzera_punti_form"))
-        
-        # Conta quanti clienti hanno punti > 0
-        clienti_con_punti = db.query(func.count(Cliente.id_cliente)).filter(
-            Cliente.punti_fedelta > 0
-        ).scalar() or 0
-        
-        # Azzera tutti i punti
-        db.query(Cliente).update({Cliente.punti_fedelta: 0})
-        
-        # Aggiorna anche i livelli a "base" per tutti i clienti
-        db.query(Cliente).update({Cliente.livello: "base"})
-        
-        # Log dell'azione
-        staff_id = session.get("staff_id")
-        log_action(
-            db,
-            tabella="clienti",
-            record_id=0,
-            staff_id=staff_id,
-            azione="update",
-            note=f"Azzera punti: {clienti_con_punti} clienti azzerati. Tutti i punti fedeltà sono stati resettati a 0."
-        )
-        
-        db.commit()
-        flash(f"Tutti i punti fedeltà sono stati azzerati. {clienti_con_punti} clienti interessati.", "warning")
-        return redirect(url_for("fedelta.admin_list"))
+
+        if get_job_attivo(db, JOB_AZZERA_PUNTI):
+            flash("Un azzeramento è già in corso.", "info")
+            return redirect(url_for("fedelta.admin_azzera_punti_form"))
+
+        # Lotti brevi per chiave in background: niente lock sull'intera tabella clienti
+        totale = db.query(func.count(Cliente.id_cliente)).scalar() or 0
+        job = crea_job(db, JOB_AZZERA_PUNTI, totale=totale, staff_id=session.get("staff_id"))
+        avvia_job(job.id_job)
+
+        flash(f"Azzeramento punti avviato: {totale} clienti da elaborare.", "warning")
+        return redirect(url_for("fedelta.admin_azzera_punti_form"))
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+@fedelta_bp.route("/admin/azzera-punti/stato", methods=["GET"])
+@require_admin
+def admin_azzera_punti_stato():
+    """Avanzamento dell'ultimo azzeramento (JSON, per il polling della pagina)"""
+    db = SessionLocal()
+    try:
+        job = get_ultimo_job(db, JOB_AZZERA_PUNTI)
+        if not job:
+            return jsonify({"ok": False, "reason": "nessun_job"})
+        return jsonify({
+            "ok": True,
+            "id_job": job.id_job,
+            "stato": job.stato,
+            "processati": job.processati,
+            "totale": job.totale,
+            "percentuale": job.percentuale,
+            "errore": job.errore,
+        })
+    finally:
+        db.close()
@@ -5,11 +5,13 @@ from sqlalchemy import and_, func, or_
 from app.database import SessionLocal
 from app.utils.decorators import require_cliente, require_admin
 from app.utils.limiter import limiter
+from app.utils.paginazione import pagina_keyset, per_page_richiesto, imposta_totale, richiesta_json, risposta_json
 from app.models.feedback import Feedback
 from app.models.eventi import Evento
 from app.models.ingressi import Ingresso
 from app.models.clienti import Cliente
-from app.models.fedeltà import Fedelta
+from app.services.fedelta_ledger import registra_movimento
+from app.services.esportazioni import registra_esportazione
 
 feedback_bp = Blueprint("feedback", __name__, url_prefix="/feedback")
 
@@ -81,17 +83,7 @@ def nuovo():
                 note=note,
             )
             db.add(fb)
-            bonus = Fedelta(
-                cliente_id=cliente_id,
-                evento_id=int(evento_id),
-                punti=2,
-                motivo=f"Feedback evento #{evento_id}"
-            )
-            db.add(bonus)
-
-            cliente = db.query(Cliente).get(cliente_id)
-            if cliente:
-                cliente.punti_fedelta = (cliente.punti_fedelta or 0) + 2
+            registra_movimento(db, cliente_id, 2, f"Feedback evento #{evento_id}", evento_id=int(evento_id))
 
             db.commit()
 
@@ -105,53 +97,79 @@ def nuovo():
 # -----------------------
 # ADMIN
 # -----------------------
+def _filtro_lista(args) -> dict:
+    """Filtri della lista admin dalla query string (condivisi con l'esportazione)"""
+    return {
+        "evento_id": args.get("evento_id", type=int),
+        "cliente_id": args.get("cliente_id", type=int),
+        "dal": args.get("dal"),
+        "al": args.get("al"),
+        "cerca_nome": (args.get("cerca_nome") or "").strip(),
+    }
+
+
+def _query_lista(db, filtro: dict):
+    q = (
+        db.query(Feedback, Cliente, Evento)
+        .join(Cliente, Cliente.id_cliente == Feedback.cliente_id)
+        .join(Evento, Evento.id_evento == Feedback.evento_id)
+    )
+    if filtro["evento_id"]:
+        q = q.filter(Feedback.evento_id == filtro["evento_id"])
+    if filtro["cliente_id"]:
+        q = q.filter(Feedback.cliente_id == filtro["cliente_id"])
+    if filtro["cerca_nome"]:
+        cerca_pattern = f"%{filtro['cerca_nome']}%"
+        q = q.filter(
+            or_(
+                func.lower(Cliente.nome).like(func.lower(cerca_pattern)),
+                func.lower(Cliente.cognome).like(func.lower(cerca_pattern)),
+                func.lower(func.concat(Cliente.nome, ' ', Cliente.cognome)).like(func.lower(cerca_pattern))
+            )
+        )
+    if filtro["dal"]:
+        q = q.filter(Feedback.data_feedback >= filtro["dal"])
+    if filtro["al"]:
+        q = q.filter(Feedback.data_feedback <= filtro["al"])
+    return q
+
+
+@registra_esportazione("feedback", _filtro_lista)
+def _esporta_lista(db, filtro: dict):
+    return _query_lista(db, filtro).with_entities(
+        Feedback.id_feedback.label("id_feedback"),
+        Feedback.data_feedback.label("data"),
+        Evento.nome_evento.label("evento"),
+        Cliente.id_cliente.label("id_cliente"),
+        Cliente.nome.label("nome"),
+        Cliente.cognome.label("cognome"),
+        Feedback.voto_musica.label("voto_musica"),
+        Feedback.voto_ingresso.label("voto_ingresso"),
+        Feedback.voto_ambiente.label("voto_ambiente"),
+        Feedback.voto_servizio.label("voto_servizio"),
+        Feedback.note.label("note"),
+    ).order_by(Feedback.data_feedback.desc(), Feedback.id_feedback.desc())
+
+
 @feedback_bp.route("/admin")
 @require_admin
 def admin_list():
     db = SessionLocal()
     try:
-        evento_id = request.args.get("evento_id", type=int)
-        cliente_id = request.args.get("cliente_id", type=int)
-        dal = request.args.get("dal")
-        al = request.args.get("al")
-        cerca_nome = request.args.get("cerca_nome", "").strip()
-
-        q = (
-            db.query(Feedback, Cliente, Evento)
-            .join(Cliente, Cliente.id_cliente == Feedback.cliente_id)
-            .join(Evento, Evento.id_evento == Feedback.evento_id)
+        filtro = _filtro_lista(request.args)
+        evento_id = filtro["evento_id"]
+        q = _query_lista(db, filtro)
+
+        per_page = per_page_richiesto()
+        pagina = pagina_keyset(
+            q, [(Feedback.data_feedback, True), (Feedback.id_feedback, True)],
+            prima=request.args.get("prima"), dopo=request.args.get("dopo"), per_page=per_page,
+            parametri=filtro,
         )
-        if evento_id:
-            q = q.filter(Feedback.evento_id == evento_id)
-        if cliente_id:
-            q = q.filter(Feedback.cliente_id == cliente_id)
-        if cerca_nome:
-            cerca_pattern = f"%{cerca_nome}%"
-            q = q.filter(
-                or_(
-                    func.lower(Cliente.nome).like(func.lower(cerca_pattern)),
-                    func.lower(Cliente.cognome).like(func.lower(cerca_pattern)),
-                    func.lower(func.concat(Cliente.nome, ' ', Cliente.cognome)).like(func.lower(cerca_pattern))
-                )
-            )
-        if dal:
-            q = q.filter(Feedback.data_feedback >= dal)
-        if al:
-            q = q.filter(Feedback.data_feedback <= al)
-
-        # Parametri paginazione
-        page = request.args.get("page", 1, type=int)
-        per_page = request.args.get("per_page", 50, type=int)
-        per_page = min(max(per_page, 10), 200)
-        
-        # Conta totale
-        total = q.count()
-        
-        # Applica paginazione
-        rows = q.order_by(Feedback.data_feedback.desc())\
-                .offset((page - 1) * per_page)\
-                .limit(per_page)\
-                .all()
+        rows = pagina.righe
+        if richiesta_json():
+            return risposta_json(pagina, "admin/_righe_feedback.html", rows=rows)
+        imposta_totale(pagina, db, q, Feedback)
 
         # analytics rapidi
         agg = (
@@ -167,39 +185,21 @@ def admin_list():
             agg = agg.filter(Feedback.evento_id == evento_id)
         count, avg_musica, avg_ingresso, avg_ambiente, avg_servizio = agg.one()
 
-        # Calcola pagine
-        total_pages = (total + per_page - 1) // per_page if total > 0 else 1
-        start_page = max(1, page - 2)
-        end_page = min(total_pages, page + 2)
-        pages_list = list(range(start_page, end_page + 1))
-
         eventi = db.query(Evento).order_by(Evento.data_evento.desc()).all()
 
-        # Conteggio prenotazioni tavolo in attesa
-        from app.models.prenotazioni import Prenotazione
-        prenotazioni_tavolo_attesa_count = db.query(func.count(Prenotazione.id_prenotazione))\
-            .filter(
-                Prenotazione.tipo == "tavolo",
-                Prenotazione.stato_approvazione_tavolo == "in_attesa"
-            ).scalar() or 0
-
         return render_template(
             "admin/feedback_list.html",
             rows=rows,
             eventi=eventi,
             filtro_evento_id=evento_id,
-            filtro={"evento_id": evento_id, "dal": dal, "al": al, "cerca_nome": cerca_nome},
+            filtro=filtro,
             count=count or 0,
             avg_musica=round(avg_musica or 0, 2),
             avg_ingresso=round(avg_ingresso or 0, 2),
             avg_ambiente=round(avg_ambiente or 0, 2),
             avg_servizio=round(avg_servizio or 0, 2),
-            page=page,
             per_page=per_page,
-            total=total,
-            prenotazioni_tavolo_attesa_count=prenotazioni_tavolo_attesa_count,
-            total_pages=total_pages,
-            pages_list=pages_list,
+            pagina=pagina,
         )
     finally:
         db.close()
@@ -2,10 +2,13 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify
 from sqlalchemy import func, and_, or_
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
 from datetime import datetime, timedelta
 from app.database import SessionLocal
 from app.utils.decorators import require_cliente, require_admin, require_staff
+from app.utils.paginazione import pagina_keyset, per_page_richiesto, imposta_totale, richiesta_json, risposta_json
 from app.routes.log_attivita import log_action
+from app.services.esportazioni import registra_esportazione
 from app.utils.events import get_evento_operativo
 from app.utils.helpers import get_current_staff_id, cliente_has_ingresso
 
@@ -306,95 +309,98 @@ def staff_esito(ingresso_id):
 # ============================================
 # 👑 ADMIN — Liste/Filtri, CRUD manuale, Undo, Analytics
 # ============================================
+def _filtro_lista(args) -> dict:
+    """Filtri della lista admin dalla query string (condivisi con l'esportazione)"""
+    return {
+        "evento_id": args.get("evento_id", type=int),
+        "tipo": args.get("tipo_ingresso"),
+        "staff_id": args.get("staff_id", type=int),
+        "dal": args.get("dal"),  # YYYY-MM-DD
+        "al": args.get("al"),    # YYYY-MM-DD
+        "cerca_nome": (args.get("cerca_nome") or "").strip(),
+    }
+
+
+def _query_lista(db, filtro: dict):
+    q = db.query(Ingresso, Cliente, Evento).join(Cliente, Cliente.id_cliente == Ingresso.cliente_id) \
+                                           .join(Evento, Evento.id_evento == Ingresso.evento_id)
+
+    if filtro["evento_id"]:
+        q = q.filter(Ingresso.evento_id == filtro["evento_id"])
+    if filtro["tipo"] in TIPI:
+        q = q.filter(Ingresso.tipo_ingresso == filtro["tipo"])
+    if filtro["staff_id"]:
+        q = q.filter(Ingresso.staff_id == filtro["staff_id"])
+    if filtro["cerca_nome"]:
+        cerca_pattern = f"%{filtro['cerca_nome']}%"
+        q = q.filter(
+            or_(
+                func.lower(Cliente.nome).like(func.lower(cerca_pattern)),
+                func.lower(Cliente.cognome).like(func.lower(cerca_pattern)),
+                func.lower(func.concat(Cliente.nome, ' ', Cliente.cognome)).like(func.lower(cerca_pattern))
+            )
+        )
+    if filtro["dal"]:
+        try:
+            d = datetime.strptime(filtro["dal"], "%Y-%m-%d")
+            q = q.filter(Ingresso.orario_ingresso >= d)
+        except ValueError:
+            pass
+    if filtro["al"]:
+        try:
+            d2 = datetime.strptime(filtro["al"], "%Y-%m-%d") + timedelta(days=1)
+            q = q.filter(Ingresso.orario_ingresso < d2)
+        except ValueError:
+            pass
+    return q
+
+
+@registra_esportazione("ingressi", _filtro_lista)
+def _esporta_lista(db, filtro: dict):
+    return _query_lista(db, filtro).outerjoin(Staff, Staff.id_staff == Ingresso.staff_id).with_entities(
+        Ingresso.id_ingresso.label("id_ingresso"),
+        Ingresso.orario_ingresso.label("orario"),
+        Evento.nome_evento.label("evento"),
+        Evento.data_evento.label("data_evento"),
+        Cliente.id_cliente.label("id_cliente"),
+        Cliente.nome.label("nome"),
+        Cliente.cognome.label("cognome"),
+        Ingresso.tipo_ingresso.label("tipo"),
+        Staff.nome.label("staff"),
+        Ingresso.note.label("note"),
+    ).order_by(Ingresso.orario_ingresso.desc(), Ingresso.id_ingresso.desc())
+
+
 @ingressi_bp.route("/admin", methods=["GET"])
 @require_admin
 def admin_list():
     db = SessionLocal()
     try:
-        from sqlalchemy import func
-        
-        # Parametri paginazione
-        page = request.args.get("page", 1, type=int)
-        per_page = request.args.get("per_page", 50, type=int)
-        per_page = min(max(per_page, 10), 200)
-        
-        # Filtri
-        evento_id = request.args.get("evento_id", type=int)
-        tipo = request.args.get("tipo_ingresso")
-        staff_id = request.args.get("staff_id", type=int)
-        dal = request.args.get("dal")  # YYYY-MM-DD
-        al = request.args.get("al")    # YYYY-MM-DD
-        cerca_nome = request.args.get("cerca_nome", "").strip()
-
-        q = db.query(Ingresso, Cliente, Evento).join(Cliente, Cliente.id_cliente == Ingresso.cliente_id) \
-                                               .join(Evento, Evento.id_evento == Ingresso.evento_id)
-
-        if evento_id:
-            q = q.filter(Ingresso.evento_id == evento_id)
-        if tipo in TIPI:
-            q = q.filter(Ingresso.tipo_ingresso == tipo)
-        if staff_id:
-            q = q.filter(Ingresso.staff_id == staff_id)
-        if cerca_nome:
-            from sqlalchemy import or_, func
-            cerca_pattern = f"%{cerca_nome}%"
-            q = q.filter(
-                or_(
-                    func.lower(Cliente.nome).like(func.lower(cerca_pattern)),
-                    func.lower(Cliente.cognome).like(func.lower(cerca_pattern)),
-                    func.lower(func.concat(Cliente.nome, ' ', Cliente.cognome)).like(func.lower(cerca_pattern))
-                )
-            )
-        if dal:
-            try:
-                d = datetime.strptime(dal, "%Y-%m-%d")
-                q = q.filter(Ingresso.orario_ingresso >= d)
-            except ValueError:
-                pass
-        if al:
-            try:
-                d2 = datetime.strptime(al, "%Y-%m-%d") + timedelta(days=1)
-                q = q.filter(Ingresso.orario_ingresso < d2)
-            except ValueError:
-                pass
+        per_page = per_page_richiesto()
+
+        filtro = _filtro_lista(request.args)
+        q = _query_lista(db, filtro)
+        pagina = pagina_keyset(
+            q.options(joinedload(Ingresso.staff)),
+            [(Ingresso.orario_ingresso, True), (Ingresso.id_ingresso, True)],
+            prima=request.args.get("prima"), dopo=request.args.get("dopo"), per_page=per_page,
+            parametri={**filtro, "tipo_ingresso": filtro["tipo"], "tipo": None},
+        )
+        rows = pagina.righe
+        if richiesta_json():
+            return risposta_json(pagina, "admin/_righe_ingressi.html", rows=rows)
+        imposta_totale(pagina, db, q, Ingresso)
 
-        # Conta totale
-        total = q.count()
-        
-        # Applica paginazione
-        rows = q.order_by(Ingresso.orario_ingresso.desc())\
-                .offset((page - 1) * per_page)\
-                .limit(per_page)\
-                .all()
-        
-        # Calcola pagine
-        total_pages = (total + per_page - 1) // per_page if total > 0 else 1
-        start_page = max(1, page - 2)
-        end_page = min(total_pages, page + 2)
-        pages_list = list(range(start_page, end_page + 1))
-        
         eventi = db.query(Evento).order_by(Evento.data_evento.desc()).all()
         staff_list = db.query(Staff).order_by(Staff.nome.asc()).all()
         
-        # Conteggio prenotazioni tavolo in attesa
-        from app.models.prenotazioni import Prenotazione
-        prenotazioni_tavolo_attesa_count = db.query(func.count(Prenotazione.id_prenotazione))\
-            .filter(
-                Prenotazione.tipo == "tavolo",
-                Prenotazione.stato_approvazione_tavolo == "in_attesa"
-            ).scalar() or 0
-        
         return render_template("admin/ingressi_list.html", 
                              rows=rows, 
                              eventi=eventi, 
                              staff_list=staff_list,
-                             filtro={"evento_id": evento_id, "tipo": tipo, "staff_id": staff_id, "dal": dal, "al": al, "cerca_nome": cerca_nome},
-                             page=page,
+                             filtro=filtro,
                              per_page=per_page,
-                             total=total,
-                             total_pages=total_pages,
-                             pages_list=pages_list,
-                             prenotazioni_tavolo_attesa_count=prenotazioni_tavolo_attesa_count)
+                             pagina=pagina)
     finally:
         db.close()
 
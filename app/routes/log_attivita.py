@@ -1,6 +1,5 @@
 # app/routes/log_attivita.py
 from flask import Blueprint, render_template, request
-from sqlalchemy import and_
 from typing import Optional
 from app.database import SessionLocal
 from app.utils.decorators import require_admin
@@ -9,84 +8,150 @@ from app.models.staff import Staff
 from app.models.consumi import Consumo
 from app.models.ingressi import Ingresso
 from app.models.clienti import Cliente
+from app.services import log_asincrono, log_archivio
+from app.services.esportazioni import registra_esportazione
 
 log_bp = Blueprint("log", __name__, url_prefix="/admin/logs")
 
 # Utility importabile per registrare log ovunque
-def log_action(db, *, tabella: str, record_id: int, staff_id: Optional[int], azione: str, note: Optional[str] = None):
-    entry = LogAttivita(tabella=tabella, record_id=record_id, staff_id=staff_id, azione=azione, note=note)
-    db.add(entry)
-    # commit delegato al chiamante per transazioni atomiche
+def log_action(db, *, tabella: str, record_id: int, staff_id: Optional[int], azione: str,
+               note: Optional[str] = None, sincrono: Optional[bool] = None):
+    """
+    Registra un'azione: scritta in background dopo il commit del chiamante
+    (scartata se fa rollback). Le azioni critiche, o ``sincrono=True``, restano
+    nella transazione del chiamante. Vedi ``app.services.log_asincrono``.
+    """
+    if sincrono is None:
+        sincrono = azione in log_asincrono.AZIONI_SINCRONE
+    riga = dict(tabella=tabella, record_id=record_id, staff_id=staff_id, azione=azione, note=note)
+    log_asincrono.registra(db, riga, sincrono)
+
+def _dettagli(db, logs):
+    """Descrizione leggibile di vendite e ingressi della pagina (3 query in tutto)"""
+    consumi_ids = {log.record_id for log in logs if log.tabella == "consumi"}
+    ingressi_ids = {log.record_id for log in logs if log.tabella == "ingressi"}
+    consumi = {c.id_consumo: c for c in db.query(Consumo).filter(Consumo.id_consumo.in_(consumi_ids))} if consumi_ids else {}
+    ingressi = {i.id_ingresso: i for i in db.query(Ingresso).filter(Ingresso.id_ingresso.in_(ingressi_ids))} if ingressi_ids else {}
+    clienti_ids = {c.cliente_id for c in consumi.values()} | {i.cliente_id for i in ingressi.values()}
+    clienti = {
+        c.id_cliente: f"{c.nome} {c.cognome}"
+        for c in db.query(Cliente.id_cliente, Cliente.nome, Cliente.cognome).filter(Cliente.id_cliente.in_(clienti_ids))
+    } if clienti_ids else {}
+
+    dettagli = {}
+    for log in logs:
+        if log.tabella == "consumi" and log.record_id in consumi:
+            c = consumi[log.record_id]
+            cliente_nome = clienti.get(c.cliente_id, "cliente sconosciuto")
+            dettagli[log.id_log] = f"Vendita: {c.prodotto} a {cliente_nome} (€{float(c.importo):.2f})"
+        elif log.tabella == "ingressi" and log.record_id in ingressi:
+            ing = ingressi[log.record_id]
+            cliente_nome = clienti.get(ing.cliente_id, "cliente sconosciuto")
+            dettagli[log.id_log] = f"Ingresso registrato: {ing.tipo_ingresso} per {cliente_nome}"
+    return dettagli
+
+
+def _filtro_lista(args) -> dict:
+    """Filtri del registro dalla query string (condivisi con l'esportazione)"""
+    return {
+        "tabella": args.get("tabella"),
+        "staff_id": args.get("staff_id", type=int),
+        "tipo": args.get("tipo"),  # "ingressi" | "vendite"
+        "dal": args.get("dal"),
+        "al": args.get("al"),
+    }
+
+
+def _tabelle(filtro: dict) -> set:
+    """Filtro per tipo alto livello + filtro diretto per tabella (opzionale, più tecnico)"""
+    tabelle = set()
+    if filtro["tipo"] == "ingressi":
+        tabelle.add("ingressi")
+    elif filtro["tipo"] == "vendite":
+        tabelle.add("consumi")
+    if filtro["tabella"]:
+        tabelle = {filtro["tabella"]} if not tabelle or filtro["tabella"] in tabelle else {None}
+    return tabelle
+
+
+def _query_lista(db, filtro: dict):
+    q = db.query(LogAttivita)
+    tabelle = _tabelle(filtro)
+    if tabelle:
+        q = q.filter(LogAttivita.tabella.in_(tabelle))
+    if filtro["staff_id"]:
+        q = q.filter(LogAttivita.staff_id == filtro["staff_id"])
+    if filtro["dal"]:
+        q = q.filter(LogAttivita.timestamp >= filtro["dal"])
+    if filtro["al"]:
+        q = q.filter(LogAttivita.timestamp <= filtro["al"])
+    return q
+
+
+@registra_esportazione("log", _filtro_lista)
+def _esporta_lista(db, filtro: dict):
+    # Solo le righe ancora nel DB: l'archivio compresso è già un file esportabile
+    return _query_lista(db, filtro).outerjoin(Staff, Staff.id_staff == LogAttivita.staff_id).with_entities(
+        LogAttivita.id_log.label("id_log"),
+        LogAttivita.timestamp.label("timestamp"),
+        LogAttivita.tabella.label("tabella"),
+        LogAttivita.record_id.label("record_id"),
+        LogAttivita.azione.label("azione"),
+        Staff.nome.label("staff"),
+        LogAttivita.note.label("note"),
+    ).order_by(LogAttivita.timestamp.desc(), LogAttivita.id_log.desc())
+
 
 @log_bp.route("/")
 @require_admin
 def list():
     db = SessionLocal()
     try:
-        tabella = request.args.get("tabella")
-        staff_id = request.args.get("staff_id", type=int)
-        tipo = request.args.get("tipo")  # "ingressi" | "vendite"
-        dal = request.args.get("dal")
-        al = request.args.get("al")
-        page = request.args.get("page", 1, type=int)
-        per_page = request.args.get("per_page", 50, type=int)
-
-        q = db.query(LogAttivita, Staff).outerjoin(Staff, LogAttivita.staff_id == Staff.id_staff)
-        # Filtro per tipo alto livello
-        if tipo == "ingressi":
-            q = q.filter(LogAttivita.tabella == "ingressi")
-        elif tipo == "vendite":
-            q = q.filter(LogAttivita.tabella == "consumi")
-        # Filtro diretto per tabella (opzionale, più tecnico)
-        if tabella:
-            q = q.filter(LogAttivita.tabella == tabella)
-        if staff_id:
-            q = q.filter(LogAttivita.staff_id == staff_id)
-        if dal:
-            q = q.filter(LogAttivita.timestamp >= dal)
-        if al:
-            q = q.filter(LogAttivita.timestamp <= al)
-
-        total = q.count()
-        base_rows = (
-            q.order_by(LogAttivita.timestamp.desc())
-             .offset((page - 1) * per_page)
-             .limit(per_page)
-             .all()
-        )
-        staffs = db.query(Staff).order_by(Staff.nome.asc()).all()
-
-        # Enrich: dettaglio umano leggibile
-        enriched_rows = []
-        for log, staff in base_rows:
-            detail = None
-            if log.tabella == "consumi":
-                c = db.query(Consumo).get(log.record_id)
-                if c:
-                    cli = db.query(Cliente).get(c.cliente_id)
-                    cliente_nome = f"{cli.nome} {cli.cognome}" if cli else "cliente sconosciuto"
-                    detail = f"Vendita: {c.prodotto} a {cliente_nome} (€{float(c.importo):.2f})"
-            elif log.tabella == "ingressi":
-                ing = db.query(Ingresso).get(log.record_id)
-                if ing:
-                    cli = db.query(Cliente).get(ing.cliente_id)
-                    cliente_nome = f"{cli.nome} {cli.cognome}" if cli else "cliente sconosciuto"
-                    detail = f"Ingresso registrato: {ing.tipo_ingresso} per {cliente_nome}"
-            enriched_rows.append((log, staff, detail))
+        filtro = _filtro_lista(request.args)
+        tabella, staff_id, tipo = filtro["tabella"], filtro["staff_id"], filtro["tipo"]
+        dal, al = filtro["dal"], filtro["al"]
+        tabelle = _tabelle(filtro)
+        archivio = request.args.get("archivio") == "1"
+        prima = request.args.get("prima")  # cursore: pagina successiva (più vecchie)
+        dopo = request.args.get("dopo")  # cursore: pagina precedente (più recenti)
+        per_page = min(max(request.args.get("per_page", 50, type=int), 1), 200)
 
+        staffs = db.query(Staff.id_staff, Staff.nome).order_by(Staff.nome.asc()).all()
+        nomi_staff = {s.id_staff: s.nome for s in staffs}
+
+        if archivio:
+            logs, cursore_successiva, cursore_precedente = log_archivio.cerca_archivio(
+                tabelle=tabelle, staff_id=staff_id, dal=dal, al=al, prima=prima, dopo=dopo, per_page=per_page
+            )
+            total = None
+        else:
+            q = _query_lista(db, filtro)
+            logs, cursore_successiva, cursore_precedente = log_archivio.pagina_log(
+                q, prima=prima, dopo=dopo, per_page=per_page
+            )
+            total = log_archivio.stima_totale(db)
+
+        dettagli = _dettagli(db, logs)
+        enriched_rows = [(log, nomi_staff.get(log.staff_id), dettagli.get(log.id_log)) for log in logs]
+
+        filtri = dict(per_page=per_page, tabella=tabella, staff_id=staff_id, tipo=tipo, dal=dal, al=al,
+                      archivio="1" if archivio else None)
         return render_template(
             "admin/log_list.html",
             rows=enriched_rows,
             total=total,
-            page=page,
             per_page=per_page,
             staffs=staffs,
+            filtri=filtri,
+            filtro=filtro,
+            cursore_successiva=cursore_successiva,
+            cursore_precedente=cursore_precedente,
             filtro_tabella=tabella,
             filtro_staff_id=staff_id,
             filtro_tipo=tipo,
             filtro_dal=dal,
             filtro_al=al,
+            filtro_archivio=archivio,
         )
     finally:
         db.close()
-
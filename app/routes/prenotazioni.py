@@ -1,5 +1,4 @@
 # app/routes/prenotazioni.py
-import secrets
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session, abort
 from sqlalchemy import func, and_, or_
 from sqlalchemy.orm import joinedload
@@ -17,6 +16,9 @@ from app.models.tavoli_evento import TavoloEvento
 from app.utils.decorators import require_cliente, require_admin, require_staff
 from app.routes.fedelta import award_on_no_show, PUNTI_NO_SHOW
 from app.utils.limiter import limiter
+from app.services import tavoli_inventario, codici_pool, contatori
+from app.services.esportazioni import registra_esportazione
+from app.utils.paginazione import pagina_keyset, per_page_richiesto, imposta_totale, richiesta_json, risposta_json
 
 prenotazioni_bp = Blueprint("prenotazioni", __name__, url_prefix="/prenotazioni")
 
@@ -29,16 +31,6 @@ STATI = ("attiva", "no-show", "usata", "cancellata")
 # ---------------------------
 from app.utils.helpers import get_current_cliente as _get_current_cliente
 
-INVITE_CODE_ALPHABET = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789"
-
-
-def _generate_unique_invite_code(db):
-    for _ in range(20):
-        candidate = "".join(secrets.choice(INVITE_CODE_ALPHABET) for _ in range(6))
-        if not db.query(Prenotazione.id_prenotazione).filter(Prenotazione.codice_invito == candidate).first():
-            return candidate
-    raise RuntimeError("Impossibile generare un codice invito univoco.")
-
 def _has_active_for_event(db, cliente_id, evento_id):
     return db.query(Prenotazione).filter(
         Prenotazione.cliente_id == cliente_id,
@@ -76,22 +68,6 @@ def nuova():
             flash("Evento non disponibile per prenotazioni.", "warning")
             return redirect(url_for("eventi.dettaglio_pubblico", evento_id=e.id_evento))
 
-        # Calcola tavoli disponibili per GET
-        tavoli_attivi = db.query(TavoloEvento).filter(
-            TavoloEvento.evento_id == e.id_evento,
-            TavoloEvento.attivo == True
-        ).order_by(TavoloEvento.numero_tavolo.asc()).all()
-
-        prenotazioni_tavolo = db.query(Prenotazione.numero_tavolo).filter(
-            Prenotazione.evento_id == e.id_evento,
-            Prenotazione.stato == "attiva",
-            Prenotazione.numero_tavolo.isnot(None),
-            Prenotazione.stato_approvazione_tavolo.in_(["in_attesa", "approvata", None]),
-            Prenotazione.ruolo_tavolo != "aderente"
-        ).all()
-        tavoli_prenotati_ids = {p[0] for p in prenotazioni_tavolo}
-        tavoli_disponibili = [t for t in tavoli_attivi if t.id_tavolo not in tavoli_prenotati_ids]
-
         if request.method == "POST":
             cli = _get_current_cliente(db)
             if not cli:
@@ -153,22 +129,6 @@ def nuova_tavolo():
             flash("Evento non disponibile per prenotazioni.", "warning")
             return redirect(url_for("eventi.dettaglio_pubblico", evento_id=e.id_evento))
 
-        # Calcola tavoli disponibili
-        tavoli_attivi = db.query(TavoloEvento).filter(
-            TavoloEvento.evento_id == e.id_evento,
-            TavoloEvento.attivo == True
-        ).order_by(TavoloEvento.numero_tavolo.asc()).all()
-
-        prenotazioni_tavolo = db.query(Prenotazione.numero_tavolo).filter(
-            Prenotazione.evento_id == e.id_evento,
-            Prenotazione.stato == "attiva",
-            Prenotazione.numero_tavolo.isnot(None),
-            Prenotazione.stato_approvazione_tavolo.in_(["in_attesa", "approvata", None]),
-            Prenotazione.ruolo_tavolo != "aderente"
-        ).all()
-        tavoli_prenotati_ids = {p[0] for p in prenotazioni_tavolo}
-        tavoli_disponibili = [t for t in tavoli_attivi if t.id_tavolo not in tavoli_prenotati_ids]
-
         if request.method == "POST":
             cli = _get_current_cliente(db)
             if not cli:
@@ -197,7 +157,11 @@ def nuova_tavolo():
                 flash("Specifica il numero di persone previste.", "danger")
                 return redirect(url_for("prenotazioni.nuova_tavolo", evento_id=e.id_evento))
 
-            tavolo = next((t for t in tavoli_attivi if t.id_tavolo == numero_tavolo_id), None)
+            tavolo = db.query(TavoloEvento).filter(
+                TavoloEvento.id_tavolo == numero_tavolo_id,
+                TavoloEvento.evento_id == e.id_evento,
+                TavoloEvento.attivo == True
+            ).first()
             if not tavolo:
                 flash("Tavolo non disponibile per questo evento.", "danger")
                 return redirect(url_for("prenotazioni.nuova_tavolo", evento_id=e.id_evento))
@@ -206,18 +170,6 @@ def nuova_tavolo():
                 flash(f"Numero superiore alla capienza del tavolo (max {tavolo.capienza}).", "danger")
                 return redirect(url_for("prenotazioni.nuova_tavolo", evento_id=e.id_evento))
 
-            prenotazione_esistente = db.query(Prenotazione).filter(
-                Prenotazione.evento_id == e.id_evento,
-                Prenotazione.numero_tavolo == numero_tavolo_id,
-                Prenotazione.stato == "attiva",
-                Prenotazione.stato_approvazione_tavolo.in_(["in_attesa", "approvata", None]),
-                Prenotazione.ruolo_tavolo != "aderente"
-            ).first()
-
-            if prenotazione_esistente:
-                flash("Questo tavolo è già stato richiesto da un altro referente.", "warning")
-                return redirect(url_for("prenotazioni.nuova_tavolo", evento_id=e.id_evento))
-
             pren = Prenotazione(
                 cliente_id=cli.id_cliente,
                 evento_id=e.id_evento,
@@ -230,14 +182,25 @@ def nuova_tavolo():
                 numero_tavolo=numero_tavolo_id,
                 nome_tavolo_gruppo=nome_tavolo_gruppo,
                 ruolo_tavolo="referente",
-                codice_invito=_generate_unique_invite_code(db)
+                codice_invito=codici_pool.assegna_codice(db, "invito")
             )
             db.add(pren)
+            db.flush()
+
+            # Claim atomico: con richieste simultanee sullo stesso tavolo ne passa una sola
+            if not tavoli_inventario.claim_tavolo(db, tavolo.id_tavolo, e.id_evento, pren.id_prenotazione):
+                db.rollback()
+                tavoli_inventario.aggiorna_mappa(db, e.id_evento)  # la mappa mostrata era superata
+                flash("Questo tavolo è già stato richiesto da un altro referente.", "warning")
+                return redirect(url_for("prenotazioni.nuova_tavolo", evento_id=e.id_evento))
             db.commit()
+            tavoli_inventario.aggiorna_mappa(db, e.id_evento)
             flash("Richiesta tavolo inviata. Attendi approvazione dallo staff.", "success")
             return redirect(url_for("prenotazioni.mie"))
 
         # GET
+        # Dalla mappa disponibilità in cache: nessuna query su prenotazioni
+        tavoli_disponibili = tavoli_inventario.tavoli_liberi(db, e.id_evento)
         return render_template("clienti/prenotazioni_new_tavolo.html", e=e, tavoli_disponibili=tavoli_disponibili)
     finally:
         db.close()
@@ -290,7 +253,7 @@ def entra_tavolo():
 
             # Query base: SOLO tavoli approvati dall'admin
             base_query = db.query(Prenotazione)\
-                .options(joinedload(Prenotazione.tavolo_evento), joinedload(Prenotazione.aderenti))\
+                .options(joinedload(Prenotazione.tavolo_evento))\
                 .filter(
                     Prenotazione.evento_id == e.id_evento,
                     Prenotazione.tipo == "tavolo",
@@ -344,7 +307,12 @@ def entra_tavolo():
                 flash("Sei già il referente di questo tavolo.", "info")
                 return redirect(url_for("prenotazioni.mie"))
 
-            if any(a.cliente_id == cli.id_cliente for a in target.aderenti if a.stato != "cancellata"):
+            gia_aderente = db.query(Prenotazione.id_prenotazione).filter(
+                Prenotazione.prenotazione_padre_id == target.id_prenotazione,
+                Prenotazione.cliente_id == cli.id_cliente,
+                Prenotazione.stato != "cancellata"
+            ).first()
+            if gia_aderente:
                 flash("Sei già associato a questo tavolo.", "info")
                 return redirect(url_for("prenotazioni.mie"))
 
@@ -365,12 +333,6 @@ def entra_tavolo():
                 return redirect(url_for("prenotazioni.entra_tavolo", evento_id=e.id_evento))
 
             max_capienza = min(tavolo.capienza, target.num_persone or tavolo.capienza)
-            aderenti_attivi = [a for a in target.aderenti if a.stato == "attiva"]
-            occupati = 1 + sum(a.num_persone or 1 for a in aderenti_attivi)
-
-            if occupati >= max_capienza:
-                flash("Il tavolo ha raggiunto la capienza massima.", "warning")
-                return redirect(url_for("prenotazioni.entra_tavolo", evento_id=e.id_evento))
 
             pren = Prenotazione(
                 cliente_id=cli.id_cliente,
@@ -387,7 +349,14 @@ def entra_tavolo():
                 prenotazione_padre_id=target.id_prenotazione
             )
             db.add(pren)
+
+            # Contatore occupazione atomico: niente conteggio degli aderenti in Python
+            if not tavoli_inventario.occupa_posto(db, target, max_capienza):
+                db.rollback()
+                flash("Il tavolo ha raggiunto la capienza massima.", "warning")
+                return redirect(url_for("prenotazioni.entra_tavolo", evento_id=e.id_evento))
             db.commit()
+            tavoli_inventario.aggiorna_mappa(db, e.id_evento)
             flash("Adesione al tavolo completata. Presentati con il gruppo alla serata.", "success")
             return redirect(url_for("prenotazioni.mie"))
 
@@ -594,8 +563,10 @@ def cancella_mia(pren_id):
             flash("Non è più possibile cancellare questa prenotazione.", "warning")
             return redirect(url_for("prenotazioni.mie"))
 
+        tavoli_inventario.rilascia(db, pren)
         pren.stato = "cancellata"
         db.commit()
+        tavoli_inventario.aggiorna_mappa(db, pren.evento_id)
         flash("Prenotazione cancellata.", "success")
         return redirect(url_for("prenotazioni.mie"))
     finally:
@@ -632,7 +603,6 @@ def staff_lista_evento(evento_id):
 @require_admin
 def admin_hub():
     """Hub centrale per la gestione operativa: prenotazioni, ingressi, consumi"""
-    from app.models.ingressi import Ingresso
     from app.models.consumi import Consumo
     from app.utils.events import get_evento_operativo
     
@@ -642,8 +612,7 @@ def admin_hub():
         evento_operativo = get_evento_operativo(db)
         
         # Statistiche generali
-        tot_prenotazioni_attive = db.query(func.count(Prenotazione.id_prenotazione))\
-            .filter(Prenotazione.stato == "attiva").scalar() or 0
+        tot_prenotazioni_attive = contatori.prenotazioni_attive(db)
         tot_prenotazioni_oggi = 0
         tot_ingressi_oggi = 0
         tot_consumi_oggi = 0
@@ -652,29 +621,20 @@ def admin_hub():
             eid = evento_operativo.id_evento
             tot_prenotazioni_oggi = db.query(func.count(Prenotazione.id_prenotazione))\
                 .filter(Prenotazione.evento_id == eid).scalar() or 0
-            tot_ingressi_oggi = db.query(func.count(Ingresso.id_ingresso))\
-                .filter(Ingresso.evento_id == eid).scalar() or 0
+            tot_ingressi_oggi = contatori.ingressi_evento(eid, db)
             tot_consumi_oggi = db.query(func.coalesce(func.sum(Consumo.importo), 0))\
                 .filter(Consumo.evento_id == eid).scalar() or 0
         
         # Ultimi eventi per filtro rapido
         eventi_recenti = db.query(Evento).order_by(Evento.data_evento.desc()).limit(10).all()
         
-        # Conteggio prenotazioni tavolo in attesa
-        prenotazioni_tavolo_attesa_count = db.query(func.count(Prenotazione.id_prenotazione))\
-            .filter(
-                Prenotazione.tipo == "tavolo",
-                Prenotazione.stato_approvazione_tavolo == "in_attesa"
-            ).scalar() or 0
-        
         return render_template("admin/operativo_hub.html",
                              evento_operativo=evento_operativo,
                              tot_prenotazioni_attive=tot_prenotazioni_attive,
                              tot_prenotazioni_oggi=tot_prenotazioni_oggi,
                              tot_ingressi_oggi=tot_ingressi_oggi,
                              tot_consumi_oggi=float(tot_consumi_oggi),
-                             eventi_recenti=eventi_recenti,
-                             prenotazioni_tavolo_attesa_count=prenotazioni_tavolo_attesa_count)
+                             eventi_recenti=eventi_recenti)
     finally:
         db.close()
 
@@ -682,80 +642,88 @@ def admin_hub():
 # ============================================
 # 👑 ADMIN — CRUD + regole + analytics
 # ============================================
+def _filtro_lista(args) -> dict:
+    """Filtri della lista admin dalla query string (condivisi con l'esportazione)"""
+    return {
+        "evento_id": args.get("evento_id", type=int),
+        "tipo": args.get("tipo"),
+        "stato": args.get("stato"),
+        "cerca_nome": (args.get("cerca_nome") or "").strip(),
+    }
+
+
+def _query_lista(db, filtro: dict):
+    q = db.query(Prenotazione, Cliente, Evento) \
+          .join(Cliente, Cliente.id_cliente == Prenotazione.cliente_id) \
+          .join(Evento, Evento.id_evento == Prenotazione.evento_id)
+
+    if filtro["evento_id"]:
+        q = q.filter(Prenotazione.evento_id == filtro["evento_id"])
+    if filtro["tipo"] in ("lista", "tavolo", "prevendita"):
+        q = q.filter(Prenotazione.tipo == filtro["tipo"])
+    if filtro["stato"] in STATI:
+        q = q.filter(Prenotazione.stato == filtro["stato"])
+    if filtro["cerca_nome"]:
+        # Cerca nel nome e cognome del cliente (case-insensitive)
+        cerca_pattern = f"%{filtro['cerca_nome']}%"
+        # Usa LIKE con LOWER per compatibilità MySQL
+        q = q.filter(
+            or_(
+                func.lower(Cliente.nome).like(func.lower(cerca_pattern)),
+                func.lower(Cliente.cognome).like(func.lower(cerca_pattern)),
+                func.lower(func.concat(Cliente.nome, ' ', Cliente.cognome)).like(func.lower(cerca_pattern))
+            )
+        )
+    return q
+
+
+@registra_esportazione("prenotazioni", _filtro_lista)
+def _esporta_lista(db, filtro: dict):
+    return _query_lista(db, filtro).with_entities(
+        Prenotazione.id_prenotazione.label("id_prenotazione"),
+        Evento.nome_evento.label("evento"),
+        Evento.data_evento.label("data_evento"),
+        Cliente.id_cliente.label("id_cliente"),
+        Cliente.nome.label("nome"),
+        Cliente.cognome.label("cognome"),
+        Cliente.telefono.label("telefono"),
+        Prenotazione.tipo.label("tipo"),
+        Prenotazione.stato.label("stato"),
+        Prenotazione.num_persone.label("num_persone"),
+        Prenotazione.orario_previsto.label("orario_previsto"),
+        Prenotazione.nome_tavolo_gruppo.label("tavolo_gruppo"),
+        Prenotazione.stato_approvazione_tavolo.label("approvazione_tavolo"),
+        Prenotazione.note.label("note"),
+    ).order_by(Evento.data_evento.desc(), Prenotazione.id_prenotazione.desc())
+
+
 @prenotazioni_bp.route("/admin", methods=["GET"])
 @require_admin
 def admin_list():
     db = SessionLocal()
     try:
-        from sqlalchemy import func
-        
-        # Parametri paginazione
-        page = request.args.get("page", 1, type=int)
-        per_page = request.args.get("per_page", 50, type=int)
-        per_page = min(max(per_page, 10), 200)
-        
-        # Filtri
-        evento_id = request.args.get("evento_id", type=int)
-        tipo = request.args.get("tipo")
-        stato = request.args.get("stato")
-        cerca_nome = request.args.get("cerca_nome", "").strip()
-
-        q = db.query(Prenotazione, Cliente, Evento) \
-              .join(Cliente, Cliente.id_cliente == Prenotazione.cliente_id) \
-              .join(Evento, Evento.id_evento == Prenotazione.evento_id)
-
-        if evento_id:
-            q = q.filter(Prenotazione.evento_id == evento_id)
-        if tipo in ("lista", "tavolo", "prevendita"):
-            q = q.filter(Prenotazione.tipo == tipo)
-        if stato in STATI:
-            q = q.filter(Prenotazione.stato == stato)
-        if cerca_nome:
-            # Cerca nel nome e cognome del cliente (case-insensitive)
-            cerca_pattern = f"%{cerca_nome}%"
-            # Usa LIKE con LOWER per compatibilità MySQL
-            q = q.filter(
-                or_(
-                    func.lower(Cliente.nome).like(func.lower(cerca_pattern)),
-                    func.lower(Cliente.cognome).like(func.lower(cerca_pattern)),
-                    func.lower(func.concat(Cliente.nome, ' ', Cliente.cognome)).like(func.lower(cerca_pattern))
-                )
-            )
-
-        # Conta totale
-        total = q.count()
-        
-        # Applica paginazione
-        rows = q.order_by(Evento.data_evento.desc(), Prenotazione.id_prenotazione.desc())\
-                .offset((page - 1) * per_page)\
-                .limit(per_page)\
-                .all()
-
-        # Calcola pagine
-        total_pages = (total + per_page - 1) // per_page if total > 0 else 1
-        start_page = max(1, page - 2)
-        end_page = min(total_pages, page + 2)
-        pages_list = list(range(start_page, end_page + 1))
+        per_page = per_page_richiesto()
+
+        filtro = _filtro_lista(request.args)
+        q = _query_lista(db, filtro)
+        pagina = pagina_keyset(
+            q, [(Evento.data_evento, True), (Prenotazione.id_prenotazione, True)],
+            prima=request.args.get("prima"), dopo=request.args.get("dopo"), per_page=per_page,
+            parametri=filtro,
+        )
+        rows = pagina.righe
+        if richiesta_json():
+            return risposta_json(pagina, "admin/_righe_prenotazioni.html", rows=rows)
+        imposta_totale(pagina, db, q, Prenotazione)
 
         eventi = db.query(Evento).order_by(Evento.data_evento.desc()).all()
         
-        # Conteggio prenotazioni tavolo in attesa
-        prenotazioni_tavolo_attesa_count = db.query(func.count(Prenotazione.id_prenotazione))\
-            .filter(
-                Prenotazione.tipo == "tavolo",
-                Prenotazione.stato_approvazione_tavolo == "in_attesa"
-            ).scalar() or 0
-        
         return render_template("admin/prenotazioni_list.html", 
                              rows=rows, 
                              eventi=eventi,
-                             filtro={"evento_id": evento_id, "tipo": tipo, "stato": stato, "cerca_nome": cerca_nome},
-                             page=page,
+                             filtro=filtro,
                              per_page=per_page,
-                             total=total,
-                             total_pages=total_pages,
-                             pages_list=pages_list,
-                             prenotazioni_tavolo_attesa_count=prenotazioni_tavolo_attesa_count)
+                             pagina=pagina)
     finally:
         db.close()
 
@@ -803,7 +771,7 @@ def admin_new():
                 note=note or None,
                 stato=stato,
                 ruolo_tavolo="referente" if tipo == "tavolo" else "none",
-                codice_invito=_generate_unique_invite_code(db) if tipo == "tavolo" else None
+                codice_invito=codici_pool.assegna_codice(db, "invito") if tipo == "tavolo" else None
             )
             db.add(pren)
             db.commit()
@@ -857,6 +825,11 @@ def admin_edit(pren_id):
                     flash("Per tavolo, note con nome tavolo obbligatorie.", "danger")
                     return redirect(url_for("prenotazioni.admin_edit", pren_id=pren_id))
 
+            # Se la prenotazione smette di tenere il tavolo, libera l'inventario
+            evento_precedente_id = pren.evento_id
+            if pren.tipo == "tavolo" and (tipo != "tavolo" or stato != "attiva" or evento_id != pren.evento_id):
+                tavoli_inventario.rilascia(db, pren)
+
             pren.cliente_id = cliente_id
             pren.evento_id = evento_id
             pren.tipo = tipo
@@ -874,9 +847,20 @@ def admin_edit(pren_id):
             else:
                 pren.ruolo_tavolo = "aderente" if pren.prenotazione_padre_id else "referente"
                 if pren.ruolo_tavolo == "referente" and not pren.codice_invito:
-                    pren.codice_invito = _generate_unique_invite_code(db)
+                    pren.codice_invito = codici_pool.assegna_codice(db, "invito")
+
+            # Referente di nuovo attivo (o su un altro tavolo): riprende il claim, se il tavolo è libero
+            if not tavoli_inventario.riprendi_tavolo(db, pren):
+                db.rollback()
+                tavoli_inventario.aggiorna_mappa(db, evento_precedente_id)
+                flash("Il tavolo di questa prenotazione è già tenuto da un'altra prenotazione "
+                      "(o non appartiene all'evento scelto): modifica non salvata.", "warning")
+                return redirect(url_for("prenotazioni.admin_edit", pren_id=pren_id))
 
             db.commit()
+            tavoli_inventario.aggiorna_mappa(db, evento_precedente_id)
+            if pren.evento_id != evento_precedente_id:
+                tavoli_inventario.aggiorna_mappa(db, pren.evento_id)
             if stato == "no-show":
                 award_on_no_show(db, cliente_id=pren.cliente_id, evento_id=pren.evento_id)
             flash("Prenotazione aggiornata.", "success")
@@ -924,8 +908,11 @@ def admin_delete(pren_id):
     try:
         pren = db.query(Prenotazione).get(pren_id)
         if pren:
+            evento_id = pren.evento_id
+            tavoli_inventario.rilascia(db, pren)
             db.delete(pren)
             db.commit()
+            tavoli_inventario.aggiorna_mappa(db, evento_id)
             flash("Prenotazione eliminata.", "warning")
         return redirect(url_for("prenotazioni.admin_list"))
     finally:
@@ -1036,6 +1023,7 @@ def admin_tavolo_new():
             )
             db.add(tavolo)
             db.commit()
+            tavoli_inventario.aggiorna_mappa(db, evento_id)
             flash("Tavolo creato correttamente.", "success")
             return redirect(url_for("prenotazioni.admin_tavoli_evento", evento_id=evento_id))
         
@@ -1064,6 +1052,7 @@ def admin_tavolo_edit(tavolo_id):
             tavolo.attivo = request.form.get("attivo") == "on"
             
             db.commit()
+            tavoli_inventario.aggiorna_mappa(db, tavolo.evento_id)
             flash("Tavolo aggiornato correttamente.", "success")
             return redirect(url_for("prenotazioni.admin_tavoli_evento", evento_id=tavolo.evento_id))
         
@@ -1087,6 +1076,7 @@ def admin_tavolo_delete(tavolo_id):
         evento_id = tavolo.evento_id
         db.delete(tavolo)
         db.commit()
+        tavoli_inventario.aggiorna_mappa(db, evento_id)
         flash("Tavolo eliminato correttamente.", "success")
         return redirect(url_for("prenotazioni.admin_tavoli_evento", evento_id=evento_id))
     finally:
@@ -1136,6 +1126,7 @@ def admin_tavoli_bulk_create(evento_id):
                 tavoli_esistenti += 1
         
         db.commit()
+        tavoli_inventario.aggiorna_mappa(db, evento_id)
         
         if tavoli_creati > 0:
             flash(f"Creati {tavoli_creati} tavoli (da 1 a {num_tavoli}). {tavoli_esistenti} tavoli già esistenti sono stati saltati.", "success")
@@ -1193,6 +1184,7 @@ def admin_approva_prenotazione_tavolo(pren_id):
         
         pren.stato_approvazione_tavolo = "approvata"
         db.commit()
+        tavoli_inventario.aggiorna_mappa(db, pren.evento_id)
         flash("Prenotazione tavolo approvata.", "success")
         return redirect(url_for("prenotazioni.admin_prenotazioni_tavolo_attesa"))
     finally:
@@ -1210,9 +1202,11 @@ def admin_rifiuta_prenotazione_tavolo(pren_id):
             flash("Prenotazione non trovata o non valida.", "danger")
             return redirect(url_for("prenotazioni.admin_prenotazioni_tavolo_attesa"))
         
+        tavoli_inventario.rilascia(db, pren)
         pren.stato_approvazione_tavolo = "rifiutata"
         pren.numero_tavolo = None  # Libera il tavolo
         db.commit()
+        tavoli_inventario.aggiorna_mappa(db, pren.evento_id)
         flash("Prenotazione tavolo rifiutata. Il tavolo è ora disponibile per altre prenotazioni.", "info")
         return redirect(url_for("prenotazioni.admin_prenotazioni_tavolo_attesa"))
     finally:
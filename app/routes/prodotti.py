@@ -4,6 +4,8 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash
 from app.database import SessionLocal
 from app.models.prodotti import Prodotto
 from app.utils.decorators import require_admin
+from app.utils.http_cache import condizionale
+from app.services.versioni_contenuti import firma_listino_pubblico
 
 prodotti_bp = Blueprint("prodotti", __name__, url_prefix="/prodotti")
 
@@ -139,6 +141,7 @@ def admin_delete(prodotto_id):
 
 
 @prodotti_bp.route("/listino", methods=["GET"])
+@condizionale(firma_listino_pubblico, max_age_anonimo=300)
 def public_listino():
     """Listino pubblico dei prodotti disponibili."""
     db = SessionLocal()
@@ -8,6 +8,7 @@ from werkzeug.security import generate_password_hash
 from app.utils.events import get_evento_operativo, set_evento_operativo_id
 from app.routes.log_attivita import log_action
 from app.utils.limiter import limiter
+from app.services import contatori
 
 staff_bp = Blueprint("staff", __name__, url_prefix="/staff")
 staff_admin_bp = Blueprint("staff_admin", __name__, url_prefix="/admin/staff")
@@ -44,7 +45,6 @@ def home():
 def scan_unificato():
     """Scanner unificato - porta d'ingresso principale per tutti gli operatori"""
     from sqlalchemy import func
-    from app.models.ingressi import Ingresso
     from app.models.prodotti import Prodotto
     from app.models.prenotazioni import Prenotazione
     
@@ -58,9 +58,7 @@ def scan_unificato():
         staff_role = session.get("staff_role", "")
         
         # Statistiche evento
-        ingressi_totali = db.query(func.count(Ingresso.id_ingresso)).filter(
-            Ingresso.evento_id == evento.id_evento
-        ).scalar() or 0
+        ingressi_totali = contatori.ingressi_evento(evento.id_evento, db)
         
         capienza_residua = None
         if evento.capienza_max:
@@ -12,6 +12,7 @@ from app.services.statistics import (
     get_consumi_stats,
     get_clienti_stats
 )
+from app.services.analisi_clienti import analisi_clienti
 
 stats_bp = Blueprint("stats", __name__, url_prefix="/admin/stats")
 
@@ -51,6 +52,9 @@ def admin_overview():
         
         eventi = db.query(Evento).order_by(Evento.data_evento.desc()).limit(20).all()
         
+        # KPI di tutte le aree in un'unica SELECT: le statistiche complete li riusano
+        get_overview_stats(db, evento_id)
+        
         # Statistiche complete
         ingressi_stats = get_ingressi_stats(db, evento_id, giorni)
         prenotazioni_stats = get_prenotazioni_stats(db, evento_id)
@@ -144,10 +148,13 @@ def admin_clienti():
     try:
         eventi = db.query(Evento).order_by(Evento.data_evento.desc()).limit(20).all()
         stats = get_clienti_stats(db)
+        # Coorti, frequenza, RFM e churn (None se NumPy non è installato)
+        analisi = analisi_clienti(db)
         
         return render_template(
             "admin/stats_clienti.html",
             stats=stats,
+            analisi=analisi,
             eventi=eventi
         )
     finally:
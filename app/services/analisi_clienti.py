@@ -0,0 +1,251 @@
+"""
+Analisi clienti vettorizzata: coorti di retention, frequenza delle visite,
+segmenti RFM e clienti a rischio abbandono (churn).
+
+Una sola query in streaming carica array compatti (cliente, mese di
+registrazione, giorno di ogni serata frequentata, spesa totale), già come
+numeri calcolati dal DB (``fasce_orarie.mese_epoca``/``giorno_epoca``); tutti i calcoli
+sono operazioni NumPy sugli array, senza cicli per cliente, così anche
+centinaia di migliaia di clienti si analizzano in pochi secondi. Il risultato
+è calcolato una volta al giorno e tenuto nella cache condivisa.
+
+NumPy è nei requirements; se manca comunque, all'avvio si logga un warning,
+``analisi_clienti`` ritorna None e la pagina statistiche lo segnala.
+"""
+import logging
+from datetime import date, datetime
+from typing import Optional
+
+from sqlalchemy import Float, cast, func, select
+from sqlalchemy.orm import Session
+
+from app.models.clienti import Cliente
+from app.models.eventi import Evento
+from app.services.archivio_eventi import unione
+from app.utils.cache import cache_get, cache_set
+from app.utils.fasce_orarie import giorno_epoca, mese_epoca
+
+logger = logging.getLogger(__name__)
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+    logger.warning("Pacchetto 'numpy' non installato: analisi coorti/RFM disattivata (pip install -r requirements.txt)")
+
+MESI_COORTE = 12           # coorti mostrate (mesi di registrazione più recenti)
+SOGLIA_CHURN_GIORNI = 90   # assenza minima per considerare perso un cliente
+TTL_ANALISI = 24 * 3600
+LOTTO = 50000              # righe lette dal cursore per volta
+NESSUNO = -(2 ** 31)       # sentinella SQL per date mancanti
+
+# (minimo visite, etichetta): l'ultima fascia è aperta
+FASCE_FREQUENZA = ((0, "0"), (1, "1"), (2, "2"), (3, "3-5"), (6, "6-10"), (11, "11+"))
+
+# In ordine di priorità: vince la prima condizione vera (punteggi R/F da 1 a 5)
+SEGMENTI = (
+    ("Campioni", lambda r, f: (r >= 4) & (f >= 4)),
+    ("Fedeli", lambda r, f: (r >= 3) & (f >= 4)),
+    ("Nuovi", lambda r, f: (r >= 4) & (f <= 1)),
+    ("Promettenti", lambda r, f: r >= 4),
+    ("A rischio", lambda r, f: (r <= 2) & (f >= 3)),
+    ("Persi", lambda r, f: r <= 1),
+)
+SEGMENTO_RESTO = "Dormienti"
+
+
+# ─────────────────────────────────────────────
+# Caricamento
+# ─────────────────────────────────────────────
+def _carica(db: Session) -> dict:
+    """Array paralleli, una riga per (cliente, serata frequentata) o per cliente senza ingressi"""
+    # Storico completo: tabelle calde + archivio degli eventi chiusi da tempo
+    consumi, ingressi = unione("consumi", "cliente_id", "importo"), unione("ingressi", "cliente_id", "evento_id")
+    spesa = select(
+        consumi.c.cliente_id, func.sum(consumi.c.importo).label("spesa")
+    ).group_by(consumi.c.cliente_id).subquery()
+    serate = select(
+        ingressi.c.cliente_id, Evento.data_evento
+    ).join(Evento, ingressi.c.evento_id == Evento.id_evento).where(
+        Evento.data_evento.isnot(None)
+    ).distinct().subquery()
+    # Solo interi e float già calcolati dal DB: niente datetime/Decimal da convertire riga per riga
+    stmt = select(
+        Cliente.id_cliente,
+        func.coalesce(mese_epoca(Cliente.data_registrazione), NESSUNO),
+        cast(func.coalesce(spesa.c.spesa, 0), Float),
+        func.coalesce(giorno_epoca(serate.c.data_evento), NESSUNO),
+    ).outerjoin(spesa, spesa.c.cliente_id == Cliente.id_cliente).outerjoin(
+        serate, serate.c.cliente_id == Cliente.id_cliente
+    )
+
+    colonne = ([], [], [], [])
+    tipi = (np.int64, np.int64, np.float64, np.int64)
+    # Core (non ORM): le righe arrivano come tuple senza passare dal caricamento oggetti
+    risultato = db.connection().execute(stmt.execution_options(yield_per=LOTTO))
+    try:
+        for lotto in risultato.partitions():
+            for i, valori in enumerate(zip(*lotto)):
+                colonne[i].append(np.fromiter(valori, dtype=tipi[i], count=len(lotto)))
+    finally:
+        risultato.close()
+    ids, registrazione, spese, serata = (
+        np.concatenate(c) if c else np.empty(0, dtype=t) for c, t in zip(colonne, tipi)
+    )
+
+    # Sentinella → NaT, poi gli interi diventano date NumPy senza copie
+    for valori in (registrazione, serata):
+        valori[valori == NESSUNO] = np.iinfo(np.int64).min
+    return {
+        "id": ids,
+        "registrazione": registrazione.view("datetime64[M]"),
+        "spesa": spese,
+        "serata": serata.view("datetime64[D]"),
+    }
+
+
+# ─────────────────────────────────────────────
+# Calcoli vettorizzati
+# ─────────────────────────────────────────────
+def _punteggio_quintili(valori, crescente: bool = True):
+    """Punteggio 1..5 per quintile (5 = migliore); con crescente=False vince il valore più basso"""
+    if not len(valori):
+        return valori.astype(np.int64)
+    soglie = np.quantile(valori, [0.2, 0.4, 0.6, 0.8])
+    punteggio = np.searchsorted(soglie, valori, side="right") + 1
+    return punteggio if crescente else 6 - punteggio
+
+
+def _coorti(mese_reg, cliente_visita, mese_visita, mese_corrente: int) -> list:
+    primo = mese_corrente - MESI_COORTE + 1
+    nella_finestra = (mese_reg >= primo) & (mese_reg <= mese_corrente)
+    dimensioni = np.bincount(mese_reg[nella_finestra] - primo, minlength=MESI_COORTE)
+
+    # Clienti distinti per (coorte, mesi dalla registrazione)
+    in_coorte = nella_finestra[cliente_visita]
+    cliente_visita = cliente_visita[in_coorte]
+    offset = mese_visita[in_coorte] - mese_reg[cliente_visita]
+    validi = (offset >= 0) & (offset < MESI_COORTE)
+    coppie = np.unique(cliente_visita[validi] * MESI_COORTE + offset[validi])
+    clienti, offset = coppie // MESI_COORTE, coppie % MESI_COORTE
+    matrice = np.zeros((MESI_COORTE, MESI_COORTE), dtype=np.int64)
+    np.add.at(matrice, (mese_reg[clienti] - primo, offset), 1)
+
+    coorti = []
+    for i in range(MESI_COORTE):
+        if not dimensioni[i]:
+            continue
+        mesi_trascorsi = MESI_COORTE - i  # offset osservabili fino al mese corrente
+        mese = np.datetime64(primo + i, "M")
+        coorti.append({
+            "mese": str(mese),
+            "clienti": int(dimensioni[i]),
+            "retention": [
+                round(float(matrice[i, k]) * 100 / int(dimensioni[i]), 1) if k < mesi_trascorsi else None
+                for k in range(MESI_COORTE)
+            ],
+        })
+    return coorti
+
+
+def _frequenza(visite) -> list:
+    minimi = [m for m, _ in FASCE_FREQUENZA]
+    fascia = np.searchsorted(minimi, visite, side="right") - 1
+    conteggi = np.bincount(fascia, minlength=len(minimi))
+    return [{"fascia": etichetta, "clienti": int(n)} for (_, etichetta), n in zip(FASCE_FREQUENZA, conteggi)]
+
+
+def _segmenti(recency, visite, spesa) -> list:
+    r = _punteggio_quintili(recency, crescente=False)
+    f = _punteggio_quintili(visite)
+    nomi = [nome for nome, _ in SEGMENTI] + [SEGMENTO_RESTO]
+    codice = np.select([cond(r, f) for _, cond in SEGMENTI], range(len(SEGMENTI)), default=len(SEGMENTI))
+
+    conteggi = np.bincount(codice, minlength=len(nomi))
+    somme = {
+        "recency": np.bincount(codice, weights=recency, minlength=len(nomi)),
+        "visite": np.bincount(codice, weights=visite, minlength=len(nomi)),
+        "spesa": np.bincount(codice, weights=spesa, minlength=len(nomi)),
+    }
+    out = []
+    for i, nome in enumerate(nomi):
+        n = int(conteggi[i])
+        out.append({
+            "segmento": nome,
+            "clienti": n,
+            "recency_media": int(round(somme["recency"][i] / n)) if n else None,
+            "visite_medie": round(float(somme["visite"][i]) / n, 1) if n else None,
+            "spesa_media": round(float(somme["spesa"][i]) / n, 2) if n else None,
+        })
+    return out
+
+
+def calcola(db: Session, oggi: Optional[date] = None) -> dict:
+    oggi = oggi or date.today()
+    dati = _carica(db)
+
+    # Un indice 0..n-1 per cliente; registrazione e spesa sono ripetute su ogni riga del cliente
+    _, primo_indice, cliente = np.unique(dati["id"], return_index=True, return_inverse=True)
+    n = len(primo_indice)
+    registrazione = dati["registrazione"][primo_indice]
+    spesa = dati["spesa"][primo_indice]
+
+    ha_serata = ~np.isnat(dati["serata"])
+    cliente_visita = cliente[ha_serata]
+    giorno_visita = dati["serata"][ha_serata].astype(np.int64)
+    mese_visita = dati["serata"][ha_serata].astype("datetime64[M]").astype(np.int64)
+
+    visite = np.bincount(cliente_visita, minlength=n)
+    ultima = np.full(n, np.iinfo(np.int64).min)
+    prima = np.full(n, np.iinfo(np.int64).max)
+    np.maximum.at(ultima, cliente_visita, giorno_visita)
+    np.minimum.at(prima, cliente_visita, giorno_visita)
+
+    # Clienti senza data di registrazione: coorte del mese della prima serata (nessuna se mai entrati)
+    mese_reg = registrazione.astype(np.int64)
+    senza_reg = np.isnat(registrazione)
+    if senza_reg.any():
+        mese_prima = np.where(visite > 0, prima, 0).astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+        mese_reg = np.where(senza_reg & (visite > 0), mese_prima, mese_reg)
+
+    giorno_oggi = np.datetime64(oggi, "D").astype(np.int64)
+    mese_corrente = np.datetime64(oggi, "M").astype(np.int64)
+
+    attivi = visite > 0
+    recency = (giorno_oggi - ultima[attivi]).astype(np.float64)
+    visite_attivi = visite[attivi].astype(np.float64)
+
+    # Churn: assente da più della soglia e da più del doppio del suo intervallo medio fra le serate
+    intervallo = np.where(
+        visite_attivi > 1,
+        (ultima[attivi] - prima[attivi]) / np.maximum(visite_attivi - 1, 1),
+        0,
+    )
+    churn = recency > np.maximum(SOGLIA_CHURN_GIORNI, 2 * intervallo)
+    n_attivi = int(attivi.sum())
+
+    return {
+        "generato": datetime.now().isoformat(timespec="seconds"),
+        "clienti": int(n),
+        "con_ingressi": n_attivi,
+        "coorti": _coorti(mese_reg, cliente_visita, mese_visita, int(mese_corrente)),
+        "frequenza": _frequenza(visite),
+        "segmenti": _segmenti(recency, visite_attivi, spesa[attivi]),
+        "churn": {
+            "clienti": int(churn.sum()),
+            "percentuale": round(float(churn.sum()) * 100 / n_attivi, 1) if n_attivi else 0,
+            "soglia_giorni": SOGLIA_CHURN_GIORNI,
+        },
+    }
+
+
+def analisi_clienti(db: Session) -> Optional[dict]:
+    """Analisi del giorno dalla cache, calcolata alla prima richiesta; None se NumPy manca"""
+    if np is None:
+        return None
+    chiave = f"analisi_clienti:{date.today().isoformat()}"
+    analisi = cache_get(chiave)
+    if analisi is None:
+        analisi = calcola(db)
+        cache_set(chiave, analisi, TTL_ANALISI)
+    return analisi
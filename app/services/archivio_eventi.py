@@ -0,0 +1,265 @@
+"""
+Archivio freddo degli eventi chiusi.
+
+Gli eventi chiusi con data più vecchia di ``EVENTI_ARCHIVIO_MESI`` mesi
+(default 13, oltre lo storico usato dalle previsioni d'affluenza) vengono
+archiviati da un job a lotti (``flask eventi-archivia``), un evento per lotto:
+
+1. il log attività dei loro record va nei file mensili di ``log_archivio``;
+2. gli aggregati vanno in ``riepilogo_eventi`` / ``riepilogo_eventi_prodotti``;
+3. ingressi, consumi, prenotazioni e movimenti fedeltà già consolidati negli
+   snapshot passano nelle tabelle ``*_archivio`` (INSERT … SELECT + DELETE),
+   nella stessa transazione che imposta ``eventi.archiviato_il``.
+
+Lettura trasparente: ``modelli_evento`` dà al dettaglio evento le tabelle
+giuste (calde o archivio, stesse colonne); le statistiche sommano i riepiloghi
+ai KPI; scheda cliente e analisi clienti leggono anche l'archivio.
+"""
+import json
+import os
+import re
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+import click
+from sqlalchemy import and_, case, delete, func, insert, select, union_all
+from sqlalchemy.orm import Session
+
+from app.models.archivio_eventi import (
+    ConsumoArchivio, FedeltaArchivio, IngressoArchivio, PrenotazioneArchivio, RiepilogoEvento,
+    RiepilogoProdottoEvento,
+)
+from app.models.consumi import Consumo
+from app.models.eventi import Evento
+from app.models.fedelta_snapshot import FedeltaSnapshot
+from app.models.fedeltà import Fedelta
+from app.models.ingressi import Ingresso
+from app.models.log_attivita import LogAttivita
+from app.models.prenotazioni import Prenotazione
+from app.services import contatori, log_archivio
+from app.utils.jobs import registra_handler
+
+MESI_ARCHIVIO = int(os.getenv("EVENTI_ARCHIVIO_MESI", "13"))
+JOB_ARCHIVIA_EVENTI = "archivia_eventi"
+
+Modelli = namedtuple("Modelli", "ingressi consumi prenotazioni fedelta")
+CALDE = Modelli(Ingresso, Consumo, Prenotazione, Fedelta)
+ARCHIVIO = Modelli(IngressoArchivio, ConsumoArchivio, PrenotazioneArchivio, FedeltaArchivio)
+
+# Quantità nel nome prodotto (es. "Cocktail x3"), come in statistics.get_consumi_stats
+_QUANTITA = re.compile(r"\s+x(\d+)$")
+
+
+# ─────────────────────────────────────────────
+# Lettura trasparente
+# ─────────────────────────────────────────────
+def modelli_evento(db: Session, evento_id: int) -> Modelli:
+    """Tabelle che contengono il dettaglio dell'evento: calde oppure archivio"""
+    archiviato = db.query(Evento.archiviato_il).filter(Evento.id_evento == evento_id).scalar()
+    return ARCHIVIO if archiviato else CALDE
+
+
+def unione(tabella: str, *colonne: str):
+    """Subquery UNION ALL di tabella calda e archivio sulle colonne indicate (per nome)"""
+    calda, archivio = getattr(CALDE, tabella), getattr(ARCHIVIO, tabella)
+    return union_all(
+        select(*[getattr(calda, c) for c in colonne]),
+        select(*[getattr(archivio, c) for c in colonne]),
+    ).subquery(f"{tabella}_tutti")
+
+
+def totali_archivio_cliente(db: Session, cliente_id: int) -> dict:
+    """Totali del cliente sugli eventi archiviati (una SELECT, indici per cliente)"""
+    def scalare(colonna, model):
+        return select(colonna).where(model.cliente_id == cliente_id).scalar_subquery()
+
+    r = db.execute(select(
+        scalare(func.count(PrenotazioneArchivio.id_prenotazione), PrenotazioneArchivio).label("prenotazioni"),
+        scalare(func.count(IngressoArchivio.id_ingresso), IngressoArchivio).label("ingressi"),
+        scalare(func.coalesce(func.sum(ConsumoArchivio.importo), 0), ConsumoArchivio).label("consumi"),
+        scalare(func.coalesce(func.sum(FedeltaArchivio.punti), 0), FedeltaArchivio).label("punti"),
+    )).one()
+    return {
+        "prenotazioni": r.prenotazioni or 0,
+        "ingressi": r.ingressi or 0,
+        "consumi": float(r.consumi or 0),
+        "punti": int(r.punti or 0),
+    }
+
+
+# ─────────────────────────────────────────────
+# Riepiloghi (aggregati conservati)
+# ─────────────────────────────────────────────
+def _conta_se(condizione):
+    return func.coalesce(func.sum(case((condizione, 1), else_=0)), 0)
+
+
+def _riepilogo(db: Session, evento_id: int) -> dict:
+    tavolo = Prenotazione.tipo == "tavolo"
+    approvazione = Prenotazione.stato_approvazione_tavolo
+    p = db.execute(select(
+        func.count(Prenotazione.id_prenotazione),
+        _conta_se(Prenotazione.tipo == "lista"),
+        _conta_se(tavolo),
+        _conta_se(and_(tavolo, approvazione == "in_attesa")),
+        _conta_se(and_(tavolo, approvazione == "approvata")),
+        _conta_se(and_(tavolo, approvazione == "rifiutata")),
+    ).where(Prenotazione.evento_id == evento_id)).one()
+    revenue, ordini = db.execute(
+        select(func.coalesce(func.sum(Consumo.importo), 0), func.count(Consumo.id_consumo))
+        .where(Consumo.evento_id == evento_id)
+    ).one()
+    return {
+        "ingressi": db.execute(
+            select(func.count(Ingresso.id_ingresso)).where(Ingresso.evento_id == evento_id)
+        ).scalar() or 0,
+        "prenotazioni": p[0] or 0,
+        "prenotazioni_lista": int(p[1]),
+        "prenotazioni_tavolo": int(p[2]),
+        "tavoli_in_attesa": int(p[3]),
+        "tavoli_approvati": int(p[4]),
+        "tavoli_rifiutati": int(p[5]),
+        "revenue": revenue,
+        "num_ordini": ordini or 0,
+        "punti_fedelta": int(db.execute(
+            select(func.coalesce(func.sum(Fedelta.punti), 0)).where(Fedelta.evento_id == evento_id)
+        ).scalar() or 0),
+    }
+
+
+def _riepilogo_prodotti(db: Session, evento_id: int) -> list:
+    """Una riga per (prodotto, nome venduto): la quantità si ricava dal nome come nelle statistiche"""
+    righe = db.execute(
+        select(Consumo.prodotto_id, Consumo.prodotto, func.count(Consumo.id_consumo), func.sum(Consumo.importo))
+        .where(Consumo.evento_id == evento_id)
+        .group_by(Consumo.prodotto_id, Consumo.prodotto)
+    ).all()
+    prodotti = []
+    for prodotto_id, nome, n, importo in righe:
+        match = _QUANTITA.search(nome or "")
+        prodotti.append({
+            "evento_id": evento_id,
+            "prodotto_id": prodotto_id,
+            "prodotto": nome,
+            "num_consumi": n,
+            "quantita": n * (int(match.group(1)) if match else 1),
+            "revenue": importo or 0,
+        })
+    return prodotti
+
+
+# ─────────────────────────────────────────────
+# Archiviazione
+# ─────────────────────────────────────────────
+def _da_archiviare(mesi: int):
+    limite = date.today() - timedelta(days=30 * mesi)
+    return (
+        Evento.stato_pubblico == "chiuso",
+        Evento.data_evento < limite,
+        Evento.archiviato_il.is_(None),
+    )
+
+
+def conta_da_archiviare(db: Session, mesi: int = MESI_ARCHIVIO) -> int:
+    return db.query(func.count(Evento.id_evento)).filter(*_da_archiviare(mesi)).scalar() or 0
+
+
+def _condizione(model, evento_id: int):
+    condizione = model.evento_id == evento_id
+    if model is Fedelta:
+        # Solo i movimenti già dentro lo snapshot: il saldo (snapshot + coda) non cambia
+        consolidato = select(FedeltaSnapshot.ultimo_id_fedelta).where(
+            FedeltaSnapshot.cliente_id == Fedelta.cliente_id
+        ).scalar_subquery()
+        condizione = and_(condizione, Fedelta.id_fedelta <= consolidato)
+    return condizione
+
+
+def archivia_evento(db: Session, evento: Evento, staff_id: Optional[int] = None) -> int:
+    """
+    Sposta il dettaglio di un evento nell'archivio; ritorna le righe spostate.
+    Il log viene archiviato prima (con commit propri); il resto è nella
+    transazione del chiamante, che fa commit.
+    """
+    from app.routes.log_attivita import log_action
+
+    evento_id = evento.id_evento
+    log = 0
+    for model in CALDE:
+        pk = model.__mapper__.primary_key[0]
+        log += log_archivio.sposta(
+            db, LogAttivita.tabella == model.__tablename__,
+            LogAttivita.record_id.in_(select(pk).where(model.evento_id == evento_id)),
+        )
+
+    db.merge(RiepilogoEvento(evento_id=evento_id, log_archiviati=log, data_archiviazione=datetime.now(),
+                             **_riepilogo(db, evento_id)))
+    db.execute(delete(RiepilogoProdottoEvento).where(RiepilogoProdottoEvento.evento_id == evento_id))
+    prodotti = _riepilogo_prodotti(db, evento_id)
+    if prodotti:
+        db.execute(insert(RiepilogoProdottoEvento), prodotti)
+
+    # Ingressi prima delle prenotazioni (FK prenotazione_id in SET NULL)
+    spostate = 0
+    for calda, archivio in zip(CALDE, ARCHIVIO):
+        condizione = _condizione(calda, evento_id)
+        colonne = [c.name for c in archivio.__table__.columns]
+        spostate += db.execute(insert(archivio).from_select(
+            colonne, select(*[calda.__table__.c[n] for n in colonne]).where(condizione)
+        )).rowcount
+        db.execute(delete(calda).where(condizione).execution_options(synchronize_session=False))
+
+    evento.archiviato_il = datetime.now()
+    log_action(
+        db,
+        tabella="eventi",
+        record_id=evento_id,
+        staff_id=staff_id,
+        azione="update",
+        note=f"Evento archiviato: {evento.nome_evento} ({evento.data_evento}), {spostate} righe e {log} log spostati",
+    )
+    return spostate
+
+
+@registra_handler(JOB_ARCHIVIA_EVENTI)
+def archivia_eventi_batch(db: Session, job) -> bool:
+    """Un lotto = un evento (id > cursore); il runner fa commit dopo ogni evento"""
+    from app.services import fedelta_ledger
+
+    mesi = json.loads(job.parametri or "{}").get("mesi", MESI_ARCHIVIO)
+    if not job.cursore:
+        # Consolida il ledger: i movimenti degli eventi possono lasciare la tabella calda
+        fedelta_ledger.aggiorna_snapshot(db)
+    evento = db.query(Evento).filter(
+        *_da_archiviare(mesi), Evento.id_evento > (job.cursore or 0)
+    ).order_by(Evento.id_evento).first()
+    if evento is None:
+        # Prenotazioni e ingressi spostati con INSERT…SELECT: i contatori si riallineano una volta alla fine
+        contatori.ricalcola(db)
+        return True
+    archivia_evento(db, evento, staff_id=job.staff_id)
+    job.cursore = evento.id_evento
+    job.processati = (job.processati or 0) + 1
+    return False
+
+
+def init_cli(app):
+    from app.database import SessionLocal
+    from app.utils.jobs import crea_job, esegui_job
+
+    @app.cli.command("eventi-archivia")
+    @click.option("--mesi", type=int, default=MESI_ARCHIVIO, show_default=True,
+                  help="Archivia gli eventi chiusi con data più vecchia di N mesi")
+    def eventi_archivia_cmd(mesi):
+        """Sposta il dettaglio degli eventi chiusi da tempo nelle tabelle di archivio."""
+        db = SessionLocal()
+        try:
+            job = crea_job(db, JOB_ARCHIVIA_EVENTI, totale=conta_da_archiviare(db, mesi), parametri={"mesi": mesi})
+            esegui_job(job.id_job)
+            db.refresh(job)
+            click.echo(f"Eventi archiviati: {job.processati or 0} (stato job: {job.stato})")
+            if job.errore:
+                click.echo(f"Errore: {job.errore}")
+        finally:
+            db.close()
@@ -0,0 +1,142 @@
+"""
+Allocazione di codici univoci da un pool pregenerato.
+
+I QR dei clienti e i codici invito dei tavoli vengono generati a lotti in
+background, verificati in blocco contro la tabella di destinazione (una query
+``IN`` per lotto invece di una per tentativo) e salvati in ``codici_pool``.
+Assegnare un codice è un unico ``DELETE`` condizionale sulla riga scelta, nella
+stessa transazione del chiamante: se questa fa rollback il codice torna nel pool.
+
+Quando il pool scende sotto la soglia parte un rifornimento in un thread; se è
+vuoto (primo avvio) si ricade sulla generazione diretta con verifica puntuale.
+"""
+import logging
+import secrets
+import threading
+from collections import namedtuple
+
+import click
+from sqlalchemy import func, insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.models.clienti import Cliente
+from app.models.codici_pool import CodicePool
+from app.models.prenotazioni import Prenotazione
+from app.utils.qr import generate_invite_code, generate_short_code
+
+logger = logging.getLogger(__name__)
+
+TipoCodice = namedtuple("TipoCodice", "genera colonna dimensione")
+
+TIPI = {
+    "qr": TipoCodice(lambda: generate_short_code(10), Cliente.qr_code, 500),
+    "invito": TipoCodice(generate_invite_code, Prenotazione.codice_invito, 200),
+}
+SOGLIA_RIFORNIMENTO = 50  # sotto questa quantità si rifornisce in background
+TENTATIVI_CLAIM = 5
+TENTATIVI_DIRETTI = 20
+
+_in_corso = set()
+_lock = threading.Lock()
+
+
+# ─────────────────────────────────────────────
+# Assegnazione
+# ─────────────────────────────────────────────
+def assegna_codice(db: Session, tipo: str) -> str:
+    """Preleva un codice libero dal pool (claim atomico, nessun commit qui)"""
+    for _ in range(TENTATIVI_CLAIM):
+        candidati = db.query(CodicePool.id_codice, CodicePool.codice).filter(
+            CodicePool.tipo == tipo
+        ).order_by(CodicePool.id_codice).limit(SOGLIA_RIFORNIMENTO).all()
+        if len(candidati) < SOGLIA_RIFORNIMENTO:
+            rifornisci_in_background(tipo)
+        if not candidati:
+            break
+        # Scelta casuale: richieste concorrenti puntano quasi sempre a righe diverse
+        scelto = secrets.choice(candidati)
+        preso = db.query(CodicePool).filter(
+            CodicePool.id_codice == scelto.id_codice
+        ).delete(synchronize_session=False)
+        if preso == 1:
+            return scelto.codice
+    return _genera_diretto(db, tipo)
+
+
+def _genera_diretto(db: Session, tipo: str) -> str:
+    """Generazione con verifica puntuale: solo se il pool è vuoto o conteso"""
+    spec = TIPI[tipo]
+    for _ in range(TENTATIVI_DIRETTI):
+        codice = spec.genera()
+        usato = db.query(spec.colonna).filter(spec.colonna == codice).first()
+        in_pool = db.query(CodicePool.id_codice).filter(
+            CodicePool.tipo == tipo, CodicePool.codice == codice
+        ).first()
+        if not usato and not in_pool:
+            return codice
+    raise RuntimeError(f"Impossibile generare un codice {tipo} univoco.")
+
+
+# ─────────────────────────────────────────────
+# Rifornimento
+# ─────────────────────────────────────────────
+def rifornisci(db: Session, tipo: str) -> int:
+    """Riporta il pool alla dimensione prevista; ritorna quanti codici sono stati aggiunti"""
+    spec = TIPI[tipo]
+    presenti = db.query(func.count(CodicePool.id_codice)).filter(CodicePool.tipo == tipo).scalar() or 0
+    mancanti = spec.dimensione - presenti
+    if mancanti <= 0:
+        return 0
+
+    candidati = {spec.genera() for _ in range(mancanti)}
+    usati = {c for (c,) in db.query(spec.colonna).filter(spec.colonna.in_(candidati))}
+    usati |= {c for (c,) in db.query(CodicePool.codice).filter(
+        CodicePool.tipo == tipo, CodicePool.codice.in_(candidati)
+    )}
+    nuovi = candidati - usati
+    if not nuovi:
+        return 0
+    try:
+        db.execute(insert(CodicePool), [{"tipo": tipo, "codice": c} for c in nuovi])
+        db.commit()
+    except IntegrityError:
+        # Rifornimento concorrente da un altro processo: ci riprova il prossimo
+        db.rollback()
+        return 0
+    return len(nuovi)
+
+
+def _rifornisci_thread(tipo: str):
+    db = SessionLocal()
+    try:
+        n = rifornisci(db, tipo)
+        logger.info("Pool codici %s: aggiunti %s codici", tipo, n)
+    except Exception:
+        logger.exception("Rifornimento pool codici %s fallito", tipo)
+    finally:
+        db.close()
+        with _lock:
+            _in_corso.discard(tipo)
+
+
+def rifornisci_in_background(tipo: str):
+    """Avvia un rifornimento (al massimo uno per tipo alla volta in questo processo)"""
+    with _lock:
+        if tipo in _in_corso:
+            return
+        _in_corso.add(tipo)
+    threading.Thread(target=_rifornisci_thread, args=(tipo,), name=f"codici-pool-{tipo}", daemon=True).start()
+
+
+def init_cli(app):
+    @app.cli.command("codici-rifornisci")
+    def codici_rifornisci_cmd():
+        """Riempie il pool dei codici QR e invito pregenerati."""
+        db = SessionLocal()
+        try:
+            for tipo in TIPI:
+                click.echo(f"{tipo}: aggiunti {rifornisci(db, tipo)} codici")
+        finally:
+            db.close()
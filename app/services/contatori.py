@@ -0,0 +1,268 @@
+"""
+Contatori mantenuti per le pagine admin e staff.
+
+Invece di un COUNT su ``prenotazioni``/``ingressi`` a ogni render, la tabella
+``contatori`` tiene per nome:
+- ``prenotazioni_tavolo_attesa``: tavoli in attesa di approvazione;
+- ``prenotazioni_attive``: prenotazioni con stato "attiva";
+- ``ingressi_evento:<id>``: ingressi di un evento (quello operativo in pratica).
+
+Scrittura: un listener ``after_flush`` sulla sessione ricava dalle modifiche
+ORM a Prenotazione/Ingresso i delta e li applica con un upsert nella stessa
+transazione (rollback = nessuna variazione). Le scritture che non passano
+dall'ORM (cascade del DB, archiviazione) chiamano ``ricalcola``.
+
+Lettura: ``valore`` passa dalla cache (TTL ``CONTATORI_TTL`` secondi, default
+5); dopo il commit le chiavi toccate vengono invalidate, quindi nello stesso
+processo il valore è subito aggiornato e fra processi al massimo vecchio di TTL.
+
+Versioni per la cache: ``versione_cache``/``incrementa_versione_cache`` tengono
+nella stessa tabella (``versione_cache:<nome>``) un numero che entra nelle
+chiavi delle voci in cache invalidate esplicitamente (lista pubblica eventi,
+mappe tavoli). Sta nel DB, quindi un'invalidazione vale per tutti i worker
+anche con la cache in memoria di ogni processo.
+"""
+import os
+from datetime import datetime
+from typing import Iterable, Optional
+
+from sqlalchemy import and_, delete, event, func, insert, inspect, select
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal, engine
+from app.models.contatori import Contatore
+from app.models.ingressi import Ingresso
+from app.models.prenotazioni import Prenotazione
+from app.utils.cache import cache_delete, cache_get, cache_set
+
+TTL = int(os.getenv("CONTATORI_TTL", "5"))
+
+TAVOLI_IN_ATTESA = "prenotazioni_tavolo_attesa"
+PRENOTAZIONI_ATTIVE = "prenotazioni_attive"
+_INGRESSI_EVENTO = "ingressi_evento:"
+_VERSIONE_CACHE = "versione_cache:"
+
+# Contatori globali: nome → condizione su prenotazioni
+_CONDIZIONI = {
+    TAVOLI_IN_ATTESA: lambda: and_(Prenotazione.tipo == "tavolo",
+                                   Prenotazione.stato_approvazione_tavolo == "in_attesa"),
+    PRENOTAZIONI_ATTIVE: lambda: Prenotazione.stato == "attiva",
+}
+
+_CHIAVE_SESSIONE = "contatori_toccati"
+
+
+def ingressi_evento_nome(evento_id: int) -> str:
+    return f"{_INGRESSI_EVENTO}{evento_id}"
+
+
+def _conteggio(nome: str):
+    if nome.startswith(_INGRESSI_EVENTO):
+        evento_id = int(nome[len(_INGRESSI_EVENTO):])
+        return select(func.count(Ingresso.id_ingresso)).where(Ingresso.evento_id == evento_id)
+    return select(func.count(Prenotazione.id_prenotazione)).where(_CONDIZIONI[nome]())
+
+
+def _chiave_cache(nome: str) -> str:
+    return f"contatore:{nome}"
+
+
+# ─────────────────────────────────────────────
+# Scrittura (stessa transazione delle modifiche)
+# ─────────────────────────────────────────────
+def _upsert(conn, nome: str, *, delta: Optional[int] = None, valore: Optional[int] = None):
+    """valore = valore + delta (delta) oppure valore assoluto; crea la riga se manca"""
+    tabella = Contatore.__table__
+    ora = datetime.now()
+    nuovo = tabella.c.valore + delta if delta is not None else valore
+    if conn.dialect.name == "sqlite":
+        stmt = sqlite_insert(tabella).values(nome=nome, valore=delta if delta is not None else valore,
+                                             aggiornato_il=ora)
+        stmt = stmt.on_conflict_do_update(index_elements=["nome"], set_={"valore": nuovo, "aggiornato_il": ora})
+    else:
+        stmt = mysql_insert(tabella).values(nome=nome, valore=delta if delta is not None else valore,
+                                            aggiornato_il=ora)
+        stmt = stmt.on_duplicate_key_update(valore=nuovo, aggiornato_il=ora)
+    conn.execute(stmt)
+
+
+def _chiavi(obj, leggi) -> set:
+    """Contatori a cui contribuisce una riga, dati i valori letti con ``leggi(attributo)``"""
+    if isinstance(obj, Prenotazione):
+        chiavi = set()
+        if leggi("tipo") == "tavolo" and leggi("stato_approvazione_tavolo") == "in_attesa":
+            chiavi.add(TAVOLI_IN_ATTESA)
+        if leggi("stato") == "attiva":
+            chiavi.add(PRENOTAZIONI_ATTIVE)
+        return chiavi
+    if isinstance(obj, Ingresso):
+        return {ingressi_evento_nome(leggi("evento_id"))}
+    return set()
+
+
+class _ValorePrecedenteIgnoto(Exception):
+    pass
+
+
+def _valore_precedente(stato, attributo):
+    """Valore prima della modifica; ignoto se l'attributo era scaduto quando è stato assegnato"""
+    storia = stato.attrs[attributo].history
+    if storia.deleted:
+        return storia.deleted[0]
+    if storia.added:
+        raise _ValorePrecedenteIgnoto(attributo)
+    return storia.unchanged[0] if storia.unchanged else None
+
+
+_ATTRIBUTI = {Prenotazione: ("tipo", "stato", "stato_approvazione_tavolo"), Ingresso: ("evento_id",)}
+
+
+@event.listens_for(SessionLocal, "before_flush")
+def _prima_del_flush(session, _contesto, _istanze):
+    # Le righe eliminate servono con i valori correnti: se scadute (es. dopo un commit) si ricaricano ora
+    for obj in session.deleted:
+        for attributo in _ATTRIBUTI.get(type(obj), ()):
+            getattr(obj, attributo)
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _dopo_flush(session, _contesto):
+    delta, da_ricontare = {}, set()
+
+    def applica(chiavi, segno):
+        for nome in chiavi:
+            delta[nome] = delta.get(nome, 0) + segno
+
+    for obj in session.new:
+        applica(_chiavi(obj, lambda a: getattr(obj, a)), 1)
+    for obj in session.deleted:
+        stato = inspect(obj)
+        applica(_chiavi(obj, lambda a: _valore_precedente(stato, a)), -1)
+    for obj in session.dirty:
+        if not isinstance(obj, (Prenotazione, Ingresso)) or not session.is_modified(obj):
+            continue
+        stato = inspect(obj)
+        nuove = _chiavi(obj, lambda a: getattr(obj, a))
+        try:
+            vecchie = _chiavi(obj, lambda a: _valore_precedente(stato, a))
+        except _ValorePrecedenteIgnoto:
+            # Non si può calcolare il delta: si ricontano (dopo il flush) i contatori possibili
+            da_ricontare |= nuove | set(_CONDIZIONI)
+            continue
+        applica(nuove - vecchie, 1)
+        applica(vecchie - nuove, -1)
+
+    if not delta and not da_ricontare:
+        return
+    conn = session.connection()
+    for nome, d in delta.items():
+        if d and nome not in da_ricontare:
+            _upsert(conn, nome, delta=d)
+    for nome in da_ricontare:
+        _upsert(conn, nome, valore=conn.execute(_conteggio(nome)).scalar() or 0)
+    session.info.setdefault(_CHIAVE_SESSIONE, set()).update(delta, da_ricontare)
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _dopo_commit(session):
+    for nome in session.info.pop(_CHIAVE_SESSIONE, ()):
+        cache_delete(_chiave_cache(nome))
+
+
+@event.listens_for(SessionLocal, "after_transaction_end")
+def _fine_transazione(session, transaction):
+    if transaction.parent is None:
+        session.info.pop(_CHIAVE_SESSIONE, None)
+
+
+def ricalcola(db: Session, nomi: Optional[Iterable[str]] = None):
+    """
+    Riconta da zero (tutti i contatori o solo ``nomi``) e fa commit.
+    Da chiamare dopo scritture che non passano dall'ORM (cascade del DB, INSERT…SELECT).
+    """
+    tutti = nomi is None
+    nomi = list(_CONDIZIONI) if tutti else list(nomi)
+    if tutti:
+        # Ingressi: un solo passaggio raggruppato, via i contatori degli eventi senza più ingressi
+        per_evento = db.execute(
+            select(Ingresso.evento_id, func.count(Ingresso.id_ingresso)).group_by(Ingresso.evento_id)
+        ).all()
+        precedenti = db.execute(select(Contatore.nome).where(Contatore.nome.like(f"{_INGRESSI_EVENTO}%"))).scalars()
+        db.info.setdefault(_CHIAVE_SESSIONE, set()).update(precedenti)
+        db.execute(delete(Contatore).where(Contatore.nome.like(f"{_INGRESSI_EVENTO}%")))
+        if per_evento:
+            db.execute(insert(Contatore), [
+                {"nome": ingressi_evento_nome(e), "valore": n, "aggiornato_il": datetime.now()}
+                for e, n in per_evento
+            ])
+        db.info[_CHIAVE_SESSIONE].update(ingressi_evento_nome(e) for e, _ in per_evento)
+    conn = db.connection()
+    for nome in nomi:
+        _upsert(conn, nome, valore=db.execute(_conteggio(nome)).scalar() or 0)
+    db.info.setdefault(_CHIAVE_SESSIONE, set()).update(nomi)
+    db.commit()
+
+
+def inizializza(db: Session):
+    """Prima esecuzione (contatori mai scritti): conta tutto una volta"""
+    if db.query(Contatore.nome).filter(Contatore.nome.in_(list(_CONDIZIONI))).first() is None:
+        ricalcola(db)
+
+
+# ─────────────────────────────────────────────
+# Letture
+# ─────────────────────────────────────────────
+def valore(nome: str, db: Optional[Session] = None) -> int:
+    """
+    Valore del contatore dalla cache (al massimo vecchio di TTL secondi) o dalla tabella.
+    Senza ``db`` la sessione si apre solo se la cache non ha il valore.
+    """
+    chiave = _chiave_cache(nome)
+    v = cache_get(chiave)
+    if v is not None:
+        return v
+    propria = db is None
+    db = db or SessionLocal()
+    try:
+        v = db.query(Contatore.valore).filter(Contatore.nome == nome).scalar()
+        if v is None:
+            # Mai scritto (es. evento senza ingressi): conteggio diretto, economico con l'indice
+            v = db.execute(_conteggio(nome)).scalar() or 0
+    finally:
+        if propria:
+            db.close()
+    v = max(0, int(v))
+    cache_set(chiave, v, ttl=TTL)
+    return v
+
+
+def tavoli_in_attesa(db: Optional[Session] = None) -> int:
+    return valore(TAVOLI_IN_ATTESA, db)
+
+
+def prenotazioni_attive(db: Optional[Session] = None) -> int:
+    return valore(PRENOTAZIONI_ATTIVE, db)
+
+
+def ingressi_evento(evento_id: int, db: Optional[Session] = None) -> int:
+    return valore(ingressi_evento_nome(evento_id), db)
+
+
+# ─────────────────────────────────────────────
+# Versioni per la cache (condivise fra processi)
+# ─────────────────────────────────────────────
+def versione_cache(nome: str, db: Optional[Session] = None) -> int:
+    """Versione corrente (0 se mai incrementata), letta sempre dal DB: uguale in ogni worker"""
+    stmt = select(Contatore.valore).where(Contatore.nome == f"{_VERSIONE_CACHE}{nome}")
+    if db is not None:
+        return db.execute(stmt).scalar() or 0
+    with engine.connect() as conn:
+        return conn.execute(stmt).scalar() or 0
+
+
+def incrementa_versione_cache(nome: str):
+    """Rende obsolete in tutti i processi le voci in cache con la versione precedente (dopo il commit)"""
+    with engine.begin() as conn:
+        _upsert(conn, f"{_VERSIONE_CACHE}{nome}", delta=1)
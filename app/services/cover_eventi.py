@@ -0,0 +1,311 @@
+"""
+Pipeline copertine eventi: varianti ridimensionate, senza metadati, con nome a hash.
+
+Un upload viene identificato dall'hash del contenuto (``cover_url`` = 16 caratteri
+esadecimali). Per ogni hash si generano le varianti ``thumb``/``card``/``hero``
+in WebP e JPEG (``<hash>_<variante>.<ext>``) in un process pool, fuori dal thread
+della richiesta. I file non cambiano mai a parità di nome, quindi vengono serviti
+con cache ``immutable``; più eventi possono condividere la stessa copertina.
+
+A elaborazione finita gli eventi che usano la copertina cambiano versione e la
+lista pubblica viene invalidata: la pagina passa da "in elaborazione" all'immagine
+e l'ETag deve cambiare con lei. Un fallimento lascia ``<hash>.errore`` accanto
+alle varianti, col motivo, mostrato nelle pagine admin.
+
+I valori legacy (nome file con estensione, caricati prima della pipeline) restano
+validi e vengono serviti così come sono finché non si esegue ``flask cover-migra``.
+"""
+import hashlib
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from pathlib import Path
+from typing import Optional
+
+import click
+from flask import current_app, request, url_for
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+VARIANTI = {"thumb": 320, "card": 800, "hero": 1600}  # larghezza massima in px
+FORMATI = {"webp": ("WEBP", {"quality": 80, "method": 4}),
+           "jpg": ("JPEG", {"quality": 82, "optimize": True, "progressive": True})}
+SFONDO = (0, 0, 0)  # riempimento per PNG trasparenti
+_RE_HASH = re.compile(r"^[0-9a-f]{16}$")
+
+_pool = None
+_pool_lock = threading.Lock()
+_pronte = set()
+
+
+class CoverNonValida(ValueError):
+    pass
+
+
+def is_hash(cover: Optional[str]) -> bool:
+    return bool(cover) and bool(_RE_HASH.match(cover))
+
+
+def nome_variante(cover_hash: str, variante: str, formato: str) -> str:
+    return f"{cover_hash}_{variante}.{formato}"
+
+
+# ─────────────────────────────────────────────
+# Elaborazione (gira nei processi del pool)
+# ─────────────────────────────────────────────
+def genera_varianti(dati: bytes, cartella: str, cover_hash: str) -> int:
+    """Decodifica, orienta, ridimensiona e salva tutte le varianti. Idempotente."""
+    cartella = Path(cartella)
+    with Image.open(BytesIO(dati)) as img:
+        img = ImageOps.exif_transpose(img)
+        if img.mode in ("RGBA", "LA", "P"):
+            img = img.convert("RGBA")
+            base = Image.new("RGB", img.size, SFONDO)
+            base.paste(img, mask=img.getchannel("A"))
+            img = base
+        else:
+            img = img.convert("RGB")
+        # Nuova immagine dai soli pixel: niente EXIF/ICC/XMP nei file pubblicati
+        pulita = Image.new("RGB", img.size)
+        pulita.paste(img)
+
+    scritti = 0
+    # hero per ultima: la sua presenza segnala che la copertina è completa
+    for variante, larghezza in sorted(VARIANTI.items(), key=lambda v: v[1]):
+        if pulita.width > larghezza:
+            altezza = round(pulita.height * larghezza / pulita.width)
+            ridotta = pulita.resize((larghezza, altezza), Image.LANCZOS)
+        else:
+            ridotta = pulita
+        for formato, (pil_format, opzioni) in FORMATI.items():
+            dest = cartella / nome_variante(cover_hash, variante, formato)
+            if dest.exists():
+                continue
+            tmp = dest.with_suffix(dest.suffix + ".tmp")
+            ridotta.save(tmp, pil_format, **opzioni)
+            os.replace(tmp, dest)
+            scritti += 1
+    return scritti
+
+
+def _executor() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=int(os.getenv("COVER_WORKERS", "2")))
+        return _pool
+
+
+def _file_errore(cartella, cover_hash: str) -> Path:
+    return Path(cartella) / f"{cover_hash}.errore"
+
+
+def _registra_errore(cartella: str, cover_hash: str, exc: BaseException):
+    logger.error("Elaborazione copertina %s fallita: %s", cover_hash, exc)
+    try:
+        _file_errore(cartella, cover_hash).write_text(f"{type(exc).__name__}: {exc}"[:255], encoding="utf-8")
+    except OSError as err:
+        logger.error("Impossibile registrare l'errore della copertina %s: %s", cover_hash, err)
+
+
+def _segnala_pronta(cover_hash: str):
+    """Nuova versione per gli eventi con questa copertina e per la lista pubblica (ETag e cache)"""
+    from app.database import SessionLocal
+    from app.models.eventi import Evento
+    from app.services import eventi_pubblici
+
+    db = SessionLocal()
+    try:
+        # L'UPDATE fa scattare versione/updated_at (onupdate); se l'evento non è ancora
+        # committato non tocca righe, ma il commit della route cambia comunque versione
+        aggiornati = db.query(Evento).filter(Evento.cover_url == cover_hash).update(
+            {Evento.cover_url: cover_hash}, synchronize_session=False
+        )
+        db.commit()
+    except Exception as exc:
+        db.rollback()
+        logger.error("Impossibile aggiornare gli eventi della copertina %s: %s", cover_hash, exc)
+        return
+    finally:
+        db.close()
+    if aggiornati:
+        eventi_pubblici.invalida_lista_pubblica()
+
+
+def _esito(cartella: str, cover_hash: str):
+    # Gira in un thread del processo web, fuori dal contesto app
+    def callback(futuro):
+        exc = futuro.exception()
+        if exc is not None:
+            _registra_errore(cartella, cover_hash, exc)
+        else:
+            _segnala_pronta(cover_hash)
+    return callback
+
+
+# ─────────────────────────────────────────────
+# Upload / riuso / rimozione
+# ─────────────────────────────────────────────
+def salva_upload(file_storage) -> str:
+    """
+    Valida l'immagine caricata e accoda la generazione delle varianti.
+    Ritorna l'hash da salvare in ``Evento.cover_url``; solleva ``CoverNonValida``.
+    """
+    dati = file_storage.read()
+    try:
+        with Image.open(BytesIO(dati)) as img:
+            img.verify()  # solo header/struttura: la decodifica vera avviene nel pool
+    except (UnidentifiedImageError, OSError, SyntaxError) as exc:
+        raise CoverNonValida(str(exc))
+
+    cover_hash = hashlib.sha256(dati).hexdigest()[:16]
+    if cover_pronta(cover_hash):
+        return cover_hash  # stesso contenuto già elaborato: riuso delle varianti
+
+    cartella = current_app.config["UPLOAD_FOLDER"]
+    _file_errore(cartella, cover_hash).unlink(missing_ok=True)  # nuovo tentativo
+    try:
+        _executor().submit(genera_varianti, dati, cartella, cover_hash).add_done_callback(
+            _esito(cartella, cover_hash)
+        )
+    except Exception as exc:
+        # Pool non disponibile (es. processo figlio terminato): elabora qui
+        logger.warning("Process pool copertine non disponibile (%s): elaborazione sincrona", exc)
+        genera_varianti(dati, cartella, cover_hash)
+    return cover_hash
+
+
+def rimuovi_se_inutilizzata(db, cover: Optional[str], evento_id: int = None, cartella: Optional[str] = None):
+    """
+    Elimina i file della copertina solo se nessun altro evento la usa.
+    ``cartella`` serve fuori dal contesto app (job in background).
+    """
+    if not cover:
+        return
+    from app.models.eventi import Evento
+    q = db.query(Evento.id_evento).filter(Evento.cover_url == cover)
+    if evento_id is not None:
+        q = q.filter(Evento.id_evento != evento_id)
+    if q.first() is not None:
+        return
+
+    cartella = Path(cartella or current_app.config["UPLOAD_FOLDER"])
+    if is_hash(cover):
+        _pronte.discard(cover)
+        percorsi = [cartella / nome_variante(cover, v, f) for v in VARIANTI for f in FORMATI]
+        percorsi.append(_file_errore(cartella, cover))
+    else:
+        percorsi = [cartella / cover]
+    for p in percorsi:
+        try:
+            p.unlink()
+        except FileNotFoundError:
+            pass
+
+
+# ─────────────────────────────────────────────
+# Template helper
+# ─────────────────────────────────────────────
+def cover_pronta(cover: Optional[str]) -> bool:
+    """Copertina visualizzabile: legacy presente o varianti già generate"""
+    if not cover:
+        return False
+    if not is_hash(cover):
+        return True
+    if cover in _pronte:
+        return True
+    hero = Path(current_app.config["UPLOAD_FOLDER"]) / nome_variante(cover, "hero", "jpg")
+    if hero.exists():
+        _pronte.add(cover)
+        return True
+    return False
+
+
+def cover_errore(cover: Optional[str]) -> Optional[str]:
+    """Motivo del fallimento dell'elaborazione, se la copertina non è pronta per un errore"""
+    if not is_hash(cover) or cover_pronta(cover):
+        return None
+    try:
+        return _file_errore(current_app.config["UPLOAD_FOLDER"], cover).read_text(encoding="utf-8")
+    except OSError:
+        return None
+
+
+def cover_src(cover: Optional[str], variante: str = "card", formato: str = "jpg") -> str:
+    if not cover:
+        return ""
+    if not is_hash(cover):
+        return url_for("static", filename="uploads/eventi/" + cover)
+    return url_for("static", filename="uploads/eventi/" + nome_variante(cover, variante, formato))
+
+
+def cover_srcset(cover: Optional[str], formato: str = "jpg") -> str:
+    if not is_hash(cover):
+        return ""
+    return ", ".join(f"{cover_src(cover, v, formato)} {w}w" for v, w in VARIANTI.items())
+
+
+def migra_legacy(db) -> int:
+    """Converte le copertine caricate prima della pipeline (file originali) in varianti a hash"""
+    from app.models.eventi import Evento
+    cartella = Path(current_app.config["UPLOAD_FOLDER"])
+    legacy = {}
+    for ev in db.query(Evento).filter(Evento.cover_url.isnot(None)):
+        if not is_hash(ev.cover_url):
+            legacy.setdefault(ev.cover_url, []).append(ev)
+
+    convertite = 0
+    for nome, eventi in legacy.items():
+        originale = cartella / nome
+        if not originale.exists():
+            continue
+        dati = originale.read_bytes()
+        cover_hash = hashlib.sha256(dati).hexdigest()[:16]
+        try:
+            genera_varianti(dati, str(cartella), cover_hash)
+        except (UnidentifiedImageError, OSError) as exc:
+            logger.warning("Copertina legacy %s non convertibile: %s", nome, exc)
+            continue
+        for ev in eventi:
+            ev.cover_url = cover_hash
+        db.commit()
+        originale.unlink()
+        convertite += 1
+    return convertite
+
+
+def init_app(app):
+    from app.database import SessionLocal
+
+    @app.cli.command("cover-migra")
+    def cover_migra_cmd():
+        """Genera le varianti per le copertine legacy e rimuove gli originali."""
+        db = SessionLocal()
+        try:
+            n = migra_legacy(db)
+            click.echo(f"Copertine convertite: {n}")
+        finally:
+            db.close()
+
+    app.jinja_env.globals.update(
+        cover_pronta=cover_pronta,
+        cover_errore=cover_errore,
+        cover_src=cover_src,
+        cover_srcset=cover_srcset,
+        cover_varianti=is_hash,
+    )
+
+    prefisso = "/static/uploads/eventi/"
+
+    @app.after_request
+    def cache_immutabile_cover(resp):
+        # Le varianti hanno nome derivato dal contenuto: cache a lungo termine
+        if resp.status_code == 200 and request.path.startswith(prefisso):
+            nome = request.path[len(prefisso):]
+            if is_hash(nome.split("_", 1)[0]):
+                resp.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        return resp
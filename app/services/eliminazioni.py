@@ -0,0 +1,201 @@
+"""
+Eliminazione di eventi e clienti con le cascade del database.
+
+Le relazioni di ``Evento`` e ``Cliente`` sono ``passive_deletes=True``: il
+DELETE della riga radice lascia alle FK ``ON DELETE CASCADE`` la rimozione di
+prenotazioni, ingressi, consumi, movimenti fedeltà, feedback, tavoli, archivio
+e riepiloghi, senza caricare nulla in memoria.
+
+Fino a ``ELIMINAZIONE_SOGLIA_RIGHE`` righe collegate si elimina subito, in una
+transazione. Oltre, un job a lotti svuota le tabelle figlie per chiave primaria
+(transazioni brevi, lock brevi, avanzamento in ``job_background``) e alla fine
+elimina la radice. In entrambi i casi resta una riga nel log attività e le
+copertine non più usate vengono rimosse dal disco.
+"""
+import json
+import os
+from typing import List, Optional
+
+from flask import current_app
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+
+from app.database import Base
+from app.models.clienti import Cliente
+from app.models.eventi import Evento
+from app.models.job_background import JobBackground
+from app.models.prenotazioni import Prenotazione
+from app.services import contatori
+from app.utils.jobs import avvia_job, crea_job, registra_handler
+
+SOGLIA_ELIMINAZIONE_DIRETTA = int(os.getenv("ELIMINAZIONE_SOGLIA_RIGHE", "20000"))
+LOTTO_ELIMINAZIONE = 2000
+JOB_ELIMINAZIONE = "eliminazione"
+
+RADICI = {"evento": Evento, "cliente": Cliente}
+
+
+# ─────────────────────────────────────────────
+# Grafo delle righe collegate
+# ─────────────────────────────────────────────
+def _figli(model) -> list:
+    """Colonne FK in CASCADE verso ``model``: prima le tabelle che dipendono dalle altre"""
+    tabella = model.__table__
+    return [
+        fk.parent
+        for t in reversed(Base.metadata.sorted_tables) if t is not tabella
+        for fk in t.foreign_keys if fk.column.table is tabella and fk.ondelete == "CASCADE"
+    ]
+
+
+def conta_collegate(db: Session, model, radice_id: int) -> int:
+    return sum(
+        db.execute(select(func.count()).select_from(col.table).where(col == radice_id)).scalar() or 0
+        for col in _figli(model)
+    )
+
+
+def _svuota_lotto(db: Session, model, radice_id: int) -> int:
+    """Elimina fino a LOTTO_ELIMINAZIONE righe figlie (per chiave primaria); 0 = nessuna rimasta"""
+    for col in _figli(model):
+        pk = list(col.table.primary_key.columns)[0]
+        ids = db.execute(select(pk).where(col == radice_id).limit(LOTTO_ELIMINAZIONE)).scalars().all()
+        if ids:
+            db.execute(delete(col.table).where(pk.in_(ids)))
+            return len(ids)
+    return 0
+
+
+# ─────────────────────────────────────────────
+# Eliminazione della radice
+# ─────────────────────────────────────────────
+def _elimina_evento(db: Session, evento: Evento, staff_id: Optional[int], nota: str, cartella: Optional[str]):
+    from app.routes.log_attivita import log_action
+    from app.services import cover_eventi, eventi_pubblici
+    from app.utils.events import get_evento_operativo_id, set_evento_operativo_id
+
+    evento_id, cover = evento.id_evento, evento.cover_url
+    if get_evento_operativo_id(db) == evento_id:
+        set_evento_operativo_id(db, None)
+    db.delete(evento)
+    db.flush()
+    log_action(db, tabella="eventi", record_id=evento_id, staff_id=staff_id, azione="delete",
+               note=f"Evento eliminato: {evento.nome_evento} ({evento.data_evento}){nota}")
+    db.commit()
+    # Prenotazioni e ingressi rimossi dalle cascade del DB, fuori dai contatori mantenuti via ORM
+    contatori.ricalcola(db)
+    # Elimina l'immagine se nessun altro evento la usa
+    cover_eventi.rimuovi_se_inutilizzata(db, cover, cartella=cartella)
+    eventi_pubblici.invalida_lista_pubblica()
+
+
+def _eventi_con_tavoli(db: Session, cliente_id: int) -> List[int]:
+    return [e for (e,) in db.query(Prenotazione.evento_id).join(
+        Evento, Evento.id_evento == Prenotazione.evento_id
+    ).filter(
+        Prenotazione.cliente_id == cliente_id,
+        Prenotazione.tipo == "tavolo",
+        Evento.stato_pubblico != "chiuso",
+    ).distinct()]
+
+
+def _elimina_cliente(db: Session, cliente: Cliente, staff_id: Optional[int], nota: str, cartella: Optional[str]):
+    from app.routes.log_attivita import log_action
+    from app.services import fedelta_classifica, ricerca_clienti
+    from app.services.tavoli_inventario import ricostruisci_inventario
+
+    cliente_id = cliente.id_cliente
+    eventi_tavoli = _eventi_con_tavoli(db, cliente_id)
+    fedelta_classifica.cliente_rimosso(db, cliente.punti_fedelta, cliente.livello)
+    ricerca_clienti.rimuovi(db, cliente_id)
+    db.delete(cliente)
+    db.flush()
+    log_action(db, tabella="clienti", record_id=cliente_id, staff_id=staff_id, azione="delete",
+               note=f"Cliente eliminato: {cliente.nome} {cliente.cognome}{nota}")
+    db.commit()
+    contatori.ricalcola(db)
+    # I tavoli tenuti dalle sue prenotazioni tornano liberi
+    for evento_id in eventi_tavoli:
+        ricostruisci_inventario(db, evento_id)
+
+
+ELIMINA = {"evento": _elimina_evento, "cliente": _elimina_cliente}
+
+
+def _sospendi(db: Session, radice: str, oggetto):
+    """Mentre il job svuota le tabelle, niente nuove righe collegate"""
+    if radice == "evento":
+        oggetto.stato_pubblico = "chiuso"
+        oggetto.is_staff_operativo = False
+    else:
+        oggetto.stato_account = "disattivato"
+
+
+def elimina(db: Session, radice: str, oggetto, staff_id: Optional[int] = None) -> Optional[JobBackground]:
+    """
+    Elimina ``oggetto`` (un Evento o un Cliente) e tutto ciò che vi è collegato.
+    Grafo piccolo: subito, ritorna None. Grafo grande: avvia il job a lotti e lo ritorna.
+    """
+    model = RADICI[radice]
+    radice_id = model.__mapper__.primary_key_from_instance(oggetto)[0]
+    collegate = conta_collegate(db, model, radice_id)
+    cartella = current_app.config.get("UPLOAD_FOLDER")
+    if collegate <= SOGLIA_ELIMINAZIONE_DIRETTA:
+        ELIMINA[radice](db, oggetto, staff_id, f" · {collegate} righe collegate", cartella)
+        return None
+
+    _sospendi(db, radice, oggetto)
+    db.commit()
+    if radice == "evento":
+        from app.services import eventi_pubblici
+        eventi_pubblici.invalida_lista_pubblica()
+    job = crea_job(db, JOB_ELIMINAZIONE, totale=collegate, staff_id=staff_id, parametri={
+        "radice": radice,
+        "id": radice_id,
+        "nome": str(oggetto.nome_evento if radice == "evento" else f"{oggetto.nome} {oggetto.cognome}"),
+        "cartella": cartella,
+    })
+    avvia_job(job.id_job)
+    return job
+
+
+@registra_handler(JOB_ELIMINAZIONE)
+def elimina_batch(db: Session, job) -> bool:
+    """Un lotto di righe figlie; quando non ne restano elimina la radice e registra il log"""
+    parametri = json.loads(job.parametri)
+    model = RADICI[parametri["radice"]]
+    n = _svuota_lotto(db, model, parametri["id"])
+    if n:
+        job.processati = (job.processati or 0) + n
+        return False
+    oggetto = db.get(model, parametri["id"])
+    if oggetto is not None:
+        ELIMINA[parametri["radice"]](
+            db, oggetto, job.staff_id,
+            f" · {job.processati or 0} righe collegate (job #{job.id_job})", parametri.get("cartella")
+        )
+    return True
+
+
+def eliminazioni_in_corso(db: Session, radice: str) -> List[dict]:
+    """Eliminazioni in background non ancora concluse (per il banner delle liste admin)"""
+    jobs = db.query(JobBackground).filter(
+        JobBackground.tipo == JOB_ELIMINAZIONE,
+        JobBackground.stato.in_(("in_coda", "in_corso", "errore")),
+    ).order_by(JobBackground.id_job.desc()).limit(20).all()
+    risultato = []
+    for job in jobs:
+        parametri = json.loads(job.parametri or "{}")
+        if parametri.get("radice") != radice:
+            continue
+        # Un job in errore resta visibile finché la radice esiste ancora
+        if job.stato == "errore" and db.get(RADICI[radice], parametri.get("id")) is None:
+            continue
+        risultato.append({
+            "id_job": job.id_job,
+            "nome": parametri.get("nome"),
+            "stato": job.stato,
+            "percentuale": job.percentuale,
+            "errore": job.errore,
+        })
+    return risultato
@@ -0,0 +1,351 @@
+"""
+Esportazione CSV/XLSX in streaming delle liste admin.
+
+Ogni lista registra con ``registra_esportazione`` come leggere i propri filtri
+dalla query string (gli stessi della vista) e la query delle colonne da
+esportare, già ordinata come la lista. Le righe arrivano da un cursore lato
+server (``yield_per``) e vengono scritte un lotto alla volta da un generatore:
+la memoria resta costante anche su milioni di righe.
+
+Il CSV è compresso in gzip al volo quando il client lo accetta; l'XLSX è
+scritto con ``zipfile`` su uno stream di sola scrittura, senza dipendenze
+(celle inline, date come numeri Excel).
+
+Le esportazioni grandi possono girare in background (``avvia_esportazione``):
+un job scrive il file in ``ESPORTAZIONI_DIR`` e la pagina esportazioni ne segue
+l'avanzamento, avvisando quando il file è pronto.
+"""
+import csv
+import io
+import json
+import os
+import re
+import zipfile
+import zlib
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+from typing import Callable, Dict, Iterator, Optional
+from xml.sax.saxutils import escape
+
+from flask import Response, request, stream_with_context
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.models.job_background import JobBackground
+from app.utils.jobs import avvia_job, crea_job, registra_handler
+
+JOB_ESPORTAZIONE = "esportazione"
+ESPORTAZIONI_DIR = Path(os.getenv("ESPORTAZIONI_DIR") or Path(__file__).resolve().parents[2] / "archivio" / "esportazioni")
+RETENZIONE_ESPORTAZIONI = timedelta(days=int(os.getenv("ESPORTAZIONI_RETENZIONE_GIORNI", "7")))
+LOTTO = 2000  # righe lette dal cursore e scritte per volta
+
+FORMATI = {
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+
+@dataclass(frozen=True)
+class Esportazione:
+    nome: str
+    filtro: Callable  # argomenti della richiesta -> dict JSON-serializzabile
+    query: Callable   # (db, filtro) -> Query con colonne etichettate e ordinata
+
+
+_ESPORTAZIONI: Dict[str, Esportazione] = {}
+
+
+def registra_esportazione(nome: str, filtro: Callable):
+    """Decoratore: la funzione ``(db, filtro) -> Query`` diventa l'esportazione ``nome``"""
+    def decorator(fn):
+        _ESPORTAZIONI[nome] = Esportazione(nome, filtro, fn)
+        return fn
+    return decorator
+
+
+def get_esportazione(nome: str) -> Optional[Esportazione]:
+    return _ESPORTAZIONI.get(nome)
+
+
+# ─────────────────────────────────────────────
+# Lettura a lotti
+# ─────────────────────────────────────────────
+def _lotti(db: Session, esportazione: Esportazione, filtro: dict) -> Iterator[list]:
+    """Prima le intestazioni, poi le righe a lotti da un cursore lato server"""
+    stmt = esportazione.query(db, filtro).statement
+    risultato = db.connection().execute(stmt.execution_options(yield_per=LOTTO))
+    try:
+        yield list(risultato.keys())
+        for lotto in risultato.partitions():
+            yield lotto
+    finally:
+        risultato.close()
+
+
+# ─────────────────────────────────────────────
+# CSV
+# ─────────────────────────────────────────────
+def _testo(v) -> str:
+    if v is None:
+        return ""
+    if isinstance(v, datetime):
+        return v.isoformat(sep=" ", timespec="seconds")
+    if isinstance(v, str) and v[:1] in ("=", "+", "-", "@", "\t", "\r"):
+        return "'" + v  # niente formule eseguite all'apertura nel foglio di calcolo
+    return str(v)
+
+
+def _csv(lotti: Iterator[list]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write("\ufeff")  # BOM: Excel riconosce l'UTF-8
+    writer.writerow(next(lotti))
+    for lotto in lotti:
+        writer.writerows([_testo(v) for v in riga] for riga in lotto)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+
+def _gzip(parti: Iterator[bytes]) -> Iterator[bytes]:
+    compressore = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: formato gzip
+    for parte in parti:
+        dati = compressore.compress(parte)
+        if dati:
+            yield dati
+    yield compressore.flush()
+
+
+# ─────────────────────────────────────────────
+# XLSX
+# ─────────────────────────────────────────────
+_NS = 'xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"'
+_NS_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_XML = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+_ORIGINE_EXCEL = datetime(1899, 12, 30)
+_CARATTERI_NON_XML = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+# Stili (cellXfs): 1 = data, 2 = data e ora, 3 = intestazione in grassetto
+_STILE_DATA, _STILE_DATA_ORA, _STILE_INTESTAZIONE = 1, 2, 3
+
+
+def _parti_fisse(titolo: str) -> Dict[str, str]:
+    tipo = "application/vnd.openxmlformats-officedocument.spreadsheetml"
+    return {
+        "[Content_Types].xml": _XML + (
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            f'<Override PartName="/xl/workbook.xml" ContentType="{tipo}.sheet.main+xml"/>'
+            f'<Override PartName="/xl/worksheets/sheet1.xml" ContentType="{tipo}.worksheet+xml"/>'
+            f'<Override PartName="/xl/styles.xml" ContentType="{tipo}.styles+xml"/>'
+            "</Types>"
+        ),
+        "_rels/.rels": _XML + (
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            f'<Relationship Id="rId1" Type="{_NS_REL}/officeDocument" Target="xl/workbook.xml"/>'
+            "</Relationships>"
+        ),
+        "xl/workbook.xml": _XML + (
+            f'<workbook {_NS} xmlns:r="{_NS_REL}"><sheets>'
+            f'<sheet name="{escape(titolo[:31], {chr(34): "&quot;"})}" sheetId="1" r:id="rId1"/>'
+            "</sheets></workbook>"
+        ),
+        "xl/_rels/workbook.xml.rels": _XML + (
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            f'<Relationship Id="rId1" Type="{_NS_REL}/worksheet" Target="worksheets/sheet1.xml"/>'
+            f'<Relationship Id="rId2" Type="{_NS_REL}/styles" Target="styles.xml"/>'
+            "</Relationships>"
+        ),
+        "xl/styles.xml": _XML + (
+            f"<styleSheet {_NS}>"
+            '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+            '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+            '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+            '<fill><patternFill patternType="gray125"/></fill></fills>'
+            '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+            '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+            '<cellXfs count="4"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+            '<xf numFmtId="14" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+            '<xf numFmtId="22" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+            '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/></cellXfs>'
+            '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+            "</styleSheet>"
+        ),
+    }
+
+
+_INIZIO_FOGLIO = (_XML + (
+    f"<worksheet {_NS}><sheetViews><sheetView workbookViewId=\"0\">"
+    '<pane ySplit="1" topLeftCell="A2" activePane="bottomLeft" state="frozen"/>'
+    "</sheetView></sheetViews><sheetData>"
+)).encode("utf-8")
+_FINE_FOGLIO = b"</sheetData></worksheet>"
+
+
+def _cella(v, stile: int = 0) -> str:
+    if v is None:
+        return "<c/>"
+    if isinstance(v, bool):
+        return f'<c t="b"><v>{int(v)}</v></c>'
+    if isinstance(v, (int, float, Decimal)):
+        return f"<c><v>{v}</v></c>"
+    if isinstance(v, datetime):
+        return f'<c s="{_STILE_DATA_ORA}"><v>{(v - _ORIGINE_EXCEL) / timedelta(days=1)!r}</v></c>'
+    if isinstance(v, date):
+        return f'<c s="{_STILE_DATA}"><v>{(v - _ORIGINE_EXCEL.date()).days}</v></c>'
+    testo = escape(_CARATTERI_NON_XML.sub("", str(v)))
+    attributo_stile = f' s="{stile}"' if stile else ""
+    return f'<c t="inlineStr"{attributo_stile}><is><t xml:space="preserve">{testo}</t></is></c>'
+
+
+def _riga_xlsx(valori, stile: int = 0) -> str:
+    return "<row>" + "".join(_cella(v, stile) for v in valori) + "</row>"
+
+
+class _Uscita:
+    """Stream di sola scrittura per ``zipfile``: tiene i byte finché il generatore non li preleva"""
+
+    def __init__(self):
+        self._parti = []
+
+    def write(self, dati) -> int:
+        self._parti.append(bytes(dati))
+        return len(dati)
+
+    def flush(self):
+        pass
+
+    def preleva(self) -> bytes:
+        dati = b"".join(self._parti)
+        self._parti.clear()
+        return dati
+
+
+def _xlsx(lotti: Iterator[list], titolo: str) -> Iterator[bytes]:
+    uscita = _Uscita()
+    with zipfile.ZipFile(uscita, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for nome, contenuto in _parti_fisse(titolo).items():
+            zf.writestr(nome, contenuto)
+        with zf.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as foglio:
+            foglio.write(_INIZIO_FOGLIO)
+            foglio.write(_riga_xlsx(next(lotti), _STILE_INTESTAZIONE).encode("utf-8"))
+            for lotto in lotti:
+                foglio.write("".join(_riga_xlsx(riga) for riga in lotto).encode("utf-8"))
+                yield uscita.preleva()
+            foglio.write(_FINE_FOGLIO)
+    yield uscita.preleva()
+
+
+def _scrivi(lotti: Iterator[list], formato: str, titolo: str) -> Iterator[bytes]:
+    return _xlsx(lotti, titolo) if formato == "xlsx" else _csv(lotti)
+
+
+# ─────────────────────────────────────────────
+# Download in streaming
+# ─────────────────────────────────────────────
+def nome_file(nome: str, formato: str, quando: Optional[datetime] = None) -> str:
+    return f"{nome}_{(quando or datetime.now()).strftime('%Y%m%d_%H%M')}.{formato}"
+
+
+def risposta_esportazione(esportazione: Esportazione, formato: str) -> Response:
+    """Risposta in streaming con le righe filtrate come nella lista (gzip al volo per il CSV)"""
+    filtro = esportazione.filtro(request.args)
+    comprimi = formato == "csv" and "gzip" in request.accept_encodings
+
+    def genera():
+        db = SessionLocal()
+        lotti = _lotti(db, esportazione, filtro)
+        try:
+            parti = _scrivi(lotti, formato, esportazione.nome)
+            yield from (_gzip(parti) if comprimi else parti)
+        finally:
+            lotti.close()
+            db.close()
+
+    resp = Response(stream_with_context(genera()), mimetype=FORMATI[formato])
+    resp.headers["Content-Disposition"] = f'attachment; filename="{nome_file(esportazione.nome, formato)}"'
+    resp.headers["Cache-Control"] = "no-store"
+    resp.headers["X-Accel-Buffering"] = "no"  # il proxy inoltra i blocchi senza accumularli
+    resp.headers["Vary"] = "Accept-Encoding"
+    if comprimi:
+        resp.headers["Content-Encoding"] = "gzip"
+    return resp
+
+
+# ─────────────────────────────────────────────
+# Background
+# ─────────────────────────────────────────────
+def percorso_file(job: JobBackground) -> Path:
+    parametri = json.loads(job.parametri)
+    estensione = "csv.gz" if parametri["formato"] == "csv" else "xlsx"
+    return ESPORTAZIONI_DIR / f"esportazione_{job.id_job}_{parametri['nome']}.{estensione}"
+
+
+def pulisci_esportazioni():
+    """Elimina i file più vecchi della retenzione"""
+    if not ESPORTAZIONI_DIR.is_dir():
+        return
+    limite = (datetime.now() - RETENZIONE_ESPORTAZIONI).timestamp()
+    for p in ESPORTAZIONI_DIR.glob("esportazione_*"):
+        if p.stat().st_mtime < limite:
+            p.unlink(missing_ok=True)
+
+
+def avvia_esportazione(db: Session, esportazione: Esportazione, formato: str,
+                       staff_id: Optional[int] = None) -> JobBackground:
+    """Accoda l'esportazione con i filtri della richiesta corrente e la avvia in un thread"""
+    pulisci_esportazioni()
+    job = crea_job(db, JOB_ESPORTAZIONE, staff_id=staff_id, parametri={
+        "nome": esportazione.nome,
+        "formato": formato,
+        "filtro": esportazione.filtro(request.args),
+    })
+    avvia_job(job.id_job)
+    return job
+
+
+def _con_avanzamento(lotti: Iterator[list], db: Session, job: JobBackground) -> Iterator[list]:
+    # SQLite blocca le scritture finché il cursore di lettura è aperto: avanzamento solo a fine job
+    salva = db.get_bind().dialect.name != "sqlite"
+    yield next(lotti)
+    for lotto in lotti:
+        yield lotto
+        job.processati += len(lotto)
+        if salva:
+            job.heartbeat = datetime.now()
+            db.commit()
+
+
+@registra_handler(JOB_ESPORTAZIONE)
+def _job_esportazione(db: Session, job: JobBackground) -> bool:
+    """
+    Scrive l'intero file in un solo lotto del job: un file a metà non si può
+    riprendere, quindi dopo un riavvio si riparte da capo. Avanzamento e
+    heartbeat sono salvati a ogni blocco di righe.
+    """
+    parametri = json.loads(job.parametri)
+    esportazione = _ESPORTAZIONI[parametri["nome"]]
+    destinazione = percorso_file(job)
+    destinazione.parent.mkdir(parents=True, exist_ok=True)
+    parziale = destinazione.with_name(destinazione.name + ".parziale")
+
+    job.processati = 0
+    # Sessione separata per la lettura: i commit dell'avanzamento non chiudono il cursore
+    lettura = SessionLocal()
+    lotti = _lotti(lettura, esportazione, parametri["filtro"])
+    try:
+        parti = _scrivi(_con_avanzamento(lotti, db, job), parametri["formato"], esportazione.nome)
+        if parametri["formato"] == "csv":
+            parti = _gzip(parti)
+        with open(parziale, "wb") as f:
+            for parte in parti:
+                f.write(parte)
+    finally:
+        lotti.close()
+        lettura.close()
+    os.replace(parziale, destinazione)
+    job.totale = job.processati
+    return True
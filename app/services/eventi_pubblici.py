@@ -0,0 +1,153 @@
+"""
+Lista pubblica eventi in cache condivisa + overlay per cliente.
+
+La parte anonima di ``/eventi/`` (prossimi eventi, ultimi passati, badge di
+stato) è uguale per tutti: viene serializzata una volta e servita dalla cache.
+Le chiavi includono una versione globale che ``invalida_lista_pubblica`` cambia
+dopo ogni creazione/modifica/cambio stato/eliminazione di un evento, così tutte
+le combinazioni di filtri diventano obsolete con una sola scrittura. La versione
+sta nel DB (``contatori.versione_cache``): con più worker gunicorn e la cache in
+memoria di ciascuno, l'invalidazione vale comunque per tutti.
+
+Per il cliente loggato si calcola solo l'overlay (prenotazioni e ingressi
+sugli eventi in lista) con un'unica query batch.
+"""
+from datetime import date, datetime
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import literal, null, select, union_all
+from sqlalchemy.orm import Session
+
+from app.models.eventi import Evento
+from app.models.ingressi import Ingresso
+from app.models.prenotazioni import Prenotazione
+from app.services import contatori
+from app.utils.cache import cache_get, cache_set
+
+VERSIONE_LISTA = "eventi_pubblici"
+TTL_LISTA_PUBBLICA = 600  # rete di sicurezza: l'invalidazione è esplicita
+LIMITE_PASSATI = 20
+
+
+def versione_lista(db: Optional[Session] = None) -> int:
+    return contatori.versione_cache(VERSIONE_LISTA, db)
+
+
+def invalida_lista_pubblica():
+    """Da chiamare dopo il commit di ogni modifica che cambia la lista pubblica"""
+    contatori.incrementa_versione_cache(VERSIONE_LISTA)
+
+
+def _parse_data(valore: Optional[str]) -> Optional[date]:
+    if not valore:
+        return None
+    try:
+        return datetime.strptime(valore, "%Y-%m-%d").date()
+    except ValueError:
+        return None
+
+
+def _serializza(ev: Evento) -> dict:
+    from app.utils.workflow import evento_stato_badge
+    return {
+        "id_evento": ev.id_evento,
+        "nome_evento": ev.nome_evento,
+        "data_evento": ev.data_evento.isoformat() if ev.data_evento else None,
+        "tipo_musica": ev.tipo_musica,
+        "dj_artista": ev.dj_artista,
+        "cover_url": ev.cover_url,
+        "stato_pubblico": ev.stato_pubblico,
+        "badge": evento_stato_badge(ev),
+    }
+
+
+def _deserializza(d: dict) -> SimpleNamespace:
+    """Oggetto leggero con gli stessi attributi usati dal template (data come ``date``)"""
+    valori = dict(d)
+    valori["data_evento"] = date.fromisoformat(d["data_evento"]) if d.get("data_evento") else None
+    return SimpleNamespace(**valori)
+
+
+def _costruisci_payload(db: Session, oggi: date, dal_d: Optional[date], al_d: Optional[date],
+                        show_all_past: bool) -> dict:
+    def filtri(query):
+        if dal_d:
+            query = query.filter(Evento.data_evento >= dal_d)
+        if al_d:
+            query = query.filter(Evento.data_evento <= al_d)
+        return query
+
+    prossimi = filtri(db.query(Evento).filter(Evento.data_evento >= oggi)) \
+        .order_by(Evento.data_evento.asc(), Evento.id_evento.asc()).all()
+    q_past = filtri(db.query(Evento).filter(Evento.data_evento < oggi)) \
+        .order_by(Evento.data_evento.desc(), Evento.id_evento.desc())
+    if not show_all_past:
+        q_past = q_past.limit(LIMITE_PASSATI)
+    return {
+        "prossimi": [_serializza(ev) for ev in prossimi],
+        "passati": [_serializza(ev) for ev in q_past.all()],
+    }
+
+
+def lista_pubblica(db: Session, dal: Optional[str], al: Optional[str],
+                   show_all_past: bool) -> Tuple[List[SimpleNamespace], List[SimpleNamespace]]:
+    """(eventi_prossimi, eventi_passati) dalla cache, ricalcolati solo al primo accesso"""
+    oggi = date.today()
+    dal_d, al_d = _parse_data(dal), _parse_data(al)
+    chiave = "eventi:pubblici:{}:{}:{}:{}:{}".format(
+        versione_lista(db), oggi.isoformat(),
+        dal_d.isoformat() if dal_d else "", al_d.isoformat() if al_d else "",
+        "tutti" if show_all_past else LIMITE_PASSATI
+    )
+    payload = cache_get(chiave)
+    if payload is None:
+        payload = _costruisci_payload(db, oggi, dal_d, al_d, show_all_past)
+        cache_set(chiave, payload, TTL_LISTA_PUBBLICA)
+    return (
+        [_deserializza(d) for d in payload["prossimi"]],
+        [_deserializza(d) for d in payload["passati"]],
+    )
+
+
+def overlay_cliente(db: Session, cliente_id: int,
+                    eventi: List[SimpleNamespace]) -> Tuple[Set[int], Dict[int, dict]]:
+    """
+    Stato del cliente sugli eventi in lista con una sola query (UNION ALL
+    prenotazioni + ingressi). Ritorna (prenotati_ids, workflow_map) dove
+    workflow_map[evento_id] ha ``prenotazione_attiva``, ``ingresso_registrato``
+    e ``puo_prenotare`` (stesse regole di ``WorkflowState``).
+    """
+    ids = [ev.id_evento for ev in eventi]
+    if not cliente_id or not ids:
+        return set(), {}
+
+    q = union_all(
+        select(Prenotazione.evento_id, literal("prenotazione").label("tipo"), Prenotazione.stato)
+        .where(
+            Prenotazione.cliente_id == cliente_id,
+            Prenotazione.evento_id.in_(ids),
+            Prenotazione.stato.in_(("attiva", "usata"))
+        ),
+        select(Ingresso.evento_id, literal("ingresso").label("tipo"), null())
+        .where(Ingresso.cliente_id == cliente_id, Ingresso.evento_id.in_(ids))
+    )
+
+    prenotati_ids, attive, entrati = set(), set(), set()
+    for evento_id, tipo, stato in db.execute(q):
+        if tipo == "ingresso":
+            entrati.add(evento_id)
+        else:
+            prenotati_ids.add(evento_id)
+            if stato == "attiva":
+                attive.add(evento_id)
+
+    workflow_map = {}
+    for ev in eventi:
+        visibile = ev.stato_pubblico in ("programmato", "attivo")
+        workflow_map[ev.id_evento] = {
+            "prenotazione_attiva": ev.id_evento in attive,
+            "ingresso_registrato": ev.id_evento in entrati,
+            "puo_prenotare": visibile and ev.id_evento not in attive,
+        }
+    return prenotati_ids, workflow_map
@@ -0,0 +1,303 @@
+"""
+Dettaglio evento admin: header KPI da aggregati e tab caricate a richiesta.
+
+La pagina ``eventi.admin_evento_detail`` esegue una sola query (``kpi_evento``,
+sottoquery scalari in un'unica SELECT) e disegna le tab vuote. Ogni tab chiede
+``/eventi/admin/<id>/sezioni/<sezione>``: select Core con le sole colonne
+mostrate, paginazione keyset sugli indici ``(evento_id, data, id)`` e JSON
+scritto riga per riga mentre il cursore del DB avanza (``stream_sezione``).
+Il riepilogo della tab (conteggi per tipo, top prodotti...) viaggia solo con
+la prima pagina.
+
+Gli eventi archiviati si leggono dalle tabelle ``*_archivio`` (stesse colonne,
+``archivio_eventi.modelli_evento``): le funzioni ricevono i model da usare in
+``m``; le righe archiviate non hanno più una pagina di dettaglio propria.
+"""
+import json
+from collections import namedtuple
+from datetime import date, datetime, time
+from decimal import Decimal
+
+from flask import url_for
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.models.clienti import Cliente
+from app.models.feedback import Feedback
+from app.models.staff import Staff
+from app.services.archivio_eventi import ARCHIVIO, Modelli, modelli_evento
+from app.utils.paginazione import FlussoKeyset
+from app.utils.fasce_orarie import etichetta_ora
+
+Sezione = namedtuple("Sezione", "query chiavi riepilogo serializza")
+
+
+def _json(valore) -> str:
+    def converti(v):
+        if isinstance(v, (datetime, date, time)):
+            return v.isoformat()
+        if isinstance(v, Decimal):
+            return float(v)
+        raise TypeError(f"Non serializzabile: {type(v).__name__}")
+    return json.dumps(valore, default=converti, ensure_ascii=False, separators=(",", ":"))
+
+
+# ─────────────────────────────────────────────
+# Header KPI
+# ─────────────────────────────────────────────
+def kpi_evento(db: Session, evento_id: int) -> dict:
+    """Totali dell'header in un'unica SELECT di sottoquery scalari"""
+    m = modelli_evento(db, evento_id)
+
+    def scalare(colonna, model):
+        return select(colonna).where(model.evento_id == evento_id).scalar_subquery()
+
+    voto_medio = (Feedback.voto_musica + Feedback.voto_ingresso + Feedback.voto_ambiente + Feedback.voto_servizio) / 4.0
+    r = db.execute(select(
+        scalare(func.count(m.prenotazioni.id_prenotazione), m.prenotazioni).label("prenotazioni"),
+        scalare(func.count(m.ingressi.id_ingresso), m.ingressi).label("ingressi"),
+        scalare(func.coalesce(func.sum(m.consumi.importo), 0), m.consumi).label("consumi"),
+        scalare(func.count(func.distinct(m.consumi.cliente_id)), m.consumi).label("clienti_consumi"),
+        scalare(func.coalesce(func.sum(m.fedelta.punti), 0), m.fedelta).label("punti_fedelta"),
+        scalare(func.count(Feedback.id_feedback), Feedback).label("feedback"),
+        scalare(func.avg(voto_medio), Feedback).label("voto_medio"),
+    )).one()
+    consumi = float(r.consumi or 0)
+    return {
+        "tot_prenotazioni": r.prenotazioni or 0,
+        "tot_ingressi": r.ingressi or 0,
+        "tot_consumi": consumi,
+        "tot_punti_fedelta": int(r.punti_fedelta or 0),
+        "tot_feedback": r.feedback or 0,
+        "avg_feedback": round(float(r.voto_medio), 1) if r.voto_medio is not None else None,
+        "scontrino_medio": round(consumi / r.clienti_consumi, 2) if r.clienti_consumi else 0,
+        "archiviato": m is ARCHIVIO,
+    }
+
+
+# ─────────────────────────────────────────────
+# Tab: query, riepilogo, serializzazione riga
+# ─────────────────────────────────────────────
+def _conteggio_per(db: Session, colonna, pk, model, evento_id: int) -> dict:
+    return dict(db.execute(
+        select(colonna, func.count(pk)).where(model.evento_id == evento_id).group_by(colonna)
+    ).all())
+
+
+def _cliente(riga: dict) -> dict:
+    return {
+        "cliente": f"{riga['nome']} {riga['cognome']}",
+        "url_cliente": url_for("clienti.admin_cliente_detail", cliente_id=riga["cliente_id"]),
+    }
+
+
+def _query_prenotazioni(m: Modelli, evento_id: int):
+    P = m.prenotazioni
+    return select(
+        P.id_prenotazione, P.tipo, P.stato, P.num_persone, P.orario_previsto, P.note,
+        Cliente.id_cliente.label("cliente_id"), Cliente.nome, Cliente.cognome,
+    ).join(Cliente, Cliente.id_cliente == P.cliente_id).where(P.evento_id == evento_id)
+
+
+def _riepilogo_prenotazioni(db: Session, m: Modelli, evento_id: int) -> dict:
+    P = m.prenotazioni
+    persone = db.execute(select(func.coalesce(func.sum(P.num_persone), 0)).where(
+        P.evento_id == evento_id, P.tipo == "tavolo"
+    )).scalar()
+    return {
+        "per_tipo": _conteggio_per(db, P.tipo, P.id_prenotazione, P, evento_id),
+        "per_stato": _conteggio_per(db, P.stato, P.id_prenotazione, P, evento_id),
+        "tavolo_persone": int(persone or 0),
+    }
+
+
+def _riga_prenotazione(r: dict) -> dict:
+    return {
+        **_cliente(r),
+        "tipo": r["tipo"],
+        "stato": r["stato"],
+        "num_persone": r["num_persone"],
+        "orario_previsto": r["orario_previsto"].strftime("%H:%M") if r["orario_previsto"] else None,
+        "note": r["note"],
+        "url": url_for("prenotazioni.admin_prenotazione_detail", pren_id=r["id_prenotazione"]),
+    }
+
+
+def _query_ingressi(m: Modelli, evento_id: int):
+    I = m.ingressi
+    return select(
+        I.id_ingresso, I.tipo_ingresso, I.orario_ingresso, I.note,
+        Cliente.id_cliente.label("cliente_id"), Cliente.nome, Cliente.cognome, Staff.nome.label("staff"),
+    ).join(Cliente, Cliente.id_cliente == I.cliente_id).outerjoin(
+        Staff, Staff.id_staff == I.staff_id
+    ).where(I.evento_id == evento_id)
+
+
+def _riepilogo_ingressi(db: Session, m: Modelli, evento_id: int) -> dict:
+    I = m.ingressi
+    per_staff = db.execute(
+        select(Staff.nome, func.count(I.id_ingresso))
+        .join(I, I.staff_id == Staff.id_staff)
+        .where(I.evento_id == evento_id)
+        .group_by(Staff.id_staff, Staff.nome)
+        .order_by(func.count(I.id_ingresso).desc())
+        .limit(10)
+    ).all()
+    return {
+        "per_tipo": _conteggio_per(db, I.tipo_ingresso, I.id_ingresso, I, evento_id),
+        "per_staff": [[nome, n] for nome, n in per_staff],
+    }
+
+
+def _riga_ingresso(r: dict) -> dict:
+    return {
+        **_cliente(r),
+        "tipo": r["tipo_ingresso"],
+        "orario": r["orario_ingresso"].strftime("%d/%m/%Y %H:%M") if r["orario_ingresso"] else None,
+        "staff": r["staff"],
+        "note": r["note"],
+        "url": url_for("ingressi.admin_ingresso_detail", ingresso_id=r["id_ingresso"]),
+    }
+
+
+def _query_consumi(m: Modelli, evento_id: int):
+    C = m.consumi
+    return select(
+        C.id_consumo, C.prodotto, C.importo, C.punto_vendita, C.note,
+        Cliente.id_cliente.label("cliente_id"), Cliente.nome, Cliente.cognome, Staff.nome.label("staff"),
+    ).join(Cliente, Cliente.id_cliente == C.cliente_id).outerjoin(
+        Staff, Staff.id_staff == C.staff_id
+    ).where(C.evento_id == evento_id)
+
+
+def _top_prodotti(db: Session, m: Modelli, evento_id: int, limite: int = 10) -> list:
+    C = m.consumi
+    righe = db.execute(
+        select(C.prodotto, func.sum(C.importo), func.count(C.id_consumo))
+        .where(C.evento_id == evento_id)
+        .group_by(C.prodotto)
+        .order_by(func.sum(C.importo).desc())
+        .limit(limite)
+    ).all()
+    return [{"label": p, "revenue": float(importo or 0), "count": n} for p, importo, n in righe]
+
+
+def _riepilogo_consumi(db: Session, m: Modelli, evento_id: int) -> dict:
+    C = m.consumi
+    per_punto = db.execute(
+        select(C.punto_vendita, func.sum(C.importo))
+        .where(C.evento_id == evento_id)
+        .group_by(C.punto_vendita)
+    ).all()
+    totale, clienti = db.execute(
+        select(func.coalesce(func.sum(C.importo), 0), func.count(func.distinct(C.cliente_id)))
+        .where(C.evento_id == evento_id)
+    ).one()
+    return {
+        "per_punto": {punto: float(importo or 0) for punto, importo in per_punto},
+        "top_prodotti": _top_prodotti(db, m, evento_id),
+        "clienti_unici": clienti or 0,
+        "scontrino_medio": round(float(totale) / clienti, 2) if clienti else 0,
+    }
+
+
+def _riga_consumo(r: dict) -> dict:
+    return {
+        **_cliente(r),
+        "prodotto": r["prodotto"],
+        "importo": r["importo"],
+        "punto_vendita": r["punto_vendita"],
+        "staff": r["staff"],
+        "note": r["note"],
+        "url": url_for("consumi.admin_edit", consumo_id=r["id_consumo"]),
+    }
+
+
+def _query_feedback(m: Modelli, evento_id: int):
+    return select(
+        Feedback.id_feedback, Feedback.data_feedback, Feedback.voto_musica, Feedback.voto_ingresso,
+        Feedback.voto_ambiente, Feedback.voto_servizio, Feedback.note,
+        Cliente.id_cliente.label("cliente_id"), Cliente.nome, Cliente.cognome,
+    ).join(Cliente, Cliente.id_cliente == Feedback.cliente_id).where(Feedback.evento_id == evento_id)
+
+
+def _riga_feedback(r: dict) -> dict:
+    return {
+        **_cliente(r),
+        "data": r["data_feedback"].strftime("%d/%m/%Y %H:%M") if r["data_feedback"] else None,
+        "voti": [r["voto_musica"], r["voto_ingresso"], r["voto_ambiente"], r["voto_servizio"]],
+        "note": r["note"],
+        "url_elimina": url_for("feedback.admin_delete", id_feedback=r["id_feedback"]),
+    }
+
+
+# Le chiavi keyset dipendono dai model (tabelle calde o archivio)
+SEZIONI = {
+    "prenotazioni": Sezione(_query_prenotazioni, lambda m: [(m.prenotazioni.id_prenotazione, True)],
+                            _riepilogo_prenotazioni, _riga_prenotazione),
+    "ingressi": Sezione(_query_ingressi, lambda m: [(m.ingressi.orario_ingresso, True), (m.ingressi.id_ingresso, True)],
+                        _riepilogo_ingressi, _riga_ingresso),
+    "consumi": Sezione(_query_consumi, lambda m: [(m.consumi.data_consumo, True), (m.consumi.id_consumo, True)],
+                       _riepilogo_consumi, _riga_consumo),
+    "feedback": Sezione(_query_feedback, lambda m: [(Feedback.data_feedback, True), (Feedback.id_feedback, True)],
+                        None, _riga_feedback),
+}
+
+
+def stream_sezione(evento_id: int, nome: str, *, prima, per_page: int):
+    """
+    Generatore del JSON di una tab: ``{"ok", "riepilogo"?, "righe": [...], "successiva"}``.
+    Apre la propria sessione perché gira dopo il return della view (``stream_with_context``).
+    """
+    sezione = SEZIONI[nome]
+    db = SessionLocal()
+    try:
+        m = modelli_evento(db, evento_id)
+        yield '{"ok":true,'
+        if not prima and sezione.riepilogo:
+            yield '"riepilogo":' + _json(sezione.riepilogo(db, m, evento_id)) + ","
+        yield '"righe":['
+        flusso = FlussoKeyset(db, sezione.query(m, evento_id), sezione.chiavi(m), prima=prima, per_page=per_page)
+        for i, riga in enumerate(flusso):
+            r = sezione.serializza(riga)
+            if m is ARCHIVIO and nome != "feedback":
+                r["url"] = None  # niente pagina di dettaglio/modifica per le righe archiviate
+            yield ("," if i else "") + _json(r)
+        successiva = None
+        if flusso.successiva:
+            successiva = url_for("eventi.admin_evento_sezione", evento_id=evento_id, sezione=nome,
+                                 prima=flusso.successiva, per_page=per_page)
+        yield '],"successiva":' + _json(successiva) + "}"
+    finally:
+        db.close()
+
+
+# ─────────────────────────────────────────────
+# Tab analytics (grafici)
+# ─────────────────────────────────────────────
+def analytics_evento(db: Session, evento_id: int) -> dict:
+    m = modelli_evento(db, evento_id)
+    I = m.ingressi
+    # Ora della notte persistita: la serata resta in ordine anche dopo mezzanotte
+    ingressi_ora = db.execute(
+        select(I.ora_notte, func.count(I.id_ingresso))
+        .where(I.evento_id == evento_id, I.ora_notte.isnot(None))
+        .group_by(I.ora_notte).order_by(I.ora_notte)
+    ).all()
+    medie = db.execute(select(
+        func.avg(Feedback.voto_musica), func.avg(Feedback.voto_ingresso),
+        func.avg(Feedback.voto_ambiente), func.avg(Feedback.voto_servizio),
+    ).where(Feedback.evento_id == evento_id)).one()
+    P = m.prenotazioni
+    per_tipo = _conteggio_per(db, P.tipo, P.id_prenotazione, P, evento_id)
+    return {
+        "ok": True,
+        "ingressi": [{"slot": etichetta_ora(h), "value": n} for h, n in ingressi_ora],
+        "prenotazioni": [{"label": tipo.capitalize(), "value": n} for tipo, n in per_tipo.items()],
+        "prodotti": _top_prodotti(db, m, evento_id),
+        "feedback": {
+            "labels": ["Musica", "Ingresso", "Ambiente", "Servizio"],
+            "values": [round(float(v or 0), 1) for v in medie],
+        },
+    }
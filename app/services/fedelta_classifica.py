@@ -0,0 +1,176 @@
+"""
+Classifica fedeltà e distribuzione livelli precalcolate.
+
+Invece di ordinare/raggruppare tutta la tabella clienti a ogni vista:
+- ``fedelta_classifica`` tiene l'istogramma dei punteggi (punti → n. clienti):
+  la posizione di un cliente è 1 + somma dei bucket con punteggio superiore;
+- ``fedelta_livelli`` tiene il conteggio per livello.
+Entrambi vengono aggiornati nella stessa transazione della variazione
+(``sposta_punti_cliente`` / ``sposta_punti`` / ``sposta_livello``); ``ricostruisci``
+li rigenera con un solo passaggio raggruppato dopo operazioni massive.
+``inizializza`` gira una volta all'avvio (``create_app``), non nelle letture.
+"""
+from typing import Dict, List, Optional
+
+from sqlalchemy import func, literal, select, union_all
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from app.models.clienti import Cliente
+from app.models.fedelta_classifica import ClassificaPunti, DistribuzioneLivelli
+
+LIVELLI = ("base", "loyal", "premium", "vip")
+
+
+def _incrementa(db: Session, model, chiave_col: str, chiave, delta: int):
+    """Upsert atomico: n_clienti = n_clienti + delta sul bucket indicato"""
+    values = {chiave_col: chiave, "n_clienti": delta}
+    if db.get_bind().dialect.name == "sqlite":
+        stmt = sqlite_insert(model.__table__).values(**values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[chiave_col],
+            set_={"n_clienti": model.__table__.c.n_clienti + delta}
+        )
+    else:
+        stmt = mysql_insert(model.__table__).values(**values)
+        stmt = stmt.on_duplicate_key_update(n_clienti=model.__table__.c.n_clienti + delta)
+    db.execute(stmt)
+
+
+def sposta_punti(db: Session, vecchi: Optional[int], nuovi: Optional[int]):
+    """Un cliente passa da ``vecchi`` a ``nuovi`` punti (None = non presente)"""
+    if vecchi == nuovi:
+        return
+    if vecchi is not None:
+        _incrementa(db, ClassificaPunti, "punti", int(vecchi), -1)
+    if nuovi is not None:
+        _incrementa(db, ClassificaPunti, "punti", int(nuovi), 1)
+
+
+def sposta_punti_cliente(db: Session, cliente_id: int, delta: int):
+    """
+    Dopo ``punti_fedelta += delta`` (stessa transazione): un solo upsert a due righe,
+    bucket del saldo precedente -1 e del nuovo +1, letti da ``clienti`` nella query stessa
+    """
+    if not delta:
+        return
+    t = ClassificaPunti.__table__
+    saldo = func.coalesce(Cliente.punti_fedelta, 0)
+    del_cliente = Cliente.id_cliente == cliente_id
+    righe = union_all(
+        select(saldo - delta, literal(-1)).where(del_cliente),
+        select(saldo, literal(1)).where(del_cliente),
+    )
+    if db.get_bind().dialect.name == "sqlite":
+        stmt = sqlite_insert(t).from_select(["punti", "n_clienti"], righe)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["punti"], set_={"n_clienti": t.c.n_clienti + stmt.excluded.n_clienti}
+        )
+    else:
+        stmt = mysql_insert(t).from_select(["punti", "n_clienti"], righe)
+        stmt = stmt.on_duplicate_key_update(n_clienti=t.c.n_clienti + stmt.inserted.n_clienti)
+    db.execute(stmt)
+
+
+def sposta_livello(db: Session, vecchio: Optional[str], nuovo: Optional[str]):
+    """Un cliente passa dal livello ``vecchio`` a ``nuovo`` (None = non presente)"""
+    if vecchio == nuovo:
+        return
+    if vecchio is not None:
+        _incrementa(db, DistribuzioneLivelli, "livello", vecchio, -1)
+    if nuovo is not None:
+        _incrementa(db, DistribuzioneLivelli, "livello", nuovo, 1)
+
+
+def cliente_aggiunto(db: Session, punti: Optional[int], livello: Optional[str]):
+    sposta_punti(db, None, punti or 0)
+    sposta_livello(db, None, livello or "base")
+
+
+def cliente_rimosso(db: Session, punti: Optional[int], livello: Optional[str]):
+    sposta_punti(db, punti or 0, None)
+    sposta_livello(db, livello or "base", None)
+
+
+def ricostruisci(db: Session):
+    """
+    Rigenera entrambi gli istogrammi con un passaggio raggruppato su clienti.
+
+    Il DELETE viene prima della lettura: blocca gli istogrammi (lock di riga e di gap
+    con InnoDB in REPEATABLE READ, lock del database con SQLite) finché la ricostruzione
+    non è committata. Un'assegnazione concorrente o è già committata e finisce nel
+    conteggio, o aspetta e applica il suo delta sui bucket appena ricostruiti.
+    """
+    db.query(ClassificaPunti).delete(synchronize_session=False)
+    db.query(DistribuzioneLivelli).delete(synchronize_session=False)
+    punti = db.query(
+        func.coalesce(Cliente.punti_fedelta, 0), func.count(Cliente.id_cliente)
+    ).group_by(func.coalesce(Cliente.punti_fedelta, 0)).all()
+    livelli = db.query(
+        func.coalesce(Cliente.livello, "base"), func.count(Cliente.id_cliente)
+    ).group_by(func.coalesce(Cliente.livello, "base")).all()
+
+    db.add_all([ClassificaPunti(punti=int(p), n_clienti=n) for p, n in punti])
+    db.add_all([DistribuzioneLivelli(livello=l, n_clienti=n) for l, n in livelli])
+    db.commit()
+
+
+def inizializza(db: Session):
+    """Prima esecuzione (tabelle vuote ma clienti presenti): costruisce gli istogrammi"""
+    if db.query(DistribuzioneLivelli.livello).first() is None:
+        if db.query(Cliente.id_cliente).first() is not None:
+            ricostruisci(db)
+
+
+# ─────────────────────────────────────────────
+# Letture
+# ─────────────────────────────────────────────
+def posizione_cliente(db: Session, punti: int) -> int:
+    """Posizione in classifica (1 = primo) per un cliente con ``punti`` punti"""
+    sopra = db.query(func.coalesce(func.sum(ClassificaPunti.n_clienti), 0)).filter(
+        ClassificaPunti.punti > int(punti or 0)
+    ).scalar() or 0
+    return int(sopra) + 1
+
+
+def distribuzione_livelli(db: Session) -> Dict[str, int]:
+    out = {lvl: 0 for lvl in LIVELLI}
+    for lvl, n in db.query(DistribuzioneLivelli.livello, DistribuzioneLivelli.n_clienti):
+        out[lvl] = max(0, int(n or 0))
+    return out
+
+
+def riepilogo(db: Session) -> Dict[str, int]:
+    """Totale clienti, punti complessivi e media dai bucket (senza scansionare clienti)"""
+    totale, punti = db.query(
+        func.coalesce(func.sum(ClassificaPunti.n_clienti), 0),
+        func.coalesce(func.sum(ClassificaPunti.punti * ClassificaPunti.n_clienti), 0)
+    ).one()
+    totale, punti = int(totale), int(punti)
+    return {
+        "totale_clienti": totale,
+        "punti_totali": punti,
+        "punti_medi": int(round(punti / totale)) if totale else 0,
+    }
+
+
+def top_clienti(db: Session, limite: int = 12, punti_min: Optional[int] = None,
+                punti_max: Optional[int] = None) -> List[Cliente]:
+    """Top-N (eventualmente in una fascia di punti) letto dall'indice su punti_fedelta"""
+    q = db.query(Cliente).filter(Cliente.punti_fedelta.isnot(None))
+    if punti_min is not None:
+        q = q.filter(Cliente.punti_fedelta >= punti_min)
+    if punti_max is not None:
+        q = q.filter(Cliente.punti_fedelta < punti_max)
+    return q.order_by(Cliente.punti_fedelta.desc(), Cliente.id_cliente.asc()).limit(limite).all()
+
+
+def top_per_livello(db: Session, thresholds: Dict[str, int], limite: int = 5) -> Dict[str, List[Cliente]]:
+    """Top-N per ciascuna fascia di soglie (base/loyal/premium/vip)"""
+    fasce = sorted(thresholds.items(), key=lambda x: x[1])
+    out = {}
+    for i, (lvl, minp) in enumerate(fasce):
+        maxp = fasce[i + 1][1] if i + 1 < len(fasce) else None
+        out[lvl] = top_clienti(db, limite, punti_min=minp if i > 0 else None, punti_max=maxp)
+    return out
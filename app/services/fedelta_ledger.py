@@ -0,0 +1,272 @@
+"""
+Ledger punti fedeltà (append-only) con snapshot periodici dei saldi.
+
+- La tabella ``fedelta`` è la fonte autorevole: ogni variazione di punti è un
+  movimento, ``id_fedelta`` ne è il numero di sequenza.
+- ``clienti.punti_fedelta`` è un saldo denormalizzato per le letture veloci,
+  aggiornato con un incremento atomico nella stessa transazione del movimento.
+- ``fedelta_snapshot`` consolida periodicamente il ledger: saldo = snapshot + coda.
+"""
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import click
+from sqlalchemy import bindparam, func, insert, update
+from sqlalchemy.orm import Session
+
+from app.models.clienti import Cliente
+from app.models.fedeltà import Fedelta
+from app.models.fedelta_snapshot import FedeltaSnapshot
+from app.services import fedelta_classifica
+from app.utils.jobs import registra_handler
+
+# I movimenti più recenti di questo margine non vengono consolidati:
+# un id già assegnato ma non ancora committato non deve finire "dietro" lo snapshot.
+MARGINE_SNAPSHOT = timedelta(minutes=5)
+BATCH_SNAPSHOT = 1000
+BATCH_AZZERAMENTO = 500
+JOB_AZZERA_PUNTI = "azzera_punti"
+
+
+def registra_movimento(db: Session, cliente_id: int, punti: int, motivo: str,
+                       evento_id: Optional[int] = None) -> Fedelta:
+    """
+    Scrive un movimento nel ledger e incrementa atomicamente il saldo cliente.
+    Nessun read-modify-write: ``UPDATE clienti SET punti_fedelta = punti_fedelta + :d``.
+    Il commit è a carico del chiamante.
+    """
+    mov = Fedelta(cliente_id=cliente_id, evento_id=evento_id, punti=punti, motivo=motivo)
+    db.add(mov)
+    db.execute(
+        update(Cliente)
+        .where(Cliente.id_cliente == cliente_id)
+        .values(punti_fedelta=func.coalesce(Cliente.punti_fedelta, 0) + punti)
+        .execution_options(synchronize_session="fetch")
+    )
+    # Il record è già bloccato dall'UPDATE: l'upsert legge il saldo appena scritto
+    fedelta_classifica.sposta_punti_cliente(db, cliente_id, punti)
+    return mov
+
+
+def saldo_da_ledger(db: Session, cliente_id: int) -> int:
+    """Saldo ricostruito dal ledger: ultimo snapshot + somma della coda."""
+    snap = db.get(FedeltaSnapshot, cliente_id)
+    base = snap.saldo if snap else 0
+    seq = snap.ultimo_id_fedelta if snap else 0
+    coda = db.query(func.coalesce(func.sum(Fedelta.punti), 0)).filter(
+        Fedelta.cliente_id == cliente_id,
+        Fedelta.id_fedelta > seq
+    ).scalar() or 0
+    return int(base + coda)
+
+
+def _coda_per_cliente(db: Session, seq_max: Optional[int] = None):
+    """Subquery: somma dei movimenti non ancora consolidati, raggruppata per cliente."""
+    q = db.query(
+        Fedelta.cliente_id.label("cliente_id"),
+        func.sum(Fedelta.punti).label("punti")
+    ).outerjoin(
+        FedeltaSnapshot, FedeltaSnapshot.cliente_id == Fedelta.cliente_id
+    ).filter(
+        Fedelta.id_fedelta > func.coalesce(FedeltaSnapshot.ultimo_id_fedelta, 0)
+    )
+    if seq_max is not None:
+        q = q.filter(Fedelta.id_fedelta <= seq_max)
+    return q.group_by(Fedelta.cliente_id)
+
+
+def aggiorna_snapshot(db: Session) -> int:
+    """
+    Consolida la coda del ledger negli snapshot (un solo passaggio raggruppato).
+    Ritorna il numero di clienti il cui snapshot è cambiato.
+    """
+    limite = datetime.now() - MARGINE_SNAPSHOT
+    seq_max = db.query(func.max(Fedelta.id_fedelta)).filter(
+        Fedelta.data_assegnazione < limite
+    ).scalar()
+    if not seq_max:
+        return 0
+
+    code = _coda_per_cliente(db, seq_max).all()
+    aggiornati = 0
+    for i in range(0, len(code), BATCH_SNAPSHOT):
+        blocco = dict(code[i:i + BATCH_SNAPSHOT])
+        esistenti = {
+            s.cliente_id: s
+            for s in db.query(FedeltaSnapshot).filter(FedeltaSnapshot.cliente_id.in_(blocco.keys()))
+        }
+        for cliente_id, punti in blocco.items():
+            snap = esistenti.get(cliente_id)
+            if snap is None:
+                snap = FedeltaSnapshot(cliente_id=cliente_id, saldo=0)
+                db.add(snap)
+            snap.saldo = (snap.saldo or 0) + int(punti or 0)
+            snap.ultimo_id_fedelta = seq_max
+            aggiornati += 1
+        db.flush()
+
+    # Nessun movimento fra il vecchio watermark e seq_max per gli altri clienti:
+    # spostare avanti il watermark è sicuro e accorcia le code future.
+    db.query(FedeltaSnapshot).filter(
+        FedeltaSnapshot.ultimo_id_fedelta < seq_max
+    ).update({FedeltaSnapshot.ultimo_id_fedelta: seq_max}, synchronize_session=False)
+    db.commit()
+    return aggiornati
+
+
+def riconcilia(db: Session, correggi: Optional[str] = None) -> List[Dict]:
+    """
+    Verifica tutti i saldi in un unico passaggio raggruppato
+    (clienti ⟕ snapshot ⟕ coda del ledger raggruppata per cliente).
+
+    correggi:
+      - None     → solo report
+      - "saldi"  → il ledger vince: riallinea ``clienti.punti_fedelta``
+      - "ledger" → il saldo vince: scrive un movimento di compensazione
+    """
+    coda = _coda_per_cliente(db).subquery()
+    saldo_ledger = (
+        func.coalesce(FedeltaSnapshot.saldo, 0) + func.coalesce(coda.c.punti, 0)
+    )
+    saldo_cliente = func.coalesce(Cliente.punti_fedelta, 0)
+
+    righe = (
+        db.query(Cliente.id_cliente, saldo_cliente.label("saldo"), saldo_ledger.label("ledger"))
+        .outerjoin(FedeltaSnapshot, FedeltaSnapshot.cliente_id == Cliente.id_cliente)
+        .outerjoin(coda, coda.c.cliente_id == Cliente.id_cliente)
+        .filter(saldo_cliente != saldo_ledger)
+        .order_by(Cliente.id_cliente)
+        .all()
+    )
+    differenze = [
+        {"cliente_id": r.id_cliente, "saldo": int(r.saldo), "ledger": int(r.ledger),
+         "differenza": int(r.saldo) - int(r.ledger)}
+        for r in righe
+    ]
+
+    if correggi == "saldi" and differenze:
+        from app.routes.fedelta import get_thresholds, compute_level
+        thr = get_thresholds(db)
+        for d in differenze:
+            # Riletto al momento della correzione: il report può essere già vecchio
+            ledger = saldo_da_ledger(db, d["cliente_id"])
+            db.query(Cliente).filter(Cliente.id_cliente == d["cliente_id"]).update({
+                Cliente.punti_fedelta: ledger,
+                Cliente.livello: compute_level(ledger, thr),
+            }, synchronize_session=False)
+        db.commit()
+        fedelta_classifica.ricostruisci(db)
+    elif correggi == "ledger" and differenze:
+        db.add_all([
+            Fedelta(cliente_id=d["cliente_id"], evento_id=None,
+                    punti=d["differenza"], motivo="Riallineamento ledger")
+            for d in differenze
+        ])
+        db.commit()
+
+    return differenze
+
+
+# ─────────────────────────────────────────────
+# Azzeramento globale a lotti (job in background)
+# ─────────────────────────────────────────────
+@registra_handler(JOB_AZZERA_PUNTI)
+def azzera_punti_batch(db: Session, job) -> bool:
+    """
+    Un lotto dell'azzeramento: clienti con id > cursore, in ordine di chiave.
+    Per chi ha punti scrive un movimento di compensazione (insert multiplo) e
+    sottrae dal saldo esattamente quanto letto, così un'assegnazione arrivata
+    nel frattempo non viene persa e il ledger resta allineato.
+    """
+    righe = db.query(Cliente.id_cliente, Cliente.punti_fedelta).filter(
+        Cliente.id_cliente > (job.cursore or 0)
+    ).order_by(Cliente.id_cliente).limit(BATCH_AZZERAMENTO).all()
+    if not righe:
+        _chiudi_azzeramento(db, job)
+        return True
+
+    ultimo_id = righe[-1].id_cliente
+    con_punti = [r for r in righe if r.punti_fedelta]
+    if con_punti:
+        motivo = f"Azzeramento punti (job #{job.id_job})"
+        db.execute(insert(Fedelta), [
+            {"cliente_id": r.id_cliente, "evento_id": None, "punti": -r.punti_fedelta, "motivo": motivo}
+            for r in con_punti
+        ])
+        t = Cliente.__table__
+        db.execute(
+            t.update()
+            .where(t.c.id_cliente == bindparam("b_id"))
+            .values(punti_fedelta=t.c.punti_fedelta - bindparam("b_punti")),
+            [{"b_id": r.id_cliente, "b_punti": r.punti_fedelta} for r in con_punti]
+        )
+    db.query(Cliente).filter(
+        Cliente.id_cliente > (job.cursore or 0),
+        Cliente.id_cliente <= ultimo_id,
+        Cliente.livello != "base"
+    ).update({Cliente.livello: "base"}, synchronize_session=False)
+
+    job.cursore = ultimo_id
+    job.processati = (job.processati or 0) + len(righe)
+    if len(righe) < BATCH_AZZERAMENTO:
+        _chiudi_azzeramento(db, job)
+        return True
+    return False
+
+
+def _chiudi_azzeramento(db: Session, job):
+    from app.routes.log_attivita import log_action
+    log_action(
+        db,
+        tabella="clienti",
+        record_id=0,
+        staff_id=job.staff_id,
+        azione="update",
+        note=f"Azzera punti (job #{job.id_job}): {job.processati} clienti elaborati. Tutti i punti fedeltà sono stati resettati a 0."
+    )
+    # Aggiornamento massivo: classifica e distribuzione si rigenerano in un colpo solo
+    fedelta_classifica.ricostruisci(db)
+
+
+# ─────────────────────────────────────────────
+# Comandi CLI (flask fedelta-snapshot / fedelta-riconcilia)
+# ─────────────────────────────────────────────
+def init_cli(app):
+    from app.database import SessionLocal
+
+    @app.cli.command("fedelta-snapshot")
+    def fedelta_snapshot_cmd():
+        """Consolida il ledger fedeltà negli snapshot dei saldi."""
+        db = SessionLocal()
+        try:
+            n = aggiorna_snapshot(db)
+            click.echo(f"Snapshot aggiornati: {n}")
+        finally:
+            db.close()
+
+    @app.cli.command("fedelta-classifica")
+    def fedelta_classifica_cmd():
+        """Rigenera classifica punti e distribuzione livelli precalcolate."""
+        db = SessionLocal()
+        try:
+            fedelta_classifica.ricostruisci(db)
+            click.echo("Classifica fedeltà rigenerata.")
+        finally:
+            db.close()
+
+    @app.cli.command("fedelta-riconcilia")
+    @click.option("--correggi", type=click.Choice(["saldi", "ledger"]), default=None,
+                  help="saldi: allinea i clienti al ledger; ledger: scrive movimenti di compensazione")
+    def fedelta_riconcilia_cmd(correggi):
+        """Verifica che clienti.punti_fedelta coincida con il ledger."""
+        db = SessionLocal()
+        try:
+            differenze = riconcilia(db, correggi=correggi)
+            for d in differenze[:50]:
+                click.echo(f"cliente #{d['cliente_id']}: saldo={d['saldo']} ledger={d['ledger']} (diff {d['differenza']:+d})")
+            if len(differenze) > 50:
+                click.echo(f"... altri {len(differenze) - 50}")
+            esito = "corretti" if correggi else "da verificare"
+            click.echo(f"Saldi non allineati: {len(differenze)} ({esito})")
+        finally:
+            db.close()
@@ -0,0 +1,220 @@
+"""
+Registro attività: paginazione keyset, totale stimato e archiviazione.
+
+Il visualizzatore scorre il log per cursore ``(timestamp, id_log)`` sull'indice
+``ix_log_attivita_ts_id``: ogni pagina costa uguale, niente ``OFFSET`` né
+``COUNT(*)`` sull'intera tabella. Il totale mostrato è una stima (statistiche
+di MySQL oppure intervallo degli id).
+
+Le righe più vecchie di ``LOG_RETENZIONE_GIORNI`` vengono spostate a lotti
+(``flask log-archivia``) in file JSONL compressi, uno per mese, in
+``LOG_ARCHIVIO_DIR``; ``cerca_archivio`` li interroga con gli stessi filtri e
+lo stesso cursore quando il visualizzatore lo richiede.
+"""
+import gzip
+import heapq
+import json
+import logging
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Iterable, List, Optional
+
+import click
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session
+
+from app.models.log_attivita import LogAttivita
+from app.utils.paginazione import codifica_cursore, decodifica_cursore, pagina_keyset
+
+logger = logging.getLogger(__name__)
+
+RETENZIONE_GIORNI = int(os.getenv("LOG_RETENZIONE_GIORNI", "365"))
+ARCHIVIO_DIR = Path(os.getenv("LOG_ARCHIVIO_DIR") or Path(__file__).resolve().parents[2] / "archivio" / "log")
+LOTTO_ARCHIVIO = 5000
+
+# ─────────────────────────────────────────────
+# Pagine (keyset condiviso con le altre liste admin)
+# ─────────────────────────────────────────────
+CHIAVI_LOG = [(LogAttivita.timestamp, True), (LogAttivita.id_log, True)]
+
+
+def _cursori(righe: list, chiave, piu_vecchie: bool, piu_nuove: bool):
+    """(cursore pagina successiva, cursore pagina precedente) dalla prima/ultima riga"""
+    if not righe:
+        return None, None
+    successiva = codifica_cursore(chiave(righe[-1])) if piu_vecchie else None
+    precedente = codifica_cursore(chiave(righe[0])) if piu_nuove else None
+    return successiva, precedente
+
+
+def pagina_log(q, *, prima: Optional[str], dopo: Optional[str], per_page: int):
+    """
+    Una pagina del registro (più recenti prima) con ``paginazione.pagina_keyset``.
+    ``prima`` = righe più vecchie del cursore (avanti), ``dopo`` = più recenti (indietro).
+    Ritorna ``(righe, cursore_successiva, cursore_precedente)``; ``q`` è una query su ``LogAttivita``.
+    """
+    pagina = pagina_keyset(q, CHIAVI_LOG, prima=prima, dopo=dopo, per_page=per_page)
+    return pagina.righe, pagina.successiva, pagina.precedente
+
+
+def stima_totale(db: Session) -> int:
+    """Numero approssimato di righe senza scandire la tabella"""
+    if db.bind.dialect.name == "mysql":
+        stima = db.execute(text(
+            "SELECT TABLE_ROWS FROM information_schema.TABLES "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'log_attivita'"
+        )).scalar()
+        if stima is not None:
+            return int(stima)
+    minimo, massimo = db.query(func.min(LogAttivita.id_log), func.max(LogAttivita.id_log)).one()
+    return (massimo - minimo + 1) if massimo else 0
+
+
+# ─────────────────────────────────────────────
+# Archiviazione
+# ─────────────────────────────────────────────
+def _file_mese(mese: str) -> Path:
+    return ARCHIVIO_DIR / f"log_attivita_{mese}.jsonl.gz"
+
+
+def _serializza(log: LogAttivita) -> dict:
+    return {
+        "id_log": log.id_log,
+        "tabella": log.tabella,
+        "record_id": log.record_id,
+        "staff_id": log.staff_id,
+        "azione": log.azione,
+        "note": log.note,
+        "timestamp": log.timestamp.isoformat(),
+    }
+
+
+def archivia(db: Session, giorni: int = RETENZIONE_GIORNI) -> int:
+    """Sposta nei file mensili le righe più vecchie di ``giorni`` giorni"""
+    limite = datetime.now() - timedelta(days=giorni)
+    return sposta(db, LogAttivita.timestamp < limite)
+
+
+def sposta(db: Session, *condizioni) -> int:
+    """
+    Sposta nei file mensili le righe che soddisfano ``condizioni``, a lotti
+    per chiave. Il file viene scritto prima del DELETE: un'interruzione può al
+    più duplicare un lotto nell'archivio (la ricerca deduplica per id).
+    """
+    ARCHIVIO_DIR.mkdir(parents=True, exist_ok=True)
+    spostate = 0
+    while True:
+        righe = db.query(LogAttivita).filter(
+            *condizioni
+        ).order_by(LogAttivita.id_log).limit(LOTTO_ARCHIVIO).all()
+        if not righe:
+            break
+        per_mese = defaultdict(list)
+        for r in righe:
+            per_mese[r.timestamp.strftime("%Y-%m")].append(_serializza(r))
+        for mese, dati in per_mese.items():
+            # Append come nuovo membro gzip: il file resta leggibile come un unico stream
+            with gzip.open(_file_mese(mese), "at", encoding="utf-8") as f:
+                f.writelines(json.dumps(d, ensure_ascii=False) + "\n" for d in dati)
+        db.query(LogAttivita).filter(
+            LogAttivita.id_log.in_([r.id_log for r in righe])
+        ).delete(synchronize_session=False)
+        db.commit()
+        spostate += len(righe)
+    return spostate
+
+
+def _mesi_archiviati(dal: Optional[datetime], al: Optional[datetime]) -> List[Path]:
+    if not ARCHIVIO_DIR.is_dir():
+        return []
+    primo = dal.strftime("%Y-%m") if dal else None
+    ultimo = al.strftime("%Y-%m") if al else None
+    file = []
+    for p in sorted(ARCHIVIO_DIR.glob("log_attivita_*.jsonl.gz")):
+        mese = p.name[len("log_attivita_"):-len(".jsonl.gz")]
+        if (primo and mese < primo) or (ultimo and mese > ultimo):
+            continue
+        file.append(p)
+    return file
+
+
+def _leggi(percorsi: Iterable[Path]):
+    visti = set()
+    for p in percorsi:
+        try:
+            with gzip.open(p, "rt", encoding="utf-8") as f:
+                for riga in f:
+                    d = json.loads(riga)
+                    if d["id_log"] in visti:
+                        continue
+                    visti.add(d["id_log"])
+                    d["timestamp"] = datetime.fromisoformat(d["timestamp"])
+                    yield SimpleNamespace(**d)
+        except (OSError, EOFError, ValueError) as exc:
+            logger.warning("File di archivio log non leggibile %s: %s", p, exc)
+
+
+def _parse_filtro_data(valore: Optional[str]) -> Optional[datetime]:
+    if not valore:
+        return None
+    try:
+        return datetime.fromisoformat(valore)
+    except ValueError:
+        return None
+
+
+def cerca_archivio(*, tabelle: Optional[set], staff_id: Optional[int], dal: Optional[str], al: Optional[str],
+                   prima: Optional[str], dopo: Optional[str], per_page: int):
+    """Stessa semantica di ``pagina_log`` sulle righe archiviate (memoria limitata alla pagina)"""
+    dal_d, al_d = _parse_filtro_data(dal), _parse_filtro_data(al)
+    c_dopo, c_prima = decodifica_cursore(dopo, 2), decodifica_cursore(prima, 2)
+    c_dopo, c_prima = (tuple(c) if c else None for c in (c_dopo, c_prima))
+
+    def chiave(log):
+        return log.timestamp, log.id_log
+
+    def valida(log):
+        if tabelle and log.tabella not in tabelle:
+            return False
+        if staff_id and log.staff_id != staff_id:
+            return False
+        if (dal_d and log.timestamp < dal_d) or (al_d and log.timestamp > al_d):
+            return False
+        if c_dopo and chiave(log) <= c_dopo:
+            return False
+        if c_prima and chiave(log) >= c_prima:
+            return False
+        return True
+
+    candidati = (log for log in _leggi(_mesi_archiviati(dal_d, al_d)) if valida(log))
+    if c_dopo:
+        righe = heapq.nsmallest(per_page + 1, candidati, key=chiave)
+        piu_nuove = len(righe) > per_page
+        righe = righe[:per_page][::-1]
+        piu_vecchie = True
+    else:
+        righe = heapq.nlargest(per_page + 1, candidati, key=chiave)
+        piu_vecchie = len(righe) > per_page
+        righe = righe[:per_page]
+        piu_nuove = c_prima is not None
+    successiva, precedente = _cursori(righe, chiave, piu_vecchie, piu_nuove)
+    return righe, successiva, precedente
+
+
+def init_cli(app):
+    from app.database import SessionLocal
+
+    @app.cli.command("log-archivia")
+    @click.option("--giorni", type=int, default=RETENZIONE_GIORNI, show_default=True,
+                  help="Archivia le righe più vecchie di N giorni")
+    def log_archivia_cmd(giorni):
+        """Sposta il log attività vecchio nei file di archivio mensili compressi."""
+        db = SessionLocal()
+        try:
+            n = archivia(db, giorni)
+            click.echo(f"Righe di log archiviate: {n} (in {ARCHIVIO_DIR})")
+        finally:
+            db.close()
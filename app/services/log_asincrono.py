@@ -0,0 +1,163 @@
+"""
+Scrittura asincrona a lotti del log attività.
+
+``log_action`` non aggiunge più la riga alla transazione del chiamante: la
+parcheggia in ``db.info`` e, solo dopo il commit, la passa a una coda limitata
+in memoria. Un thread writer la svuota con insert multipli ogni
+``LOG_INTERVALLO_MS`` millisecondi o ``LOG_LOTTO`` righe. Se la transazione fa
+rollback le righe parcheggiate vengono scartate, come prima.
+
+Le azioni amministrative critiche (``AZIONI_SINCRONE``) restano nella
+transazione del chiamante. ``LOG_DURABILITA=transazionale`` ripristina questo
+comportamento per tutte le azioni; con ``asincrono`` (default) un crash del
+processo può perdere al massimo le righe ancora in coda.
+"""
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import event, insert
+
+from app.database import SessionLocal
+from app.models.log_attivita import LogAttivita
+
+logger = logging.getLogger(__name__)
+
+DURABILITA = os.getenv("LOG_DURABILITA", "asincrono").lower()  # asincrono | transazionale
+LOTTO_MAX = int(os.getenv("LOG_LOTTO", "200"))
+INTERVALLO = int(os.getenv("LOG_INTERVALLO_MS", "250")) / 1000
+CODA_MAX = int(os.getenv("LOG_CODA_MAX", "10000"))
+
+AZIONI_SINCRONE = frozenset({
+    "delete",
+    "evento_create",
+    "evento_duplicate",
+    "event_close",
+    "set_operativo",
+    "unset_operativo",
+    "override_capienza",
+})
+
+_CHIAVE_SESSIONE = "log_attivita_in_attesa"
+
+_coda = queue.Queue(maxsize=CODA_MAX)
+_writer = None
+_writer_pid = None
+_lock = threading.Lock()
+
+
+def registra(db, riga: dict, sincrono: bool):
+    """Riga nella transazione (sincrono) oppure in attesa del commit del chiamante"""
+    # Orario dell'azione, non della scrittura differita; timbrato qui per entrambi i
+    # percorsi, così righe sincrone e asincrone hanno lo stesso orologio (il server_default
+    # del DB è UTC su SQLite) e l'ordine per timestamp del registro resta coerente
+    riga["timestamp"] = datetime.now()
+    if sincrono or DURABILITA == "transazionale":
+        db.add(LogAttivita(**riga))
+        return
+    db.info.setdefault(_CHIAVE_SESSIONE, []).append(riga)
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _dopo_commit(session):
+    righe = session.info.pop(_CHIAVE_SESSIONE, None)
+    if righe:
+        accoda(righe)
+
+
+@event.listens_for(SessionLocal, "after_transaction_end")
+def _fine_transazione(session, transaction):
+    # Dopo un commit la lista è già stata consumata: qui resta solo ciò che va scartato
+    if transaction.parent is None:
+        session.info.pop(_CHIAVE_SESSIONE, None)
+
+
+# ─────────────────────────────────────────────
+# Coda e writer
+# ─────────────────────────────────────────────
+def accoda(righe):
+    _avvia_writer()
+    for i, riga in enumerate(righe):
+        try:
+            _coda.put_nowait(riga)
+        except queue.Full:
+            # DB più lento del traffico: il chiamante scrive da sé il resto (backpressure)
+            logger.warning("Coda log attività piena: scrittura sincrona di %s righe", len(righe) - i)
+            scrivi(righe[i:])
+            return
+
+
+def scrivi(righe):
+    """Insert multiplo; se fallisce riprova riga per riga per non perdere il lotto intero"""
+    db = SessionLocal()
+    try:
+        try:
+            db.execute(insert(LogAttivita), righe)
+            db.commit()
+            return
+        except Exception as exc:
+            db.rollback()
+            logger.warning("Insert a lotti del log fallito (%s): riprovo riga per riga", exc)
+        for riga in righe:
+            try:
+                db.execute(insert(LogAttivita), [riga])
+                db.commit()
+            except Exception as exc:
+                db.rollback()
+                logger.error("Riga di log scartata %s: %s", riga, exc)
+    finally:
+        db.close()
+
+
+def _ciclo_writer():
+    while True:
+        lotto = [_coda.get()]
+        scadenza = time.monotonic() + INTERVALLO
+        while len(lotto) < LOTTO_MAX:
+            resto = scadenza - time.monotonic()
+            if resto <= 0:
+                break
+            try:
+                lotto.append(_coda.get(timeout=resto))
+            except queue.Empty:
+                break
+        try:
+            scrivi(lotto)
+        except Exception:
+            logger.exception("Writer log attività: lotto di %s righe perso", len(lotto))
+        finally:
+            for _ in lotto:
+                _coda.task_done()
+
+
+def _avvia_writer():
+    """Un writer per processo (riavviato se il processo è un fork, es. worker gunicorn)"""
+    global _writer, _writer_pid
+    if _writer is not None and _writer_pid == os.getpid() and _writer.is_alive():
+        return
+    with _lock:
+        if _writer is not None and _writer_pid == os.getpid() and _writer.is_alive():
+            return
+        _writer = threading.Thread(target=_ciclo_writer, name="log-writer", daemon=True)
+        _writer_pid = os.getpid()
+        _writer.start()
+
+
+def svuota():
+    """Scrive subito tutto ciò che è in coda (uscita del processo, comandi CLI)"""
+    righe = []
+    while True:
+        try:
+            righe.append(_coda.get_nowait())
+        except queue.Empty:
+            break
+        _coda.task_done()
+    if righe:
+        scrivi(righe)
+
+
+atexit.register(svuota)
@@ -0,0 +1,265 @@
+"""
+Previsione degli arrivi alla porta per la serata in corso.
+
+Dallo storico (ultimo anno) si costruisce per ogni categoria di evento una
+curva tipo: la frazione degli ingressi della serata che arriva in ciascuno slot
+da 15 minuti fra le 18:00 e le 06:00, più il rapporto medio ingressi /
+prenotazioni. Le curve sono calcolate in forma vettorizzata (NumPy) una volta
+al giorno e tenute in cache.
+
+Durante la serata si combinano:
+- le prenotazioni dell'evento × il tasso di presenza della categoria;
+- il ritmo reale (ingressi finora ÷ quota della curva già trascorsa), che pesa
+  sempre di più man mano che la notte avanza;
+per proiettare gli arrivi slot per slot, l'ora in cui si raggiunge la capienza
+e quante porte tenere aperte nella prossima ora. Gli ingressi osservati sono
+tenuti per slot in cache e aggiornati solo con le scansioni nuove (id maggiore
+dell'ultimo letto).
+
+NumPy è nei requirements; se manca comunque, all'avvio si logga un warning
+e ``previsione_ingressi`` ritorna None.
+"""
+import logging
+import math
+from datetime import date, datetime, time, timedelta
+from typing import Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.models.eventi import Evento
+from app.models.ingressi import Ingresso
+from app.models.prenotazioni import Prenotazione
+from app.utils.cache import cache_get, cache_set
+from app.utils.fasce_orarie import data_lavorativa, giorno_epoca, minuti_epoca
+
+logger = logging.getLogger(__name__)
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+    logger.warning("Pacchetto 'numpy' non installato: previsione ingressi disattivata (pip install -r requirements.txt)")
+
+SLOT_MINUTI = 15
+INIZIO_NOTTE = 18 * 60          # minuti dalla mezzanotte della data evento
+FINE_NOTTE = 30 * 60            # 06:00 del giorno dopo
+N_SLOT = (FINE_NOTTE - INIZIO_NOTTE) // SLOT_MINUTI
+GIORNI_STORICO = 365
+MIN_INGRESSI_STORICO = 20       # serate più piccole non fanno curva
+INGRESSI_PER_PORTA_15M = 60     # un varco con scanner regge ~4 ingressi al minuto
+PORTE_MAX = 4
+TTL_MODELLI = 24 * 3600
+TTL_LIVE = 12 * 3600
+LOTTO = 50000
+
+STATI_PRENOTAZIONE_VALIDI = ("attiva", "usata")
+
+
+def _etichetta_slot(i: int) -> str:
+    minuti = INIZIO_NOTTE + i * SLOT_MINUTI
+    return f"{(minuti // 60) % 24:02d}:{minuti % 60:02d}"
+
+
+def _slot(minuti):
+    """Indice di slot (array) dai minuti dalla mezzanotte della data evento; fuori finestra → bordi"""
+    return np.clip((minuti - INIZIO_NOTTE) // SLOT_MINUTI, 0, N_SLOT - 1)
+
+
+def _minuti_evento():
+    """Minuti dell'ingresso dalla mezzanotte della data dell'evento (in SQL)"""
+    return minuti_epoca(Ingresso.orario_ingresso) - giorno_epoca(Evento.data_evento) * 1440
+
+
+# ─────────────────────────────────────────────
+# Curve tipo dallo storico
+# ─────────────────────────────────────────────
+def calcola_modelli(db: Session, fino_a: date) -> dict:
+    """Curve per categoria (e "tutte") dalle serate fra GIORNI_STORICO giorni fa e ``fino_a`` esclusa"""
+    finestra = (Evento.data_evento < fino_a, Evento.data_evento >= fino_a - timedelta(days=GIORNI_STORICO))
+
+    stmt = select(Ingresso.evento_id, _minuti_evento()).join(
+        Evento, Ingresso.evento_id == Evento.id_evento
+    ).where(*finestra, Ingresso.orario_ingresso.isnot(None))
+    eventi, minuti = [], []
+    risultato = db.connection().execute(stmt.execution_options(yield_per=LOTTO))
+    try:
+        for lotto in risultato.partitions():
+            colonne = list(zip(*lotto))
+            eventi.append(np.fromiter(colonne[0], dtype=np.int64, count=len(lotto)))
+            minuti.append(np.fromiter(colonne[1], dtype=np.int64, count=len(lotto)))
+    finally:
+        risultato.close()
+    if not eventi:
+        return {"categorie": {}, "tutte": None}
+
+    # Matrice serate × slot in un colpo solo
+    id_eventi, indice = np.unique(np.concatenate(eventi), return_inverse=True)
+    slot = _slot(np.concatenate(minuti))
+    matrice = np.bincount(indice * N_SLOT + slot, minlength=len(id_eventi) * N_SLOT).reshape(-1, N_SLOT)
+    totali = matrice.sum(axis=1)
+
+    prenotate = select(Prenotazione.evento_id, func.count(Prenotazione.id_prenotazione)).where(
+        Prenotazione.stato.in_(STATI_PRENOTAZIONE_VALIDI)
+    ).group_by(Prenotazione.evento_id).subquery()
+    info = db.execute(
+        select(Evento.id_evento, Evento.categoria, prenotate.c[1])
+        .outerjoin(prenotate, prenotate.c.evento_id == Evento.id_evento)
+        .where(*finestra)
+    ).all()
+    categoria = {r[0]: (r[1] or "altro") for r in info}
+    prenotazioni = {r[0]: (r[2] or 0) for r in info}
+    categorie = np.array([categoria.get(int(i), "altro") for i in id_eventi])
+    n_prenotazioni = np.array([prenotazioni.get(int(i), 0) for i in id_eventi], dtype=np.float64)
+
+    valide = totali >= MIN_INGRESSI_STORICO
+    frazioni = matrice / np.maximum(totali, 1)[:, None]
+
+    def modello(maschera):
+        maschera = maschera & valide
+        if not maschera.any():
+            return None
+        con_prenotazioni = maschera & (n_prenotazioni > 0)
+        tasso = float(np.median(totali[con_prenotazioni] / n_prenotazioni[con_prenotazioni])) \
+            if con_prenotazioni.any() else None
+        return {
+            "frazioni": [round(float(x), 5) for x in frazioni[maschera].mean(axis=0)],
+            "tasso_presenza": round(tasso, 3) if tasso is not None else None,
+            "ingressi_medi": round(float(totali[maschera].mean())),
+            "serate": int(maschera.sum()),
+        }
+
+    return {
+        "categorie": {c: m for c in np.unique(categorie).tolist() if (m := modello(categorie == c))},
+        "tutte": modello(np.ones(len(id_eventi), dtype=bool)),
+    }
+
+
+def _modelli(db: Session, oggi: date) -> dict:
+    chiave = f"previsione:modelli:{oggi.isoformat()}"
+    modelli = cache_get(chiave)
+    if modelli is None:
+        modelli = calcola_modelli(db, oggi)
+        cache_set(chiave, modelli, TTL_MODELLI)
+    return modelli
+
+
+# ─────────────────────────────────────────────
+# Serata in corso (incrementale)
+# ─────────────────────────────────────────────
+def _aggiorna_osservati(db: Session, evento_id: int, stato: dict) -> dict:
+    """Aggiunge allo stato gli ingressi con id successivo all'ultimo letto"""
+    nuovi = db.execute(
+        select(Ingresso.id_ingresso, _minuti_evento())
+        .join(Evento, Ingresso.evento_id == Evento.id_evento)
+        .where(Ingresso.evento_id == evento_id, Ingresso.id_ingresso > stato["ultimo_id"],
+               Ingresso.orario_ingresso.isnot(None))
+        .order_by(Ingresso.id_ingresso)
+    ).all()
+    if not nuovi:
+        return stato
+    ids, minuti = np.array(nuovi, dtype=np.int64).T
+    slot = np.array(stato["slot"], dtype=np.int64) + np.bincount(_slot(minuti), minlength=N_SLOT)
+    return {"ultimo_id": int(ids[-1]), "slot": slot.tolist(), "totale": int(slot.sum())}
+
+
+def _osservati(db: Session, evento_id: int) -> dict:
+    """Ingressi per slot della serata, aggiornati leggendo solo le scansioni nuove"""
+    chiave = f"previsione:live:{evento_id}"
+    vuoto = {"ultimo_id": 0, "slot": [0] * N_SLOT, "totale": 0}
+    precedente = cache_get(chiave) or vuoto
+    reali = db.query(func.count(Ingresso.id_ingresso)).filter(
+        Ingresso.evento_id == evento_id, Ingresso.orario_ingresso.isnot(None)
+    ).scalar() or 0
+    stato = _aggiorna_osservati(db, evento_id, precedente)
+    if stato["totale"] != reali and precedente is not vuoto:
+        # Ingressi cancellati o modificati nel frattempo: si ricostruisce da zero
+        stato = _aggiorna_osservati(db, evento_id, vuoto)
+    if stato is not precedente:
+        cache_set(chiave, stato, TTL_LIVE)
+    return stato
+
+
+def previsione_ingressi(db: Session, evento: Evento, adesso: Optional[datetime] = None) -> Optional[dict]:
+    if np is None:
+        return None
+    adesso = adesso or datetime.now()
+    modelli = _modelli(db, data_lavorativa(adesso))
+    categoria = evento.categoria or "altro"
+    modello = modelli["categorie"].get(categoria) or modelli["tutte"]
+
+    osservati = _osservati(db, evento.id_evento)
+    slot_osservati = np.array(osservati["slot"], dtype=np.float64)
+    entrati = osservati["totale"]
+    capienza = evento.capienza_max or 0
+    prenotazioni = db.query(func.count(Prenotazione.id_prenotazione)).filter(
+        Prenotazione.evento_id == evento.id_evento,
+        Prenotazione.stato.in_(STATI_PRENOTAZIONE_VALIDI)
+    ).scalar() or 0
+
+    minuto = (adesso - datetime.combine(evento.data_evento, time())).total_seconds() / 60
+    posizione = (minuto - INIZIO_NOTTE) / SLOT_MINUTI  # slot corrente con la parte trascorsa
+    corrente = int(np.clip(math.floor(posizione), -1, N_SLOT))
+
+    out = {
+        "categoria": categoria,
+        "entrati": entrati,
+        "prenotazioni": prenotazioni,
+        "capienza": capienza,
+        "modello": None,
+        "totale_previsto": None,
+        "ora_capienza": None,
+        "minuti_a_capienza": None,
+        "porte_consigliate": None,
+        "slot": [
+            {"ora": _etichetta_slot(i), "osservati": int(slot_osservati[i]), "previsti": None}
+            for i in range(N_SLOT)
+        ],
+    }
+    if modello is None:
+        return out
+
+    frazioni = np.array(modello["frazioni"])
+    cumulata = np.concatenate([[0.0], np.cumsum(frazioni)])
+    # Quota della curva già trascorsa (lo slot corrente conta per la parte passata)
+    if corrente < 0:
+        quota = 0.0
+    elif corrente >= N_SLOT:
+        quota = 1.0
+    else:
+        quota = float(cumulata[corrente] + frazioni[corrente] * (posizione - corrente))
+
+    da_prenotazioni = prenotazioni * modello["tasso_presenza"] if modello["tasso_presenza"] else modello["ingressi_medi"]
+    if quota >= 0.05 and entrati:
+        totale = (1 - quota) * da_prenotazioni + quota * (entrati / quota)
+    else:
+        totale = da_prenotazioni
+    totale = max(totale, entrati)
+
+    # Arrivi ancora attesi, distribuiti sugli slot futuri secondo la curva
+    futuro = np.where(np.arange(N_SLOT) > corrente, frazioni, 0.0)
+    if 0 <= corrente < N_SLOT:
+        futuro[corrente] = frazioni[corrente] * (1 - (posizione - corrente))
+    residuo = futuro.sum()
+    previsti = futuro * ((totale - entrati) / residuo) if residuo > 0 else futuro
+
+    cumulati = entrati + np.cumsum(previsti)
+    if capienza and entrati >= capienza:
+        out["ora_capienza"], out["minuti_a_capienza"] = "ora", 0
+    elif capienza and (cumulati >= capienza).any():
+        i = int(np.argmax(cumulati >= capienza))
+        fine_slot = INIZIO_NOTTE + (i + 1) * SLOT_MINUTI
+        out["ora_capienza"] = _etichetta_slot(i + 1)
+        out["minuti_a_capienza"] = max(0, int(fine_slot - minuto))
+
+    prossima_ora = previsti[max(corrente, 0):max(corrente, 0) + 4]
+    picco = float(prossima_ora.max()) if len(prossima_ora) else 0.0
+    out["porte_consigliate"] = int(np.clip(math.ceil(picco / INGRESSI_PER_PORTA_15M), 1, PORTE_MAX))
+
+    out["modello"] = {"serate": modello["serate"], "tasso_presenza": modello["tasso_presenza"],
+                      "generico": categoria not in modelli["categorie"]}
+    out["totale_previsto"] = int(round(totale))
+    for i in range(N_SLOT):
+        if previsti[i] > 0:
+            out["slot"][i]["previsti"] = round(float(previsti[i]), 1)
+    return out
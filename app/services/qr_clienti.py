@@ -0,0 +1,129 @@
+"""
+Immagini QR dei clienti: generate una volta, poi servite dalla cache.
+
+Il QR di un cliente dipende solo da ``Cliente.qr_code``, quindi l'immagine è
+identificata da un'impronta del codice (``impronta_qr``) e non cambia mai a
+parità di URL: ``/clienti/me/qr/<impronta>.<formato>`` viene servito con ETag
+forte e ``Cache-Control: immutable``. I byte sono tenuti in un LRU in memoria
+davanti a una cache su disco (``QR_CACHE_DIR``, condivisa fra i worker).
+
+Prima di un evento si possono pregenerare i QR degli ospiti attesi
+(prenotazioni attive) con un job in background o con ``flask qr-pregenera``.
+"""
+import hashlib
+import json
+import logging
+import os
+from functools import lru_cache
+from pathlib import Path
+
+import click
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.models.clienti import Cliente
+from app.models.prenotazioni import Prenotazione
+from app.utils.jobs import registra_handler
+from app.utils.qr import qr_png, qr_svg
+
+logger = logging.getLogger(__name__)
+
+FORMATI = {"svg": ("image/svg+xml", qr_svg), "png": ("image/png", qr_png)}
+VERSIONE_RENDER = "1"  # da incrementare se cambia l'aspetto del QR: nuovi URL e ETag
+CACHE_DIR = Path(os.getenv("QR_CACHE_DIR") or Path(__file__).resolve().parents[2] / ".cache" / "qr")
+MAX_AGE = 31536000
+JOB_PREGENERA_QR = "qr_pregenera"
+BATCH_PREGENERA = 200
+
+
+def impronta_qr(qr_code: str) -> str:
+    return hashlib.sha256(f"{VERSIONE_RENDER}:{qr_code}".encode("utf-8")).hexdigest()[:16]
+
+
+def _percorso(qr_code: str, formato: str) -> Path:
+    return CACHE_DIR / f"{impronta_qr(qr_code)}.{formato}"
+
+
+def _genera_su_disco(qr_code: str, formato: str) -> bytes:
+    path = _percorso(qr_code, formato)
+    try:
+        return path.read_bytes()
+    except FileNotFoundError:
+        pass
+    dati = FORMATI[formato][1](qr_code)
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_bytes(dati)
+        os.replace(tmp, path)  # atomico: un altro worker non legge mai un file a metà
+    except OSError as exc:
+        logger.warning("Cache QR su disco non scrivibile (%s): immagine solo in memoria", exc)
+    return dati
+
+
+@lru_cache(maxsize=int(os.getenv("QR_CACHE_MEMORIA", "2048")))
+def immagine_qr(qr_code: str, formato: str = "svg") -> bytes:
+    """Byte dell'immagine QR: LRU in memoria → file in cache → rendering"""
+    if formato not in FORMATI:
+        raise ValueError(f"Formato QR non supportato: {formato}")
+    return _genera_su_disco(qr_code, formato)
+
+
+def mimetype_qr(formato: str) -> str:
+    return FORMATI[formato][0]
+
+
+# ─────────────────────────────────────────────
+# Pregenerazione per gli ospiti attesi di un evento
+# ─────────────────────────────────────────────
+def _filtri_ospiti(evento_id: int):
+    return (
+        Prenotazione.evento_id == evento_id,
+        Prenotazione.stato == "attiva",
+        Cliente.qr_code.isnot(None),
+    )
+
+
+def conta_ospiti_attesi(db: Session, evento_id: int) -> int:
+    return db.query(func.count(func.distinct(Cliente.id_cliente))).join(
+        Prenotazione, Prenotazione.cliente_id == Cliente.id_cliente
+    ).filter(*_filtri_ospiti(evento_id)).scalar() or 0
+
+
+@registra_handler(JOB_PREGENERA_QR)
+def pregenera_qr_batch(db: Session, job) -> bool:
+    """Un lotto: clienti con prenotazione attiva sull'evento e id > cursore"""
+    evento_id = json.loads(job.parametri or "{}").get("evento_id")
+    righe = db.query(Cliente.id_cliente, Cliente.qr_code).join(
+        Prenotazione, Prenotazione.cliente_id == Cliente.id_cliente
+    ).filter(
+        *_filtri_ospiti(evento_id), Cliente.id_cliente > (job.cursore or 0)
+    ).distinct().order_by(Cliente.id_cliente).limit(BATCH_PREGENERA).all()
+
+    for r in righe:
+        for formato in FORMATI:
+            # Solo disco (condiviso fra i worker): il LRU si riempie alla prima richiesta
+            _genera_su_disco(r.qr_code, formato)
+    if righe:
+        job.cursore = righe[-1].id_cliente
+        job.processati = (job.processati or 0) + len(righe)
+    return len(righe) < BATCH_PREGENERA
+
+
+def init_cli(app):
+    from app.database import SessionLocal
+    from app.utils.jobs import crea_job, esegui_job
+
+    @app.cli.command("qr-pregenera")
+    @click.argument("evento_id", type=int)
+    def qr_pregenera_cmd(evento_id):
+        """Genera in cache i QR (SVG e PNG) degli ospiti attesi di un evento."""
+        db = SessionLocal()
+        try:
+            job = crea_job(db, JOB_PREGENERA_QR, totale=conta_ospiti_attesi(db, evento_id),
+                           parametri={"evento_id": evento_id})
+            esegui_job(job.id_job)
+            db.refresh(job)
+            click.echo(f"QR pregenerati: {job.processati or 0} clienti (stato job: {job.stato})")
+        finally:
+            db.close()
@@ -0,0 +1,244 @@
+"""
+Ricerca clienti indicizzata (autocomplete bar, lista admin, movimenti fedeltà).
+
+Invece di ``ILIKE '%termine%'`` su nome/cognome/telefono (scansione completa di
+``clienti`` a ogni tasto) ogni cliente ha in ``clienti_ricerca`` le sue parole
+normalizzate (senza accenti, minuscole) e le cifre del telefono, più i
+trigrammi delle parole. La ricerca per prefisso è una range scan sull'indice
+``(tipo, valore)``; se i risultati non bastano si passa alla ricerca
+approssimata per trigrammi in comune (errori di battitura, nomi storpiati).
+
+L'indice viene aggiornato nella stessa transazione della modifica
+(``indicizza`` / ``rimuovi``) e ricostruito con ``flask clienti-indicizza``.
+"""
+import re
+import unicodedata
+from dataclasses import dataclass
+from typing import List, Optional, Set
+
+import click
+from sqlalchemy import and_, case, exists, false, func, insert, or_
+from sqlalchemy.orm import Session
+
+from app.models.clienti import Cliente
+from app.models.clienti_ricerca import ClienteRicerca
+from app.models.ingressi import Ingresso
+
+PAROLA, TRIGRAMMA = "p", "t"
+LUNGHEZZA_MAX = 64
+SOGLIA_FUZZY = 0.4  # frazione minima di trigrammi della ricerca presenti nel cliente
+LOTTO_RICOSTRUZIONE = 1000
+
+_SOLO_TELEFONO = re.compile(r"[\d\s+\-/.()]+")
+
+
+@dataclass
+class Risultato:
+    cliente: Cliente
+    punteggio: float
+    ha_ingresso: bool = False
+    approssimato: bool = False
+
+
+# ─────────────────────────────────────────────
+# Normalizzazione
+# ─────────────────────────────────────────────
+def normalizza(testo: Optional[str]) -> str:
+    """Minuscolo, senza accenti, solo lettere/cifre separate da spazi"""
+    testo = unicodedata.normalize("NFKD", testo or "")
+    testo = "".join(c for c in testo if not unicodedata.combining(c)).lower()
+    return re.sub(r"[^a-z0-9]+", " ", testo).strip()
+
+
+def _cifre_telefono(telefono: Optional[str]) -> Set[str]:
+    """Numero completo e, se c'è il prefisso internazionale italiano, quello nazionale"""
+    cifre = re.sub(r"\D", "", telefono or "")
+    if not cifre:
+        return set()
+    out = {cifre}
+    for prefisso in ("0039", "39"):
+        if cifre.startswith(prefisso) and len(cifre) - len(prefisso) >= 9:
+            out.add(cifre[len(prefisso):])
+            break
+    return out
+
+
+def trigrammi(parola: str) -> Set[str]:
+    p = f"  {parola} "
+    return {p[i:i + 3] for i in range(len(p) - 2)}
+
+
+def parole_cliente(nome: Optional[str], cognome: Optional[str], telefono: Optional[str]) -> Set[str]:
+    parole = set(normalizza(f"{nome or ''} {cognome or ''}").split())
+    return {p[:LUNGHEZZA_MAX] for p in parole} | _cifre_telefono(telefono)
+
+
+def termini_ricerca(testo: str) -> List[str]:
+    """Termini della query; un numero di telefono scritto con spazi/trattini resta un termine unico"""
+    if _SOLO_TELEFONO.fullmatch(testo.strip() or "x"):
+        cifre = re.sub(r"\D", "", testo)
+        return [cifre] if cifre else []
+    termini = sorted(set(normalizza(testo).split()), key=len, reverse=True)
+    # "ros rossi": il termine più corto è già coperto dal più lungo
+    return [t for i, t in enumerate(termini) if not any(a.startswith(t) for a in termini[:i])]
+
+
+# ─────────────────────────────────────────────
+# Aggiornamento indice
+# ─────────────────────────────────────────────
+def _righe_indice(cliente_id: int, nome, cognome, telefono) -> List[dict]:
+    parole = parole_cliente(nome, cognome, telefono)
+    grammi = set()
+    for p in parole:
+        if not p.isdigit():
+            grammi |= trigrammi(p)
+    return (
+        [{"cliente_id": cliente_id, "tipo": PAROLA, "valore": p} for p in parole]
+        + [{"cliente_id": cliente_id, "tipo": TRIGRAMMA, "valore": g} for g in grammi]
+    )
+
+
+def indicizza(db: Session, cliente: Cliente):
+    """(Re)indicizza un cliente nella transazione del chiamante (dopo il flush, serve l'id)"""
+    rimuovi(db, cliente.id_cliente)
+    righe = _righe_indice(cliente.id_cliente, cliente.nome, cliente.cognome, cliente.telefono)
+    if righe:
+        db.execute(insert(ClienteRicerca), righe)
+
+
+def rimuovi(db: Session, cliente_id: int):
+    db.query(ClienteRicerca).filter(ClienteRicerca.cliente_id == cliente_id).delete(synchronize_session=False)
+
+
+def ricostruisci(db: Session) -> int:
+    """Rigenera l'intero indice a lotti di clienti; ritorna quanti clienti sono stati indicizzati"""
+    db.query(ClienteRicerca).delete(synchronize_session=False)
+    db.commit()
+    ultimo, totale = 0, 0
+    while True:
+        clienti = db.query(Cliente.id_cliente, Cliente.nome, Cliente.cognome, Cliente.telefono).filter(
+            Cliente.id_cliente > ultimo
+        ).order_by(Cliente.id_cliente).limit(LOTTO_RICOSTRUZIONE).all()
+        if not clienti:
+            break
+        righe = []
+        for c in clienti:
+            righe.extend(_righe_indice(c.id_cliente, c.nome, c.cognome, c.telefono))
+        if righe:
+            db.execute(insert(ClienteRicerca), righe)
+        db.commit()
+        ultimo = clienti[-1].id_cliente
+        totale += len(clienti)
+    return totale
+
+
+def inizializza(db: Session):
+    """Prima esecuzione (indice vuoto ma clienti presenti): costruisce l'indice"""
+    if db.query(ClienteRicerca.id_token).first() is None:
+        if db.query(Cliente.id_cliente).first() is not None:
+            ricostruisci(db)
+
+
+# ─────────────────────────────────────────────
+# Ricerca
+# ─────────────────────────────────────────────
+def _like_prefisso(termine: str) -> str:
+    return re.sub(r"([\\%_])", r"\\\1", termine) + "%"
+
+
+def _per_prefisso(db: Session, termini: List[str]):
+    """cliente_id + punteggio dei clienti che hanno una parola per ciascun termine"""
+    R = ClienteRicerca
+    casi = [(R.valore.like(_like_prefisso(t), escape="\\"), i) for i, t in enumerate(termini)]
+    return db.query(
+        R.cliente_id.label("cliente_id"),
+        # Parola identica al termine pesa più di un semplice prefisso
+        func.sum(case((R.valore.in_(termini), 2), else_=1)).label("punteggio"),
+    ).filter(
+        R.tipo == PAROLA, or_(*[c for c, _ in casi])
+    ).group_by(R.cliente_id).having(
+        func.count(func.distinct(case(*casi))) >= len(termini)
+    )
+
+
+def _per_trigrammi(db: Session, termini: List[str]):
+    """cliente_id + frazione di trigrammi della ricerca presenti nel cliente"""
+    grammi = set()
+    for t in termini:
+        if not t.isdigit():
+            grammi |= trigrammi(t)
+    if not grammi:
+        return None
+    R = ClienteRicerca
+    minimo = max(2, int(len(grammi) * SOGLIA_FUZZY + 0.5))
+    return db.query(
+        R.cliente_id.label("cliente_id"),
+        (func.count(R.id_token) * 1.0 / len(grammi)).label("punteggio"),
+    ).filter(
+        R.tipo == TRIGRAMMA, R.valore.in_(grammi)
+    ).group_by(R.cliente_id).having(func.count(R.id_token) >= minimo)
+
+
+def filtro_clienti(db: Session, testo: str):
+    """
+    Condizione su ``Cliente.id_cliente`` per le liste: tutti i termini devono
+    corrispondere per prefisso (ordinamento e paginazione restano della lista).
+    """
+    termini = termini_ricerca(testo)
+    if not termini:
+        return false()
+    sq = _per_prefisso(db, termini).subquery()
+    return Cliente.id_cliente.in_(db.query(sq.c.cliente_id))
+
+
+def cerca(db: Session, testo: str, *, limite: int = 10, evento_id: Optional[int] = None,
+          solo_entrati: bool = False) -> List[Risultato]:
+    """
+    Clienti per prefisso e, se non bastano, per somiglianza. Con ``evento_id``
+    ogni risultato dice se il cliente è entrato all'evento (calcolato nella
+    stessa query) e gli entrati vengono prima; ``solo_entrati`` li filtra.
+    """
+    termini = termini_ricerca(testo)
+    if not termini:
+        return []
+
+    if evento_id:
+        entrato = exists().where(and_(Ingresso.cliente_id == Cliente.id_cliente, Ingresso.evento_id == evento_id))
+    else:
+        entrato = false()
+    colonna_ingresso = case((entrato, 1), else_=0).label("ha_ingresso")
+
+    def esegui(candidati, esclusi, n):
+        sq = candidati.subquery()
+        q = db.query(Cliente, sq.c.punteggio, colonna_ingresso).join(sq, sq.c.cliente_id == Cliente.id_cliente)
+        if solo_entrati:
+            q = q.filter(entrato)
+        if esclusi:
+            q = q.filter(Cliente.id_cliente.notin_(esclusi))
+        return q.order_by(
+            colonna_ingresso.desc(), sq.c.punteggio.desc(), Cliente.cognome, Cliente.nome, Cliente.id_cliente
+        ).limit(n).all()
+
+    risultati = [Risultato(c, float(p), bool(i)) for c, p, i in esegui(_per_prefisso(db, termini), None, limite)]
+    if len(risultati) < limite:
+        simili = _per_trigrammi(db, termini)
+        if simili is not None:
+            trovati = [r.cliente.id_cliente for r in risultati]
+            risultati += [
+                Risultato(c, float(p), bool(i), approssimato=True)
+                for c, p, i in esegui(simili, trovati, limite - len(risultati))
+            ]
+    return risultati
+
+
+def init_cli(app):
+    from app.database import SessionLocal
+
+    @app.cli.command("clienti-indicizza")
+    def clienti_indicizza_cmd():
+        """Ricostruisce l'indice di ricerca dei clienti."""
+        db = SessionLocal()
+        try:
+            click.echo(f"Clienti indicizzati: {ricostruisci(db)}")
+        finally:
+            db.close()
@@ -1,60 +1,168 @@
 """
 Servizio per query statistiche aggregate
+
+I KPI (totali e conteggi) sono calcolati per area con un solo passaggio di
+aggregazione condizionale per tabella (``_kpi``); l'overview li chiede tutti
+insieme in un'unica SELECT. Risultati e KPI sono memorizzati per la richiesta
+(``memo_richiesta``): lo stesso aggregato non viene mai ricalcolato nella
+stessa pagina.
+
+Gli eventi archiviati (``archivio_eventi``) non sono più nelle tabelle calde:
+i loro totali arrivano da ``riepilogo_eventi``/``riepilogo_eventi_prodotti``.
 """
-from sqlalchemy import func, case, and_, or_
+from sqlalchemy import func, case, and_, or_, select, true, union_all
 from sqlalchemy.orm import Session
 from datetime import datetime, date, timedelta
 from collections import defaultdict
 from typing import Dict, List, Optional, Tuple
 
+from app.utils.cache import memo_corrente, memo_richiesta
+
+AREE_KPI = ("ingressi", "prenotazioni", "consumi", "clienti")
+
+
+# ─────────────────────────────────────────────
+# KPI (solo scalari)
+# ─────────────────────────────────────────────
+def _conta_se(condizione):
+    return func.coalesce(func.sum(case((condizione, 1), else_=0)), 0)
+
+
+def _archiviati(colonna, evento_id: Optional[int]):
+    """Sottoquery scalare: somma di ``colonna`` dei riepiloghi degli eventi archiviati"""
+    from app.models.archivio_eventi import RiepilogoEvento
+
+    stmt = select(func.coalesce(func.sum(colonna), 0))
+    if evento_id:
+        stmt = stmt.where(RiepilogoEvento.evento_id == evento_id)
+    return stmt.scalar_subquery()
+
+
+def _select_kpi(area: str, evento_id: Optional[int]):
+    """SELECT di una riga con i KPI dell'area (una sola scansione della tabella + riepiloghi archivio)"""
+    from app.models.ingressi import Ingresso
+    from app.models.prenotazioni import Prenotazione
+    from app.models.consumi import Consumo
+    from app.models.clienti import Cliente
+    from app.models.eventi import Evento
+    from app.models.archivio_eventi import RiepilogoEvento as R
+
+    oggi = datetime.now()
+    if area == "ingressi":
+        stmt = select(
+            (func.count(Ingresso.id_ingresso) + _archiviati(R.ingressi, evento_id)).label("totale"),
+            _conta_se(Ingresso.data_lavorativa >= (oggi - timedelta(days=7)).date()).label("ultimi_7_giorni"),
+        )
+        return stmt.where(Ingresso.evento_id == evento_id) if evento_id else stmt
+    if area == "prenotazioni":
+        tavolo = Prenotazione.tipo == "tavolo"
+        approvazione = Prenotazione.stato_approvazione_tavolo
+        stmt = select(
+            (func.count(Prenotazione.id_prenotazione) + _archiviati(R.prenotazioni, evento_id)).label("totale"),
+            (_conta_se(Prenotazione.tipo == "lista") + _archiviati(R.prenotazioni_lista, evento_id)).label("lista"),
+            (_conta_se(tavolo) + _archiviati(R.prenotazioni_tavolo, evento_id)).label("tavolo"),
+            (_conta_se(and_(tavolo, approvazione == "in_attesa"))
+             + _archiviati(R.tavoli_in_attesa, evento_id)).label("tavoli_in_attesa"),
+            (_conta_se(and_(tavolo, approvazione == "approvata"))
+             + _archiviati(R.tavoli_approvati, evento_id)).label("tavoli_approvati"),
+            (_conta_se(and_(tavolo, approvazione == "rifiutata"))
+             + _archiviati(R.tavoli_rifiutati, evento_id)).label("tavoli_rifiutati"),
+            # Conversioni: clienti con un tavolo attivo (solo tabelle calde: i distinti non si sommano)
+            func.count(func.distinct(case(
+                (and_(tavolo, Prenotazione.stato == "attiva"), Prenotazione.cliente_id)
+            ))).label("conversioni"),
+        )
+        return stmt.where(Prenotazione.evento_id == evento_id) if evento_id else stmt
+    if area == "consumi":
+        stmt = select(
+            (func.coalesce(func.sum(Consumo.importo), 0) + _archiviati(R.revenue, evento_id)).label("revenue_totale"),
+            (func.count(Consumo.id_consumo) + _archiviati(R.num_ordini, evento_id)).label("num_ordini"),
+        )
+        return stmt.where(Consumo.evento_id == evento_id) if evento_id else stmt
+    # clienti: non dipende dall'evento
+    attivi = select(func.count(func.distinct(Prenotazione.cliente_id))).join(
+        Evento, Prenotazione.evento_id == Evento.id_evento
+    ).where(
+        Evento.data_evento.isnot(None),
+        Evento.data_evento >= oggi.date() - timedelta(days=90)
+    ).scalar_subquery()
+    return select(
+        func.count(Cliente.id_cliente).label("totale"),
+        _conta_se(Cliente.data_registrazione >= oggi - timedelta(days=30)).label("nuovi_ultimi_30_giorni"),
+        attivi.label("attivi_ultimi_90_giorni"),
+    )
+
 
+def _kpi(db: Session, evento_id: Optional[int], *aree: str) -> Dict[str, Dict]:
+    """KPI delle aree richieste: quelle non ancora calcolate nella richiesta in un'unica SELECT"""
+    memo = memo_corrente()
+    chiave = lambda area: ("kpi", area, None if area == "clienti" else evento_id)
+    mancanti = [a for a in aree if chiave(a) not in memo]
+    if mancanti:
+        sottoquery = [_select_kpi(a, evento_id).subquery(f"kpi_{a}") for a in mancanti]
+        # Ogni sottoquery ha una sola riga: il prodotto cartesiano è una riga sola
+        da = sottoquery[0]
+        for sq in sottoquery[1:]:
+            da = da.join(sq, true())
+        riga = db.execute(select(*[c for sq in sottoquery for c in sq.c]).select_from(da)).one()
+        i = 0
+        for area, sq in zip(mancanti, sottoquery):
+            nomi = [c.name for c in sq.c]
+            memo[chiave(area)] = dict(zip(nomi, riga[i:i + len(nomi)]))
+            i += len(nomi)
+    return {a: memo[chiave(a)] for a in aree}
+
+
+@memo_richiesta
 def get_ingressi_stats(db: Session, evento_id: Optional[int] = None, giorni: int = 30) -> Dict:
     """Statistiche ingressi: totale, trend giornaliero, per ora"""
     from app.models.ingressi import Ingresso
     from app.models.eventi import Evento
-    
-    base_query = db.query(Ingresso)
-    if evento_id:
-        base_query = base_query.filter(Ingresso.evento_id == evento_id)
+    from app.models.archivio_eventi import RiepilogoEvento
+    from app.services.archivio_eventi import modelli_evento
     
     # Totale ingressi
-    totale = base_query.count()
+    totale = _kpi(db, evento_id, "ingressi")["ingressi"]["totale"]
     
     # Trend ultimi N giorni
     data_inizio = datetime.now() - timedelta(days=giorni)
     ingressi_giornalieri = db.query(
-        func.date(Ingresso.orario_ingresso).label('data'),
+        Ingresso.data_lavorativa.label('data'),
         func.count(Ingresso.id_ingresso).label('count')
     ).filter(
-        Ingresso.orario_ingresso >= data_inizio
+        Ingresso.data_lavorativa >= data_inizio.date()
     )
     if evento_id:
         ingressi_giornalieri = ingressi_giornalieri.filter(Ingresso.evento_id == evento_id)
     
     ingressi_giornalieri = ingressi_giornalieri.group_by(
-        func.date(Ingresso.orario_ingresso)
-    ).order_by('data').all()
+        Ingresso.data_lavorativa
+    ).order_by(Ingresso.data_lavorativa).all()
     
     trend_data = [{'data': str(row.data), 'count': row.count} for row in ingressi_giornalieri]
     
-    # Ingressi per ora (ultimo evento o evento specifico)
+    # Ingressi per ora della notte (ultimo evento o evento specifico): 22, 23, 0, 1...
+    # Un evento archiviato si legge dalla sua tabella di archivio
+    I = modelli_evento(db, evento_id).ingressi if evento_id else Ingresso
     ingressi_per_ora = db.query(
-        func.extract('hour', Ingresso.orario_ingresso).label('ora'),
-        func.count(Ingresso.id_ingresso).label('count')
+        I.ora_notte.label('ora'),
+        func.count(I.id_ingresso).label('count')
     )
     if evento_id:
-        ingressi_per_ora = ingressi_per_ora.filter(Ingresso.evento_id == evento_id)
+        ingressi_per_ora = ingressi_per_ora.filter(I.evento_id == evento_id)
     else:
         # Ultimo evento
         ultimo_evento = db.query(Evento).order_by(Evento.data_evento.desc()).first()
         if ultimo_evento:
-            ingressi_per_ora = ingressi_per_ora.filter(Ingresso.evento_id == ultimo_evento.id_evento)
+            ingressi_per_ora = ingressi_per_ora.filter(I.evento_id == ultimo_evento.id_evento)
     
-    ingressi_per_ora = ingressi_per_ora.group_by(
-        func.extract('hour', Ingresso.orario_ingresso)
-    ).order_by('ora').all()
+    ingressi_per_ora = ingressi_per_ora.filter(
+        I.ora_notte.isnot(None)
+    ).group_by(
+        I.ora_notte
+    ).order_by(I.ora_notte).all()
     
-    ore_data = [{'ora': int(row.ora), 'count': row.count} for row in ingressi_per_ora]
+    ore_data = [{'ora': int(row.ora) % 24, 'count': row.count} for row in ingressi_per_ora]
     
     # Saturazione capienza per evento
     saturazione_eventi = []
@@ -65,9 +173,13 @@ def get_ingressi_stats(db: Session, evento_id: Optional[int] = None, giorni: int
         eventi_query = eventi_query.order_by(Evento.data_evento.desc()).limit(10)
     
     for evento in eventi_query.all():
-        ingressi_evento = db.query(func.count(Ingresso.id_ingresso)).filter(
-            Ingresso.evento_id == evento.id_evento
-        ).scalar() or 0
+        if evento.archiviato_il:
+            riepilogo = db.get(RiepilogoEvento, evento.id_evento)
+            ingressi_evento = riepilogo.ingressi if riepilogo else 0
+        else:
+            ingressi_evento = db.query(func.count(Ingresso.id_ingresso)).filter(
+                Ingresso.evento_id == evento.id_evento
+            ).scalar() or 0
         
         capienza = evento.capienza_max or 0
         percentuale = (ingressi_evento / capienza * 100) if capienza > 0 else 0
@@ -87,37 +199,15 @@ def get_ingressi_stats(db: Session, evento_id: Optional[int] = None, giorni: int
     }
 
 
+@memo_richiesta
 def get_prenotazioni_stats(db: Session, evento_id: Optional[int] = None) -> Dict:
     """Statistiche prenotazioni: conversioni, approvazioni tavoli, trend"""
     from app.models.prenotazioni import Prenotazione
     from app.models.eventi import Evento
+    from app.models.archivio_eventi import RiepilogoEvento
     
-    base_query = db.query(Prenotazione)
-    if evento_id:
-        base_query = base_query.filter(Prenotazione.evento_id == evento_id)
-    
-    # Totale prenotazioni
-    totale = base_query.count()
-    
-    # Per tipo
-    lista_count = base_query.filter(Prenotazione.tipo == "lista").count()
-    tavolo_count = base_query.filter(Prenotazione.tipo == "tavolo").count()
-    
-    # Stati approvazione tavoli
-    tavoli_in_attesa = base_query.filter(
-        Prenotazione.tipo == "tavolo",
-        Prenotazione.stato_approvazione_tavolo == "in_attesa"
-    ).count()
-    
-    tavoli_approvati = base_query.filter(
-        Prenotazione.tipo == "tavolo",
-        Prenotazione.stato_approvazione_tavolo == "approvata"
-    ).count()
-    
-    tavoli_rifiutati = base_query.filter(
-        Prenotazione.tipo == "tavolo",
-        Prenotazione.stato_approvazione_tavolo == "rifiutata"
-    ).count()
+    # Totali, per tipo e stati approvazione tavoli (un solo passaggio)
+    kpi = _kpi(db, evento_id, "prenotazioni")["prenotazioni"]
     
     # Trend mensile (usa evento.data_evento come proxy)
     # Raggruppa per evento e mese dell'evento
@@ -131,6 +221,11 @@ def get_prenotazioni_stats(db: Session, evento_id: Optional[int] = None) -> Dict
     trend_mensile_query = trend_mensile_query.group_by(
         Prenotazione.evento_id
     ).all()
+    # Eventi archiviati: conteggio dal riepilogo
+    archiviati = db.query(RiepilogoEvento.evento_id, RiepilogoEvento.prenotazioni.label('count'))
+    if evento_id:
+        archiviati = archiviati.filter(RiepilogoEvento.evento_id == evento_id)
+    trend_mensile_query += archiviati.all()
     
     # Raggruppa per mese usando data_evento
     mesi_dict = defaultdict(int)
@@ -142,48 +237,51 @@ def get_prenotazioni_stats(db: Session, evento_id: Optional[int] = None) -> Dict
     
     trend_data = [{'mese': mese, 'count': count} for mese, count in sorted(mesi_dict.items())]
     
-    # Conversioni lista -> tavolo (clienti che hanno fatto entrambi)
-    conversioni = db.query(func.count(func.distinct(Prenotazione.cliente_id))).filter(
-        Prenotazione.tipo == "tavolo",
-        Prenotazione.stato == "attiva"
-    )
-    if evento_id:
-        conversioni = conversioni.filter(Prenotazione.evento_id == evento_id)
-    
-    conversioni_count = conversioni.scalar() or 0
-    
     return {
-        'totale': totale,
-        'lista': lista_count,
-        'tavolo': tavolo_count,
-        'tavoli_in_attesa': tavoli_in_attesa,
-        'tavoli_approvati': tavoli_approvati,
-        'tavoli_rifiutati': tavoli_rifiutati,
+        'totale': kpi['totale'],
+        'lista': kpi['lista'],
+        'tavolo': kpi['tavolo'],
+        'tavoli_in_attesa': kpi['tavoli_in_attesa'],
+        'tavoli_approvati': kpi['tavoli_approvati'],
+        'tavoli_rifiutati': kpi['tavoli_rifiutati'],
         'trend_mensile': trend_data,
-        'conversioni': conversioni_count
+        'conversioni': kpi['conversioni']
     }
 
 
+@memo_richiesta
 def get_consumi_stats(db: Session, evento_id: Optional[int] = None) -> Dict:
     """Statistiche consumi: revenue, scontrino medio, top prodotti"""
     from app.models.consumi import Consumo
     from app.models.prodotti import Prodotto
+    from app.models.archivio_eventi import RiepilogoProdottoEvento as RP
     
-    base_query = db.query(Consumo)
-    if evento_id:
-        base_query = base_query.filter(Consumo.evento_id == evento_id)
-    
-    # Revenue totale
-    revenue_totale = db.query(func.coalesce(func.sum(Consumo.importo), 0)).filter(
-        base_query.whereclause if evento_id else True
-    ).scalar() or 0
-    
-    # Numero ordini
-    num_ordini = base_query.count()
+    # Revenue totale e numero ordini
+    kpi = _kpi(db, evento_id, "consumi")["consumi"]
+    revenue_totale = kpi['revenue_totale'] or 0
+    num_ordini = kpi['num_ordini']
     
     # Scontrino medio
     scontrino_medio = (revenue_totale / num_ordini) if num_ordini > 0 else 0
     
+    # Vendite per prodotto: tabella calda + riepiloghi degli eventi archiviati
+    calde = select(
+        Consumo.prodotto_id.label('prodotto_id'),
+        func.count(Consumo.id_consumo).label('num_consumi'),
+        func.sum(Consumo.importo).label('revenue')
+    ).where(Consumo.prodotto_id.isnot(None))
+    archiviate = select(
+        RP.prodotto_id.label('prodotto_id'),
+        func.sum(RP.num_consumi).label('num_consumi'),
+        func.sum(RP.revenue).label('revenue')
+    ).where(RP.prodotto_id.isnot(None))
+    if evento_id:
+        calde = calde.where(Consumo.evento_id == evento_id)
+        archiviate = archiviate.where(RP.evento_id == evento_id)
+    vendite = union_all(
+        calde.group_by(Consumo.prodotto_id), archiviate.group_by(RP.prodotto_id)
+    ).subquery('vendite')
+
     # Top prodotti per categoria
     # Nota: Consumo non ha campo quantita, ogni record è un consumo
     # La quantità può essere nel nome prodotto (es. "Cocktail x3")
@@ -191,19 +289,23 @@ def get_consumi_stats(db: Session, evento_id: Optional[int] = None) -> Dict:
         Prodotto.categoria,
         Prodotto.nome,
         Prodotto.id_prodotto,
-        func.count(Consumo.id_consumo).label('num_consumi'),
-        func.sum(Consumo.importo).label('revenue')
+        func.sum(vendite.c.num_consumi).label('num_consumi'),
+        func.sum(vendite.c.revenue).label('revenue')
     ).join(
-        Consumo, Consumo.prodotto_id == Prodotto.id_prodotto
-    )
-    if evento_id:
-        top_prodotti = top_prodotti.filter(Consumo.evento_id == evento_id)
-    
-    top_prodotti = top_prodotti.group_by(
+        vendite, vendite.c.prodotto_id == Prodotto.id_prodotto
+    ).group_by(
         Prodotto.categoria, Prodotto.nome, Prodotto.id_prodotto
     ).order_by(
-        func.sum(Consumo.importo).desc()
+        func.sum(vendite.c.revenue).desc()
     ).limit(20).all()
+
+    # Quantità già calcolate per gli eventi archiviati
+    quantita_archivio = db.query(RP.prodotto_id, func.sum(RP.quantita)).filter(
+        RP.prodotto_id.in_([row.id_prodotto for row in top_prodotti])
+    )
+    if evento_id:
+        quantita_archivio = quantita_archivio.filter(RP.evento_id == evento_id)
+    quantita_archivio = dict(quantita_archivio.group_by(RP.prodotto_id).all()) if top_prodotti else {}
     
     # Calcola quantità totale estraendo dal nome prodotto se presente
     import re
@@ -217,7 +319,7 @@ def get_consumi_stats(db: Session, evento_id: Optional[int] = None) -> Dict:
         if evento_id:
             consumi_prodotto = consumi_prodotto.filter(Consumo.evento_id == evento_id)
         
-        quantita_totale = 0
+        quantita_totale = int(quantita_archivio.get(row.id_prodotto) or 0)
         for consumo_row in consumi_prodotto.all():
             nome_prod = consumo_row.prodotto or ""
             # Cerca pattern " x3" alla fine del nome
@@ -237,17 +339,13 @@ def get_consumi_stats(db: Session, evento_id: Optional[int] = None) -> Dict:
     # Revenue per categoria
     revenue_categoria = db.query(
         Prodotto.categoria,
-        func.sum(Consumo.importo).label('revenue')
+        func.sum(vendite.c.revenue).label('revenue')
     ).join(
-        Consumo, Consumo.prodotto_id == Prodotto.id_prodotto
-    )
-    if evento_id:
-        revenue_categoria = revenue_categoria.filter(Consumo.evento_id == evento_id)
-    
-    revenue_categoria = revenue_categoria.group_by(
+        vendite, vendite.c.prodotto_id == Prodotto.id_prodotto
+    ).group_by(
         Prodotto.categoria
     ).order_by(
-        func.sum(Consumo.importo).desc()
+        func.sum(vendite.c.revenue).desc()
     ).all()
     
     categorie_data = [
@@ -258,17 +356,17 @@ def get_consumi_stats(db: Session, evento_id: Optional[int] = None) -> Dict:
     # Trend giornaliero revenue
     data_inizio = datetime.now() - timedelta(days=30)
     trend_revenue = db.query(
-        func.date(Consumo.data_consumo).label('data'),
+        Consumo.data_lavorativa.label('data'),
         func.sum(Consumo.importo).label('revenue')
     ).filter(
-        Consumo.data_consumo >= data_inizio
+        Consumo.data_lavorativa >= data_inizio.date()
     )
     if evento_id:
         trend_revenue = trend_revenue.filter(Consumo.evento_id == evento_id)
     
     trend_revenue = trend_revenue.group_by(
-        func.date(Consumo.data_consumo)
-    ).order_by('data').all()
+        Consumo.data_lavorativa
+    ).order_by(Consumo.data_lavorativa).all()
     
     revenue_trend = [
         {'data': str(row.data), 'revenue': float(row.revenue)}
@@ -285,13 +383,13 @@ def get_consumi_stats(db: Session, evento_id: Optional[int] = None) -> Dict:
     }
 
 
+@memo_richiesta
 def get_clienti_stats(db: Session) -> Dict:
     """Statistiche clienti: distribuzione livelli, retention, nuovi"""
     from app.models.clienti import Cliente
-    from app.models.eventi import Evento
     
-    # Totale clienti
-    totale_clienti = db.query(func.count(Cliente.id_cliente)).scalar() or 0
+    # Totale, nuovi ultimi 30 giorni, attivi (prenotazione a un evento degli ultimi 90 giorni)
+    kpi = _kpi(db, None, "clienti")["clienti"]
     
     # Distribuzione livelli fedeltà
     livelli = db.query(
@@ -305,56 +403,40 @@ def get_clienti_stats(db: Session) -> Dict:
         row.livello: row.count for row in livelli
     }
     
-    # Nuovi clienti ultimi 30 giorni
-    data_inizio = datetime.now() - timedelta(days=30)
-    nuovi_clienti = db.query(func.count(Cliente.id_cliente)).filter(
-        Cliente.data_registrazione >= data_inizio
-    ).scalar() or 0
-    
-    # Clienti attivi (con almeno una prenotazione negli ultimi 90 giorni)
-    from app.models.prenotazioni import Prenotazione
-    data_attivita = datetime.now().date() - timedelta(days=90)
-    clienti_attivi = db.query(func.count(func.distinct(Prenotazione.cliente_id)))\
-        .join(Evento, Prenotazione.evento_id == Evento.id_evento)\
-        .filter(
-            Evento.data_evento.isnot(None),
-            Evento.data_evento >= data_attivita
-        ).scalar() or 0
-    
     return {
-        'totale': totale_clienti,
+        'totale': kpi['totale'],
         'distribuzione_livelli': distribuzione_livelli,
-        'nuovi_ultimi_30_giorni': nuovi_clienti,
-        'attivi_ultimi_90_giorni': clienti_attivi
+        'nuovi_ultimi_30_giorni': kpi['nuovi_ultimi_30_giorni'],
+        'attivi_ultimi_90_giorni': kpi['attivi_ultimi_90_giorni'] or 0
     }
 
 
+@memo_richiesta
 def get_overview_stats(db: Session, evento_id: Optional[int] = None) -> Dict:
-    """Statistiche overview: KPI principali"""
-    ingressi_stats = get_ingressi_stats(db, evento_id, giorni=7)
-    prenotazioni_stats = get_prenotazioni_stats(db, evento_id)
-    consumi_stats = get_consumi_stats(db, evento_id)
-    clienti_stats = get_clienti_stats(db)
+    """Statistiche overview: solo i KPI principali, in un'unica SELECT"""
+    kpi = _kpi(db, evento_id, *AREE_KPI)
+    ingressi, prenotazioni, consumi, clienti = (kpi[a] for a in AREE_KPI)
+    revenue_totale = float(consumi['revenue_totale'] or 0)
+    num_ordini = consumi['num_ordini']
     
     return {
         'ingressi': {
-            'totale': ingressi_stats['totale'],
-            'ultimi_7_giorni': sum(d['count'] for d in ingressi_stats['trend_giornaliero'])
+            'totale': ingressi['totale'],
+            'ultimi_7_giorni': ingressi['ultimi_7_giorni']
         },
         'prenotazioni': {
-            'totale': prenotazioni_stats['totale'],
-            'tavoli_in_attesa': prenotazioni_stats['tavoli_in_attesa'],
-            'conversioni': prenotazioni_stats['conversioni']
+            'totale': prenotazioni['totale'],
+            'tavoli_in_attesa': prenotazioni['tavoli_in_attesa'],
+            'conversioni': prenotazioni['conversioni']
         },
         'consumi': {
-            'revenue_totale': consumi_stats['revenue_totale'],
-            'scontrino_medio': consumi_stats['scontrino_medio'],
-            'num_ordini': consumi_stats['num_ordini']
+            'revenue_totale': revenue_totale,
+            'scontrino_medio': round(revenue_totale / num_ordini, 2) if num_ordini else 0,
+            'num_ordini': num_ordini
         },
         'clienti': {
-            'totale': clienti_stats['totale'],
-            'nuovi_30_giorni': clienti_stats['nuovi_ultimi_30_giorni'],
-            'attivi_90_giorni': clienti_stats['attivi_ultimi_90_giorni']
+            'totale': clienti['totale'],
+            'nuovi_30_giorni': clienti['nuovi_ultimi_30_giorni'],
+            'attivi_90_giorni': clienti['attivi_ultimi_90_giorni'] or 0
         }
     }
-
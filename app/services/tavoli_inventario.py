@@ -0,0 +1,281 @@
+"""
+Inventario tavoli per evento: claim/rilascio atomici e contatore occupazione.
+
+Ogni ``TavoloEvento`` registra la prenotazione referente che lo tiene
+(``prenotazione_id``, univoco) e i posti occupati (``occupati``: referente +
+aderenti). Claim e adesioni sono singoli ``UPDATE ... WHERE`` condizionali:
+su MySQL il lock di riga serializza le richieste concorrenti sullo stesso
+tavolo, su SQLite le scritture sono già serializzate dal lock del database.
+Chi arriva secondo trova la condizione falsa (rowcount 0) e riceve un rifiuto.
+
+Un claim il cui referente non è più valido (cancellato, rifiutato, no-show...)
+viene considerato libero: così lo stato resta corretto anche se un percorso
+cambia la prenotazione senza passare da ``rilascia``.
+"""
+from typing import Dict, List
+
+from sqlalchemy import and_, bindparam, exists, func, or_, select, update
+from sqlalchemy.orm import Session
+
+from app.models.prenotazioni import Prenotazione
+from app.models.tavoli_evento import TavoloEvento
+from app.services import contatori
+from app.utils.cache import cache_get, cache_set
+
+STATI_APPROVAZIONE_OCCUPANTI = ("in_attesa", "approvata")
+TTL_MAPPA_DISPONIBILITA = 120  # rete di sicurezza: gli scrittori aggiornano la mappa subito
+
+
+def _holder_valido():
+    """Condizione correlata: il referente registrato tiene ancora il tavolo"""
+    return exists().where(
+        Prenotazione.id_prenotazione == TavoloEvento.prenotazione_id,
+        Prenotazione.numero_tavolo == TavoloEvento.id_tavolo,
+        Prenotazione.stato == "attiva",
+        or_(
+            Prenotazione.stato_approvazione_tavolo.is_(None),
+            Prenotazione.stato_approvazione_tavolo.in_(STATI_APPROVAZIONE_OCCUPANTI)
+        )
+    ).correlate(TavoloEvento)
+
+
+def tavolo_libero():
+    """Filtro SQL: tavolo attivo senza un referente valido"""
+    return and_(
+        TavoloEvento.attivo == True,
+        or_(TavoloEvento.prenotazione_id.is_(None), ~_holder_valido())
+    )
+
+
+def claim_tavolo(db: Session, tavolo_id: int, evento_id: int, prenotazione_id: int) -> bool:
+    """
+    Assegna il tavolo alla prenotazione referente (già flushata) se è libero.
+    Ritorna False se un'altra richiesta lo ha preso prima. Commit a carico del chiamante.
+    """
+    res = db.execute(
+        update(TavoloEvento)
+        .where(
+            TavoloEvento.id_tavolo == tavolo_id,
+            TavoloEvento.evento_id == evento_id,
+            tavolo_libero()
+        )
+        .values(prenotazione_id=prenotazione_id, occupati=1)
+        .execution_options(synchronize_session=False)
+    )
+    return res.rowcount == 1
+
+
+def occupa_posto(db: Session, referente: Prenotazione, max_posti: int) -> bool:
+    """Aggiunge un aderente al tavolo del referente se c'è ancora posto (contatore atomico)"""
+    res = db.execute(
+        update(TavoloEvento)
+        .where(
+            TavoloEvento.id_tavolo == referente.numero_tavolo,
+            TavoloEvento.prenotazione_id == referente.id_prenotazione,
+            TavoloEvento.occupati < max_posti
+        )
+        .values(occupati=TavoloEvento.occupati + 1)
+        .execution_options(synchronize_session=False)
+    )
+    return res.rowcount == 1
+
+
+def rilascia(db: Session, pren: Prenotazione):
+    """
+    Rilascia quanto tenuto dalla prenotazione: il tavolo se referente,
+    un posto se aderente. Idempotente; commit a carico del chiamante.
+    """
+    if pren.tipo != "tavolo":
+        return
+    if pren.ruolo_tavolo == "aderente":
+        if pren.prenotazione_padre_id:
+            db.execute(
+                update(TavoloEvento)
+                .where(
+                    TavoloEvento.prenotazione_id == pren.prenotazione_padre_id,
+                    TavoloEvento.occupati > 1
+                )
+                .values(occupati=TavoloEvento.occupati - 1)
+                .execution_options(synchronize_session=False)
+            )
+        return
+    db.execute(
+        update(TavoloEvento)
+        .where(TavoloEvento.prenotazione_id == pren.id_prenotazione)
+        .values(prenotazione_id=None, occupati=0)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def tiene_tavolo(pren: Prenotazione) -> bool:
+    """La prenotazione (già modificata) dovrebbe tenere il suo tavolo: referente attivo non rifiutato"""
+    return (
+        pren.tipo == "tavolo"
+        and pren.ruolo_tavolo != "aderente"
+        and pren.stato == "attiva"
+        and pren.numero_tavolo is not None
+        and pren.stato_approvazione_tavolo in (None,) + STATI_APPROVAZIONE_OCCUPANTI
+    )
+
+
+def riprendi_tavolo(db: Session, pren: Prenotazione) -> bool:
+    """
+    Dopo una modifica (admin): se la prenotazione deve tenere il tavolo e non ne ha il claim,
+    lo reclama con il contatore dei suoi aderenti attivi. False se il tavolo è tenuto da altri
+    (o non è un tavolo attivo di quell'evento); commit/rollback a carico del chiamante.
+    """
+    if not tiene_tavolo(pren):
+        return True
+    db.flush()
+    gia_suo = db.query(TavoloEvento.id_tavolo).filter(
+        TavoloEvento.id_tavolo == pren.numero_tavolo,
+        TavoloEvento.evento_id == pren.evento_id,
+        TavoloEvento.prenotazione_id == pren.id_prenotazione,
+    ).first()
+    if gia_suo:
+        return True
+    if not claim_tavolo(db, pren.numero_tavolo, pren.evento_id, pren.id_prenotazione):
+        return False
+    aderenti = db.query(func.count(Prenotazione.id_prenotazione)).filter(
+        Prenotazione.prenotazione_padre_id == pren.id_prenotazione,
+        Prenotazione.stato == "attiva",
+    ).scalar() or 0
+    if aderenti:
+        db.execute(
+            update(TavoloEvento)
+            .where(TavoloEvento.id_tavolo == pren.numero_tavolo)
+            .values(occupati=1 + aderenti)
+            .execution_options(synchronize_session=False)
+        )
+    return True
+
+
+def ricostruisci_inventario(db: Session, evento_id: int = None):
+    """
+    Ricalcola claim e occupazione dalle prenotazioni (migrazione/manutenzione).
+    Solo statement Core su colonne esplicite: gira anche all'avvio, prima di caricare oggetti ORM.
+    """
+    filtro_tavoli = [TavoloEvento.evento_id == evento_id] if evento_id else []
+    filtro_prenotazioni = [Prenotazione.evento_id == evento_id] if evento_id else []
+
+    tavoli = dict(db.execute(
+        select(TavoloEvento.id_tavolo, TavoloEvento.evento_id).where(*filtro_tavoli)
+    ).all())
+    aderenti = dict(db.execute(
+        select(Prenotazione.prenotazione_padre_id, func.count(Prenotazione.id_prenotazione))
+        .where(
+            Prenotazione.prenotazione_padre_id.isnot(None),
+            Prenotazione.stato == "attiva",
+            *filtro_prenotazioni
+        )
+        .group_by(Prenotazione.prenotazione_padre_id)
+    ).all())
+    referenti = db.execute(
+        select(Prenotazione.id_prenotazione, Prenotazione.numero_tavolo)
+        .where(
+            Prenotazione.tipo == "tavolo",
+            Prenotazione.stato == "attiva",
+            Prenotazione.numero_tavolo.isnot(None),
+            Prenotazione.ruolo_tavolo != "aderente",
+            or_(
+                Prenotazione.stato_approvazione_tavolo.is_(None),
+                Prenotazione.stato_approvazione_tavolo.in_(STATI_APPROVAZIONE_OCCUPANTI)
+            ),
+            *filtro_prenotazioni
+        )
+        .order_by(Prenotazione.id_prenotazione.asc())
+    ).all()
+
+    # Il primo referente (per id) di ogni tavolo lo tiene
+    claim = {}
+    for pren_id, tavolo_id in referenti:
+        if tavolo_id in tavoli and tavolo_id not in claim:
+            claim[tavolo_id] = pren_id
+
+    tabella = TavoloEvento.__table__
+    db.execute(update(tabella).where(*filtro_tavoli).values(prenotazione_id=None, occupati=0))
+    if claim:
+        db.execute(
+            update(tabella)
+            .where(tabella.c.id_tavolo == bindparam("b_tavolo"))
+            .values(prenotazione_id=bindparam("b_prenotazione"), occupati=bindparam("b_occupati")),
+            [
+                {"b_tavolo": t, "b_prenotazione": p, "b_occupati": 1 + aderenti.get(p, 0)}
+                for t, p in claim.items()
+            ]
+        )
+    db.commit()
+    # Le mappe in cache (di ogni worker) vanno ricalcolate dal nuovo stato
+    for ev_id in set(tavoli.values()):
+        contatori.incrementa_versione_cache(_versione_mappa(ev_id))
+
+
+# ─────────────────────────────────────────────
+# Mappa disponibilità per evento (cache + versione nel DB, write-through)
+# ─────────────────────────────────────────────
+def _versione_mappa(evento_id: int) -> str:
+    return f"tavoli:{evento_id}"
+
+
+def _chiave_mappa(evento_id: int, versione: int) -> str:
+    return f"tavoli:disponibilita:{evento_id}:{versione}"
+
+
+def _costruisci_mappa(db: Session, evento_id: int) -> Dict[str, dict]:
+    """
+    Claim e contatore di tavoli_evento; un claim conta solo se il referente è ancora valido
+    (stessa condizione di ``tavolo_libero``, altrimenti la mappa direbbe occupato un tavolo prenotabile)
+    """
+    mappa = {}
+    righe = db.query(TavoloEvento, _holder_valido().label("tenuto")).filter(TavoloEvento.evento_id == evento_id)
+    for t, tenuto in righe:
+        tenuto = t.prenotazione_id is not None and bool(tenuto)
+        if not t.attivo:
+            stato = "disattivato"
+        elif tenuto:
+            stato = "occupato"
+        else:
+            stato = "libero"
+        mappa[str(t.id_tavolo)] = {
+            "id_tavolo": t.id_tavolo,
+            "numero_tavolo": t.numero_tavolo,
+            "nome_tavolo": t.nome_tavolo,
+            "capienza": t.capienza,
+            "prezzo_minimo": t.prezzo_minimo,
+            "occupati": (t.occupati or 0) if tenuto else 0,
+            "stato": stato,
+        }
+    return mappa
+
+
+def aggiorna_mappa(db: Session, evento_id: int) -> Dict[str, dict]:
+    """
+    Write-through: da chiamare dopo il commit di ogni modifica a tavoli/claim dell'evento.
+    La nuova versione nel DB rende obsolete le mappe in cache anche negli altri worker.
+    """
+    if not evento_id:
+        return {}
+    contatori.incrementa_versione_cache(_versione_mappa(evento_id))
+    mappa = _costruisci_mappa(db, evento_id)
+    cache_set(_chiave_mappa(evento_id, contatori.versione_cache(_versione_mappa(evento_id), db)),
+              mappa, TTL_MAPPA_DISPONIBILITA)
+    return mappa
+
+
+def mappa_disponibilita(db: Session, evento_id: int) -> Dict[str, dict]:
+    """id_tavolo → capienza, occupazione e stato (libero/occupato/disattivato)"""
+    chiave = _chiave_mappa(evento_id, contatori.versione_cache(_versione_mappa(evento_id), db))
+    mappa = cache_get(chiave)
+    if mappa is None:
+        mappa = _costruisci_mappa(db, evento_id)
+        cache_set(chiave, mappa, TTL_MAPPA_DISPONIBILITA)
+    return mappa
+
+
+def tavoli_liberi(db: Session, evento_id: int) -> List[dict]:
+    """Tavoli prenotabili dalla mappa in cache, in ordine di numero"""
+    mappa = mappa_disponibilita(db, evento_id)
+    return sorted(
+        (t for t in mappa.values() if t["stato"] == "libero"),
+        key=lambda t: t["numero_tavolo"]
+    )
@@ -0,0 +1,130 @@
+"""
+Firme di versione per le richieste condizionali (vedi ``app.utils.http_cache``).
+
+Le firme leggono solo ``versione``/``updated_at`` delle entità versionate
+(Evento, Prodotto, Cliente, TavoloEvento) e piccoli contatori sulle righe
+personali del cliente:
+bastano a capire se la pagina è cambiata senza caricarla né renderizzarla.
+"""
+from datetime import date
+from typing import Optional, Tuple
+
+from flask import request, session
+from sqlalchemy import func, literal, null, select, union_all
+from sqlalchemy.orm import Session
+
+from app.models.clienti import Cliente
+from app.models.consumi import Consumo
+from app.models.eventi import Evento
+from app.models.feedback import Feedback
+from app.models.ingressi import Ingresso
+from app.models.prenotazioni import Prenotazione
+from app.models.prodotti import Prodotto
+
+Firma = Optional[Tuple[tuple, object]]
+
+
+def firma_tabella(db: Session, model, *filtri) -> Tuple[tuple, object]:
+    """(righe, Σ versione, max id) + ultima modifica: cambia con insert, update e delete"""
+    pk = model.__mapper__.primary_key[0]
+    n, somma, max_id, ultimo = db.query(
+        func.count(pk), func.coalesce(func.sum(model.versione), 0), func.max(pk), func.max(model.updated_at)
+    ).filter(*filtri).one()
+    return (model.__tablename__, n, int(somma), max_id, ultimo), ultimo
+
+
+def _attivita_cliente(db: Session, cliente_id: int, evento_id: int = None, tipi: str = "picf") -> tuple:
+    """
+    Contatori delle righe personali in una query: (p)renotazioni per stato, (i)ngressi,
+    (c)onsumi, (f)eedback; ``tipi`` sceglie quali
+    """
+    def per(model):
+        filtri = [model.cliente_id == cliente_id]
+        if evento_id is not None:
+            filtri.append(model.evento_id == evento_id)
+        return filtri
+
+    parti = {
+        "p": lambda: select(literal("p"), Prenotazione.stato, func.count(Prenotazione.id_prenotazione),
+                            func.max(Prenotazione.id_prenotazione))
+        .where(*per(Prenotazione)).group_by(Prenotazione.stato),
+        "i": lambda: select(literal("i"), null(), func.count(Ingresso.id_ingresso), func.max(Ingresso.id_ingresso))
+        .where(*per(Ingresso)),
+        "c": lambda: select(literal("c"), null(), func.count(Consumo.id_consumo), func.max(Consumo.id_consumo))
+        .where(*per(Consumo)),
+        "f": lambda: select(literal("f"), null(), func.count(Feedback.id_feedback), func.max(Feedback.id_feedback))
+        .where(*per(Feedback)),
+    }
+    q = union_all(*(parti[t]() for t in tipi))
+    return tuple(sorted(tuple(str(v) for v in row) for row in db.execute(q)))
+
+
+def _piu_recente(*date_ora):
+    valide = [d for d in date_ora if d is not None]
+    return max(valide) if valide else None
+
+
+# ─────────────────────────────────────────────
+# Firme per pagina
+# ─────────────────────────────────────────────
+def firma_listino_pubblico(db: Session) -> Firma:
+    return firma_tabella(db, Prodotto)
+
+
+def firma_lista_eventi(db: Session) -> Firma:
+    """Versione della lista in cache + timbro dell'overlay del cliente (prenotazioni e ingressi)"""
+    from app.services import eventi_pubblici
+    parti = (eventi_pubblici.versione_lista(db), date.today())
+    cid = session.get("cliente_id")
+    if cid:
+        parti += _attivita_cliente(db, cid, tipi="pi")
+    return parti, None
+
+
+def firma_dettaglio_evento(db: Session, evento_id: int) -> Firma:
+    row = db.query(Evento.versione, Evento.updated_at).filter(Evento.id_evento == evento_id).first()
+    if row is None:
+        return None  # la vista gestisce il redirect
+    parti = (evento_id, row.versione, row.updated_at, date.today())
+    cid = session.get("cliente_id")
+    if cid:
+        parti += _attivita_cliente(db, cid, evento_id)
+    return parti, row.updated_at
+
+
+def firma_listino_staff(db: Session) -> Firma:
+    from app.utils.events import get_evento_operativo
+    from app.utils.helpers import cliente_has_ingresso, get_cliente_by_qr
+
+    e = get_evento_operativo(db)
+    if not e or e.stato_pubblico == "chiuso" or not e.is_staff_operativo:
+        return None
+    cli = get_cliente_by_qr(db, (request.args.get("qr") or "").strip())
+    if not cli or not cliente_has_ingresso(db, cli.id_cliente, e.id_evento):
+        return None
+    prodotti, ultimo = firma_tabella(db, Prodotto, Prodotto.attivo == True)
+    consumi = db.query(func.count(Consumo.id_consumo), func.max(Consumo.id_consumo)).filter(
+        Consumo.evento_id == e.id_evento, Consumo.cliente_id == cli.id_cliente
+    ).one()
+    parti = prodotti + (e.id_evento, e.versione, cli.id_cliente, cli.versione, tuple(consumi))
+    return parti, _piu_recente(ultimo, e.updated_at, cli.updated_at)
+
+
+def firma_area_personale(db: Session) -> Firma:
+    from app.routes.fedelta import get_thresholds
+    from app.services import fedelta_classifica
+
+    cid = session.get("cliente_id")
+    cli = db.query(Cliente.versione, Cliente.updated_at, Cliente.punti_fedelta).filter(
+        Cliente.id_cliente == cid
+    ).first() if cid else None
+    if cli is None:
+        return None
+    eventi, ultimo_evento = firma_tabella(db, Evento)
+    parti = (
+        cli.versione, cli.updated_at,
+        fedelta_classifica.posizione_cliente(db, int(cli.punti_fedelta or 0)),
+        tuple(sorted(get_thresholds(db).items())),
+        eventi, date.today(),
+    ) + _attivita_cliente(db, cid)
+    return parti, _piu_recente(cli.updated_at, ultimo_evento)
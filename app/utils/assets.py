@@ -0,0 +1,141 @@
+"""
+Asset statici con fingerprint, precompressi e cache immutabile.
+
+Build (``flask assets-build`` oppure ``python app/utils/assets.py``, senza DB né config):
+copia css/js/img/doc e favicon in ``static/dist`` con l'hash del contenuto nel
+nome (``js/qr-scanner.<hash>.js``), genera i fratelli ``.gz`` (e ``.br`` se il
+pacchetto ``brotli`` è installato) e scrive ``static/dist/manifest.json``.
+
+Runtime: ``asset_url('js/qr-scanner.js')`` nei template restituisce l'URL
+fingerprinted servito da ``/assets/...`` con ``Content-Encoding`` negoziato e
+``Cache-Control: immutable``. Senza manifest (sviluppo) o con l'app in debug
+ricade su ``url_for('static', ...)``, quindi i template funzionano sempre.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import shutil
+from pathlib import Path
+
+import click
+from flask import abort, current_app, request, send_file, url_for
+from werkzeug.security import safe_join
+
+try:
+    import brotli  # opzionale: senza, solo .gz
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+CARTELLE = ("css", "js", "img", "doc")
+FILE_SINGOLI = ("favicon.ico",)
+COMPRIMIBILI = {".css", ".js", ".svg", ".json", ".ico", ".txt", ".map"}
+DIST = "dist"
+MANIFEST = "manifest.json"
+MAX_AGE = 31536000  # un anno: il nome cambia a ogni modifica del contenuto
+
+
+def _sorgenti(static_dir: Path):
+    for cartella in CARTELLE:
+        base = static_dir / cartella
+        if base.is_dir():
+            for p in sorted(base.rglob("*")):
+                if p.is_file():
+                    yield p
+    for nome in FILE_SINGOLI:
+        p = static_dir / nome
+        if p.is_file():
+            yield p
+
+
+def build(static_dir) -> dict:
+    """Rigenera ``static/dist`` e il manifest; ritorna il manifest {logico: fingerprinted}"""
+    static_dir = Path(static_dir)
+    dist = static_dir / DIST
+    if dist.exists():
+        shutil.rmtree(dist)  # niente file orfani di build precedenti
+
+    manifest = {}
+    for src in _sorgenti(static_dir):
+        logico = src.relative_to(static_dir).as_posix()
+        dati = src.read_bytes()
+        digest = hashlib.sha256(dati).hexdigest()[:12]
+        fingerprinted = Path(logico).with_name(f"{src.stem}.{digest}{src.suffix}").as_posix()
+
+        dest = dist / fingerprinted
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        dest.write_bytes(dati)
+        if src.suffix.lower() in COMPRIMIBILI:
+            # mtime=0: output deterministico, stessa build = stessi byte
+            Path(f"{dest}.gz").write_bytes(gzip.compress(dati, compresslevel=9, mtime=0))
+            if brotli is not None:
+                Path(f"{dest}.br").write_bytes(brotli.compress(dati, quality=11))
+        manifest[logico] = fingerprinted
+
+    (dist / MANIFEST).write_text(json.dumps(manifest, indent=2, sort_keys=True))
+    return manifest
+
+
+def carica_manifest(static_dir) -> dict:
+    path = Path(static_dir) / DIST / MANIFEST
+    if not path.is_file():
+        return {}
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError) as exc:
+        logger.warning("Manifest asset non leggibile (%s): uso gli statici originali", exc)
+        return {}
+
+
+def asset_url(filename: str) -> str:
+    """Come ``url_for('static', filename=...)`` ma verso la versione fingerprinted"""
+    manifest = current_app.extensions.get("assets_manifest") or {}
+    fingerprinted = manifest.get(filename)
+    if fingerprinted is None or current_app.debug:
+        return url_for("static", filename=filename)
+    return url_for("asset", filename=fingerprinted)
+
+
+def _servi_asset(filename):
+    path = safe_join(os.path.join(current_app.static_folder, DIST), filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+    codifica = None
+    for enc, ext in (("br", ".br"), ("gzip", ".gz")):
+        if request.accept_encodings[enc] and os.path.isfile(path + ext):
+            path, codifica = path + ext, enc
+            break
+
+    resp = send_file(path, mimetype=mimetype, conditional=True, max_age=MAX_AGE)
+    if codifica:
+        resp.headers["Content-Encoding"] = codifica
+    resp.headers["Cache-Control"] = f"public, max-age={MAX_AGE}, immutable"
+    resp.vary.add("Accept-Encoding")
+    return resp
+
+
+def init_app(app):
+    from app.utils.limiter import limiter
+
+    app.extensions["assets_manifest"] = carica_manifest(app.static_folder)
+    app.add_url_rule("/assets/<path:filename>", endpoint="asset", view_func=limiter.exempt(_servi_asset))
+    app.jinja_env.globals["asset_url"] = asset_url
+
+    @app.cli.command("assets-build")
+    def assets_build_cmd():
+        """Fingerprint + precompressione degli asset statici in static/dist."""
+        manifest = build(app.static_folder)
+        app.extensions["assets_manifest"] = manifest
+        click.echo(f"Asset generati: {len(manifest)} (brotli {'attivo' if brotli else 'non installato'})")
+
+
+if __name__ == "__main__":
+    # Build senza importare il package app (es. durante la build dell'immagine Docker)
+    static = Path(__file__).resolve().parents[2] / "static"
+    print(f"Asset generati: {len(build(static))}")
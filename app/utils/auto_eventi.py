@@ -42,6 +42,8 @@ def processa_apertura_chiusura_automatica():
         
         if count_aperti > 0 or count_chiusi > 0:
             db.commit()
+            from app.services.eventi_pubblici import invalida_lista_pubblica
+            invalida_lista_pubblica()
             return count_aperti, count_chiusi
         
         return 0, 0
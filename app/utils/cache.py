@@ -0,0 +1,139 @@
+"""
+Cache condivisa per MalibuApp.
+
+Backend scelto da ``CACHE_URL`` (come ``storage_uri`` del rate limiter):
+- ``memory://`` (default): dizionario in processo con TTL, thread-safe;
+- ``redis://host:6379/0``: condivisa fra worker/processi (richiede il pacchetto ``redis``).
+
+I valori devono essere serializzabili in JSON (dict/list/str/numeri).
+
+Con ``memory://`` ogni worker ha la sua copia: un ``delete`` vale solo nel
+processo che lo esegue. Le voci che vanno invalidate subito ovunque hanno una
+versione nel DB nella chiave (``contatori.versione_cache``); le altre si
+affidano al TTL. Le chiavi di una versione superata non vengono più lette: la
+cache in memoria tiene al massimo ``CACHE_MAX_VOCI`` voci (default 5000) e
+scarta le meno usate di recente, così non cresce senza limite.
+
+``memo_richiesta`` invece tiene i risultati solo per la richiesta corrente
+(``flask.g``): serve a non ricalcolare lo stesso aggregato due volte nella
+stessa pagina, senza problemi di invalidazione.
+"""
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 300  # secondi
+MAX_VOCI = int(os.getenv("CACHE_MAX_VOCI", "5000"))
+
+
+class _MemoryCache:
+    def __init__(self, max_voci: int = MAX_VOCI):
+        self._data = OrderedDict()  # ordine = uso più recente in fondo (LRU)
+        self._max_voci = max_voci
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            scadenza, value = item
+            if scadenza and scadenza < time.monotonic():
+                self._data.pop(key, None)
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: Optional[int] = DEFAULT_TTL):
+        scadenza = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (scadenza, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self._max_voci:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class _RedisCache:
+    def __init__(self, url: str):
+        import redis  # dipendenza opzionale
+        self._r = redis.Redis.from_url(url)
+
+    def get(self, key: str) -> Optional[Any]:
+        raw = self._r.get(key)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key: str, value: Any, ttl: Optional[int] = DEFAULT_TTL):
+        self._r.set(key, json.dumps(value, default=str), ex=ttl or None)
+
+    def delete(self, key: str):
+        self._r.delete(key)
+
+
+def _crea_backend():
+    url = os.getenv("CACHE_URL", "memory://")
+    if url.startswith("redis://") or url.startswith("rediss://"):
+        try:
+            return _RedisCache(url)
+        except ImportError:
+            logger.warning("CACHE_URL=%s ma il pacchetto 'redis' non è installato: uso la cache in memoria", url)
+    return _MemoryCache()
+
+
+cache = _crea_backend()
+
+
+def cache_get(key: str) -> Optional[Any]:
+    try:
+        return cache.get(key)
+    except Exception as exc:
+        # La cache non deve mai bloccare una richiesta: in caso di errore si ricalcola
+        logger.warning("Cache non disponibile (get %s): %s", key, exc)
+        return None
+
+
+def cache_set(key: str, value: Any, ttl: Optional[int] = DEFAULT_TTL):
+    try:
+        cache.set(key, value, ttl)
+    except Exception as exc:
+        logger.warning("Cache non disponibile (set %s): %s", key, exc)
+
+
+def cache_delete(key: str):
+    try:
+        cache.delete(key)
+    except Exception as exc:
+        logger.warning("Cache non disponibile (delete %s): %s", key, exc)
+
+
+# ─────────────────────────────────────────────
+# Memo per richiesta
+# ─────────────────────────────────────────────
+def memo_corrente() -> dict:
+    """Dizionario della richiesta corrente (uno nuovo e usa-e-getta fuori da una richiesta)"""
+    from flask import g, has_request_context
+    if not has_request_context():
+        return {}
+    return g.setdefault("_memo_richiesta", {})
+
+
+def memo_richiesta(fn):
+    """Risultato memorizzato per la richiesta; il primo argomento (la sessione DB) non entra nella chiave"""
+    @functools.wraps(fn)
+    def wrapper(db, *args, **kwargs):
+        memo = memo_corrente()
+        chiave = (fn.__module__, fn.__qualname__, args, tuple(sorted(kwargs.items())))
+        if chiave not in memo:
+            memo[chiave] = fn(db, *args, **kwargs)
+        return memo[chiave]
+    return wrapper
@@ -0,0 +1,77 @@
+"""
+Certificato self-signed per il server di sviluppo.
+
+In produzione il TLS lo termina il proxy davanti a gunicorn (vedi
+``gunicorn.conf.py``): qui c'è solo il certificato per provare in locale le
+pagine che richiedono HTTPS (es. la fotocamera dello scanner QR da telefono).
+Si genera una volta con ``flask cert-genera`` oppure al primo
+``python run.py`` (senza ``--http``), mai durante le richieste.
+"""
+import ipaddress
+import os
+from datetime import datetime, timedelta
+from typing import Tuple
+
+import click
+
+CERT_FILE = "cert.pem"
+KEY_FILE = "key.pem"
+
+
+def genera_cert(cert_file: str = CERT_FILE, key_file: str = KEY_FILE, forza: bool = False) -> Tuple[str, str]:
+    """Genera un certificato self-signed se non esiste già (o se ``forza``)"""
+    if not forza and os.path.exists(cert_file) and os.path.exists(key_file):
+        return (cert_file, key_file)
+
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from cryptography.x509.oid import NameOID
+
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    subject = issuer = x509.Name([
+        x509.NameAttribute(NameOID.COUNTRY_NAME, "IT"),
+        x509.NameAttribute(NameOID.STATE_OR_PROVINCE_NAME, "Italia"),
+        x509.NameAttribute(NameOID.LOCALITY_NAME, "Roma"),
+        x509.NameAttribute(NameOID.ORGANIZATION_NAME, "MalibuApp"),
+        x509.NameAttribute(NameOID.COMMON_NAME, "localhost"),
+    ])
+    cert = x509.CertificateBuilder().subject_name(
+        subject
+    ).issuer_name(
+        issuer
+    ).public_key(
+        private_key.public_key()
+    ).serial_number(
+        x509.random_serial_number()
+    ).not_valid_before(
+        datetime.utcnow()
+    ).not_valid_after(
+        datetime.utcnow() + timedelta(days=365)
+    ).add_extension(
+        x509.SubjectAlternativeName([
+            x509.DNSName("localhost"),
+            x509.DNSName("127.0.0.1"),
+            x509.IPAddress(ipaddress.IPv4Address("127.0.0.1")),
+        ]),
+        critical=False,
+    ).sign(private_key, hashes.SHA256())
+
+    with open(cert_file, "wb") as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    with open(key_file, "wb") as f:
+        f.write(private_key.private_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PrivateFormat.PKCS8,
+            encryption_algorithm=serialization.NoEncryption()
+        ))
+    return (cert_file, key_file)
+
+
+def init_cli(app):
+    @app.cli.command("cert-genera")
+    @click.option("--forza", is_flag=True, help="Rigenera anche se cert.pem/key.pem esistono già")
+    def cert_genera_cmd(forza):
+        """Genera cert.pem/key.pem self-signed per il server di sviluppo HTTPS."""
+        cert_file, key_file = genera_cert(forza=forza)
+        click.echo(f"Certificato: {cert_file} · chiave: {key_file}")
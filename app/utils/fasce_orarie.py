@@ -0,0 +1,210 @@
+"""
+Fasce orarie portabili (MySQL / SQLite) per i grafici orari e giornalieri.
+
+Due livelli:
+- espressioni SQL corrette per dialetto (``ora``, ``giorno``,
+  ``giorno_lavorativo``, ``ora_della_notte``, ``giorno_epoca``,
+  ``mese_epoca``, ``minuti_epoca``) per query ad hoc, backfill e caricamenti
+  in array;
+- colonne persistite e indicizzate ``data_lavorativa`` / ``ora_notte`` su
+  ``ingressi`` e ``consumi``, calcolate in Python al salvataggio
+  (``collega_fasce``): i GROUP BY dei grafici leggono solo l'indice e danno lo
+  stesso risultato su entrambi i backend.
+
+La giornata lavorativa cambia alle ``ROLLOVER_ORE`` (06:00): un ingresso alle
+02:00 del 15 appartiene alla notte del 14 e ha ``ora_notte`` = 26, cioè le ore
+dalla mezzanotte della data lavorativa (= data dell'evento per le serate). Così
+la serata si ordina 22, 23, 24, 25... senza spezzarsi a mezzanotte;
+``etichetta_ora`` la riporta a "02:00".
+"""
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import Date, Integer, event
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+
+ROLLOVER_ORE = 6
+
+
+# ─────────────────────────────────────────────
+# Calcolo in Python (colonne persistite)
+# ─────────────────────────────────────────────
+def data_lavorativa(orario: datetime) -> date:
+    return (orario - timedelta(hours=ROLLOVER_ORE)).date()
+
+
+def ora_notte(orario: datetime) -> int:
+    return (orario - timedelta(hours=ROLLOVER_ORE)).hour + ROLLOVER_ORE
+
+
+def etichetta_ora(ora: Optional[int]) -> str:
+    return f"{int(ora or 0) % 24:02d}:00"
+
+
+def collega_fasce(model, colonna_orario: str):
+    """Mantiene ``data_lavorativa``/``ora_notte`` di ``model`` allineate alla colonna orario"""
+    def aggiorna(mapper, connection, target):
+        orario = getattr(target, colonna_orario)
+        if orario is None:
+            # Stesso orologio delle fasce (il server_default userebbe quello del DB)
+            orario = datetime.now()
+            setattr(target, colonna_orario, orario)
+        target.data_lavorativa = data_lavorativa(orario)
+        target.ora_notte = ora_notte(orario)
+
+    event.listen(model, "before_insert", aggiorna)
+    event.listen(model, "before_update", aggiorna)
+
+
+# ─────────────────────────────────────────────
+# Espressioni SQL per dialetto
+# ─────────────────────────────────────────────
+class ora(FunctionElement):
+    """Ora del giorno (0-23) di un DATETIME"""
+    type = Integer()
+    inherit_cache = True
+
+
+class giorno(FunctionElement):
+    """Data di calendario di un DATETIME"""
+    type = Date()
+    inherit_cache = True
+
+
+class giorno_lavorativo(FunctionElement):
+    """Data lavorativa (cambio alle ROLLOVER_ORE) di un DATETIME"""
+    type = Date()
+    inherit_cache = True
+
+
+class ora_della_notte(FunctionElement):
+    """Ore dalla mezzanotte della data lavorativa (ROLLOVER_ORE..ROLLOVER_ORE+23)"""
+    type = Integer()
+    inherit_cache = True
+
+
+def _arg(compiler, element, **kw):
+    return compiler.process(list(element.clauses)[0], **kw)
+
+
+@compiles(ora)
+def _ora(element, compiler, **kw):
+    return f"EXTRACT(HOUR FROM {_arg(compiler, element, **kw)})"
+
+
+@compiles(ora, "mysql")
+def _ora_mysql(element, compiler, **kw):
+    return f"HOUR({_arg(compiler, element, **kw)})"
+
+
+@compiles(ora, "sqlite")
+def _ora_sqlite(element, compiler, **kw):
+    return f"CAST(strftime('%H', {_arg(compiler, element, **kw)}) AS INTEGER)"
+
+
+@compiles(giorno)
+def _giorno(element, compiler, **kw):
+    return f"CAST({_arg(compiler, element, **kw)} AS DATE)"
+
+
+@compiles(giorno, "mysql")
+@compiles(giorno, "sqlite")
+def _giorno_mysql_sqlite(element, compiler, **kw):
+    return f"DATE({_arg(compiler, element, **kw)})"
+
+
+@compiles(giorno_lavorativo)
+def _giorno_lavorativo(element, compiler, **kw):
+    return f"CAST({_arg(compiler, element, **kw)} - INTERVAL '{ROLLOVER_ORE} hours' AS DATE)"
+
+
+@compiles(giorno_lavorativo, "mysql")
+def _giorno_lavorativo_mysql(element, compiler, **kw):
+    return f"DATE(DATE_SUB({_arg(compiler, element, **kw)}, INTERVAL {ROLLOVER_ORE} HOUR))"
+
+
+@compiles(giorno_lavorativo, "sqlite")
+def _giorno_lavorativo_sqlite(element, compiler, **kw):
+    return f"DATE({_arg(compiler, element, **kw)}, '-{ROLLOVER_ORE} hours')"
+
+
+@compiles(ora_della_notte)
+def _ora_della_notte(element, compiler, **kw):
+    return f"(EXTRACT(HOUR FROM {_arg(compiler, element, **kw)} - INTERVAL '{ROLLOVER_ORE} hours') + {ROLLOVER_ORE})"
+
+
+@compiles(ora_della_notte, "mysql")
+def _ora_della_notte_mysql(element, compiler, **kw):
+    return f"(HOUR(DATE_SUB({_arg(compiler, element, **kw)}, INTERVAL {ROLLOVER_ORE} HOUR)) + {ROLLOVER_ORE})"
+
+
+@compiles(ora_della_notte, "sqlite")
+def _ora_della_notte_sqlite(element, compiler, **kw):
+    return f"(CAST(strftime('%H', {_arg(compiler, element, **kw)}, '-{ROLLOVER_ORE} hours') AS INTEGER) + {ROLLOVER_ORE})"
+
+
+class giorno_epoca(FunctionElement):
+    """Giorni dal 1970-01-01 (intero, per caricare date in array senza oggetti Python)"""
+    type = Integer()
+    inherit_cache = True
+
+
+class mese_epoca(FunctionElement):
+    """Mesi dal gennaio 1970 (intero)"""
+    type = Integer()
+    inherit_cache = True
+
+
+@compiles(giorno_epoca)
+def _giorno_epoca(element, compiler, **kw):
+    return f"(CAST({_arg(compiler, element, **kw)} AS DATE) - DATE '1970-01-01')"
+
+
+@compiles(giorno_epoca, "mysql")
+def _giorno_epoca_mysql(element, compiler, **kw):
+    return f"DATEDIFF({_arg(compiler, element, **kw)}, '1970-01-01')"
+
+
+@compiles(giorno_epoca, "sqlite")
+def _giorno_epoca_sqlite(element, compiler, **kw):
+    return f"CAST(julianday(DATE({_arg(compiler, element, **kw)})) - 2440587.5 AS INTEGER)"
+
+
+@compiles(mese_epoca)
+def _mese_epoca(element, compiler, **kw):
+    x = _arg(compiler, element, **kw)
+    return f"(EXTRACT(YEAR FROM {x}) * 12 + EXTRACT(MONTH FROM {x}) - 23641)"
+
+
+@compiles(mese_epoca, "mysql")
+def _mese_epoca_mysql(element, compiler, **kw):
+    x = _arg(compiler, element, **kw)
+    return f"(YEAR({x}) * 12 + MONTH({x}) - 23641)"
+
+
+@compiles(mese_epoca, "sqlite")
+def _mese_epoca_sqlite(element, compiler, **kw):
+    x = _arg(compiler, element, **kw)
+    return f"(CAST(strftime('%Y', {x}) AS INTEGER) * 12 + CAST(strftime('%m', {x}) AS INTEGER) - 23641)"
+
+
+class minuti_epoca(FunctionElement):
+    """Minuti dal 1970-01-01 00:00 di un DATETIME (senza fuso: gli orari sono locali)"""
+    type = Integer()
+    inherit_cache = True
+
+
+@compiles(minuti_epoca)
+def _minuti_epoca(element, compiler, **kw):
+    return f"CAST(FLOOR(EXTRACT(EPOCH FROM {_arg(compiler, element, **kw)}) / 60) AS INTEGER)"
+
+
+@compiles(minuti_epoca, "mysql")
+def _minuti_epoca_mysql(element, compiler, **kw):
+    return f"TIMESTAMPDIFF(MINUTE, '1970-01-01 00:00:00', {_arg(compiler, element, **kw)})"
+
+
+@compiles(minuti_epoca, "sqlite")
+def _minuti_epoca_sqlite(element, compiler, **kw):
+    return f"(CAST(strftime('%s', {_arg(compiler, element, **kw)}) AS INTEGER) / 60)"
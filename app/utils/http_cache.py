@@ -0,0 +1,83 @@
+"""
+Richieste condizionali (ETag / Last-Modified) per le pagine lette spesso.
+
+Ogni vista dichiara una funzione ``firma(db, **view_args)`` che legge solo
+versioni e contatori (niente template) e restituisce ``(parti, last_modified)``,
+oppure ``None`` per lasciar gestire la richiesta alla vista (redirect, errori).
+Se il browser ha già quella versione si risponde subito ``304 Not Modified``.
+
+Esempio:
+
+    @prodotti_bp.route("/listino")
+    @condizionale(firma_listino_pubblico, max_age_anonimo=300)
+    def public_listino():
+        ...
+"""
+import hashlib
+from functools import wraps
+
+from flask import current_app, make_response, request, session
+
+from app.database import SessionLocal
+
+
+def calcola_etag(parti) -> str:
+    raw = "|".join(str(p) for p in parti)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:24]
+
+
+def _identita():
+    """Chi vede la pagina: entra nell'ETag perché navbar e overlay dipendono dalla sessione"""
+    return (session.get("cliente_id"), session.get("staff_id"), session.get("staff_role"))
+
+
+def _applica_header(resp, etag, last_modified, privata: bool, max_age_anonimo: int):
+    resp.set_etag(etag)
+    if last_modified:
+        resp.last_modified = last_modified
+    if privata:
+        # Contenuto personale: mai in cache condivise, rivalidato sempre (costa un 304)
+        resp.headers["Cache-Control"] = "private, no-cache"
+    else:
+        resp.headers["Cache-Control"] = f"public, max-age={max_age_anonimo}"
+    resp.vary.add("Cookie")
+    return resp
+
+
+def condizionale(firma, max_age_anonimo: int = 60):
+    """Decoratore: ETag calcolato da ``firma`` prima del render, 304 se invariato"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # Con messaggi flash in coda la pagina va renderizzata (li consuma)
+            if request.method not in ("GET", "HEAD") or session.get("_flashes"):
+                return view(*args, **kwargs)
+
+            db = SessionLocal()
+            try:
+                risultato = firma(db, **kwargs)
+            except Exception as exc:
+                current_app.logger.warning("Firma ETag non calcolabile per %s: %s", request.endpoint, exc)
+                risultato = None
+            finally:
+                db.close()
+            if risultato is None:
+                return view(*args, **kwargs)
+
+            parti, last_modified = risultato
+            identita = _identita()
+            etag = calcola_etag(
+                (request.endpoint, request.query_string.decode("utf-8", "ignore"), identita) + tuple(parti)
+            )
+            privata = any(identita)
+
+            if request.if_none_match.contains_weak(etag):
+                resp = current_app.response_class(status=304)
+                return _applica_header(resp, etag, last_modified, privata, max_age_anonimo)
+
+            resp = make_response(view(*args, **kwargs))
+            if resp.status_code == 200:
+                _applica_header(resp, etag, last_modified, privata, max_age_anonimo)
+            return resp
+        return wrapper
+    return decorator
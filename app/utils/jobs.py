@@ -0,0 +1,122 @@
+"""
+Esecuzione di job in background a lotti.
+
+Ogni tipo di job registra un handler ``fn(db, job) -> bool`` che elabora UN
+lotto, aggiorna ``job.cursore``/``job.processati`` e ritorna True quando ha
+finito. Il runner fa commit dopo ogni lotto (transazioni brevi), quindi dopo un
+crash il job riparte dall'ultimo cursore salvato.
+"""
+import json
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+
+from sqlalchemy import or_
+
+from app.database import SessionLocal
+from app.models.job_background import JobBackground
+
+logger = logging.getLogger(__name__)
+
+# Un worker che non aggiorna l'heartbeat da più di così è considerato morto
+LEASE_JOB = timedelta(seconds=60)
+
+_HANDLERS: Dict[str, Callable] = {}
+
+
+def registra_handler(tipo: str):
+    """Decoratore: associa un handler di lotto a un tipo di job"""
+    def decorator(fn):
+        _HANDLERS[tipo] = fn
+        return fn
+    return decorator
+
+
+def get_job_attivo(db, tipo: str) -> Optional[JobBackground]:
+    return db.query(JobBackground).filter(
+        JobBackground.tipo == tipo,
+        JobBackground.stato.in_(("in_coda", "in_corso"))
+    ).order_by(JobBackground.id_job.desc()).first()
+
+
+def get_ultimo_job(db, tipo: str) -> Optional[JobBackground]:
+    return db.query(JobBackground).filter(
+        JobBackground.tipo == tipo
+    ).order_by(JobBackground.id_job.desc()).first()
+
+
+def crea_job(db, tipo: str, *, totale: Optional[int] = None, parametri: Optional[dict] = None,
+             staff_id: Optional[int] = None) -> JobBackground:
+    job = JobBackground(
+        tipo=tipo,
+        stato="in_coda",
+        totale=totale,
+        parametri=json.dumps(parametri) if parametri else None,
+        staff_id=staff_id,
+    )
+    db.add(job)
+    db.commit()
+    return job
+
+
+def _claim(db, job_id: int) -> bool:
+    """Presa in carico atomica: un solo worker (anche fra processi) esegue il job"""
+    ora = datetime.now()
+    n = db.query(JobBackground).filter(
+        JobBackground.id_job == job_id,
+        JobBackground.stato.in_(("in_coda", "in_corso")),
+        or_(JobBackground.heartbeat.is_(None), JobBackground.heartbeat < ora - LEASE_JOB)
+    ).update({JobBackground.stato: "in_corso", JobBackground.heartbeat: ora}, synchronize_session=False)
+    db.commit()
+    return n == 1
+
+
+def esegui_job(job_id: int):
+    """Esegue il job nel thread corrente fino alla fine (usato dal thread di ``avvia_job`` e dai comandi CLI)"""
+    db = SessionLocal()
+    try:
+        if not _claim(db, job_id):
+            return
+        job = db.get(JobBackground, job_id)
+        handler = _HANDLERS.get(job.tipo)
+        if handler is None:
+            raise RuntimeError(f"Nessun handler per il job '{job.tipo}'")
+        while True:
+            finito = handler(db, job)
+            job.heartbeat = datetime.now()
+            if finito:
+                job.stato = "completato"
+            db.commit()
+            if finito:
+                break
+    except Exception as exc:
+        db.rollback()
+        logger.exception("Job #%s fallito", job_id)
+        job = db.get(JobBackground, job_id)
+        if job:
+            job.stato = "errore"
+            job.errore = str(exc)[:255]
+            db.commit()
+    finally:
+        db.close()
+
+
+def avvia_job(job_id: int):
+    """Avvia il job in un thread daemon (ritorna subito)"""
+    threading.Thread(target=esegui_job, args=(job_id,), name=f"job-{job_id}", daemon=True).start()
+
+
+def riprendi_job_interrotti():
+    """Riavvia i job rimasti in coda/in corso senza un worker vivo (es. dopo un riavvio)"""
+    db = SessionLocal()
+    try:
+        limite = datetime.now() - LEASE_JOB
+        ids = [j.id_job for j in db.query(JobBackground.id_job).filter(
+            JobBackground.stato.in_(("in_coda", "in_corso")),
+            or_(JobBackground.heartbeat.is_(None), JobBackground.heartbeat < limite)
+        )]
+    finally:
+        db.close()
+    for job_id in ids:
+        avvia_job(job_id)
@@ -0,0 +1,257 @@
+"""
+Paginazione keyset condivisa dalle liste admin.
+
+Ogni lista dichiara le sue chiavi di ordinamento stabili (l'ultima deve essere
+univoca, tipicamente la primary key) e riceve una ``Pagina`` con le righe e i
+cursori opachi per la pagina successiva (``prima``) e precedente (``dopo``).
+Niente ``OFFSET``: ogni pagina è una range scan sull'indice delle chiavi.
+
+Il totale è facoltativo: stimato senza filtri (``stima_righe``) oppure contato
+una volta e tenuto in cache per ``TTL_TOTALE`` secondi con i filtri attivi.
+Con ``?formato=json`` la stessa vista risponde a "Carica altri" con l'HTML
+delle sole righe e l'URL della pagina successiva (``risposta_json``).
+``FlussoKeyset`` fa lo stesso su select Core per gli endpoint JSON in streaming.
+
+Esempio:
+
+    pagina = pagina_keyset(q, [(Ingresso.orario_ingresso, True), (Ingresso.id_ingresso, True)],
+                           prima=request.args.get("prima"), dopo=request.args.get("dopo"),
+                           per_page=per_page)
+"""
+import base64
+import hashlib
+import json
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, List, Optional, Sequence, Tuple
+
+from flask import jsonify, render_template, request, url_for
+from sqlalchemy import DateTime, String, and_, func, or_, text, type_coerce
+
+from app.utils.cache import cache_get, cache_set
+
+TTL_TOTALE = 60
+
+Chiave = Tuple[Any, bool]  # (colonna, discendente)
+
+
+@dataclass
+class Pagina:
+    righe: list
+    per_page: int
+    successiva: Optional[str] = None  # cursore per ?prima=
+    precedente: Optional[str] = None  # cursore per ?dopo=
+    totale: Optional[int] = None
+    totale_stimato: bool = False
+    parametri: dict = field(default_factory=dict)  # filtri da propagare nei link
+
+    @property
+    def prima_pagina(self) -> bool:
+        return self.precedente is None
+
+    def url(self, endpoint: str, **cursore) -> str:
+        return url_for(endpoint, per_page=self.per_page, **self.parametri, **cursore)
+
+
+# ─────────────────────────────────────────────
+# Cursori
+# ─────────────────────────────────────────────
+def _a_json(v):
+    if isinstance(v, datetime):
+        return {"dt": v.isoformat()}
+    if isinstance(v, date):
+        return {"d": v.isoformat()}
+    if isinstance(v, Decimal):
+        return {"n": str(v)}
+    return v
+
+
+def _da_json(v):
+    if isinstance(v, dict):
+        if "dt" in v:
+            return datetime.fromisoformat(v["dt"])
+        if "d" in v:
+            return date.fromisoformat(v["d"])
+        if "n" in v:
+            return Decimal(v["n"])
+    return v
+
+
+def codifica_cursore(valori: Sequence) -> str:
+    raw = json.dumps([_a_json(v) for v in valori], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decodifica_cursore(valore: Optional[str], n_chiavi: int) -> Optional[list]:
+    """Valori del cursore, oppure None se assente o manomesso (si riparte dall'inizio)"""
+    if not valore:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(valore + "=" * (-len(valore) % 4))
+        valori = [_da_json(v) for v in json.loads(raw)]
+    except (ValueError, TypeError):
+        return None
+    return valori if len(valori) == n_chiavi else None
+
+
+def _chiavi_sql(chiavi: List[Chiave], dialetto: str) -> List[Chiave]:
+    """
+    Su SQLite i DATETIME sono testo in due formati: con i microsecondi se scritti da Python,
+    senza se da ``server_default=func.now()``. Lì cursore e confronti usano il testo
+    memorizzato (stesso ordine dell'ORDER BY), non un datetime che si legherebbe sempre
+    con ``.000000`` e sbaglierebbe uguaglianze e confronti con le righe senza microsecondi.
+    """
+    if dialetto != "sqlite":
+        return chiavi
+    return [(type_coerce(col, String) if isinstance(col.type, DateTime) else col, desc) for col, desc in chiavi]
+
+
+def _dopo_cursore(chiavi: List[Chiave], valori: list, indietro: bool):
+    """Righe che vengono dopo ``valori`` nell'ordine delle chiavi (o prima, se ``indietro``)"""
+    condizioni = []
+    for i, (col, desc) in enumerate(chiavi):
+        verso_basso = desc != indietro
+        confronto = col < valori[i] if verso_basso else col > valori[i]
+        uguali = [chiavi[j][0] == valori[j] for j in range(i)]
+        condizioni.append(and_(*uguali, confronto))
+    return or_(*condizioni)
+
+
+def _ordina(chiavi: List[Chiave], indietro: bool):
+    return [col.asc() if (desc == indietro) else col.desc() for col, desc in chiavi]
+
+
+# ─────────────────────────────────────────────
+# Pagina
+# ─────────────────────────────────────────────
+def per_page_richiesto(default: int = 50) -> int:
+    per_page = request.args.get("per_page", default, type=int)
+    return min(max(per_page, 10), 200)
+
+
+def pagina_keyset(q, chiavi: List[Chiave], *, prima: Optional[str], dopo: Optional[str],
+                  per_page: int, parametri: Optional[dict] = None) -> Pagina:
+    """
+    Una pagina di ``q`` nell'ordine di ``chiavi`` (le colonne non devono essere NULL).
+    ``prima`` avanza oltre il cursore, ``dopo`` torna indietro.
+    """
+    n = len(chiavi)
+    chiavi = _chiavi_sql(chiavi, q.session.get_bind().dialect.name)
+    singola = len(q.column_descriptions) == 1
+    q = q.add_columns(*[col.label(f"_chiave_{i}") for i, (col, _) in enumerate(chiavi)])
+
+    c_dopo = decodifica_cursore(dopo, n)
+    c_prima = None if c_dopo else decodifica_cursore(prima, n)
+    indietro = c_dopo is not None
+    cursore = c_dopo or c_prima
+    if cursore:
+        q = q.filter(_dopo_cursore(chiavi, cursore, indietro))
+    risultati = q.order_by(*_ordina(chiavi, indietro)).limit(per_page + 1).all()
+
+    altre = len(risultati) > per_page
+    risultati = risultati[:per_page]
+    if indietro:
+        risultati.reverse()
+        ci_sono_successive, ci_sono_precedenti = True, altre
+    else:
+        ci_sono_successive, ci_sono_precedenti = altre, c_prima is not None
+
+    righe = [r[0] if singola else tuple(r[:-n]) for r in risultati]
+    pagina = Pagina(righe=righe, per_page=per_page, parametri={k: v for k, v in (parametri or {}).items() if v})
+    if risultati:
+        if ci_sono_successive:
+            pagina.successiva = codifica_cursore(risultati[-1][-n:])
+        if ci_sono_precedenti:
+            pagina.precedente = codifica_cursore(risultati[0][-n:])
+    return pagina
+
+
+class FlussoKeyset:
+    """
+    Pagina di una select Core (solo colonne, nessun oggetto ORM) letta in
+    streaming: l'iterazione produce un dict per riga man mano che arriva dal
+    DB; a iterazione finita ``successiva`` contiene il cursore per ``?prima=``.
+    """
+
+    def __init__(self, db, stmt, chiavi: List[Chiave], *, prima: Optional[str], per_page: int):
+        self.db = db
+        self.stmt = stmt
+        self.chiavi = chiavi
+        self.prima = prima
+        self.per_page = per_page
+        self.successiva: Optional[str] = None
+
+    def __iter__(self):
+        n = len(self.chiavi)
+        chiavi = _chiavi_sql(self.chiavi, self.db.get_bind().dialect.name)
+        stmt = self.stmt.add_columns(*[col.label(f"_chiave_{i}") for i, (col, _) in enumerate(chiavi)])
+        cursore = decodifica_cursore(self.prima, n)
+        if cursore:
+            stmt = stmt.where(_dopo_cursore(chiavi, cursore, False))
+        stmt = stmt.order_by(*_ordina(chiavi, False)).limit(self.per_page + 1)
+
+        risultato = self.db.execute(stmt.execution_options(yield_per=100))
+        campi = list(risultato.keys())[:-n]
+        ultima = None
+        try:
+            for i, r in enumerate(risultato):
+                if i == self.per_page:
+                    self.successiva = codifica_cursore(ultima)
+                    break
+                ultima = r[-n:]
+                yield dict(zip(campi, r))
+        finally:
+            risultato.close()
+
+
+# ─────────────────────────────────────────────
+# Totali
+# ─────────────────────────────────────────────
+def stima_righe(db, model) -> int:
+    """Numero approssimato di righe della tabella senza scandirla"""
+    if db.bind.dialect.name == "mysql":
+        stima = db.execute(text(
+            "SELECT TABLE_ROWS FROM information_schema.TABLES "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :tabella"
+        ), {"tabella": model.__tablename__}).scalar()
+        if stima is not None:
+            return int(stima)
+    pk = model.__mapper__.primary_key[0]
+    minimo, massimo = db.query(func.min(pk), func.max(pk)).one()
+    return (massimo - minimo + 1) if massimo else 0
+
+
+def imposta_totale(pagina: Pagina, db, q, model):
+    """Senza filtri: stima dalla tabella; con filtri: COUNT tenuto in cache per TTL_TOTALE"""
+    if not pagina.parametri:
+        pagina.totale, pagina.totale_stimato = stima_righe(db, model), True
+        return pagina
+    firma = json.dumps(sorted((k, str(v)) for k, v in pagina.parametri.items()))
+    chiave = "totale:{}:{}".format(request.endpoint, hashlib.sha1(firma.encode("utf-8")).hexdigest()[:16])
+    totale = cache_get(chiave)
+    if totale is None:
+        totale = q.order_by(None).count()
+        cache_set(chiave, totale, TTL_TOTALE)
+    pagina.totale = totale
+    return pagina
+
+
+# ─────────────────────────────────────────────
+# "Carica altri"
+# ─────────────────────────────────────────────
+def richiesta_json() -> bool:
+    return request.args.get("formato") == "json"
+
+
+def risposta_json(pagina: Pagina, template_righe: str, **contesto):
+    """HTML delle sole righe + URL JSON della pagina successiva, per il bottone "Carica altri" """
+    successiva = None
+    if pagina.successiva:
+        successiva = pagina.url(request.endpoint, prima=pagina.successiva, formato="json")
+    return jsonify({
+        "ok": True,
+        "html": render_template(template_righe, pagina=pagina, **contesto),
+        "righe": len(pagina.righe),
+        "successiva": successiva,
+    })
@@ -1,8 +1,10 @@
 # app/utils/qr.py
-import base64, io, secrets, string
+import io, secrets, string
 import qrcode
+import qrcode.image.svg
 
 ALPHABET = string.ascii_uppercase + string.digits
+INVITE_CODE_ALPHABET = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789"  # senza 0/O/1/I: si detta a voce
 
 def generate_short_code(length=10) -> str:
     # 8-12 alfanumerico con semplice checksum su base36
@@ -14,9 +16,18 @@ def base36_checksum(s: str) -> str:
     n = sum(ord(c) for c in s) % 36
     return ALPHABET[n]
 
-def qr_data_url(text: str) -> str:
+def generate_invite_code(length=6) -> str:
+    return ''.join(secrets.choice(INVITE_CODE_ALPHABET) for _ in range(length))
+
+def qr_png(text: str) -> bytes:
     img = qrcode.make(text)  # richiede `pip install qrcode[pil]`
     buf = io.BytesIO()
-    img.save(buf, format="PNG")
-    b64 = base64.b64encode(buf.getvalue()).decode('utf-8')
-    return f"data:image/png;base64,{b64}"
\ No newline at end of file
+    img.save(buf, format="PNG", optimize=True)
+    return buf.getvalue()
+
+def qr_svg(text: str) -> bytes:
+    # Un unico <path>: pochi byte, scalabile, niente Pillow
+    img = qrcode.make(text, image_factory=qrcode.image.svg.SvgPathImage)
+    buf = io.BytesIO()
+    img.save(buf)
+    return buf.getvalue()
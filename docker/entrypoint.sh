@@ -25,11 +25,11 @@ USE_SQLITE=false
 
 # Flask Configuration
 SECRET_KEY=dev-secret-key-change-in-production
-FLASK_ENV=development
-FLASK_DEBUG=1
+# Produzione (gunicorn): niente debug, asset con fingerprint. In sviluppo lo attiva docker-compose
+FLASK_DEBUG=0
 EOF
 fi
 
-# Esegue il comando passato (di default: python run.py)
+# Esegue il comando passato (di default: gunicorn -c gunicorn.conf.py wsgi:app)
 exec "$@"
 
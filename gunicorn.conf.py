@@ -0,0 +1,94 @@
+"""
+Configurazione gunicorn per la produzione: ``gunicorn -c gunicorn.conf.py wsgi:app``
+(oppure ``python run.py --prod``). Il TLS lo termina il proxy davanti (nginx/traefik):
+qui si serve HTTP in chiaro e ``PROXY_HOPS`` dice all'app quanti proxy fidarsi.
+
+Variabili d'ambiente:
+- ``PORT`` (8123), ``WEB_CONCURRENCY`` worker, ``GUNICORN_THREADS`` thread per worker
+  (4, worker ``gthread``);
+- ``CACHE_URL``: con più di un worker dev'essere condivisa (``redis://...``), altrimenti
+  l'avvio si ferma. Default dei worker: 2 × CPU + 1 con Redis, 1 con la cache in memoria;
+- ``GUNICORN_MAX_REQUESTS`` (1000) e ``GUNICORN_MAX_REQUESTS_JITTER`` (100): ogni worker
+  viene riciclato dopo circa N richieste (frammentazione/leak non crescono all'infinito);
+- ``GUNICORN_TIMEOUT`` (60) e ``GUNICORN_GRACEFUL_TIMEOUT`` (30) secondi.
+
+I job in background (esportazioni, azzeramenti, eliminazioni) girano in thread dei
+worker: un riciclo (o un timeout, un HUP) li interrompe a metà. Il lease del job in
+``app/utils/jobs.py`` scade senza heartbeat e il worker nuovo lo riprende dal punto
+salvato: ``riprendi_job_interrotti`` gira all'avvio del worker e di nuovo appena scaduto
+il lease dei job lasciati dal worker appena uscito.
+
+L'app è caricata una volta nel master (``preload_app``) e condivisa copy-on-write fra
+i worker; dopo il fork ogni worker apre il proprio pool di connessioni al DB.
+
+Reload senza downtime: ``kill -HUP <master>`` riavvia i worker con grazia (finiscono le
+richieste in corso). Con il preload il codice nuovo si carica con ``kill -USR2 <master>``
+(nuovo master accanto al vecchio) e poi ``kill -WINCH`` / ``kill -QUIT`` sul vecchio.
+"""
+import gc
+import multiprocessing
+import os
+
+# Letto da create_app: i job interrotti si riprendono nei worker, non nel master
+os.environ["SERVER_PREFORK"] = "1"
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8123')}"
+
+# La cache in memoria è per processo: con più worker le voci in cache divergono
+cache_condivisa = os.getenv("CACHE_URL", "memory://").startswith(("redis://", "rediss://"))
+if cache_condivisa:
+    try:
+        import redis  # noqa: F401
+    except ImportError:
+        raise RuntimeError("CACHE_URL punta a Redis ma il pacchetto 'redis' non è installato")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1 if cache_condivisa else 1))
+if workers > 1 and not cache_condivisa:
+    raise RuntimeError(
+        f"{workers} worker richiedono una cache condivisa: impostare CACHE_URL=redis://... (oppure WEB_CONCURRENCY=1)"
+    )
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+worker_class = "gthread" if threads > 1 else "sync"
+
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "1000"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "100"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
+
+preload_app = True
+
+# Header X-Forwarded-* accettati solo dal proxy (IP o reti separati da virgola; l'app usa lo stesso elenco)
+forwarded_allow_ips = os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1")
+
+accesslog = "-"
+errorlog = "-"
+loglevel = os.getenv("GUNICORN_LOGLEVEL", "info")
+
+
+def when_ready(server):
+    # Gli oggetti dell'app precaricata non vengono più toccati dal GC: le pagine restano condivise
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # Le connessioni aperte dal master (migrazioni, inizializzazioni) non vanno condivise fra processi
+    from app.database import engine
+    engine.dispose(close=False)
+
+
+def post_worker_init(worker):
+    # Claim atomico sul DB: ogni job interrotto lo riprende un solo worker. Il secondo giro,
+    # a lease scaduto, raccoglie i job del worker appena riciclato (heartbeat ancora fresco ora)
+    import threading
+    from app.utils.jobs import LEASE_JOB, riprendi_job_interrotti
+
+    def riprendi():
+        try:
+            riprendi_job_interrotti()
+        except Exception as exc:
+            worker.log.error("Impossibile riprendere i job in background: %s", exc)
+
+    riprendi()
+    timer = threading.Timer(LEASE_JOB.total_seconds() + 5, riprendi)
+    timer.daemon = True
+    timer.start()
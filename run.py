@@ -1,81 +1,79 @@
-from app import create_app
-import ssl
+"""
+Avvio di MalibuApp.
+
+    python run.py                  server di sviluppo Werkzeug (debug, reloader) in HTTPS self-signed
+    python run.py --http           ... senza TLS
+    python run.py --prod           gunicorn pre-fork (gunicorn.conf.py); il TLS lo fa il proxy
+    python run.py --profile        cProfile per richiesta, file .prof in PROFILO_DIR (default ./profili)
+    python run.py --bench 200      micro-benchmark in processo: N richieste per URL, latenze p50/p95/p99
+
+Il certificato di sviluppo si genera una volta (``flask cert-genera``), non all'avvio in produzione.
+"""
+import argparse
 import os
-import ipaddress
-from cryptography import x509
-from cryptography.x509.oid import NameOID
-from cryptography.hazmat.primitives import hashes, serialization
-from cryptography.hazmat.primitives.asymmetric import rsa
-from datetime import datetime, timedelta
-
-def generate_self_signed_cert():
-    """Genera un certificato self-signed se non esiste già"""
-    cert_file = "cert.pem"
-    key_file = "key.pem"
-    
-    # Se i file esistono già, li usiamo
-    if os.path.exists(cert_file) and os.path.exists(key_file):
-        return (cert_file, key_file)
-    
-    # Genera una chiave privata
-    private_key = rsa.generate_private_key(
-        public_exponent=65537,
-        key_size=2048,
-    )
-    
-    # Crea il certificato
-    subject = issuer = x509.Name([
-        x509.NameAttribute(NameOID.COUNTRY_NAME, "IT"),
-        x509.NameAttribute(NameOID.STATE_OR_PROVINCE_NAME, "Italia"),
-        x509.NameAttribute(NameOID.LOCALITY_NAME, "Roma"),
-        x509.NameAttribute(NameOID.ORGANIZATION_NAME, "MalibuApp"),
-        x509.NameAttribute(NameOID.COMMON_NAME, "localhost"),
-    ])
-    
-    cert = x509.CertificateBuilder().subject_name(
-        subject
-    ).issuer_name(
-        issuer
-    ).public_key(
-        private_key.public_key()
-    ).serial_number(
-        x509.random_serial_number()
-    ).not_valid_before(
-        datetime.utcnow()
-    ).not_valid_after(
-        datetime.utcnow() + timedelta(days=365)
-    ).add_extension(
-        x509.SubjectAlternativeName([
-            x509.DNSName("localhost"),
-            x509.DNSName("127.0.0.1"),
-            x509.IPAddress(ipaddress.IPv4Address("127.0.0.1")),
-        ]),
-        critical=False,
-    ).sign(private_key, hashes.SHA256())
-    
-    # Salva il certificato
-    with open(cert_file, "wb") as f:
-        f.write(cert.public_bytes(serialization.Encoding.PEM))
-    
-    # Salva la chiave privata
-    with open(key_file, "wb") as f:
-        f.write(private_key.private_bytes(
-            encoding=serialization.Encoding.PEM,
-            format=serialization.PrivateFormat.PKCS8,
-            encryption_algorithm=serialization.NoEncryption()
-        ))
-    
-    return (cert_file, key_file)
-
-app = create_app()
+import statistics
+import sys
+import time
+
+from app import create_app  # noqa: F401 — con FLASK_APP=run.py i comandi `flask ...` trovano la factory
+
+URL_BENCH = ["/", "/eventi/", "/prodotti/listino"]
+
+
+def _argomenti(argv=None):
+    parser = argparse.ArgumentParser(description="Avvio di MalibuApp")
+    parser.add_argument("--prod", action="store_true", help="Serve con gunicorn (gunicorn.conf.py)")
+    parser.add_argument("--http", action="store_true", help="Server di sviluppo senza certificato self-signed")
+    parser.add_argument("--profile", action="store_true", help="Profila ogni richiesta (file .prof in PROFILO_DIR)")
+    parser.add_argument("--bench", type=int, metavar="N", help="Esegue N richieste per URL in processo ed esce")
+    parser.add_argument("--url", action="append", help="URL per --bench (ripetibile, default: pagine pubbliche)")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8123")))
+    return parser.parse_args(argv)
+
+
+def bench(app, n: int, urls):
+    """Latenze dell'app senza rete né server (test client), utile per confrontare due versioni"""
+    client = app.test_client()
+    print(f"{'URL':<32} {'stato':>5} {'media':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'req/s':>8}")
+    for url in urls:
+        client.get(url)  # riscaldamento: cache, template compilati
+        tempi, stato = [], None
+        for _ in range(n):
+            inizio = time.perf_counter()
+            stato = client.get(url).status_code
+            tempi.append((time.perf_counter() - inizio) * 1000)
+        tempi.sort()
+        p = lambda q: tempi[min(len(tempi) - 1, int(q * len(tempi)))]
+        print(f"{url:<32} {stato:>5} {statistics.mean(tempi):>7.2f}ms {p(.5):>6.2f}ms {p(.95):>6.2f}ms "
+              f"{p(.99):>6.2f}ms {1000 * n / sum(tempi):>8.1f}")
+
+
+def main(argv=None):
+    args = _argomenti(argv)
+    if args.profile:
+        os.environ.setdefault("PROFILO_DIR", "profili")
+
+    if args.prod:
+        os.environ["PORT"] = str(args.port)
+        os.execvp("gunicorn", ["gunicorn", "-c", "gunicorn.conf.py", "wsgi:app"])
+
+    from wsgi import app
+
+    if args.bench:
+        bench(app, args.bench, args.url or URL_BENCH)
+        return
+
+    debug = os.getenv("FLASK_DEBUG", "1") == "1"
+    ssl_context = None
+    if not args.http:
+        try:
+            from app.utils.cert_dev import genera_cert
+            ssl_context = genera_cert()
+        except Exception as e:
+            print(f"Errore nella configurazione SSL: {e}")
+            print("Avvio senza HTTPS...")
+    app.run(host="0.0.0.0", port=args.port, debug=debug, ssl_context=ssl_context)
+
 
 if __name__ == "__main__":
-    try:
-        cert_file, key_file = generate_self_signed_cert()
-        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
-        context.load_cert_chain(cert_file, key_file)
-        app.run(host="0.0.0.0", port=8123, debug=True, ssl_context=context)
-    except Exception as e:
-        print(f"Errore nella configurazione SSL: {e}")
-        print("Avvio senza HTTPS...")
-        app.run(host="0.0.0.0", port=8123, debug=True)
\ No newline at end of file
+    sys.exit(main())
@@ -0,0 +1,34 @@
+// Liste admin: bottone "Carica altri" (paginazione keyset, risposta JSON con l'HTML delle righe)
+document.addEventListener('click', async (event) => {
+  const btn = event.target.closest('[data-carica-altri]');
+  if (!btn) return;
+  event.preventDefault();
+  btn.disabled = true;
+  const etichetta = btn.textContent;
+  btn.textContent = 'Caricamento…';
+  try {
+    const resp = await fetch(btn.dataset.url, { headers: { Accept: 'application/json' }, credentials: 'same-origin' });
+    const data = await resp.json();
+    if (!resp.ok || !data.ok) throw new Error('risposta non valida');
+    document.querySelector(btn.dataset.target).insertAdjacentHTML('beforeend', data.html);
+
+    const nav = btn.closest('[data-paginazione]');
+    const link = nav && nav.querySelector('[data-successivi]');
+    if (data.successiva) {
+      btn.dataset.url = data.successiva;
+      btn.textContent = etichetta;
+      btn.disabled = false;
+      if (link) {
+        const url = new URL(data.successiva, window.location.href);
+        url.searchParams.delete('formato');
+        link.href = url.toString();
+      }
+    } else {
+      btn.remove();
+      if (link) link.remove();
+    }
+  } catch (err) {
+    btn.textContent = 'Errore, riprova';
+    btn.disabled = false;
+  }
+});
@@ -0,0 +1,172 @@
+// Dettaglio evento admin: le tab si caricano alla prima apertura dagli endpoint JSON
+// (riepilogo con la prima pagina, righe a cursore con "Carica altri").
+(function () {
+  const esc = (v) => String(v ?? '').replace(/[&<>"']/g, (c) => (
+    { '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;' }[c]
+  ));
+  const cap = (s) => (s ? esc(s.charAt(0).toUpperCase() + s.slice(1)).replace(/_/g, ' ') : '—');
+  const euro = (v) => '€' + Number(v || 0).toFixed(2);
+  const oppure = (v) => (v === null || v === undefined || v === '' ? '—' : esc(v));
+
+  const linkCliente = (r) => (
+    `<a href="${esc(r.url_cliente)}" style="text-decoration: none; color: inherit; font-weight: var(--font-weight-medium);">${esc(r.cliente)}</a>`
+  );
+
+  function scheda(titolo, voci, extra) {
+    if (!voci.length && !extra) return '';
+    const righe = voci.map(([label, valore]) => (
+      `<div class="info-list__item"><dt class="info-list__label">${label}</dt><dd class="info-list__value">${valore}</dd></div>`
+    )).join('');
+    return `<div class="card" style="margin-bottom: 0; background: rgba(255,255,255,0.02);"><div class="card__content">
+      <h3 class="card__title" style="font-size: var(--font-size-base); margin-bottom: var(--spacing-3);">${titolo}</h3>
+      <dl class="info-list">${righe}</dl>${extra || ''}</div></div>`;
+  }
+
+  function evidenza(html) {
+    return `<div style="margin-top: var(--spacing-3); padding: var(--spacing-3); background: rgba(212, 175, 55, 0.08); border-radius: var(--radius-md); border-left: 3px solid var(--admin-accent);">${html}</div>`;
+  }
+
+  // Le righe degli eventi archiviati non hanno una pagina propria (url null)
+  const azione = (url, label) => (
+    url ? `<a href="${esc(url)}" class="btn btn--ghost btn--small">${label}</a>` : '<span class="text--muted">Archivio</span>'
+  );
+
+  const conteggi = (obj) => Object.entries(obj || {}).map(([k, n]) => [cap(k), n]);
+  const badgeStato = { attiva: 'warning', usata: 'success' };
+
+  const SEZIONI = {
+    prenotazioni: {
+      riepilogo: (r) => scheda('Per Tipo', conteggi(r.per_tipo)) + scheda('Per Stato', conteggi(r.per_stato),
+        r.tavolo_persone > 0 ? evidenza(`<strong>Totale persone tavoli:</strong> <span class="text--gold">${r.tavolo_persone}</span>`) : ''),
+      riga: (r) => `<tr>
+        <td>${linkCliente(r)}</td>
+        <td><span class="badge badge--${r.tipo === 'tavolo' ? 'primary' : 'secondary'}">${cap(r.tipo)}</span></td>
+        <td><span class="badge badge--${badgeStato[r.stato] || 'secondary'}">${cap(r.stato)}</span></td>
+        <td>${r.tipo === 'tavolo' ? (r.num_persone ? `<strong>${r.num_persone}</strong>` : '<span class="text--muted">Da confermare</span>') : oppure(r.num_persone)}</td>
+        <td>${oppure(r.orario_previsto)}</td>
+        <td>${r.tipo === 'tavolo' && r.note ? `<span class="text--gold">${esc(r.note)}</span>` : oppure(r.note)}</td>
+        <td class="table__cell--actions">${azione(r.url, 'Dettagli')}</td>
+      </tr>`,
+    },
+    ingressi: {
+      riepilogo: (r) => scheda('Per Tipo', conteggi(r.per_tipo)) +
+        (r.per_staff && r.per_staff.length ? scheda('Per Staff (Top 10)', r.per_staff.map(([nome, n]) => [esc(nome), n])) : ''),
+      riga: (r) => `<tr>
+        <td>${linkCliente(r)}</td>
+        <td><span class="badge badge--secondary">${cap(r.tipo)}</span></td>
+        <td>${oppure(r.orario)}</td>
+        <td>${oppure(r.staff)}</td>
+        <td>${oppure(r.note)}</td>
+        <td class="table__cell--actions">${azione(r.url, 'Dettagli')}</td>
+      </tr>`,
+    },
+    consumi: {
+      riepilogo: (r) => scheda('Per Punto Vendita',
+        Object.entries(r.per_punto || {}).map(([p, v]) => [cap(p), `<strong class="text--gold">${euro(v)}</strong>`]),
+        evidenza(`<div style="margin-bottom: var(--spacing-1);"><strong>Clienti unici:</strong> <span class="text--gold">${r.clienti_unici}</span></div>
+          <div><strong>Scontrino medio:</strong> <span class="text--gold">${euro(r.scontrino_medio)}</span></div>`)) +
+        (r.top_prodotti && r.top_prodotti.length ? scheda('Top Prodotti', r.top_prodotti.map((p) => (
+          [esc(p.label), `<strong class="text--gold">${euro(p.revenue)}</strong> <span class="text--muted">(${p.count})</span>`]
+        ))) : ''),
+      riga: (r) => `<tr>
+        <td>${linkCliente(r)}</td>
+        <td>${esc(r.prodotto)}</td>
+        <td><strong class="text--gold">${euro(r.importo)}</strong></td>
+        <td>${cap(r.punto_vendita)}</td>
+        <td>${oppure(r.staff)}</td>
+        <td>${oppure(r.note)}</td>
+        <td class="table__cell--actions">${azione(r.url, 'Modifica')}</td>
+      </tr>`,
+    },
+    feedback: {
+      riga: (r, tab) => `<div class="card" style="margin-bottom: 0; background: rgba(255,255,255,0.03); border-left: 3px solid var(--admin-accent);">
+        <div class="card__header">
+          <div>
+            <a href="${esc(r.url_cliente)}" style="text-decoration: none; color: inherit;"><strong style="font-size: var(--font-size-base);">${esc(r.cliente)}</strong></a>
+            <p class="card__meta" style="margin: 0;">${oppure(r.data)}</p>
+          </div>
+          <div style="display: flex; flex-wrap: wrap; gap: var(--spacing-2);">
+            <span class="badge badge--primary">🎵 ${r.voti[0]}/10</span>
+            <span class="badge badge--primary">${r.voti[1]}/10 Ingresso</span>
+            <span class="badge badge--primary">🌟 ${r.voti[2]}/10</span>
+            <span class="badge badge--primary">${r.voti[3]}/10 Servizio</span>
+          </div>
+        </div>
+        ${r.note ? `<div class="card__content"><p class="text--muted" style="margin: 0; font-style: italic;">"${esc(r.note)}"</p></div>` : ''}
+        <div class="card__footer">
+          <form method="post" action="${esc(r.url_elimina)}" style="display: inline;">
+            <input type="hidden" name="next" value="${esc(tab.dataset.ritorno)}">
+            <button class="btn btn--danger btn--small" onclick="return confirm('Eliminare il feedback selezionato?');" type="submit">Elimina</button>
+          </form>
+        </div>
+      </div>`,
+    },
+  };
+
+  async function caricaPagina(tab, url) {
+    const nome = tab.id.replace('tab-', '');
+    const spec = SEZIONI[nome];
+    const altri = tab.querySelector('[data-altri]');
+    const stato = tab.querySelector('[data-caricamento]');
+    if (altri) altri.disabled = true;
+    try {
+      const resp = await fetch(url, { headers: { Accept: 'application/json' }, credentials: 'same-origin' });
+      const data = await resp.json();
+      if (!resp.ok || !data.ok) throw new Error('risposta non valida');
+
+      if (data.riepilogo && spec.riepilogo) {
+        tab.querySelector('[data-riepilogo]').innerHTML = spec.riepilogo(data.riepilogo);
+      }
+      const righe = tab.querySelector('[data-righe]');
+      righe.insertAdjacentHTML('beforeend', data.righe.map((r) => spec.riga(r, tab)).join(''));
+      const vuota = !righe.children.length;
+      tab.querySelector('[data-elenco]').hidden = vuota;
+      tab.querySelector('[data-vuoto]').hidden = !vuota;
+      if (stato) stato.hidden = true;
+
+      if (altri) {
+        altri.hidden = !data.successiva;
+        altri.disabled = false;
+        altri.dataset.url = data.successiva || '';
+      }
+    } catch (err) {
+      if (stato) {
+        stato.hidden = false;
+        stato.textContent = 'Errore nel caricamento, riapri la scheda per riprovare.';
+      }
+      tab.dataset.caricata = '';
+      if (altri) altri.disabled = false;
+    }
+  }
+
+  async function caricaAnalytics(tab) {
+    try {
+      const resp = await fetch(tab.dataset.analytics, { headers: { Accept: 'application/json' }, credentials: 'same-origin' });
+      const data = await resp.json();
+      if (!resp.ok || !data.ok) throw new Error('risposta non valida');
+      if (window.disegnaAnalyticsEvento) window.disegnaAnalyticsEvento(data);
+    } catch (err) {
+      tab.dataset.caricata = '';
+    }
+  }
+
+  // Chiamata da showTab: scarica la tab solo la prima volta che viene aperta
+  window.caricaSezioneEvento = function (nome) {
+    const tab = document.getElementById('tab-' + nome);
+    if (!tab || tab.dataset.caricata) return;
+    if (tab.dataset.sezione) {
+      tab.dataset.caricata = '1';
+      caricaPagina(tab, tab.dataset.sezione);
+    } else if (tab.dataset.analytics) {
+      tab.dataset.caricata = '1';
+      caricaAnalytics(tab);
+    }
+  };
+
+  document.addEventListener('click', (event) => {
+    const btn = event.target.closest('[data-altri]');
+    if (!btn || !btn.dataset.url) return;
+    event.preventDefault();
+    caricaPagina(btn.closest('.tab-content'), btn.dataset.url);
+  });
+})();
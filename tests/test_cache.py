@@ -0,0 +1,23 @@
+import os
+
+os.environ.setdefault("USE_SQLITE", "true")
+
+from app.utils.cache import _MemoryCache
+
+
+def test_cache_in_memoria_limitata_scarta_le_meno_usate():
+    cache = _MemoryCache(max_voci=3)
+    for chiave in ("a", "b", "c"):
+        cache.set(chiave, chiave)
+    cache.get("a")  # "b" diventa la meno usata
+    cache.set("d", "d")
+    assert cache.get("b") is None
+    assert [cache.get(k) for k in ("a", "c", "d")] == ["a", "c", "d"]
+
+
+def test_chiavi_di_versioni_superate_non_crescono_senza_limite():
+    cache = _MemoryCache(max_voci=10)
+    for versione in range(1000):
+        cache.set(f"eventi:lista:{versione}", [versione])
+    assert len(cache._data) == 10
+    assert cache.get("eventi:lista:999") == [999]
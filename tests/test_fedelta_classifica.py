@@ -0,0 +1,52 @@
+import os
+
+os.environ.setdefault("USE_SQLITE", "true")
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+import app  # noqa: F401 — registra tutti i model sul metadata
+from app.database import Base
+from app.models.clienti import Cliente
+from app.models.fedelta_classifica import ClassificaPunti
+from app.services import fedelta_classifica
+from app.services.fedelta_ledger import registra_movimento
+
+
+def _db():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    db = Session(engine)
+    db.add_all([
+        Cliente(id_cliente=1, nome="Anna", cognome="Rossi", password_hash="x", punti_fedelta=10),
+        Cliente(id_cliente=2, nome="Luca", cognome="Bianchi", password_hash="x", punti_fedelta=10),
+        Cliente(id_cliente=3, nome="Sara", cognome="Verdi", password_hash="x"),
+    ])
+    db.commit()
+    fedelta_classifica.ricostruisci(db)
+    return db
+
+
+def _istogramma(db):
+    return {c.punti: c.n_clienti for c in db.query(ClassificaPunti) if c.n_clienti}
+
+
+def test_assegnazione_sposta_il_cliente_di_bucket():
+    db = _db()
+    assert _istogramma(db) == {0: 1, 10: 2}
+
+    registra_movimento(db, 1, 5, "Consumo")
+    registra_movimento(db, 3, 7, "Feedback")  # saldo NULL → 7
+    db.commit()
+    assert _istogramma(db) == {7: 1, 10: 1, 15: 1}
+    assert fedelta_classifica.posizione_cliente(db, 10) == 2
+
+
+def test_assegnazione_coincide_con_ricostruzione():
+    db = _db()
+    for cliente_id, punti in ((1, 3), (2, -10), (1, -3), (3, 10)):
+        registra_movimento(db, cliente_id, punti, "Rettifica")
+    db.commit()
+    incrementale = _istogramma(db)
+    fedelta_classifica.ricostruisci(db)
+    assert incrementale == _istogramma(db)
@@ -0,0 +1,101 @@
+import os
+from datetime import datetime
+
+os.environ.setdefault("USE_SQLITE", "true")
+
+from sqlalchemy import Column, DateTime, Integer, create_engine, func, insert, select, text
+from sqlalchemy.orm import Session, declarative_base
+
+from app.models.log_attivita import LogAttivita
+from app.services.log_archivio import pagina_log
+from app.utils.paginazione import FlussoKeyset, pagina_keyset
+
+Base = declarative_base()
+
+
+class Riga(Base):
+    __tablename__ = "righe"
+
+    id = Column(Integer, primary_key=True)
+    creata_il = Column(DateTime, server_default=func.now())
+
+
+def _db():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    db = Session(engine)
+    # Timestamp a pari merito: metà dal server_default (senza microsecondi), metà scritti da Python
+    for _ in range(5):
+        db.add(Riga())
+    db.flush()
+    istante = db.execute(select(Riga.creata_il)).scalars().first()
+    db.add_all([Riga(creata_il=istante) for _ in range(3)])
+    db.add_all([Riga(creata_il=istante.replace(microsecond=500)) for _ in range(2)])
+    db.add(Riga(creata_il=datetime(2000, 1, 1)))
+    db.commit()
+    return db
+
+
+CHIAVI = [(Riga.creata_il, True), (Riga.id, True)]
+
+
+def test_pagine_con_timestamp_a_pari_merito():
+    db = _db()
+    attesi = [r.id for r in db.query(Riga).order_by(Riga.creata_il.desc(), Riga.id.desc())]
+
+    visti, cursore = [], None
+    for _ in range(len(attesi)):  # una pagina che ripete la precedente non deve girare all'infinito
+        pagina = pagina_keyset(db.query(Riga), CHIAVI, prima=cursore, dopo=None, per_page=3)
+        visti += [r.id for r in pagina.righe]
+        cursore = pagina.successiva
+        if not cursore:
+            break
+    assert visti == attesi
+
+
+def test_pagina_precedente_con_timestamp_a_pari_merito():
+    db = _db()
+    prima = pagina_keyset(db.query(Riga), CHIAVI, prima=None, dopo=None, per_page=4)
+    seconda = pagina_keyset(db.query(Riga), CHIAVI, prima=prima.successiva, dopo=None, per_page=4)
+    indietro = pagina_keyset(db.query(Riga), CHIAVI, prima=None, dopo=seconda.precedente, per_page=4)
+    assert [r.id for r in indietro.righe] == [r.id for r in prima.righe]
+
+
+def test_flusso_con_timestamp_a_pari_merito():
+    db = _db()
+    attesi = [r.id for r in db.query(Riga).order_by(Riga.creata_il.desc(), Riga.id.desc())]
+
+    visti, cursore = [], None
+    for _ in range(len(attesi)):
+        flusso = FlussoKeyset(db, select(Riga.id), CHIAVI, prima=cursore, per_page=4)
+        visti += [r["id"] for r in flusso]
+        cursore = flusso.successiva
+        if not cursore:
+            break
+    assert visti == attesi
+
+
+def test_registro_con_timestamp_a_pari_merito():
+    engine = create_engine("sqlite://")
+    LogAttivita.__table__.create(engine)
+    db = Session(engine)
+    db.execute(insert(LogAttivita), [
+        {"tabella": "eventi", "record_id": i, "azione": "update"} for i in range(6)
+    ])
+    # Stesso istante, nel formato del server_default (senza microsecondi)
+    db.execute(text("UPDATE log_attivita SET timestamp = '2026-01-01 12:00:00'"))
+    db.commit()
+
+    visti, cursore = [], None
+    for _ in range(6):
+        righe, cursore, _precedente = pagina_log(db.query(LogAttivita), prima=cursore, dopo=None, per_page=2)
+        visti += [r.id_log for r in righe]
+        if not cursore:
+            break
+    assert visti == [6, 5, 4, 3, 2, 1]
+
+    _righe, successiva, _precedente = pagina_log(db.query(LogAttivita), prima=None, dopo=None, per_page=2)
+    seconda, _successiva, precedente = pagina_log(db.query(LogAttivita), prima=successiva, dopo=None, per_page=2)
+    indietro, _successiva, _precedente = pagina_log(db.query(LogAttivita), prima=None, dopo=precedente, per_page=2)
+    assert [r.id_log for r in seconda] == [4, 3]
+    assert [r.id_log for r in indietro] == [6, 5]
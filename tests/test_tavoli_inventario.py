@@ -0,0 +1,86 @@
+import os
+from datetime import date
+
+os.environ.setdefault("USE_SQLITE", "true")
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+import app  # noqa: F401 — registra tutti i model sul metadata
+from app.database import Base
+from app.models.clienti import Cliente
+from app.models.eventi import Evento
+from app.models.prenotazioni import Prenotazione
+from app.models.tavoli_evento import TavoloEvento
+from app.services import tavoli_inventario
+
+
+def _db():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    db = Session(engine)
+    db.add_all([
+        Evento(id_evento=1, nome_evento="Sabato", data_evento=date(2099, 1, 1)),
+        Cliente(id_cliente=1, nome="Anna", cognome="Rossi", password_hash="x"),
+        Cliente(id_cliente=2, nome="Luca", cognome="Bianchi", password_hash="x"),
+        TavoloEvento(id_tavolo=1, evento_id=1, numero_tavolo=7),
+    ])
+    db.commit()
+    return db
+
+
+def _referente(db, id_prenotazione, cliente_id, stato="attiva"):
+    pren = Prenotazione(
+        id_prenotazione=id_prenotazione, cliente_id=cliente_id, evento_id=1, tipo="tavolo", stato=stato,
+        ruolo_tavolo="referente", numero_tavolo=1, stato_approvazione_tavolo="approvata",
+    )
+    db.add(pren)
+    db.flush()
+    return pren
+
+
+def test_claim_concorrente_rifiutato():
+    db = _db()
+    _referente(db, 1, 1)
+    assert tavoli_inventario.claim_tavolo(db, 1, 1, 1)
+    _referente(db, 2, 2)
+    assert not tavoli_inventario.claim_tavolo(db, 1, 1, 2)
+    assert db.get(TavoloEvento, 1).prenotazione_id == 1
+
+
+def test_claim_di_referente_non_valido_riassegnabile():
+    db = _db()
+    prima = _referente(db, 1, 1)
+    assert tavoli_inventario.claim_tavolo(db, 1, 1, 1)
+    prima.stato = "cancellata"  # senza passare da rilascia
+    _referente(db, 2, 2)
+    assert tavoli_inventario.claim_tavolo(db, 1, 1, 2)
+
+
+def test_riattivazione_admin_con_tavolo_tenuto_da_altri():
+    db = _db()
+    riattivata = _referente(db, 1, 1, stato="cancellata")
+    _referente(db, 2, 2)
+    assert tavoli_inventario.claim_tavolo(db, 1, 1, 2)
+    db.commit()
+
+    riattivata.stato = "attiva"
+    assert not tavoli_inventario.riprendi_tavolo(db, riattivata)
+    db.rollback()
+    db.expire_all()
+    assert db.get(TavoloEvento, 1).prenotazione_id == 2
+
+
+def test_riattivazione_admin_riprende_tavolo_libero_con_aderenti():
+    db = _db()
+    riattivata = _referente(db, 1, 1, stato="cancellata")
+    db.add(Prenotazione(cliente_id=2, evento_id=1, tipo="tavolo", stato="attiva", ruolo_tavolo="aderente",
+                        numero_tavolo=1, prenotazione_padre_id=1))
+    db.commit()
+
+    riattivata.stato = "attiva"
+    assert tavoli_inventario.riprendi_tavolo(db, riattivata)
+    db.commit()
+    db.expire_all()
+    tavolo = db.get(TavoloEvento, 1)
+    assert (tavolo.prenotazione_id, tavolo.occupati) == (1, 2)
@@ -0,0 +1,19 @@
+"""
+Entrypoint WSGI per la produzione: ``gunicorn -c gunicorn.conf.py wsgi:app``.
+
+Con ``PROFILO_DIR`` impostata (``python run.py --profile``) ogni richiesta viene
+profilata con cProfile e il risultato salvato in un file ``.prof`` nella cartella
+(da aprire con ``python -m pstats`` o snakeviz).
+"""
+import os
+
+from app import create_app
+
+app = create_app()
+
+if os.getenv("PROFILO_DIR"):
+    from werkzeug.middleware.profiler import ProfilerMiddleware
+
+    os.makedirs(os.environ["PROFILO_DIR"], exist_ok=True)
+    app.wsgi_app = ProfilerMiddleware(app.wsgi_app, profile_dir=os.environ["PROFILO_DIR"],
+                                      restrictions=(30,))